@@ -0,0 +1,220 @@
+import json
+import re
+
+# 结构性字符：扫描时只在这几个字符上停下
+_STRUCTURAL = re.compile(r'[{}"\\]')
+# 删除指令后留下的空代码块和多余空行
+_EMPTY_FENCE = re.compile(r'```[A-Za-z]*\s*```')
+_BLANK_LINES = re.compile(r'\n[ \t]*\n(?:[ \t]*\n)+')
+
+# 正文中未闭合的 { 会让之后的引号配对错位：从它之后重新扫描，次数有上限（每次 O(n)）
+MAX_RECOVERIES = 3
+# 外层对象不是指令时向内查找的层数上限
+MAX_DESCENT = 2
+
+PRIORITIES = ('high', 'medium', 'low')
+_TRUE_VALUES = ('true', '1', 'yes')
+_FALSE_VALUES = ('false', '0', 'no')
+
+# 指令格式：字段 -> 类型（str / bool / int / 枚举元组）；required 中的字段必须存在且非空
+# 未列出的字段会被丢弃
+ACTION_SCHEMAS = {
+    'create_task': {
+        'required': ('title',),
+        'fields': {
+            'title': str, 'description': str, 'priority': PRIORITIES, 'due_date': str,
+            'start_time': str, 'end_time': str, 'is_important': bool, 'list_name': str,
+            'icon': str, 'color': str,
+        },
+    },
+    'create_list': {
+        'required': ('name',),
+        'fields': {'name': str, 'icon': str, 'color': str},
+    },
+    'update_task': {
+        'required': ('task_id',),
+        'fields': {
+            'task_id': int, 'title': str, 'description': str, 'priority': PRIORITIES,
+            'due_date': str, 'start_time': str, 'end_time': str, 'list_id': int,
+            'is_important': bool, 'completed': bool,
+        },
+    },
+    'delete_task': {
+        'required': ('task_id',),
+        'fields': {'task_id': int},
+    },
+    'search_tasks': {
+        'required': ('query',),
+        'fields': {'query': str},
+    },
+}
+
+
+class ActionFormatError(ValueError):
+    """操作指令不符合格式"""
+
+
+class ParsedReply:
+    """解析结果：合法指令、去掉指令后的正文、格式错误的指令 [(操作类型, 错误信息)]"""
+
+    __slots__ = ('actions', 'text', 'rejected')
+
+    def __init__(self, actions, text, rejected):
+        self.actions = actions
+        self.text = text
+        self.rejected = rejected
+
+
+class Span:
+    """一对配对的 {...} 在原文中的位置，children 为直接嵌套的对象"""
+
+    __slots__ = ('start', 'end', 'children')
+
+    def __init__(self, start, end, children):
+        self.start = start
+        self.end = end
+        self.children = children
+
+
+def _scan(text, start):
+    """从 start 开始扫描，返回 (最外层对象列表, 需要重新扫描的位置或 None)
+
+    最外层的 { 未闭合且其后出现过引号时，引号配对可能错位，返回该 { 的位置。
+    """
+    roots = []
+    opened = []
+    in_string = False
+    quoted = False
+    skip_until = -1
+    for match in _STRUCTURAL.finditer(text, start):
+        index = match.start()
+        char = match.group()
+        if not opened:
+            # 对象之外的引号和反斜杠属于正文
+            if char == '{':
+                opened.append(index)
+            continue
+        if index < skip_until:
+            continue
+        if in_string:
+            if char == '\\':
+                skip_until = index + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = quoted = True
+        elif char == '{':
+            opened.append(index)
+        elif char == '}':
+            begin = opened.pop()
+            children = []
+            while roots and roots[-1].start > begin:
+                children.append(roots.pop())
+            children.reverse()
+            roots.append(Span(begin, index + 1, children))
+    return roots, (opened[0] if opened and quoted else None)
+
+
+def scan_objects(text):
+    """线性扫描找出所有最外层的配对 {...}（字符串内的括号和转义不参与配对）"""
+    spans = []
+    start = 0
+    for _ in range(MAX_RECOVERIES):
+        roots, unclosed = _scan(text, start)
+        if unclosed is None:
+            return spans + roots
+        # 未闭合的 { 当作正文：保留它之前的对象，从它之后重新扫描
+        spans.extend(span for span in roots if span.end <= unclosed)
+        start = unclosed + 1
+    roots, _ = _scan(text, start)
+    return spans + roots
+
+
+def _coerce(field, value, kind):
+    if kind is str:
+        if value is None or isinstance(value, str):
+            return value
+    elif kind is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.lower() in _TRUE_VALUES + _FALSE_VALUES:
+            return value.lower() in _TRUE_VALUES
+    elif kind is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+    elif isinstance(value, str) and value.lower() in kind:
+        return value.lower()
+    raise ActionFormatError(f'字段 {field} 格式错误')
+
+
+def validate_action(item):
+    """按 ACTION_SCHEMAS 校验并规范化一条指令，返回 {'action': ..., 'data': {...}}"""
+    action = item.get('action')
+    schema = ACTION_SCHEMAS.get(action)
+    if schema is None:
+        raise ActionFormatError(f'不支持的操作类型: {action}')
+    data = item.get('data')
+    if not isinstance(data, dict):
+        raise ActionFormatError('缺少 data 对象')
+    cleaned = {}
+    for field, kind in schema['fields'].items():
+        if field in data:
+            cleaned[field] = _coerce(field, data[field], kind)
+    for field in schema['required']:
+        value = cleaned.get(field)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            raise ActionFormatError(f'缺少字段 {field}')
+    return {'action': action, 'data': cleaned}
+
+
+def _collect(text, spans, depth, actions, rejected, removed):
+    for span in spans:
+        # 不含 "action" 的对象不解析
+        if text.find('"action"', span.start, span.end) == -1:
+            continue
+        try:
+            value = json.loads(text[span.start:span.end])
+        except (ValueError, RecursionError):
+            value = None
+        if isinstance(value, dict):
+            items = value.get('actions') if 'action' not in value else [value]
+            items = [item for item in items if isinstance(item, dict) and 'action' in item] \
+                if isinstance(items, list) else []
+            if items:
+                for item in items:
+                    try:
+                        actions.append(validate_action(item))
+                    except ActionFormatError as e:
+                        rejected.append((str(item.get('action')), str(e)))
+                removed.append(span)
+                continue
+        if depth < MAX_DESCENT:
+            _collect(text, span.children, depth + 1, actions, rejected, removed)
+
+
+def parse_reply(text):
+    """从AI回复中提取操作指令，同时返回去掉指令后的正文
+
+    支持单条指令 {"action": ..., "data": {...}} 和 {"actions": [...]}；
+    指令可以嵌在代码块中，删除后留下的空代码块一并去掉。
+    """
+    actions = []
+    rejected = []
+    removed = []
+    _collect(text, scan_objects(text), 0, actions, rejected, removed)
+    if not removed:
+        return ParsedReply(actions, text, rejected)
+
+    parts = []
+    last = 0
+    for span in removed:
+        parts.append(text[last:span.start])
+        last = span.end
+    parts.append(text[last:])
+    cleaned = _EMPTY_FENCE.sub('', ''.join(parts))
+    cleaned = _BLANK_LINES.sub('\n\n', cleaned).strip()
+    return ParsedReply(actions, cleaned, rejected)
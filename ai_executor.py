@@ -0,0 +1,251 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import serializers
+import task_bulk
+import task_search
+
+# 一次查出本批次用到的列表：按名称引用的、按ID引用的、用户的默认列表（排序最前），以及当前最大排序值
+_LISTS_SQL = '''
+    SELECT id, name,
+           id = (SELECT id FROM task_lists WHERE user_id = ?1 ORDER BY sort_order LIMIT 1) AS is_default,
+           (SELECT MAX(sort_order) FROM task_lists WHERE user_id = ?1) AS max_order
+    FROM task_lists
+    WHERE user_id = ?1
+      AND (name IN (SELECT value FROM json_each(?2))
+           OR id IN (SELECT value FROM json_each(?3))
+           OR id = (SELECT id FROM task_lists WHERE user_id = ?1 ORDER BY sort_order LIMIT 1))
+    ORDER BY id
+'''
+
+_CREATE_LIST_SQL = '''
+    INSERT INTO task_lists (name, icon, color, sort_order, user_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_CREATE_TASK_SQL = '''
+    INSERT INTO tasks (title, description, priority, due_date, start_time, end_time, list_id, is_important, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+DEFAULT_LIST_NAME = '默认列表'
+
+
+class _ActionFailed(Exception):
+    """单条指令执行失败（只回滚这一条）"""
+
+
+class _Batch:
+    """一次回复中全部指令的执行状态
+
+    各处理方法只在自己的SQL全部成功后才修改这里的状态，
+    失败时回滚到保存点即可，不需要撤销内存中的记录。
+    """
+
+    def __init__(self, conn, user_id, now):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.user_id = user_id
+        self.now = now
+        self.lists_by_name = {}
+        self.owned_lists = set()
+        self.default_list = None
+        self.max_order = 0
+        self.owned_tasks = set()
+        self.touched_tasks = set()
+        self.deleted_tasks = set()
+        self.created_lists = []
+
+    def load(self, actions):
+        """按本批次引用的列表名称、列表ID和任务ID各查询一次"""
+        names, list_refs, task_refs = set(), set(), set()
+        for action in actions:
+            data = action['data']
+            if action['action'] == 'create_task' and data.get('list_name'):
+                names.add(data['list_name'])
+            elif action['action'] == 'create_list':
+                names.add(data['name'].strip())
+            elif action['action'] in ('update_task', 'delete_task'):
+                task_refs.add(data['task_id'])
+                if data.get('list_id') is not None:
+                    list_refs.add(data['list_id'])
+
+        self.cursor.execute(_LISTS_SQL, (self.user_id, json.dumps(sorted(names), ensure_ascii=False),
+                                         json.dumps(sorted(list_refs))))
+        for row in self.cursor.fetchall():
+            # 同名列表取最早创建的
+            self.lists_by_name.setdefault(row['name'], row['id'])
+            self.owned_lists.add(row['id'])
+            if row['is_default']:
+                self.default_list = row['id']
+            self.max_order = row['max_order'] or 0
+
+        if task_refs:
+            self.cursor.execute(task_bulk.OWNED_IDS_SQL, (self.user_id, json.dumps(sorted(task_refs))))
+            self.owned_tasks = {row[0] for row in self.cursor.fetchall()}
+
+    def _insert_list(self, name, icon, color, sort_order):
+        self.cursor.execute(_CREATE_LIST_SQL, (name, icon, color, sort_order, self.user_id))
+        return self.cursor.lastrowid
+
+    def _remember_list(self, list_id, name, sort_order):
+        self.lists_by_name[name] = list_id
+        self.owned_lists.add(list_id)
+        self.created_lists.append(list_id)
+        self.max_order = max(self.max_order, sort_order)
+
+    def create_task(self, data):
+        title = data['title'].strip()
+        list_name = data.get('list_name')
+        new_list = None
+        if list_name:
+            list_id = self.lists_by_name.get(list_name)
+            if list_id is None:
+                new_list = (list_name, self.max_order + 1)
+                list_id = self._insert_list(list_name, data.get('icon') or '📋', data.get('color') or '#0078d4',
+                                            self.max_order + 1)
+        else:
+            list_id = self.default_list
+            if list_id is None:
+                new_list = (DEFAULT_LIST_NAME, 0)
+                list_id = self._insert_list(DEFAULT_LIST_NAME, '📋', '#0078d4', 0)
+
+        self.cursor.execute(_CREATE_TASK_SQL, (
+            title,
+            data.get('description') or '',
+            data.get('priority') or 'medium',
+            data.get('due_date'),
+            data.get('start_time'),
+            data.get('end_time'),
+            list_id,
+            data.get('is_important', False),
+            self.user_id
+        ))
+        task_id = self.cursor.lastrowid
+
+        if new_list:
+            self._remember_list(list_id, *new_list)
+            if not list_name:
+                self.default_list = list_id
+        self.owned_tasks.add(task_id)
+        self.touched_tasks.add(task_id)
+        return {
+            'success': True,
+            'action': 'create_task',
+            'task_id': task_id,
+            'list_id': list_id,
+            'title': title,
+            'message': f'任务"{title}"创建成功'
+        }
+
+    def create_list(self, data):
+        name = data['name'].strip()
+        existing = self.lists_by_name.get(name)
+        if existing is not None:
+            # 同名列表已存在（或本批次已创建）时直接复用
+            return {
+                'success': True,
+                'action': 'create_list',
+                'list_id': existing,
+                'name': name,
+                'message': f'列表"{name}"已存在'
+            }
+        sort_order = self.max_order + 1
+        list_id = self._insert_list(name, data.get('icon') or '📋', data.get('color') or '#0078d4', sort_order)
+        self._remember_list(list_id, name, sort_order)
+        return {
+            'success': True,
+            'action': 'create_list',
+            'list_id': list_id,
+            'name': name,
+            'message': f'列表"{name}"创建成功'
+        }
+
+    def update_task(self, data):
+        task_id = data['task_id']
+        if task_id not in self.owned_tasks:
+            raise _ActionFailed(f'任务{task_id}不存在')
+        fields = {field: value for field, value in data.items() if field != 'task_id'}
+        if 'title' in fields and not (fields['title'] or '').strip():
+            raise _ActionFailed('任务标题不能为空')
+        if fields.get('list_id') is not None and fields['list_id'] not in self.owned_lists:
+            raise _ActionFailed(f'列表{fields["list_id"]}不存在')
+        signature = task_bulk.update_signature(fields)
+        if not signature:
+            raise _ActionFailed('没有要更新的字段')
+        self.cursor.execute(task_bulk.update_sql(signature),
+                            task_bulk.update_params(fields, signature, task_id, self.user_id, self.now))
+        self.touched_tasks.add(task_id)
+        return {
+            'success': True,
+            'action': 'update_task',
+            'task_id': task_id,
+            'message': f'任务{task_id}更新成功'
+        }
+
+    def delete_task(self, data):
+        task_id = data['task_id']
+        if task_id not in self.owned_tasks:
+            raise _ActionFailed(f'任务{task_id}不存在')
+        self.cursor.execute(task_bulk.DELETE_TASK_SQL, (task_id, self.user_id))
+        self.owned_tasks.discard(task_id)
+        self.touched_tasks.discard(task_id)
+        self.deleted_tasks.add(task_id)
+        return {
+            'success': True,
+            'action': 'delete_task',
+            'task_id': task_id,
+            'message': f'任务{task_id}删除成功'
+        }
+
+    def search_tasks(self, data):
+        query = data['query'].strip()
+        # 在同一事务中搜索，能搜到本批次前面刚创建或修改的任务
+        tasks = task_search.search_tasks(serializers.tuple_cursor(self.conn), self.user_id, query)
+        return {
+            'success': True,
+            'action': 'search_tasks',
+            'query': query,
+            'results': tasks,
+            'count': len(tasks),
+            'message': f'找到{len(tasks)}个相关任务'
+        }
+
+
+def execute_actions(conn, user_id, actions):
+    """在一个 BEGIN IMMEDIATE 事务中执行一次回复里的全部指令（指令已经过 ai_actions 校验）
+
+    - 列表名称、列表ID、任务ID各用一次查询解析，同名列表只创建一次
+    - 每条指令一个保存点：失败的指令回滚自己的修改并报告错误，其余指令照常提交
+    - 返回逐条结果和需要推送的变更
+    """
+    batch = _Batch(conn, user_id, datetime.now().isoformat())
+    results = []
+
+    if conn.in_transaction:
+        conn.commit()
+    batch.cursor.execute('BEGIN IMMEDIATE')
+    try:
+        batch.load(actions)
+        for action in actions:
+            handler = getattr(batch, action['action'])
+            batch.cursor.execute('SAVEPOINT ai_action')
+            try:
+                result = handler(action['data'])
+            except (_ActionFailed, sqlite3.Error) as e:
+                batch.cursor.execute('ROLLBACK TO ai_action')
+                result = {'success': False, 'error': str(e), 'action': action['action']}
+            batch.cursor.execute('RELEASE ai_action')
+            results.append(result)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'results': results,
+        'task_ids': sorted(batch.touched_tasks),
+        'list_ids': batch.created_lists,
+        'deleted_task_ids': sorted(batch.deleted_tasks),
+    }
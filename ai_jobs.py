@@ -0,0 +1,223 @@
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ttl_cache import TTLCache
+
+# 后台执行AI请求的线程数（所有提供商共享）
+MAX_WORKERS = 16
+# 每个提供商默认的并发请求数和排队上限（可由 ai_config.json 的 advanced 覆盖）
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_QUEUED = 32
+# 完成的任务保留多久供轮询
+RESULT_TTL = 600
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+
+class QueueFull(Exception):
+    """提供商的排队数已达上限"""
+
+
+class AIJob:
+    """一次AI请求：状态、流式输出的事件和最终结果"""
+
+    def __init__(self, user_id, provider, stream=False):
+        self.id = secrets.token_hex(8)
+        self.user_id = user_id
+        self.provider = provider
+        self.stream = stream
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self.cancelled = False
+        self._condition = threading.Condition()
+
+    def emit(self, event, data):
+        """追加一条事件（如流式输出的 token），唤醒正在转发的连接"""
+        with self._condition:
+            self.events.append((event, data))
+            self._condition.notify_all()
+
+    def _set_status(self, status, result=None, error=None):
+        with self._condition:
+            self.status = status
+            if status == 'running':
+                self.started_at = time.time()
+            else:
+                self.result = result
+                self.error = error
+                self.finished_at = time.time()
+            self._condition.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.finished, timeout)
+
+    def wait_events(self, index, timeout):
+        """返回 index 之后的事件和任务是否已结束；没有新事件时最多等待 timeout 秒"""
+        with self._condition:
+            if len(self.events) <= index and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[index:], self.finished
+
+    def to_dict(self):
+        with self._condition:
+            result = {
+                'job_id': self.id,
+                'status': self.status,
+                'stream': self.stream,
+                'queued_ms': round(((self.started_at or time.time()) - self.created_at) * 1000, 1),
+            }
+            if self.started_at:
+                result['run_ms'] = round(((self.finished_at or time.time()) - self.started_at) * 1000, 1)
+            if self.result is not None:
+                result['result'] = self.result
+            if self.error:
+                result['error'] = self.error
+            return result
+
+
+class _Provider:
+    __slots__ = ('active', 'waiting', 'limit', 'completed', 'rejected')
+
+    def __init__(self, limit):
+        self.active = 0
+        self.waiting = deque()
+        self.limit = limit
+        self.completed = 0
+        self.rejected = 0
+
+
+class JobQueue:
+    """AI请求任务队列：请求线程提交后立即返回，后台线程调用大模型
+
+    每个提供商有独立的并发上限和排队上限，超出并发的任务在该提供商的队列中等待，
+    不占用后台线程，也不会挤占其他提供商的额度。on_finish 在任务结束后于后台线程中调用。
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, result_ttl=RESULT_TTL, on_finish=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-job')
+        self._providers = {}
+        self._lock = threading.Lock()
+        self.jobs = TTLCache(maxsize=10000, ttl=result_ttl)
+        self.on_finish = on_finish
+        self._submitted = 0
+        self._failed = 0
+        self._wait_ms = 0.0
+        self._run_ms = 0.0
+
+    def submit(self, user_id, provider, func, concurrency=DEFAULT_CONCURRENCY,
+               max_queued=DEFAULT_MAX_QUEUED, stream=False):
+        """提交任务，func(job) 的返回值作为结果；排队已满时抛出 QueueFull"""
+        job = AIJob(user_id, provider, stream)
+        with self._lock:
+            state = self._providers.get(provider)
+            if state is None:
+                state = self._providers[provider] = _Provider(concurrency)
+            state.limit = max(int(concurrency), 1)
+            start = state.active < state.limit
+            if start:
+                state.active += 1
+            elif len(state.waiting) >= max_queued:
+                state.rejected += 1
+                raise QueueFull(f'{provider} 排队请求过多')
+            else:
+                state.waiting.append((job, func))
+            self._submitted += 1
+        self.jobs.set(job.id, job)
+        if start:
+            self._executor.submit(self._worker, state, job, func)
+        return job
+
+    def get(self, job_id, user_id):
+        """查找任务（只能查到自己的）"""
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def cancel(self, job):
+        """取消排队中的任务；已开始的任务只标记，结束后丢弃结果"""
+        with self._lock:
+            state = self._providers.get(job.provider)
+            queued = state is not None and any(item[0] is job for item in state.waiting)
+            if queued:
+                state.waiting = deque(item for item in state.waiting if item[0] is not job)
+            job.cancelled = True
+        if queued:
+            job._set_status('cancelled')
+            self._notify(job)
+        return queued
+
+    def _notify(self, job):
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"AI任务完成回调失败: {e}")
+
+    def _run(self, job, func):
+        job._set_status('running')
+        try:
+            result = func(job)
+        except Exception as e:
+            print(f"AI任务 {job.id} 失败: {e}")
+            job._set_status('failed', error=str(e))
+        else:
+            job._set_status('cancelled' if job.cancelled else 'done', result=result)
+        # 任务结束后重新计算保留时间
+        self.jobs.set(job.id, job)
+        with self._lock:
+            self._wait_ms += (job.started_at - job.created_at) * 1000
+            self._run_ms += (job.finished_at - job.started_at) * 1000
+            if job.status == 'failed':
+                self._failed += 1
+        self._notify(job)
+
+    def _worker(self, state, job, func):
+        # 一个线程连续处理该提供商排队的任务，直到队列为空才归还并发额度
+        while True:
+            self._run(job, func)
+            with self._lock:
+                state.completed += 1
+                if state.waiting and state.active <= state.limit:
+                    job, func = state.waiting.popleft()
+                else:
+                    state.active -= 1
+                    return
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            finished = sum(state.completed for state in self._providers.values())
+            return {
+                'submitted': self._submitted,
+                'completed': finished,
+                'failed': self._failed,
+                'avg_wait_ms': round(self._wait_ms / finished, 1) if finished else 0.0,
+                'avg_run_ms': round(self._run_ms / finished, 1) if finished else 0.0,
+                'providers': {
+                    provider: {
+                        'limit': state.limit,
+                        'active': state.active,
+                        'queued': len(state.waiting),
+                        'completed': state.completed,
+                        'rejected': state.rejected,
+                    }
+                    for provider, state in self._providers.items()
+                },
+            }
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from ttl_cache import TTLCache
+
+RESPONSE_CACHE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS ai_response_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        latency_ms REAL NOT NULL DEFAULT 0,
+        expires_at REAL NOT NULL
+    )
+'''
+RESPONSE_CACHE_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_ai_response_cache_expires ON ai_response_cache (expires_at)'
+
+# 每写入这么多条后清理一次数据库中的过期记录
+PURGE_EVERY = 200
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '。！？!?.～~ '
+
+
+def normalize_message(message):
+    """归一化用户消息：全半角统一、大小写、空白和句末标点不影响命中"""
+    text = unicodedata.normalize('NFKC', message).lower()
+    text = _WHITESPACE.sub(' ', text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def make_cache_key(user_id, model, temperature, message, task_context):
+    """根据用户、模型参数、归一化消息和任务上下文生成缓存键
+
+    任务数据变化后上下文摘要随之变化，旧回复自然不会再命中。
+    """
+    context_hash = hashlib.sha256(task_context.encode('utf-8')).hexdigest()
+    raw = json.dumps([user_id, model, temperature, normalize_message(message), context_hash],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """AI回复缓存：内存 LRU + TTL，可选 SQLite 持久层（重启或多进程间共享）"""
+
+    def __init__(self, connection_factory=None, maxsize=512, ttl=600.0):
+        self.connection_factory = connection_factory
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._db_hits = 0
+        self._stores = 0
+        self._bypassed = 0
+        self._saved_latency_ms = 0.0
+
+    def _record_hit(self, latency_ms, from_db=False):
+        with self._lock:
+            self._saved_latency_ms += latency_ms
+            if from_db:
+                self._db_hits += 1
+
+    def get(self, key, persist=False):
+        """查找缓存的回复，未命中返回 None"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._record_hit(entry[1])
+            return entry[0]
+        if not persist or self.connection_factory is None:
+            return None
+
+        conn = self.connection_factory()
+        try:
+            row = conn.execute(
+                'SELECT response, latency_ms, expires_at FROM ai_response_cache WHERE cache_key = ?',
+                (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        remaining = row[2] - time.time()
+        if remaining <= 0:
+            return None
+        # 回填内存层，剩余有效期与数据库一致
+        self.memory.set(key, (row[0], row[1]), ttl=remaining)
+        self._record_hit(row[1], from_db=True)
+        return row[0]
+
+    def set(self, key, response, latency_ms, ttl=None, persist=False):
+        """保存回复及其原始耗时（用于统计节省的延迟）"""
+        ttl = self.memory.ttl if ttl is None else ttl
+        self.memory.set(key, (response, latency_ms), ttl=ttl)
+        with self._lock:
+            self._stores += 1
+            purge = self._stores % PURGE_EVERY == 0
+        if not persist or self.connection_factory is None:
+            return
+
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO ai_response_cache (cache_key, response, latency_ms, expires_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, response, latency_ms, time.time() + ttl))
+            if purge:
+                cursor.execute('DELETE FROM ai_response_cache WHERE expires_at <= ?', (time.time(),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_bypass(self):
+        """回复包含操作指令，不能缓存"""
+        with self._lock:
+            self._bypassed += 1
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        result = self.memory.stats()
+        with self._lock:
+            # 数据库命中在内存层记为未命中，这里合并计算总命中率
+            lookups = result['hits'] + result['misses']
+            result['hit_rate'] = round((result['hits'] + self._db_hits) / lookups, 4) if lookups else 0.0
+            result.update({
+                'db_hits': self._db_hits,
+                'stores': self._stores,
+                'bypassed': self._bypassed,
+                'saved_latency_ms': round(self._saved_latency_ms, 1),
+            })
+        return result
@@ -0,0 +1,57 @@
+# app.py 路由中的查询。check_db 直接导入这些常量检查执行计划，修改查询时两边不会不一致。
+
+# 任务字段（同时也是 fields= 参数允许的取值）
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'due_date',
+               'start_time', 'end_time', 'list_id', 'created_at', 'updated_at', 'completed_at', 'is_important')
+
+# 任务列表及其计数（计数由触发器维护，无需扫描tasks表）
+TASK_LISTS_SQL = '''
+    SELECT
+        tl.id, tl.name, tl.icon, tl.color, tl.sort_order,
+        s.total as total_tasks,
+        s.completed as completed_tasks
+    FROM task_lists tl
+    LEFT JOIN list_task_stats s ON s.list_id = tl.id
+    WHERE tl.user_id = ?
+    ORDER BY tl.sort_order
+'''
+
+# 任务列表排序：重要优先、截止日期升序（无日期在前）、创建时间倒序，id 保证顺序唯一
+TASK_ORDER_BY = "is_important DESC, COALESCE(due_date, '') ASC, created_at DESC, id DESC"
+TASK_CURSOR_CONDITION = """
+    AND (is_important < ? OR (is_important = ? AND (
+        COALESCE(due_date, '') > ? OR (COALESCE(due_date, '') = ? AND (
+            created_at < ? OR (created_at = ? AND id < ?)
+        ))
+    )))
+"""
+
+TASK_BY_ID_SQL = f'''
+    SELECT {', '.join(TASK_FIELDS)}
+    FROM tasks
+    WHERE id = ? AND user_id = ?
+'''
+
+MAX_LIST_ORDER_SQL = 'SELECT MAX(sort_order) as max_order FROM task_lists WHERE user_id = ?'
+
+LOAD_USER_SQL = 'SELECT * FROM users WHERE id = ? AND is_active = 1'
+
+
+def tasks_query(columns, by_list=False, show_completed=True, window=False, after_cursor=False, paginate=False):
+    """GET /api/tasks 的查询
+
+    参数依次为：user_id、[list_id]、[due_from, due_to]、[游标参数]、[LIMIT]
+    """
+    query = f'SELECT {", ".join(columns)} FROM tasks WHERE user_id = ?'
+    if by_list:
+        query += ' AND list_id = ?'
+    if not show_completed:
+        query += ' AND completed = 0'
+    if window:
+        query += ' AND due_date BETWEEN ? AND ?'
+    if after_cursor:
+        query += TASK_CURSOR_CONDITION
+    query += f' ORDER BY {TASK_ORDER_BY}'
+    if paginate:
+        query += ' LIMIT ?'
+    return query
@@ -1,17 +1,47 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, g, has_request_context, Response, stream_with_context, make_response
 from flask_cors import CORS
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import sqlite3
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import json
-import requests
 import os
 import bcrypt
 import secrets
-from datetime import datetime, date, timedelta
+import base64
+import io
+import re
+import time
+from collections.abc import Mapping
+from functools import wraps
+from datetime import datetime, date
 from database import init_database, insert_default_data, migrate_database
+import db_pool
+import task_stats
+import task_search
+import task_bulk
+import task_transfer
+import task_sync
+import task_calendar
+import task_recurrence
+import task_reminders
+import session_store
+import serializers
+import data_version
+import api_queries
+from api_queries import TASK_FIELDS
+from ttl_cache import TTLCache
+from config_store import ConfigStore, thaw
+from conversation_store import ConversationStore
+import llm_client
+import ai_jobs
+import ai_actions
+import ai_executor
+import local_nlu
+from task_context import TaskContextBuilder, DEFAULT_TOKEN_BUDGET
+from ai_response_cache import ResponseCache, make_cache_key
+from event_bus import EventBus
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)  # 生成安全的密钥
+# 密钥必须在重启和多个工作进程之间保持不变（记住我 Cookie 等签名用），优先取环境变量
+app.secret_key = os.environ.get('SECRET_KEY') or session_store.load_secret_key()
 CORS(app)
 
 # 配置Flask-Login
@@ -22,65 +52,72 @@ login_manager.login_message = '请先登录以访问此页面'
 login_manager.login_message_category = 'info'
 
 # 用户模型类
-class User(UserMixin):
+class User:
+    """登录用户（只读，实例会被多个请求共享缓存）
+
+    实现 Flask-Login 需要的接口：is_authenticated、is_active、is_anonymous、get_id()。
+    """
+    __slots__ = ('id', 'username', 'email', 'full_name', 'avatar_url',
+                 'is_active', 'email_verified', 'created_at', 'last_login')
+    
+    is_authenticated = True
+    is_anonymous = False
+    
     def __init__(self, user_data):
-        self._id = str(user_data['id'])
-        self._username = user_data['username']
-        self._email = user_data['email']
-        self._full_name = user_data['full_name'] if user_data['full_name'] else ''
-        self._avatar_url = user_data['avatar_url'] if user_data['avatar_url'] else ''
-        self._is_active = bool(user_data['is_active']) if user_data['is_active'] is not None else True
-        self._email_verified = bool(user_data['email_verified']) if user_data['email_verified'] is not None else False
-        self._created_at = user_data['created_at'] if user_data['created_at'] else ''
-        self._last_login = user_data['last_login'] if user_data['last_login'] else ''
-    
-    @property
-    def id(self):
-        return self._id
-    
-    @property
-    def username(self):
-        return self._username
-    
-    @property
-    def email(self):
-        return self._email
-    
-    @property
-    def full_name(self):
-        return self._full_name
-    
-    @property
-    def avatar_url(self):
-        return self._avatar_url
-    
-    @property
-    def is_active(self):
-        return self._is_active
-    
-    @property
-    def email_verified(self):
-        return self._email_verified
-    
-    @property
-    def created_at(self):
-        return self._created_at
-    
-    @property
-    def last_login(self):
-        return self._last_login
+        self.id = str(user_data['id'])
+        self.username = user_data['username']
+        self.email = user_data['email']
+        self.full_name = user_data['full_name'] or ''
+        self.avatar_url = user_data['avatar_url'] or ''
+        self.is_active = bool(user_data['is_active']) if user_data['is_active'] is not None else True
+        self.email_verified = bool(user_data['email_verified']) if user_data['email_verified'] is not None else False
+        self.created_at = user_data['created_at'] or ''
+        self.last_login = user_data['last_login'] or ''
+    
+    def get_id(self):
+        return self.id
+    
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+    
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+    
+    __hash__ = None
+
+# 已登录用户缓存，避免每个请求都查询users表
+USER_CACHE_TTL = 60
+user_cache = TTLCache(maxsize=4096, ttl=USER_CACHE_TTL)
+
+def invalidate_user_cache(user_id):
+    """用户信息变更（登录时间、停用等）后调用"""
+    user_cache.invalidate(int(user_id))
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Flask-Login用户加载器"""
+    """Flask-Login用户加载器（先查缓存）"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ? AND is_active = 1', (user_id,))
+    cursor.execute(api_queries.LOAD_USER_SQL, (user_id,))
     user_data = cursor.fetchone()
     conn.close()
     
     if user_data:
-        return User(user_data)
+        user = User(user_data)
+        user_cache.set(user_id, user)
+        return user
     return None
 
 # 初始化数据库
@@ -88,11 +125,18 @@ init_database()
 migrate_database()  # 迁移数据库添加时间字段
 insert_default_data()
 
+# 数据库连接池（请求结束时自动归还连接）
+db_connection_pool = db_pool.ConnectionPool(db_pool.DATABASE_PATH)
+db_pool.init_app(app, db_connection_pool)
+
+# 服务端会话：Cookie 只携带令牌，会话保存在 user_sessions 表，多个工作进程共用
+user_session_store = session_store.SessionStore(db_connection_pool.checkout, app.permanent_session_lifetime)
+app.session_interface = session_store.ServerSessionInterface(user_session_store)
+user_session_store.start()
+
 def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect('settings.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取数据库连接（从连接池借出，conn.close() 会归还到池中）"""
+    return db_pool.lease_connection(db_connection_pool)
 
 def get_current_user_id():
     """获取当前登录用户的ID"""
@@ -100,6 +144,39 @@ def get_current_user_id():
         return int(current_user.id)
     return None
 
+def versioned_etag(scope=None):
+    """GET 响应带上由用户数据版本生成的 ETag，If-None-Match 命中时直接返回 304
+
+    版本号只查 user_data_versions 主键，不会访问业务表。
+    scope 返回响应还依赖的其他条件（如当天日期），会拼进 ETag。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            
+            user_id = get_current_user_id()
+            conn = get_db_connection()
+            try:
+                version = data_version.get_data_version(conn.cursor(), user_id)
+            finally:
+                conn.close()
+            etag = data_version.make_etag(user_id, version, scope() if scope else '')
+            
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # 版本号在执行视图之前读取：期间若有写入，ETag 只会偏旧，下次请求会重新获取
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/')
 def index():
     """主页面"""
@@ -107,24 +184,15 @@ def index():
 
 @app.route('/api/task_lists')
 @login_required
+@versioned_etag()
 def get_task_lists():
     """获取当前用户的任务列表"""
     user_id = get_current_user_id()
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 一次性获取当前用户任务列表及其统计信息
-    cursor.execute('''
-        SELECT 
-            tl.id, tl.name, tl.icon, tl.color, tl.sort_order,
-            COUNT(t.id) as total_tasks,
-            COUNT(CASE WHEN t.completed = 1 THEN 1 END) as completed_tasks
-        FROM task_lists tl
-        LEFT JOIN tasks t ON tl.id = t.list_id
-        WHERE tl.user_id = ?
-        GROUP BY tl.id, tl.name, tl.icon, tl.color, tl.sort_order
-        ORDER BY tl.sort_order
-    ''', (user_id,))
+    # 任务列表及其计数（计数由触发器维护，无需扫描tasks表）
+    cursor.execute(api_queries.TASK_LISTS_SQL, (user_id,))
     
     lists = cursor.fetchall()
     conn.close()
@@ -143,64 +211,137 @@ def get_task_lists():
     
     return jsonify(result)
 
+TASK_PAGE_SIZE = 50
+TASK_PAGE_MAX = 200
+
+def encode_task_cursor(task):
+    """把最后一条任务的排序键编码为不透明游标"""
+    key = [task['is_important'], task['due_date'] or '', task['created_at'], task['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_task_cursor(token):
+    """解析游标，返回 api_queries.TASK_CURSOR_CONDITION 所需的参数"""
+    padded = token + '=' * (-len(token) % 4)
+    is_important, due_key, created_at, task_id = json.loads(base64.urlsafe_b64decode(padded))
+    return [is_important, is_important, due_key, due_key, created_at, created_at, int(task_id)]
+
 @app.route('/api/tasks')
 @login_required
+@versioned_etag(scope=lambda: date.today().isoformat())
 def get_tasks():
-    """获取当前用户的任务列表"""
+    """获取当前用户的任务列表
+
+    可选参数：
+    - limit / cursor：按排序键做游标分页，返回 {'tasks': [...], 'next_cursor': ...}
+    - fields：逗号分隔的字段列表，只返回需要的字段（id 总会返回）
+    - due_from / due_to：只返回截止日期在该范围内的任务，重复任务展开为范围内的每一次（不支持分页）
+
+    重复任务的模板带有 recurrence，due_date 为下一次未完成的日期。
+    """
     user_id = get_current_user_id()
     list_id = request.args.get('list_id')
     show_completed = request.args.get('show_completed', 'true').lower() == 'true'
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # 字段投影
+    fields = TASK_FIELDS
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in TASK_FIELDS]
+        if unknown:
+            return jsonify({'error': f'不支持的字段: {", ".join(unknown)}'}), 400
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+    
+    # 分页参数
+    paginate = 'limit' in request.args or 'cursor' in request.args
+    limit = TASK_PAGE_SIZE
+    cursor_params = None
+    if paginate:
+        try:
+            limit = min(max(int(request.args.get('limit', TASK_PAGE_SIZE)), 1), TASK_PAGE_MAX)
+            if request.args.get('cursor'):
+                cursor_params = decode_task_cursor(request.args['cursor'])
+        except (ValueError, TypeError):
+            return jsonify({'error': '无效的分页参数'}), 400
+    
+    # 日期范围
+    window = None
+    if 'due_from' in request.args or 'due_to' in request.args:
+        try:
+            window = (date.fromisoformat(request.args.get('due_from', '')),
+                      date.fromisoformat(request.args.get('due_to', '')))
+            task_recurrence.check_window(*window)
+        except ValueError:
+            return jsonify({'error': f'无效的日期范围（due_from、due_to，最多{task_recurrence.MAX_WINDOW_DAYS}天）'}), 400
+        if paginate:
+            return jsonify({'error': '按日期范围查询时不支持分页'}), 400
     
-    if list_id:
-        # 获取特定列表的任务
-        query = '''
-            SELECT id, title, description, completed, priority, due_date, 
-                   start_time, end_time, list_id, created_at, updated_at, completed_at, is_important
-            FROM tasks 
-            WHERE list_id = ? AND user_id = ?
-        '''
-        params = [list_id, user_id]
-    else:
-        # 获取用户所有任务
-        query = '''
-            SELECT id, title, description, completed, priority, due_date, 
-                   start_time, end_time, list_id, created_at, updated_at, completed_at, is_important
-            FROM tasks
-            WHERE user_id = ?
-        '''
-        params = [user_id]
+    # 排序键总是查询出来，用于生成下一页游标
+    columns = list(dict.fromkeys(list(fields) + ['is_important', 'due_date', 'created_at']))
     
-    if not show_completed:
-        query += ' AND completed = 0'
+    conn = get_db_connection()
+    cursor = serializers.tuple_cursor(conn)
     
-    query += ' ORDER BY is_important DESC, due_date ASC, created_at DESC'
+    query = api_queries.tasks_query(columns, by_list=bool(list_id), show_completed=show_completed,
+                                    window=bool(window), after_cursor=bool(cursor_params), paginate=paginate)
+    params = [user_id]
+    if list_id:
+        params.append(list_id)
+    if window:
+        params.extend(day.isoformat() for day in window)
+    if cursor_params:
+        params.extend(cursor_params)
+    if paginate:
+        # 多取一条用来判断是否还有下一页
+        params.append(limit + 1)
     
     cursor.execute(query, params)
     tasks = cursor.fetchall()
-    conn.close()
     
-    result = []
-    for task in tasks:
-        result.append({
-            'id': task['id'],
-            'title': task['title'],
-            'description': task['description'],
-            'completed': bool(task['completed']),
-            'priority': task['priority'],
-            'due_date': task['due_date'],
-            'start_time': task['start_time'],
-            'end_time': task['end_time'],
-            'list_id': task['list_id'],
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at'],
-            'completed_at': task['completed_at'],
-            'is_important': bool(task['is_important'])
-        })
+    if window:
+        result = expand_task_window(cursor, user_id, columns, fields, tasks, window, list_id, show_completed)
+        conn.close()
+        return serializers.json_response(result)
     
-    return jsonify(result)
+    next_cursor = None
+    if paginate and len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_task_cursor(dict(zip(columns, tasks[-1])))
+    
+    result = serializers.get_plan(tuple(columns), tuple(fields)).rows(tasks)
+    task_recurrence.decorate_tasks(cursor, user_id, result, date.today())
+    conn.close()
+    
+    if paginate:
+        return serializers.json_response({'tasks': result, 'next_cursor': next_cursor})
+    return serializers.json_response(result)
+
+def expand_task_window(cursor, user_id, columns, fields, rows, window, list_id, show_completed):
+    """日期范围查询：普通任务加上重复任务在范围内的每一次（带 occurrence_date），按任务列表的顺序排列"""
+    items = serializers.get_plan(tuple(columns)).rows(rows)
+    occurrences = task_recurrence.occurrences(cursor, user_id, *window)
+    if occurrences:
+        query = f'SELECT {", ".join(columns)} FROM tasks WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))'
+        params = [user_id, json.dumps(sorted({task_id for task_id, _, _ in occurrences}))]
+        if list_id:
+            query += ' AND list_id = ?'
+            params.append(list_id)
+        cursor.execute(query, params)
+        templates = {row['id']: row for row in serializers.get_plan(tuple(columns)).rows(cursor.fetchall())}
+        rules = task_recurrence.load_series(cursor, user_id)
+        for task_id, day, done in occurrences:
+            template = templates.get(task_id)
+            if template is None or (done and not show_completed):
+                continue
+            items.append(dict(template, due_date=day.isoformat(), completed=done,
+                              occurrence_date=day.isoformat(), recurrence=rules[task_id].to_dict()))
+    
+    # 与 api_queries.TASK_ORDER_BY 一致（先按次要键排序，排序是稳定的）
+    items.sort(key=lambda item: (item['created_at'] or '', item['id']), reverse=True)
+    items.sort(key=lambda item: (not item['is_important'], item['due_date'] or ''))
+    extras = ('occurrence_date', 'recurrence')
+    return [{**{field: item[field] for field in fields}, **{key: item[key] for key in extras if key in item}}
+            for item in items]
 
 @app.route('/api/tasks/<int:task_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
@@ -211,38 +352,27 @@ def handle_task(task_id):
     cursor = conn.cursor()
     
     if request.method == 'GET':
-        cursor.execute('''
-            SELECT id, title, description, completed, priority, due_date, 
-                   start_time, end_time, list_id, created_at, updated_at, completed_at, is_important
-            FROM tasks 
-            WHERE id = ? AND user_id = ?
-        ''', (task_id, user_id))
+        cursor = serializers.tuple_cursor(conn)
+        cursor.execute(api_queries.TASK_BY_ID_SQL, (task_id, user_id))
         
         task = cursor.fetchone()
+        if task:
+            result = task_recurrence.decorate_tasks(cursor, user_id, [serializers.get_plan(TASK_FIELDS).convert(task)],
+                                                    date.today())[0]
         conn.close()
         
         if task:
-            return jsonify({
-                'id': task['id'],
-                'title': task['title'],
-                'description': task['description'],
-                'completed': bool(task['completed']),
-                'priority': task['priority'],
-                'due_date': task['due_date'],
-                'start_time': task['start_time'],
-                'end_time': task['end_time'],
-                'list_id': task['list_id'],
-                'created_at': task['created_at'],
-                'updated_at': task['updated_at'],
-                'completed_at': task['completed_at'],
-                'is_important': bool(task['is_important'])
-            })
+            return serializers.json_response(result)
         else:
             return jsonify({'error': '任务不存在'}), 404
     
     elif request.method == 'PUT':
         data = request.get_json()
         
+        # 重复任务的日期由规则决定（/api/tasks/<id>/recurrence），忽略 due_date
+        if 'due_date' in data and task_recurrence.get_rule(cursor, user_id, task_id):
+            data = {field: value for field, value in data.items() if field != 'due_date'}
+        
         # 构建更新语句
         update_fields = []
         update_values = []
@@ -276,16 +406,22 @@ def handle_task(task_id):
             WHERE id = ? AND user_id = ?
         ''', update_values)
         
+        updated = cursor.rowcount
         conn.commit()
         conn.close()
         
+        if updated:
+            publish_changes(user_id, task_ids=[task_id])
         return jsonify({'success': True})
     
     elif request.method == 'DELETE':
         cursor.execute('DELETE FROM tasks WHERE id = ? AND user_id = ?', (task_id, user_id))
+        deleted = cursor.rowcount
         conn.commit()
         conn.close()
         
+        if deleted:
+            publish_changes(user_id, deleted_task_ids=[task_id])
         return jsonify({'success': True})
 
 @app.route('/api/tasks', methods=['POST'])
@@ -299,6 +435,15 @@ def create_task():
     if not title:
         return jsonify({'error': '任务标题不能为空'}), 400
     
+    # 重复任务：截止日期作为系列的开始日期
+    rule = None
+    if data.get('recurrence'):
+        try:
+            start = date.fromisoformat(data['due_date']) if data.get('due_date') else date.today()
+            rule = task_recurrence.parse_rule(data['recurrence'], start)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -318,11 +463,91 @@ def create_task():
     ))
     
     task_id = cursor.lastrowid
+    if rule:
+        task_recurrence.set_rule(cursor, user_id, task_id, rule)
     conn.commit()
     conn.close()
     
+    publish_changes(user_id, task_ids=[task_id])
     return jsonify({'id': task_id, 'success': True})
 
+@app.route('/api/tasks/<int:task_id>/recurrence', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+def handle_task_recurrence(task_id):
+    """读取、设置或取消任务的重复规则
+
+    PUT 的请求体为规则对象或 {"rrule": "FREQ=WEEKLY;BYDAY=MO,WE"}；规则只存一行，
+    具体日期在查询时按窗口展开。DELETE 后任务变回普通任务，截止日期为下一次未完成的日期。
+    """
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT due_date FROM tasks WHERE id = ? AND user_id = ?', (task_id, user_id))
+        task = cursor.fetchone()
+        if task is None:
+            return jsonify({'error': '任务不存在'}), 404
+        rule = task_recurrence.get_rule(cursor, user_id, task_id)
+        
+        if request.method == 'GET':
+            return jsonify({'recurrence': rule.to_dict() if rule else None})
+        
+        if request.method == 'DELETE':
+            if not task_recurrence.clear_rule(cursor, user_id, task_id, date.today()):
+                return jsonify({'error': '任务不是重复任务'}), 400
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict) and isinstance(data.get('rrule'), str):
+                data = data['rrule']
+            # 开始日期默认沿用原规则或任务的截止日期（截止日期格式不对时从今天开始）
+            start = rule.start if rule else date.today()
+            if rule is None and task['due_date']:
+                try:
+                    start = date.fromisoformat(task['due_date'][:10])
+                except ValueError:
+                    pass
+            try:
+                rule = task_recurrence.parse_rule(data, start)
+            except task_recurrence.RecurrenceError as e:
+                return jsonify({'error': str(e)}), 400
+            task_recurrence.set_rule(cursor, user_id, task_id, rule)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    publish_changes(user_id, task_ids=[task_id])
+    return jsonify({'success': True, 'recurrence': rule.to_dict() if request.method == 'PUT' else None})
+
+@app.route('/api/tasks/<int:task_id>/occurrences/<occurrence_date>', methods=['PUT', 'DELETE'])
+@login_required
+def handle_task_occurrence(task_id, occurrence_date):
+    """完成（PUT {"completed": true}）、恢复（PUT {"completed": false}）或跳过（DELETE）重复任务的某一次
+
+    只写入一行例外，不会生成系列的其他日期。
+    """
+    user_id = get_current_user_id()
+    try:
+        day = date.fromisoformat(occurrence_date)
+    except ValueError:
+        return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+    if request.method == 'DELETE':
+        status = 'skipped'
+    else:
+        data = request.get_json(silent=True) or {}
+        status = 'done' if data.get('completed', True) else None
+    
+    conn = get_db_connection()
+    try:
+        task_recurrence.set_occurrence(conn.cursor(), user_id, task_id, day, status)
+        conn.commit()
+    except task_recurrence.RecurrenceError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    
+    publish_changes(user_id, task_ids=[task_id])
+    return jsonify({'success': True, 'task_id': task_id, 'occurrence_date': day.isoformat(), 'status': status or 'pending'})
+
 @app.route('/api/task_lists', methods=['POST'])
 @login_required
 def create_task_list():
@@ -338,7 +563,7 @@ def create_task_list():
     cursor = conn.cursor()
     
     # 获取用户最大的排序顺序
-    cursor.execute('SELECT MAX(sort_order) as max_order FROM task_lists WHERE user_id = ?', (user_id,))
+    cursor.execute(api_queries.MAX_LIST_ORDER_SQL, (user_id,))
     max_order = cursor.fetchone()['max_order'] or 0
     
     cursor.execute('''
@@ -356,6 +581,7 @@ def create_task_list():
     conn.commit()
     conn.close()
     
+    publish_changes(user_id, list_ids=[list_id])
     return jsonify({'id': list_id, 'success': True})
 
 @app.route('/api/task_lists/<int:list_id>', methods=['PUT', 'DELETE'])
@@ -389,22 +615,34 @@ def handle_task_list(list_id):
             WHERE id = ? AND user_id = ?
         ''', update_values)
         
+        updated = cursor.rowcount
         conn.commit()
         conn.close()
         
+        if updated:
+            publish_changes(user_id, list_ids=[list_id])
         return jsonify({'success': True})
     
     elif request.method == 'DELETE':
         # 删除列表及其所有任务（只删除当前用户的）
         cursor.execute('DELETE FROM tasks WHERE list_id = ? AND user_id = ?', (list_id, user_id))
         cursor.execute('DELETE FROM task_lists WHERE id = ? AND user_id = ?', (list_id, user_id))
+        deleted = cursor.rowcount
         conn.commit()
         conn.close()
         
+        if deleted:
+            publish_changes(user_id, deleted_list_ids=[list_id])
         return jsonify({'success': True})
 
+# 允许修改的偏好字段
+PREFERENCE_FIELDS = ('theme', 'language', 'accent_color', 'font_size',
+                     'animations_enabled', 'transparency_enabled',
+                     'view_mode', 'show_completed', 'default_list_id')
+
 @app.route('/api/user_preferences', methods=['GET', 'PUT'])
 @login_required
+@versioned_etag()
 def handle_user_preferences():
     """处理当前用户偏好设置"""
     user_id = get_current_user_id()
@@ -457,9 +695,7 @@ def handle_user_preferences():
         update_fields = []
         update_values = []
         
-        for field in ['theme', 'language', 'accent_color', 'font_size', 
-                     'animations_enabled', 'transparency_enabled', 
-                     'view_mode', 'show_completed', 'default_list_id']:
+        for field in PREFERENCE_FIELDS:
             if field in data:
                 update_fields.append(f"{field} = ?")
                 update_values.append(data[field])
@@ -478,52 +714,24 @@ def handle_user_preferences():
         conn.commit()
         conn.close()
         
+        # 偏好设置只推送本次修改的字段，由前端合并
+        event_bus.publish(user_id, 'preferences', {field: data[field] for field in PREFERENCE_FIELDS if field in data})
         return jsonify({'success': True})
 
 @app.route('/api/stats')
 @login_required
+@versioned_etag(scope=lambda: date.today().isoformat())
 def get_stats():
     """获取当前用户的任务统计信息"""
     user_id = get_current_user_id()
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 总任务数
-    cursor.execute('SELECT COUNT(*) as total FROM tasks WHERE user_id = ?', (user_id,))
-    total_tasks = cursor.fetchone()['total']
-    
-    # 已完成任务数
-    cursor.execute('SELECT COUNT(*) as completed FROM tasks WHERE user_id = ? AND completed = 1', (user_id,))
-    completed_tasks = cursor.fetchone()['completed']
-    
-    # 重要任务数
-    cursor.execute('SELECT COUNT(*) as important FROM tasks WHERE user_id = ? AND is_important = 1 AND completed = 0', (user_id,))
-    important_tasks = cursor.fetchone()['important']
-    
-    # 今日到期任务数
-    today = date.today().isoformat()
-    cursor.execute('SELECT COUNT(*) as today_due FROM tasks WHERE user_id = ? AND due_date = ? AND completed = 0', (user_id, today))
-    today_due_tasks = cursor.fetchone()['today_due']
-    
-    # 本周到期任务数
-    cursor.execute('''
-        SELECT COUNT(*) as week_due 
-        FROM tasks 
-        WHERE user_id = ? AND due_date BETWEEN ? AND ? AND completed = 0
-    ''', (user_id, today, date.fromordinal(date.today().toordinal() + 7).isoformat()))
-    week_due_tasks = cursor.fetchone()['week_due']
-    
+    # 统计信息直接读取计数表（O(1)，与任务数量无关）
+    stats = task_stats.get_user_stats(cursor, user_id)
     conn.close()
     
-    return jsonify({
-        'total_tasks': total_tasks,
-        'completed_tasks': completed_tasks,
-        'pending_tasks': total_tasks - completed_tasks,
-        'important_tasks': important_tasks,
-        'today_due_tasks': today_due_tasks,
-        'week_due_tasks': week_due_tasks,
-        'completion_rate': round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
-    })
+    return jsonify(stats)
 
 @app.route('/api/search')
 @login_required
@@ -535,116 +743,78 @@ def search_tasks():
     if not query:
         return jsonify({'error': '缺少搜索查询'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    search_config = load_ai_config().get('features', {}).get('task_search', {})
+    if not isinstance(search_config, Mapping):
+        search_config = {}
     
-    cursor.execute('''
-        SELECT t.id, t.title, t.description, t.completed, t.priority, 
-               t.due_date, t.list_id, tl.name as list_name, tl.icon as list_icon
-        FROM tasks t
-        LEFT JOIN task_lists tl ON t.list_id = tl.id
-        WHERE t.user_id = ? AND (t.title LIKE ? OR t.description LIKE ?)
-        ORDER BY t.is_important DESC, t.due_date ASC
-    ''', (user_id, f'%{query}%', f'%{query}%'))
-    
-    results = cursor.fetchall()
+    conn = get_db_connection()
+    cursor = serializers.tuple_cursor(conn)
+    
+    # 全文检索（bm25排序 + 高亮），fuzzy_search 开启时使用三字组模糊匹配
+    search_results = task_search.search_tasks(
+        cursor, user_id, query,
+        fuzzy=search_config.get('fuzzy_search', False),
+        fields=search_config.get('search_fields', task_search.SEARCHABLE_FIELDS)
+    )
     conn.close()
     
-    search_results = []
-    for result in results:
-        search_results.append({
-            'id': result['id'],
-            'title': result['title'],
-            'description': result['description'],
-            'completed': bool(result['completed']),
-            'priority': result['priority'],
-            'due_date': result['due_date'],
-            'list_id': result['list_id'],
-            'list_name': result['list_name'],
-            'list_icon': result['list_icon']
-        })
-    
-    return jsonify(search_results)
+    return serializers.json_response(search_results)
+
+# 日历相关API：任务按天分组和缓存见 task_calendar.py
+calendar_cache = task_calendar.CalendarCache()
+
+def calendar_response(start_date, days, include_empty=True, keys=('start', 'end')):
+    """读取（或构建并缓存）当前用户的日历数据，ETag 由范围内各周的版本号生成"""
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    try:
+        version, body = calendar_cache.get(conn, user_id, start_date, days, include_empty, keys)
+    finally:
+        conn.close()
+    etag = data_version.make_etag(user_id, version, f'cal-{start_date.isoformat()}-{days}-{int(include_empty)}')
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-# 日历周视图相关API
 @app.route('/api/calendar/week')
 @login_required
 def get_calendar_week():
     """获取当前用户的周视图日历数据"""
-    user_id = get_current_user_id()
     try:
-        # 获取查询参数
-        week_start = request.args.get('week_start')
-        if not week_start:
-            # 默认为本周开始
-            today = date.today()
-            days_since_monday = today.weekday()
-            week_start = (today - timedelta(days=days_since_monday)).isoformat()
-        
-        week_start_date = date.fromisoformat(week_start)
-        week_end_date = week_start_date + timedelta(days=6)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取指定周的用户任务
-        cursor.execute('''
-            SELECT t.id, t.title, t.description, t.completed, t.priority,
-                   t.due_date, t.start_time, t.end_time, t.list_id, t.is_important,
-                   tl.name as list_name, tl.icon as list_icon, tl.color as list_color
-            FROM tasks t
-            LEFT JOIN task_lists tl ON t.list_id = tl.id
-            WHERE t.user_id = ? AND t.due_date BETWEEN ? AND ?
-            ORDER BY t.due_date, t.start_time, t.is_important DESC
-        ''', (user_id, week_start_date.isoformat(), week_end_date.isoformat()))
-        
-        tasks = cursor.fetchall()
-        conn.close()
-        
-        # 构建周数据结构
-        week_data = {
-            'week_start': week_start_date.isoformat(),
-            'week_end': week_end_date.isoformat(),
-            'days': []
-        }
-        
-        # 初始化一周的每一天
-        for i in range(7):
-            current_date = week_start_date + timedelta(days=i)
-            week_data['days'].append({
-                'date': current_date.isoformat(),
-                'day_name': current_date.strftime('%A'),
-                'tasks': []
-            })
-        
-        # 将任务分配到对应的日期
-        for task in tasks:
-            task_date = date.fromisoformat(task['due_date']) if task['due_date'] else None
-            if task_date:
-                day_index = (task_date - week_start_date).days
-                if 0 <= day_index < 7:
-                    task_data = {
-                        'id': task['id'],
-                        'title': task['title'],
-                        'description': task['description'],
-                        'completed': bool(task['completed']),
-                        'priority': task['priority'],
-                        'start_time': task['start_time'],
-                        'end_time': task['end_time'],
-                        'list_id': task['list_id'],
-                        'is_important': bool(task['is_important']),
-                        'list_name': task['list_name'],
-                        'list_icon': task['list_icon'],
-                        'list_color': task['list_color']
-                    }
-                    week_data['days'][day_index]['tasks'].append(task_data)
-        
-        return jsonify(week_data)
+        # 默认为本周开始
+        week_start = request.args.get('week_start') or task_calendar.week_start_of(date.today()).isoformat()
+        start_date, days = task_calendar.parse_range(week_start)
+        return calendar_response(start_date, days, keys=task_calendar.WEEK_KEYS)
         
+    except task_calendar.CalendarRangeError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"获取周视图数据错误: {e}")
         return jsonify({'error': '获取周视图数据失败'}), 500
 
+@app.route('/api/calendar/range')
+@login_required
+def get_calendar_range():
+    """获取当前用户任意日期范围的日历数据（月视图、日程视图），一次查询返回
+
+    参数：start、end（包含）或 days；empty=0 时省略没有任务的天
+    """
+    try:
+        days = request.args.get('days', type=int)
+        start_date, days = task_calendar.parse_range(request.args.get('start'), request.args.get('end'), days)
+        include_empty = request.args.get('empty', '1') != '0'
+        return calendar_response(start_date, days, include_empty)
+        
+    except task_calendar.CalendarRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"获取日历数据错误: {e}")
+        return jsonify({'error': '获取日历数据失败'}), 500
+
 @app.route('/api/tasks/<int:task_id>/time', methods=['PUT'])
 @login_required
 def update_task_time(task_id):
@@ -656,6 +826,11 @@ def update_task_time(task_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        # 重复任务的日期由规则决定，不能拖动单次
+        if task_recurrence.get_rule(cursor, user_id, task_id):
+            conn.close()
+            return jsonify({'error': '重复任务请修改重复规则'}), 400
+        
         # 更新用户任务时间
         cursor.execute('''
             UPDATE tasks 
@@ -670,9 +845,12 @@ def update_task_time(task_id):
             user_id
         ))
         
+        updated = cursor.rowcount
         conn.commit()
         conn.close()
         
+        if updated:
+            publish_changes(user_id, task_ids=[task_id])
         return jsonify({'success': True})
         
     except Exception as e:
@@ -682,149 +860,372 @@ def update_task_time(task_id):
 @app.route('/api/tasks/batch', methods=['POST'])
 @login_required
 def batch_update_tasks():
-    """批量更新当前用户的任务"""
+    """批量创建、更新、删除当前用户的任务（单个事务，返回逐项结果）"""
     user_id = get_current_user_id()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': '请求格式错误'}), 400
+    
+    conn = get_db_connection()
     try:
-        data = request.get_json()
-        updates = data.get('updates', [])
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        success_count = 0
-        for update in updates:
-            task_id = update.get('id')
-            if not task_id:
-                continue
-            
-            # 构建更新字段
-            update_fields = []
-            update_values = []
-            
-            for field in ['title', 'description', 'priority', 'due_date', 
-                         'start_time', 'end_time', 'list_id', 'completed', 'is_important']:
-                if field in update:
-                    update_fields.append(f"{field} = ?")
-                    update_values.append(update[field])
-            
-            if update_fields:
-                update_fields.append("updated_at = ?")
-                update_values.append(datetime.now().isoformat())
-                update_values.append(task_id)
-                update_values.append(user_id)
-                
-                cursor.execute(f'''
-                    UPDATE tasks 
-                    SET {', '.join(update_fields)}
-                    WHERE id = ? AND user_id = ?
-                ''', update_values)
-                success_count += 1
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'updated_count': success_count
-        })
-        
+        result = task_bulk.apply_batch(
+            conn, user_id,
+            creates=data.get('creates', []),
+            updates=data.get('updates', []),
+            deletes=data.get('deletes', [])
+        )
+    except task_bulk.BatchError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"批量更新任务错误: {e}")
         return jsonify({'error': '批量更新失败'}), 500
+    finally:
+        conn.close()
+    
+    publish_changes(
+        user_id,
+        task_ids=[item['id'] for item in result['created'] if item['id'] is not None]
+                 + [item['id'] for item in result['updated'] if item['rowcount']],
+        deleted_task_ids=[item['id'] for item in result['deleted'] if item['rowcount']]
+    )
+    result['success'] = True
+    return jsonify(result)
 
-# AI助手相关API
-# 全局变量存储对话历史
-conversation_history = []
+# 导入导出
+IMPORT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
 
-def load_ai_config():
-    """加载AI配置"""
-    try:
-        with open('ai_config.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            "assistant": {
-                "name": "AI助手",
-                "mode": "smart",
-                "model": "gpt-3.5-turbo",
-                "provider": "openai",
-                "api_key": "",
-                "api_base": "https://api.openai.com/v1",
-                "max_tokens": 500,
-                "temperature": 0.7,
-                "system_prompt": "你是一个专业的任务管理AI助手，帮助用户高效管理他们的待办事项。你的任务是：\n1. 帮助用户创建、编辑和管理任务\n2. 提供任务优先级建议\n3. 协助制定时间管理计划\n4. 回答任务管理相关的问题\n5. 提供提高效率的建议\n\n请用友好、专业的语调回复，回复要简洁有用。如果用户询问任务相关的信息，你可以基于当前的任务数据回答。",
-                "welcome_message": "你好！我是你的AI助手 👋\n我可以帮助你管理任务，比如：\n• 创建新任务\n• 查找特定任务\n• 管理任务优先级\n• 提供任务建议\n\n有什么可以帮助你的吗？",
-                "typing_delay": {"min": 1000, "max": 2000},
-                "timeout": 30,
-                "retries": 3,
-                "stream_response": False,
-                "save_history": True
-            },
-            "features": {
-                "task_creation": True,
-                "task_categorization": True,
-                "priority_suggestion": True,
-                "time_management": True,
-                "task_summary": True
-            },
-            "advanced": {
-                "context_memory": 10,
-                "cache_responses": True,
-                "debug_mode": False,
-                "fallback_to_rules": True
-            }
-        }
+@app.route('/api/export')
+@login_required
+def export_tasks():
+    """流式导出当前用户的列表和任务（NDJSON 或 CSV）"""
+    user_id = get_current_user_id()
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in task_transfer.EXPORT_FORMATS:
+        return jsonify({'error': '不支持的导出格式'}), 400
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"tasks-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    # 生成器每读一批借出一次连接，客户端下载期间不占用连接
+    return Response(
+        stream_with_context(task_transfer.iter_export(db_connection_pool.checkout, user_id, fmt)),
+        mimetype=f'{mimetype}; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
-def add_to_conversation_history(role, content):
-    """添加消息到对话历史"""
-    global conversation_history
-    
-    # 添加新消息
-    conversation_history.append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().isoformat()
-    })
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_tasks():
+    """流式导入任务：上传文件（multipart 的 file 字段）或直接把文件内容作为请求体"""
+    user_id = get_current_user_id()
+    import_id = request.args.get('import_id') or secrets.token_hex(8)
+    if not IMPORT_ID_PATTERN.match(import_id):
+        return jsonify({'error': '无效的导入ID'}), 400
     
-    # 限制历史记录长度
-    config = load_ai_config()
-    max_memory = config.get('advanced', {}).get('context_memory', 10)
+    upload = request.files.get('file')
+    try:
+        fmt = task_transfer.detect_format(request.args.get('format'), upload.filename if upload else None)
+    except task_transfer.ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # 保留系统消息和最近的对话
-    system_messages = [msg for msg in conversation_history if msg["role"] == "system"]
-    user_assistant_messages = [msg for msg in conversation_history if msg["role"] in ["user", "assistant"]]
+    binary_stream = upload.stream if upload else request.stream
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    progress = task_transfer.ImportProgress(import_id, user_id)
+    task_transfer.import_progress.set((user_id, import_id), progress)
     
-    # 只保留最近的用户和助手消息
-    if len(user_assistant_messages) > max_memory:
-        user_assistant_messages = user_assistant_messages[-max_memory:]
+    conn = get_db_connection()
+    try:
+        result = task_transfer.import_tasks(conn, user_id, text_stream, fmt, progress)
+    except Exception as e:
+        print(f"导入任务错误: {e}")
+        return jsonify(dict(progress.to_dict(), error='导入失败')), 500
+    finally:
+        text_stream.detach()
+        conn.close()
+        # 导入（包括中途失败前已提交的批次）可能涉及大量任务和新列表，让前端整体重新加载
+        if progress.imported or progress.lists_created:
+            event_bus.publish(user_id, 'reset', {})
+        if progress.imported:
+            reminder_scheduler.reload_user(user_id)
     
-    # 重新组合历史记录
-    conversation_history = system_messages + user_assistant_messages
+    result['success'] = True
+    return jsonify(result)
 
-def get_conversation_context():
-    """获取对话上下文"""
-    config = load_ai_config()
-    max_memory = config.get('advanced', {}).get('context_memory', 10)
+@app.route('/api/import/<import_id>/progress')
+@login_required
+def get_import_progress(import_id):
+    """查询导入进度（已处理行数、成功/跳过数量）"""
+    progress = task_transfer.import_progress.get((get_current_user_id(), import_id))
+    if progress is None:
+        return jsonify({'error': '导入任务不存在'}), 404
+    return jsonify(progress.to_dict())
+
+# 增量同步：按变更日志游标返回变化的行和删除墓碑，并接受离线期间的修改
+sync_request_count = 0
+
+def _sync_page_limit():
+    try:
+        return min(max(int(request.args.get('limit', task_sync.SYNC_PAGE_SIZE)), 1), task_sync.SYNC_PAGE_MAX)
+    except (TypeError, ValueError):
+        raise task_sync.SyncError('无效的分页参数')
+
+@app.route('/api/sync', methods=['GET', 'POST'])
+@login_required
+def sync_tasks():
+    """增量同步
+
+    GET ?since=<sync_token>&limit=：返回游标之后变化的列表/任务和被删除的ID，
+    has_more 为 true 时用返回的 sync_token 继续请求。
+    POST {"since": ..., "mutations": [...]}：先在一个事务中应用客户端修改（带冲突检测），
+    再返回 since 之后的变化（包括本次修改），一次往返完成上传和下载。
+    """
+    global sync_request_count
+    user_id = get_current_user_id()
+    data = {}
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': '请求格式错误'}), 400
     
-    # 获取最近的对话历史（不包括系统消息）
-    context_messages = [msg for msg in conversation_history if msg["role"] in ["user", "assistant"]]
+    conn = get_db_connection()
+    try:
+        raw_since = data.get('since', request.args.get('since'))
+        since = task_sync.parse_token(raw_since)
+        limit = _sync_page_limit()
+        
+        applied = None
+        if request.method == 'POST':
+            # 没有给出 since 的首次上传不做冲突检测（否则游标 0 之后的每次修改都算冲突），
+            # 单条修改自带 base_token 时仍按它检测
+            base_token = None if raw_since in (None, '') else since
+            applied = task_sync.apply_mutations(conn, user_id, data.get('mutations', []), base_token=base_token)
+        
+        cursor = serializers.tuple_cursor(conn)
+        result = task_sync.get_changes(cursor, user_id, since, limit)
+        
+        # 定期清理过期的删除墓碑
+        sync_request_count += 1
+        if sync_request_count % task_sync.PRUNE_EVERY == 0:
+            pruned = task_sync.prune_tombstones(cursor)
+            conn.commit()
+            if pruned:
+                print(f"已清理 {pruned} 条过期的同步墓碑")
+    except task_sync.SyncError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"同步错误: {e}")
+        return jsonify({'error': '同步失败'}), 500
+    finally:
+        conn.close()
     
-    # 如果历史记录超过限制，只返回最近的消息
-    if len(context_messages) > max_memory:
-        context_messages = context_messages[-max_memory:]
+    if applied:
+        result['results'] = applied['results']
+        publish_changes(user_id, task_ids=applied['task_ids'], deleted_task_ids=applied['deleted_task_ids'],
+                        list_ids=applied['list_ids'], deleted_list_ids=applied['deleted_list_ids'])
+    return serializers.json_response(result)
+
+# 变更推送（SSE）：写入接口提交后把行级变更发布到进程内事件总线，
+# /api/events 按用户推送给所有打开的页面，前端据此直接修改本地数据，不再重新拉取
+event_bus = EventBus()
+EVENT_KEEPALIVE_SECONDS = 15
+# 连接定期结束，浏览器带着 Last-Event-ID 自动重连，不会长期占用工作线程
+EVENT_STREAM_MAX_SECONDS = 300
+EVENT_RETRY_MS = 3000
+# 一次写入涉及的任务超过这个数量时不逐行推送，改为 reset 让前端重新加载
+EVENT_MAX_ROWS = 200
+
+TASK_LIST_FIELDS = ('id', 'name', 'icon', 'color', 'sort_order', 'total_tasks', 'completed_tasks')
+TASK_LIST_COUNTS_SQL = '''
+    SELECT tl.id, IFNULL(s.total, 0), IFNULL(s.completed, 0)
+    FROM task_lists tl
+    LEFT JOIN list_task_stats s ON s.list_id = tl.id
+    WHERE tl.user_id = ?
+'''
+
+def publish_changes(user_id, task_ids=(), deleted_task_ids=(), list_ids=(), deleted_list_ids=()):
+    """在写入提交之后调用：推送变更的任务/列表行和最新统计
+
+    事件依次为 list.upsert、task.upsert、task.delete、list.delete，最后一条 stats
+    （用户统计和各列表计数）。删除列表时其中的任务由前端一并移除。
+    """
+    if task_ids or deleted_task_ids:
+        try:
+            reminder_scheduler.refresh(task_ids, deleted_task_ids)
+        except Exception as e:
+            # 调度器到点时会按数据库中的当前数据再确认一次
+            print(f"更新提醒失败: {e}")
+    if user_id is None or not event_bus.has_channel(user_id):
+        return
+    if len(task_ids) + len(deleted_task_ids) > EVENT_MAX_ROWS:
+        event_bus.publish(user_id, 'reset', {})
+        return
+    
+    conn = db_connection_pool.checkout()
+    try:
+        cursor = serializers.tuple_cursor(conn)
+        if list_ids:
+            cursor.execute('''
+                SELECT tl.id, tl.name, tl.icon, tl.color, tl.sort_order,
+                       IFNULL(s.total, 0), IFNULL(s.completed, 0)
+                FROM task_lists tl
+                LEFT JOIN list_task_stats s ON s.list_id = tl.id
+                WHERE tl.user_id = ? AND tl.id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(list(list_ids))))
+            for row in serializers.get_plan(TASK_LIST_FIELDS).rows(cursor.fetchall()):
+                event_bus.publish(user_id, 'list.upsert', row)
+        if task_ids:
+            cursor.execute(f'''
+                SELECT {', '.join(TASK_FIELDS)} FROM tasks
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(list(task_ids))))
+            for row in serializers.get_plan(TASK_FIELDS).rows(cursor.fetchall()):
+                event_bus.publish(user_id, 'task.upsert', row)
+        for task_id in deleted_task_ids:
+            event_bus.publish(user_id, 'task.delete', {'id': task_id})
+        for list_id in deleted_list_ids:
+            event_bus.publish(user_id, 'list.delete', {'id': list_id})
+        
+        cursor.execute(TASK_LIST_COUNTS_SQL, (user_id,))
+        lists = [{'id': list_id, 'total_tasks': total, 'completed_tasks': completed}
+                 for list_id, total, completed in cursor.fetchall()]
+        stats = task_stats.get_user_stats(conn.cursor(), user_id)
+        event_bus.publish(user_id, 'stats', {'stats': stats, 'lists': lists})
+    except Exception as e:
+        # 推送失败不影响已经提交的写入，前端重连后会收到 reset
+        print(f"推送变更失败: {e}")
+    finally:
+        conn.close()
+
+# 截止日期提醒：后台线程按提醒时间的最小堆调度，到点后通过事件总线推送 reminder 事件
+def publish_reminder(user_id, reminder):
+    event_bus.publish(user_id, 'reminder', reminder)
+
+reminder_scheduler = task_reminders.ReminderScheduler(db_connection_pool.checkout, publish_reminder)
+reminder_scheduler.start()
+
+@app.route('/api/events')
+@login_required
+def change_events():
+    """当前用户的变更事件流（SSE），支持 Last-Event-ID 断点续传"""
+    user_id = get_current_user_id()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
     
-    return context_messages
+    def generate():
+        # 订阅放在生成器里：连接建立前客户端就断开时不会留下订阅
+        subscription = event_bus.subscribe(user_id, last_event_id)
+        deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            while time.monotonic() < deadline:
+                frames = subscription.wait(EVENT_KEEPALIVE_SECONDS)
+                yield ''.join(frames) if frames else ": keepalive\n\n"
+        finally:
+            subscription.close()
+    
+    # 不使用 stream_with_context：流式输出期间不持有请求上下文和数据库连接
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# AI助手相关API
+def default_ai_config():
+    """ai_config.json 不存在时使用的默认AI配置"""
+    return {
+        "assistant": {
+            "name": "AI助手",
+            "mode": "smart",
+            "model": "gpt-3.5-turbo",
+            "provider": "openai",
+            "api_key": "",
+            "api_base": "https://api.openai.com/v1",
+            "max_tokens": 500,
+            "temperature": 0.7,
+            "system_prompt": "你是一个专业的任务管理AI助手，帮助用户高效管理他们的待办事项。你的任务是：\n1. 帮助用户创建、编辑和管理任务\n2. 提供任务优先级建议\n3. 协助制定时间管理计划\n4. 回答任务管理相关的问题\n5. 提供提高效率的建议\n\n请用友好、专业的语调回复，回复要简洁有用。如果用户询问任务相关的信息，你可以基于当前的任务数据回答。",
+            "welcome_message": "你好！我是你的AI助手 👋\n我可以帮助你管理任务，比如：\n• 创建新任务\n• 查找特定任务\n• 管理任务优先级\n• 提供任务建议\n\n有什么可以帮助你的吗？",
+            "typing_delay": {"min": 1000, "max": 2000},
+            "timeout": 30,
+            "retries": 3,
+            "stream_response": False,
+            "save_history": True
+        },
+        "features": {
+            "task_creation": True,
+            "task_categorization": True,
+            "priority_suggestion": True,
+            "time_management": True,
+            "task_summary": True
+        },
+        "advanced": {
+            "context_memory": 10,
+            "cache_responses": True,
+            "cache_ttl": 600,
+            "cache_persist": False,
+            "max_concurrent_requests": 4,
+            "max_queued_requests": 32,
+            "context_token_budget": DEFAULT_TOKEN_BUDGET,
+            "debug_mode": False,
+            "fallback_to_rules": True
+        }
+    }
+
+# AI配置只在文件变化时重新解析，写入为原子替换
+ai_config_store = ConfigStore('ai_config.json', default_factory=default_ai_config)
+
+def load_ai_config():
+    """加载AI配置（只读快照，同一请求内共享同一份）"""
+    if has_request_context():
+        if 'ai_config' not in g:
+            g.ai_config = ai_config_store.snapshot()
+        return g.ai_config
+    return ai_config_store.snapshot()
+
+# 对话历史按用户保存：内存环形缓冲 + 数据库追加写入
+conversation_store = ConversationStore(db_connection_pool.checkout)
+
+def _conversation_settings(user_id):
+    """返回 (用户键, 上下文条数, 是否持久化)；AI接口都需要登录，历史按用户ID隔离"""
+    config = load_ai_config()
+    max_memory = max(int(config.get('advanced', {}).get('context_memory', 10) or 1), 1)
+    return user_id, max_memory, bool(config.get('assistant', {}).get('save_history', True))
 
-def clear_conversation_history():
-    """清空对话历史"""
-    global conversation_history
-    conversation_history = []
+# AI回复缓存（相同问题且任务数据未变化时直接返回）
+ai_response_cache = ResponseCache(db_connection_pool.checkout)
+
+def get_response_cache_key(config, user_message, task_context, user_id):
+    """开启 advanced.cache_responses 时返回缓存键，否则返回 None"""
+    if not config.get('advanced', {}).get('cache_responses'):
+        return None
+    assistant = config['assistant']
+    return make_cache_key(user_id or 0, assistant.get('model'),
+                          assistant.get('temperature'), user_message, task_context)
+
+def _response_cache_options():
+    advanced = load_ai_config().get('advanced', {})
+    return float(advanced.get('cache_ttl', 600)), bool(advanced.get('cache_persist', False))
+
+def add_to_conversation_history(role, content, user_id):
+    """添加消息到用户的对话历史"""
+    user_key, max_memory, persist = _conversation_settings(user_id)
+    conversation_store.append(user_key, role, content, max_memory, persist)
+
+def get_conversation_context(user_id):
+    """获取对话上下文（最近 context_memory 条用户和助手消息）"""
+    user_key, max_memory, persist = _conversation_settings(user_id)
+    return [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in conversation_store.history(user_key, max_memory, persist)
+        if msg["role"] in ("user", "assistant")
+    ]
+
+def clear_conversation_history(user_id):
+    """清空用户的对话历史"""
+    user_key, _, persist = _conversation_settings(user_id)
+    conversation_store.clear(user_key, persist)
 
 def save_ai_config(config):
     """保存AI配置"""
     try:
-        with open('ai_config.json', 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        ai_config_store.save(config)
+        if has_request_context():
+            g.pop('ai_config', None)
         return True
     except Exception as e:
         print(f"保存配置失败: {e}")
@@ -834,7 +1235,7 @@ def save_ai_config(config):
 def handle_ai_config():
     """处理AI配置"""
     if request.method == 'GET':
-        config = load_ai_config()
+        config = thaw(load_ai_config())
         # 隐藏API密钥
         if 'assistant' in config and 'api_key' in config['assistant']:
             config['assistant']['api_key'] = '***' if config['assistant']['api_key'] else ''
@@ -842,19 +1243,16 @@ def handle_ai_config():
     
     elif request.method == 'PUT':
         data = request.get_json()
-        current_config = load_ai_config()
+        original_config = load_ai_config()
+        current_config = thaw(original_config)
         
         # 更新配置
-        if 'assistant' in data:
-            current_config['assistant'].update(data['assistant'])
-        if 'features' in data:
-            current_config['features'].update(data['features'])
-        if 'ui' in data:
-            current_config['ui'].update(data['ui'])
+        for section in ['assistant', 'features', 'ui']:
+            if section in data:
+                current_config.setdefault(section, {}).update(data[section])
         
         # 如果API密钥是***，保持原值不变
         if data.get('assistant', {}).get('api_key') == '***':
-            original_config = load_ai_config()
             current_config['assistant']['api_key'] = original_config['assistant'].get('api_key', '')
         
         if save_ai_config(current_config):
@@ -863,8 +1261,20 @@ def handle_ai_config():
             return jsonify({'error': '保存配置失败'}), 500
 
 @app.route('/api/ai/chat', methods=['POST'])
+@login_required
 def ai_chat():
-    """AI聊天接口"""
+    """AI聊天接口
+
+    大模型调用在后台任务队列中执行，请求线程只做准备工作：
+    - async=true（推荐，前端使用）：立即返回 202 和 job_id。流式输出以 ai.token 事件、
+      最终结果以 ai.job 事件通过 /api/events 推送（与变更推送共用一个连接），
+      也可以轮询 /api/ai/jobs/<job_id>
+    - stream=true 且开启了流式回复：在本请求中转发任务的流式输出（SSE）
+    - 其他：等待任务完成后返回结果（与旧接口一致）
+    后两种方式在整个大模型调用期间占用一个请求线程，同步 worker 部署时应使用 async=true。
+    本地回复和缓存命中不经过队列，直接返回。
+    """
+    user_id = get_current_user_id()
     try:
         data = request.get_json()
         user_message = data.get('message', '').strip()
@@ -876,19 +1286,31 @@ def ai_chat():
         api_key = config['assistant'].get('api_key', '')
         
         # 添加用户消息到历史记录
-        add_to_conversation_history("user", user_message)
+        add_to_conversation_history("user", user_message, user_id)
         
         # 如果没有配置API密钥，使用本地回复
         if not api_key:
-            response = generate_local_response(user_message)
-            add_to_conversation_history("assistant", response)
+            response = generate_local_response(user_message, user_id)
+            add_to_conversation_history("assistant", response, user_id)
             return jsonify({
                 'response': response,
                 'source': 'local'
             })
         
         # 获取当前任务数据作为上下文
-        task_context = get_task_context()
+        task_context = get_task_context(user_id, config)
+        
+        # 相同问题且任务数据未变化时直接返回缓存的回复
+        cache_key = get_response_cache_key(config, user_message, task_context, user_id)
+        if cache_key:
+            _, persist = _response_cache_options()
+            cached_response = ai_response_cache.get(cache_key, persist=persist)
+            if cached_response is not None:
+                add_to_conversation_history("assistant", cached_response, user_id)
+                return jsonify({
+                    'response': cached_response,
+                    'source': 'cache'
+                })
         
         # 构建增强的系统提示，包含AI操作接口说明
         enhanced_system_prompt = config['assistant']['system_prompt'] + f"""
@@ -928,7 +1350,7 @@ def ai_chat():
 - 执行结果会返回给你，你可以基于结果进行后续回复
 - 你可以在一次回复中包含多个指令
 
-**当前任务数据：**
+**当前任务数据（#后的数字是任务ID，可用于 update_task / delete_task）：**
 {task_context}
 
 **重要提醒：**
@@ -946,467 +1368,233 @@ def ai_chat():
         ]
         
         # 添加对话历史（除了系统消息）
-        conversation_context = get_conversation_context()
+        conversation_context = get_conversation_context(user_id)
         messages.extend(conversation_context)
         
-        # 调用OpenAI兼容API
-        response = call_openai_api(messages, config)
-        
-        if response:
-            # 解析AI回复中的操作指令
-            ai_actions = parse_ai_actions(response)
-            action_results = []
-            
-            # 执行AI指令
-            for action in ai_actions:
-                result = execute_ai_action(action)
-                action_results.append(result)
-            
-            # 如果有操作结果，构建包含结果的回复
-            if action_results:
-                # 生成包含操作结果的回复
-                enhanced_response = generate_action_response(response, action_results)
-                add_to_conversation_history("assistant", enhanced_response)
-                return jsonify({
-                    'response': enhanced_response,
-                    'source': 'ai_with_actions',
-                    'actions': action_results
-                })
-            else:
-                # 没有操作指令，正常回复
-                add_to_conversation_history("assistant", response)
-                return jsonify({
-                    'response': response,
-                    'source': 'ai'
-                })
-        else:
-            # API调用失败，降级到本地回复
-            response = generate_local_response(user_message)
-            add_to_conversation_history("assistant", response)
-            return jsonify({
-                'response': response,
-                'source': 'local_fallback'
-            })
+        try:
+            job = submit_ai_chat_job(messages, config, user_message, user_id, cache_key)
+        except ai_jobs.QueueFull:
+            response = '当前请求较多，请稍后再试。'
+            add_to_conversation_history("assistant", response, user_id)
+            return jsonify({'response': response, 'source': 'busy'}), 429
+        
+        if data.get('async'):
+            return jsonify(job.to_dict()), 202
+        
+        # 开启流式回复且浏览器支持时，通过SSE逐段推送
+        if job.stream and data.get('stream'):
+            return Response(
+                iter_ai_job_events(job),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        job.wait()
+        if job.status != 'done':
+            raise RuntimeError(job.error or job.status)
+        return jsonify(job.result)
             
     except Exception as e:
         print(f"AI聊天错误: {e}")
         error_response = '抱歉，我遇到了一些问题。请稍后再试。'
-        add_to_conversation_history("assistant", error_response)
+        add_to_conversation_history("assistant", error_response, user_id)
         return jsonify({
             'response': error_response,
             'source': 'error'
         }), 500
 
-def parse_ai_actions(response):
-    """解析AI回复中的操作指令"""
-    import re
-    import json
-    
-    actions = []
-    
-    # 改进的JSON解析模式，支持嵌套结构
-    # 使用更精确的正则表达式来匹配完整的JSON对象
-    json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*"action"[^{}]*\}'
-    
-    # 首先尝试匹配包含action的JSON
-    matches = re.findall(json_pattern, response, re.DOTALL)
-    
-    # 如果没有找到，尝试更宽松的匹配
-    if not matches:
-        # 查找所有可能的JSON对象
-        json_pattern = r'\{(?:[^{}]|(?R))*\}'
-        matches = re.findall(json_pattern, response, re.DOTALL)
-    
-    for match in matches:
+def ai_provider_key(assistant):
+    """并发限制按提供商 + 接口地址划分"""
+    return f"{assistant.get('provider', 'openai')}:{assistant.get('api_base', '').rstrip('/')}"
+
+def submit_ai_chat_job(messages, config, user_message, user_id, cache_key=None):
+    """把大模型调用提交到后台队列，返回任务对象（排队已满时抛出 ai_jobs.QueueFull）"""
+    assistant = config['assistant']
+    advanced = config.get('advanced', {})
+    return ai_job_queue.submit(
+        user_id,
+        ai_provider_key(assistant),
+        lambda job: run_ai_chat_job(job, messages, config, user_message, cache_key),
+        concurrency=advanced.get('max_concurrent_requests', ai_jobs.DEFAULT_CONCURRENCY),
+        max_queued=advanced.get('max_queued_requests', ai_jobs.DEFAULT_MAX_QUEUED),
+        stream=bool(assistant.get('stream_response'))
+    )
+
+# 流式回复中途断开时附在已收到的部分之后
+AI_INTERRUPTED_NOTE = '\n\n（回复中断，以上内容可能不完整）'
+
+def run_ai_chat_job(job, messages, config, user_message, cache_key=None):
+    """后台线程中执行：调用大模型、执行操作指令、记录历史，返回响应数据
+
+    流式回复时每段输出作为 token 事件推送给正在转发的连接，同时作为临时的 ai.token 事件
+    （不进入补发历史）推送到 /api/events。回复中途断开时只返回已收到的
+    部分（source 为 ai_interrupted），不执行其中的指令，也不写入缓存和对话历史。
+    在应用上下文中运行，异常路径中未归还的数据库连接会在上下文结束时归还。
+    """
+    user_id = job.user_id
+    with app.app_context():
+        started = time.perf_counter()
         try:
-            # 清理可能的空白字符
-            clean_match = match.strip()
-            action_data = json.loads(clean_match)
-            if 'action' in action_data and 'data' in action_data:
-                actions.append(action_data)
-                print(f"成功解析AI指令: {action_data}")  # 调试日志
-        except json.JSONDecodeError as e:
-            print(f"JSON解析失败: {e}, 内容: {match}")  # 调试日志
-            continue
-    
-    print(f"总共解析到 {len(actions)} 个AI指令")  # 调试日志
-    return actions
-
-def execute_ai_action(action):
-    """执行AI操作指令"""
-    try:
-        action_type = action.get('action')
-        data = action.get('data', {})
-        
-        if action_type == 'create_task':
-            return execute_create_task(data)
-        elif action_type == 'create_list':
-            return execute_create_list(data)
-        elif action_type == 'update_task':
-            return execute_update_task(data)
-        elif action_type == 'delete_task':
-            return execute_delete_task(data)
-        elif action_type == 'search_tasks':
-            return execute_search_tasks(data)
-        else:
-            return {
-                'success': False,
-                'error': f'不支持的操作类型: {action_type}',
-                'action': action_type
-            }
+            if job.stream:
+                stream = llm_client.stream_chat_completion(messages, config['assistant'])
+                try:
+                    for content in stream:
+                        job.emit('token', {'content': content})
+                        event_bus.publish(user_id, 'ai.token', {'job_id': job.id, 'content': content}, replay=False)
+                except llm_client.LLMError as e:
+                    print(f"API调用异常: {e}")
+                response = stream.text
+                if response and not stream.completed:
+                    return {'response': response + AI_INTERRUPTED_NOTE, 'source': 'ai_interrupted', 'interrupted': True}
+            else:
+                response = call_openai_api(messages, config)
+            latency_ms = (time.perf_counter() - started) * 1000
             
-    except Exception as e:
-        print(f"执行AI操作失败: {e}")
-        return {
-            'success': False,
-            'error': str(e),
-            'action': action.get('action', 'unknown')
-        }
+            if response:
+                return finish_ai_response(response, user_id, cache_key, latency_ms)
+            
+            # API调用失败，降级到本地回复
+            response = generate_local_response(user_message, user_id)
+            add_to_conversation_history("assistant", response, user_id)
+            return {'response': response, 'source': 'local_fallback'}
+        except Exception as e:
+            print(f"AI聊天错误: {e}")
+            payload = {'response': '抱歉，我遇到了一些问题。请稍后再试。', 'source': 'error'}
+            add_to_conversation_history("assistant", payload['response'], user_id)
+            return payload
 
-def execute_create_task(data):
-    """执行创建任务操作"""
-    try:
-        # 获取当前用户ID
-        if current_user.is_authenticated:
-            user_id = int(current_user.id)
-        else:
-            return {
-                'success': False,
-                'error': '用户未登录',
-                'action': 'create_task'
-            }
-        
-        title = data.get('title', '').strip()
-        if not title:
-            return {
-                'success': False,
-                'error': '任务标题不能为空',
-                'action': 'create_task'
-            }
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 如果指定了列表名称，查找或创建列表
-        list_id = None
-        list_name = data.get('list_name')
-        if list_name:
-            cursor.execute('SELECT id FROM task_lists WHERE name = ? AND user_id = ?', (list_name, user_id))
-            result = cursor.fetchone()
-            if result:
-                list_id = result['id']
-            else:
-                # 创建新列表
-                cursor.execute('''
-                    INSERT INTO task_lists (name, icon, color, sort_order, user_id)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    list_name,
-                    data.get('icon', '📋'),
-                    data.get('color', '#0078d4'),
-                    999,
-                    user_id
-                ))
-                list_id = cursor.lastrowid
-        
-        # 如果没有指定列表，使用用户的默认列表
-        if not list_id:
-            cursor.execute('SELECT id FROM task_lists WHERE user_id = ? ORDER BY sort_order LIMIT 1', (user_id,))
-            result = cursor.fetchone()
-            list_id = result['id'] if result else None
-        
-        # 如果仍然没有列表，创建一个默认列表
-        if not list_id:
-            cursor.execute('''
-                INSERT INTO task_lists (name, icon, color, sort_order, user_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', ('默认列表', '📋', '#0078d4', 0, user_id))
-            list_id = cursor.lastrowid
-        
-        # 创建任务
-        cursor.execute('''
-            INSERT INTO tasks (title, description, priority, due_date, start_time, end_time, list_id, is_important, user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            title,
-            data.get('description', ''),
-            data.get('priority', 'medium'),
-            data.get('due_date'),
-            data.get('start_time'),
-            data.get('end_time'),
-            list_id,
-            data.get('is_important', False),
-            user_id
-        ))
-        
-        task_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return {
-            'success': True,
-            'action': 'create_task',
-            'task_id': task_id,
-            'list_id': list_id,
-            'title': title,
-            'message': f'任务"{title}"创建成功'
-        }
-        
-    except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'action': 'create_task'
-        }
+def publish_ai_job(job):
+    """任务结束后通过变更推送通知前端，页面不需要轮询"""
+    event_bus.publish(job.user_id, 'ai.job', job.to_dict())
 
-def execute_create_list(data):
-    """执行创建列表操作"""
-    try:
-        # 获取当前用户ID
-        if current_user.is_authenticated:
-            user_id = int(current_user.id)
-        else:
-            return {
-                'success': False,
-                'error': '用户未登录',
-                'action': 'create_list'
-            }
-        
-        name = data.get('name', '').strip()
-        if not name:
-            return {
-                'success': False,
-                'error': '列表名称不能为空',
-                'action': 'create_list'
-            }
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取用户最大的排序顺序
-        cursor.execute('SELECT MAX(sort_order) as max_order FROM task_lists WHERE user_id = ?', (user_id,))
-        max_order = cursor.fetchone()['max_order'] or 0
-        
-        cursor.execute('''
-            INSERT INTO task_lists (name, icon, color, sort_order, user_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            name,
-            data.get('icon', '📋'),
-            data.get('color', '#0078d4'),
-            max_order + 1,
-            user_id
-        ))
-        
-        list_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return {
-            'success': True,
-            'action': 'create_list',
-            'list_id': list_id,
-            'name': name,
-            'message': f'列表"{name}"创建成功'
-        }
-        
-    except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'action': 'create_list'
-        }
+# AI请求任务队列（每个提供商独立限制并发）
+ai_job_queue = ai_jobs.JobQueue(on_finish=publish_ai_job)
 
-def execute_update_task(data):
-    """执行更新任务操作"""
-    try:
-        # 获取当前用户ID
-        if current_user.is_authenticated:
-            user_id = int(current_user.id)
-        else:
-            return {
-                'success': False,
-                'error': '用户未登录',
-                'action': 'update_task'
-            }
-        
-        task_id = data.get('task_id')
-        if not task_id:
-            return {
-                'success': False,
-                'error': '任务ID不能为空',
-                'action': 'update_task'
-            }
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 构建更新语句
-        update_fields = []
-        update_values = []
-        
-        for field in ['title', 'description', 'priority', 'due_date', 'start_time', 'end_time', 'list_id', 'is_important']:
-            if field in data:
-                update_fields.append(f"{field} = ?")
-                update_values.append(data[field])
-        
-        if 'completed' in data:
-            update_fields.append("completed = ?")
-            update_values.append(data['completed'])
-            if data['completed']:
-                update_fields.append("completed_at = ?")
-                update_values.append(datetime.now().isoformat())
-            else:
-                update_fields.append("completed_at = ?")
-                update_values.append(None)
-        
-        if not update_fields:
-            return {
-                'success': False,
-                'error': '没有要更新的字段',
-                'action': 'update_task'
-            }
-        
-        update_fields.append("updated_at = ?")
-        update_values.append(datetime.now().isoformat())
-        update_values.append(task_id)
-        update_values.append(user_id)
-        
-        cursor.execute(f'''
-            UPDATE tasks 
-            SET {', '.join(update_fields)}
-            WHERE id = ? AND user_id = ?
-        ''', update_values)
-        
-        conn.commit()
-        conn.close()
-        
-        return {
-            'success': True,
-            'action': 'update_task',
-            'task_id': task_id,
-            'message': f'任务{task_id}更新成功'
-        }
-        
-    except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'action': 'update_task'
-        }
+def iter_ai_job_events(job):
+    """把任务的流式输出转发为SSE：先推送 token 事件，结束后推送 done 事件"""
+    index = 0
+    while True:
+        events, finished = job.wait_events(index, EVENT_KEEPALIVE_SECONDS)
+        for event, data in events:
+            yield sse_message(event, data)
+        index += len(events)
+        if finished and not events:
+            break
+        if not events and not finished:
+            yield ": keepalive\n\n"
+    if job.status == 'done':
+        yield sse_message('done', job.result)
+    else:
+        yield sse_message('done', {'response': '抱歉，我遇到了一些问题。请稍后再试。', 'source': 'error'})
 
-def execute_delete_task(data):
-    """执行删除任务操作"""
-    try:
-        # 获取当前用户ID
-        if current_user.is_authenticated:
-            user_id = int(current_user.id)
-        else:
-            return {
-                'success': False,
-                'error': '用户未登录',
-                'action': 'delete_task'
-            }
-        
-        task_id = data.get('task_id')
-        if not task_id:
-            return {
-                'success': False,
-                'error': '任务ID不能为空',
-                'action': 'delete_task'
-            }
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM tasks WHERE id = ? AND user_id = ?', (task_id, user_id))
-        conn.commit()
-        conn.close()
-        
-        return {
-            'success': True,
-            'action': 'delete_task',
-            'task_id': task_id,
-            'message': f'任务{task_id}删除成功'
-        }
-        
-    except Exception as e:
-        return {
+@app.route('/api/ai/jobs/<job_id>', methods=['GET', 'DELETE'])
+@login_required
+def handle_ai_job(job_id):
+    """查询AI任务状态和结果；DELETE 取消排队中的任务"""
+    job = ai_job_queue.get(job_id, get_current_user_id())
+    if job is None:
+        return jsonify({'error': 'AI任务不存在'}), 404
+    if request.method == 'DELETE':
+        cancelled = ai_job_queue.cancel(job)
+        return jsonify(dict(job.to_dict(), success=cancelled))
+    return jsonify(job.to_dict())
+
+@app.route('/api/ai/jobs/<job_id>/stream')
+@login_required
+def stream_ai_job(job_id):
+    """AI任务的流式输出（SSE），连接晚于输出开始时会从头补发
+
+    输出期间占用一个请求线程；前端改用 /api/events 的 ai.token 事件，
+    这个接口保留给不使用变更推送的客户端。
+    """
+    job = ai_job_queue.get(job_id, get_current_user_id())
+    if job is None:
+        return jsonify({'error': 'AI任务不存在'}), 404
+    return Response(
+        iter_ai_job_events(job),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def finish_ai_response(response, user_id, cache_key=None, latency_ms=0.0):
+    """执行AI回复中的操作指令，记录历史并返回响应数据
+
+    只有不含操作指令的回复才写入缓存，操作必须每次真正执行。
+    """
+    # 解析AI回复中的操作指令
+    parsed = parse_ai_actions(response)
+    
+    # 执行AI指令（整批一个事务）
+    action_results = execute_ai_actions(parsed.actions, user_id)
+    
+    # 格式不符的指令不执行，作为失败结果告知用户
+    for action_type, error in parsed.rejected:
+        action_results.append({
             'success': False,
-            'error': str(e),
-            'action': 'delete_task'
+            'error': f'指令格式错误：{error}',
+            'action': action_type
+        })
+    
+    # 如果有操作结果，构建包含结果的回复
+    if action_results:
+        if cache_key:
+            ai_response_cache.record_bypass()
+        enhanced_response = generate_action_response(parsed.text, action_results)
+        add_to_conversation_history("assistant", enhanced_response, user_id)
+        return {
+            'response': enhanced_response,
+            'source': 'ai_with_actions',
+            'actions': action_results
         }
+    
+    # 没有操作指令，正常回复
+    if cache_key:
+        ttl, persist = _response_cache_options()
+        ai_response_cache.set(cache_key, response, latency_ms, ttl=ttl, persist=persist)
+    add_to_conversation_history("assistant", response, user_id)
+    return {
+        'response': response,
+        'source': 'ai'
+    }
 
-def execute_search_tasks(data):
-    """执行搜索任务操作"""
+def sse_message(event, data):
+    """格式化一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def parse_ai_actions(response):
+    """解析AI回复中的操作指令，返回 ParsedReply（合法指令、去掉指令后的正文、格式错误的指令）"""
+    parsed = ai_actions.parse_reply(response)
+    if parsed.rejected:
+        print(f"AI回复中有 {len(parsed.rejected)} 个格式错误的指令: {[action for action, _ in parsed.rejected]}")
+    return parsed
+
+def execute_ai_actions(actions, user_id):
+    """以指定用户身份执行一次回复中的全部AI操作指令（可在请求之外的后台线程中调用）
+
+    全部指令在一个事务中执行，单条失败只回滚该条；提交后统一推送一次变更。
+    """
+    if not actions:
+        return []
+    if user_id is None:
+        return [{'success': False, 'error': '用户未登录', 'action': action['action']} for action in actions]
+    
+    conn = get_db_connection()
     try:
-        # 获取当前用户ID
-        if current_user.is_authenticated:
-            user_id = int(current_user.id)
-        else:
-            return {
-                'success': False,
-                'error': '用户未登录',
-                'action': 'search_tasks'
-            }
-        
-        query = data.get('query', '').strip()
-        if not query:
-            return {
-                'success': False,
-                'error': '搜索关键词不能为空',
-                'action': 'search_tasks'
-            }
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT t.id, t.title, t.description, t.completed, t.priority, 
-                   t.due_date, t.list_id, tl.name as list_name, tl.icon as list_icon
-            FROM tasks t
-            LEFT JOIN task_lists tl ON t.list_id = tl.id
-            WHERE t.user_id = ? AND (t.title LIKE ? OR t.description LIKE ?)
-            ORDER BY t.is_important DESC, t.due_date ASC
-        ''', (user_id, f'%{query}%', f'%{query}%'))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        tasks = []
-        for result in results:
-            tasks.append({
-                'id': result['id'],
-                'title': result['title'],
-                'description': result['description'],
-                'completed': bool(result['completed']),
-                'priority': result['priority'],
-                'due_date': result['due_date'],
-                'list_id': result['list_id'],
-                'list_name': result['list_name'],
-                'list_icon': result['list_icon']
-            })
-        
-        return {
-            'success': True,
-            'action': 'search_tasks',
-            'query': query,
-            'results': tasks,
-            'count': len(tasks),
-            'message': f'找到{len(tasks)}个相关任务'
-        }
-        
+        outcome = ai_executor.execute_actions(conn, user_id, actions)
     except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'action': 'search_tasks'
-        }
+        print(f"执行AI指令失败: {e}")
+        return [{'success': False, 'error': str(e), 'action': action['action']} for action in actions]
+    finally:
+        conn.close()
+    
+    publish_changes(user_id, task_ids=outcome['task_ids'], deleted_task_ids=outcome['deleted_task_ids'],
+                    list_ids=outcome['list_ids'])
+    return outcome['results']
 
-def generate_action_response(original_response, action_results):
-    """生成包含操作结果的回复"""
+def generate_action_response(clean_response, action_results):
+    """生成包含操作结果的回复（clean_response 为已去掉指令JSON的正文）"""
     if not action_results:
-        return original_response
+        return clean_response
     
     # 统计成功和失败的操作
     successful_actions = [r for r in action_results if r['success']]
@@ -1436,294 +1624,66 @@ def generate_action_response(original_response, action_results):
     # 组合回复
     if response_parts:
         action_summary = '\n'.join(response_parts)
-        # 移除原始回复中的JSON指令
-        clean_response = re.sub(r'\{[^{}]*"action"[^{}]*\}', '', original_response, flags=re.DOTALL)
-        clean_response = clean_response.strip()
         
         if clean_response:
             return f'{clean_response}\n\n{action_summary}'
         else:
             return action_summary
     else:
-        return original_response
+        return clean_response
 
 def call_openai_api(messages, config):
-    """调用OpenAI兼容API"""
+    """调用OpenAI兼容API（连接复用，按配置的超时和重试次数）"""
     try:
-        headers = {
-            'Authorization': f'Bearer {config["assistant"]["api_key"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'model': config['assistant']['model'],
-            'messages': messages,
-            'max_tokens': config['assistant']['max_tokens'],
-            'temperature': config['assistant']['temperature']
-        }
-        
-        response = requests.post(
-            f"{config['assistant']['api_base']}/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        else:
-            print(f"API调用失败: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
+        return llm_client.chat_completion(messages, config['assistant'])
+    except llm_client.LLMError as e:
         print(f"API调用异常: {e}")
         return None
 
-def get_task_context():
-    """获取当前任务数据作为AI上下文"""
+# AI提示中的任务上下文（按用户缓存，数据版本变化后重新构建）
+task_context_builder = TaskContextBuilder()
+
+def get_task_context(user_id, config):
+    """获取用户的任务数据作为AI上下文（长度受 advanced.context_token_budget 限制）"""
+    if user_id is None:
+        return "用户未登录，没有任务数据"
     try:
+        budget = int(config.get('advanced', {}).get('context_token_budget') or DEFAULT_TOKEN_BUDGET)
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取基本统计
-        cursor.execute('SELECT COUNT(*) as total FROM tasks')
-        total_tasks = cursor.fetchone()['total']
-        
-        cursor.execute('SELECT COUNT(*) as completed FROM tasks WHERE completed = 1')
-        completed_tasks = cursor.fetchone()['completed']
-        
-        cursor.execute('SELECT COUNT(*) as important FROM tasks WHERE is_important = 1 AND completed = 0')
-        important_tasks = cursor.fetchone()['important']
-        
-        # 获取最近的任务
-        cursor.execute('''
-            SELECT title, completed, priority, due_date 
-            FROM tasks 
-            ORDER BY created_at DESC 
-            LIMIT 5
-        ''')
-        recent_tasks = cursor.fetchall()
-        
-        conn.close()
-        
-        context = f"总任务数: {total_tasks}, 已完成: {completed_tasks}, 重要待办: {important_tasks}\n"
-        context += "最近任务:\n"
-        for task in recent_tasks:
-            status = "✓" if task['completed'] else "○"
-            priority = task['priority'] or 'medium'
-            due_date = f" (截止: {task['due_date']})" if task['due_date'] else ""
-            context += f"{status} {task['title']} [{priority}]{due_date}\n"
-        
-        return context
+        try:
+            return task_context_builder.get(conn, user_id, budget)
+        finally:
+            conn.close()
         
     except Exception as e:
         print(f"获取任务上下文失败: {e}")
         return "无法获取任务数据"
 
-def parse_task_creation_request(user_message):
-    """解析用户的任务创建请求"""
-    import re
-    
-    # 初始化任务数据
-    task_data = {
-        'title': '',
-        'description': '',
-        'priority': 'medium',
-        'due_date': None,
-        'start_time': None,
-        'end_time': None,
-        'is_important': False,
-        'list_name': None
-    }
-    
-    message = user_message.strip()
-    
-    # 提取任务标题（主要内容）
-    # 常见的任务创建模式
-    patterns = [
-        r'创建[一个]?任务[：:]\s*(.+)',
-        r'新建[一个]?任务[：:]\s*(.+)',
-        r'添加[一个]?任务[：:]\s*(.+)',
-        r'任务[：:]\s*(.+)',
-        r'提醒我?(.+)',
-        r'我需要?(.+)',
-        r'帮我?(.+)',
-        r'(.+)任务',
-    ]
-    
-    title = None
-    for pattern in patterns:
-        match = re.search(pattern, message, re.IGNORECASE)
-        if match:
-            title = match.group(1).strip()
-            break
-    
-    # 如果没有匹配到模式，尝试提取整个消息作为标题
-    if not title:
-        # 过滤掉常见的对话词汇
-        filtered_message = re.sub(r'^(你好|请问|帮我|可以|能否|我想|我要|需要)', '', message).strip()
-        if filtered_message:
-            title = filtered_message
-    
-    if not title:
-        return None
-    
-    task_data['title'] = title
-    
-    # 提取优先级
-    priority_keywords = {
-        '高': ['高', '重要', '紧急', '优先', '马上', '立即', 'urgent', 'important', 'high'],
-        '低': ['低', '不急', '稍后', '有空', 'low', 'later']
-    }
-    
-    for priority, keywords in priority_keywords.items():
-        if any(keyword in message for keyword in keywords):
-            task_data['priority'] = priority
-            break
-    
-    # 提取重要性
-    important_keywords = ['重要', '关键', '核心', '必须', '一定', 'star', 'important']
-    if any(keyword in message for keyword in important_keywords):
-        task_data['is_important'] = True
-    
-    # 提取时间信息
-    from datetime import datetime, date, timedelta
-    
-    # 今天
-    if '今天' in message:
-        task_data['due_date'] = date.today().isoformat()
-    # 明天
-    elif '明天' in message:
-        task_data['due_date'] = (date.today() + timedelta(days=1)).isoformat()
-    # 后天
-    elif '后天' in message:
-        task_data['due_date'] = (date.today() + timedelta(days=2)).isoformat()
-    # 本周
-    elif '本周' in message or '这周' in message:
-        # 找到本周日
-        days_ahead = 6 - date.today().weekday()
-        if days_ahead >= 0:
-            task_data['due_date'] = (date.today() + timedelta(days=days_ahead)).isoformat()
-    # 下周
-    elif '下周' in message:
-        task_data['due_date'] = (date.today() + timedelta(days=7)).isoformat()
-    
-    # 提取具体时间
-    time_patterns = [
-        r'(\d{1,2})[点时](\d{0,2})',
-        r'(\d{1,2}):(\d{2})',
-        r'上午(\d{1,2})[点时](\d{0,2})',
-        r'下午(\d{1,2})[点时](\d{0,2})',
-    ]
-    
-    for pattern in time_patterns:
-        match = re.search(pattern, message)
-        if match:
-            hour = int(match.group(1))
-            minute = int(match.group(2)) if match.group(2) else 0
-            
-            # 处理上午/下午
-            if '下午' in message and hour < 12:
-                hour += 12
-            elif '上午' in message and hour == 12:
-                hour = 0
-            
-            task_data['start_time'] = f"{hour:02d}:{minute:02d}"
-            # 默认持续1小时
-            end_hour = hour + 1
-            task_data['end_time'] = f"{end_hour:02d}:{minute:02d}"
-            break
-    
-    # 提取列表名称
-    list_patterns = [
-        r'在["""]?(.+?)["""]?列表',
-        r'添加到["""]?(.+?)["""]?',
-        r'放到["""]?(.+?)["""]?',
-    ]
-    
-    for pattern in list_patterns:
-        match = re.search(pattern, message)
-        if match:
-            task_data['list_name'] = match.group(1).strip()
-            break
-    
-    return task_data
-
-def create_task_from_parsed_data(task_data):
-    """根据解析的数据创建任务"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 如果指定了列表名称，查找或创建列表
-        list_id = None
-        if task_data.get('list_name'):
-            cursor.execute('SELECT id FROM task_lists WHERE name = ?', (task_data['list_name'],))
-            result = cursor.fetchone()
-            if result:
-                list_id = result['id']
-            else:
-                # 创建新列表
-                cursor.execute('''
-                    INSERT INTO task_lists (name, icon, color, sort_order)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    task_data['list_name'],
-                    '📋',
-                    '#0078d4',
-                    999  # 放在最后
-                ))
-                list_id = cursor.lastrowid
-        
-        # 如果没有指定列表，使用默认列表
-        if not list_id:
-            cursor.execute('SELECT id FROM task_lists ORDER BY sort_order LIMIT 1')
-            result = cursor.fetchone()
-            list_id = result['id'] if result else 1
-        
-        # 创建任务
-        cursor.execute('''
-            INSERT INTO tasks (title, description, priority, due_date, start_time, end_time, list_id, is_important)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            task_data['title'],
-            task_data['description'],
-            task_data['priority'],
-            task_data['due_date'],
-            task_data['start_time'],
-            task_data['end_time'],
-            list_id,
-            task_data['is_important']
-        ))
-        
-        task_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return {
-            'success': True,
-            'task_id': task_id,
-            'list_id': list_id,
-            'task_data': task_data
-        }
-        
-    except Exception as e:
-        print(f"创建任务失败: {e}")
+def create_task_from_parsed_data(task_data, user_id):
+    """根据解析的数据为指定用户创建任务（与AI指令走同一个执行器）"""
+    data = {field: value for field, value in task_data.items() if value is not None}
+    result = execute_ai_actions([{'action': 'create_task', 'data': data}], user_id)[0]
+    if not result['success']:
+        print(f"创建任务失败: {result['error']}")
         return {
             'success': False,
-            'error': str(e)
+            'error': result['error']
         }
+    return {
+        'success': True,
+        'task_id': result['task_id'],
+        'list_id': result['list_id'],
+        'task_data': task_data
+    }
 
-def generate_local_response(user_message):
-    """生成本地回复（当AI不可用时）"""
-    lower_message = user_message.lower()
+def generate_local_response(user_message, user_id):
+    """生成本地回复（当AI不可用时）：按 local_nlu 识别的意图回复，创建意图直接建任务"""
+    parsed = local_nlu.parse(user_message)
+    task_data = parsed.task
     
-    # 尝试解析任务创建请求
-    task_data = parse_task_creation_request(user_message)
-    if task_data:
+    if parsed.intent == 'create' and task_data['title']:
         # 创建任务
-        result = create_task_from_parsed_data(task_data)
+        result = create_task_from_parsed_data(task_data, user_id)
         if result['success']:
             response = f'✅ 任务已创建："{task_data["title"]}"'
             
@@ -1731,7 +1691,9 @@ def generate_local_response(user_message):
             if task_data.get('due_date'):
                 response += f'\n📅 截止日期：{task_data["due_date"]}'
             if task_data.get('start_time'):
-                response += f'\n⏰ 时间：{task_data["start_time"]}'
+                response += f'\n⏰ 时间：{task_data["start_time"]}-{task_data["end_time"]}'
+            if task_data.get('list_name'):
+                response += f'\n📋 列表：{task_data["list_name"]}'
             if task_data.get('priority') != 'medium':
                 priority_text = {'high': '高', 'low': '低'}
                 response += f'\n🔴 优先级：{priority_text.get(task_data["priority"], "中")}'
@@ -1743,36 +1705,31 @@ def generate_local_response(user_message):
         else:
             return f'❌ 创建任务失败：{result.get("error", "未知错误")}'
     
-    # 创建任务相关
-    if any(keyword in lower_message for keyword in ['创建', '新建', '添加', '任务']):
+    # 创建意图但没有提取到标题
+    if parsed.intent == 'create':
         return '好的！我来帮你创建任务。请告诉我任务的详细信息，比如：\n\n• "创建任务：完成项目报告"\n• "明天下午3点开会"\n• "添加重要任务：准备演示文稿"\n\n我可以理解自然语言并自动设置时间和优先级！📝'
     
     # 查找任务相关
-    if any(keyword in lower_message for keyword in ['查找', '搜索', '找']):
+    if parsed.intent == 'search':
         return '我可以帮你查找任务！请使用顶部的搜索框，输入关键词来查找你需要的任务。你可以搜索任务标题或描述内容。🔍'
     
     # 总结相关
-    if any(keyword in lower_message for keyword in ['总结', '统计', '报告']):
+    if parsed.intent == 'summary':
+        if user_id is None:
+            return '请先登录，我才能统计你的任务。'
         try:
             conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) as total FROM tasks')
-            total_tasks = cursor.fetchone()['total']
-            
-            cursor.execute('SELECT COUNT(*) as completed FROM tasks WHERE completed = 1')
-            completed_tasks = cursor.fetchone()['completed']
+            try:
+                stats = task_stats.get_user_stats(conn.cursor(), user_id)
+            finally:
+                conn.close()
             
-            conn.close()
-            
-            completion_rate = round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
-            
-            return f'📊 **任务总结报告**\n\n• 总任务数: {total_tasks}\n• 已完成: {completed_tasks}\n• 待完成: {total_tasks - completed_tasks}\n• 完成率: {completion_rate}%\n\n继续加油！💪'
-        except:
+            return f'📊 **任务总结报告**\n\n• 总任务数: {stats["total_tasks"]}\n• 已完成: {stats["completed_tasks"]}\n• 待完成: {stats["pending_tasks"]}\n• 完成率: {stats["completion_rate"]}%\n\n继续加油！💪'
+        except Exception:
             return '抱歉，无法获取任务统计数据。'
     
     # 问候相关
-    if any(keyword in lower_message for keyword in ['你好', '嗨', '早上好', '下午好', '晚上好']):
+    if parsed.intent == 'greeting':
         hour = datetime.now().hour
         if hour < 12:
             return '早上好！今天有什么任务计划吗？🌟 我可以帮你创建和管理今天的任务。'
@@ -1782,7 +1739,7 @@ def generate_local_response(user_message):
             return '晚上好！今天完成任务了吗？我可以帮你明天的计划。'
     
     # 帮助相关
-    if any(keyword in lower_message for keyword in ['帮助', '怎么用', '功能']):
+    if parsed.intent == 'help':
         return '''我可以帮助你：
 📋 创建、编辑和管理任务
 🔍 查找和搜索任务
@@ -1797,18 +1754,21 @@ def generate_local_response(user_message):
     return '我理解你的需求。虽然我目前使用的是基础回复模式，但我可以帮你管理任务。你可以尝试问我关于创建任务、查找任务或获取任务总结的问题。🤝'
 
 @app.route('/api/ai/history', methods=['GET', 'DELETE'])
+@login_required
 def handle_conversation_history():
     """处理对话历史"""
     if request.method == 'GET':
         # 获取对话历史
+        user_key, max_memory, persist = _conversation_settings(get_current_user_id())
+        history = conversation_store.history(user_key, max_memory, persist)
         return jsonify({
-            'history': conversation_history,
-            'count': len(conversation_history)
+            'history': history,
+            'count': len(history)
         })
     
     elif request.method == 'DELETE':
         # 清空对话历史
-        clear_conversation_history()
+        clear_conversation_history(get_current_user_id())
         return jsonify({
             'success': True,
             'message': '对话历史已清空'
@@ -1922,12 +1882,8 @@ def register():
         ''', (username, email, password_hash, full_name))
         
         user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
         
-        # 创建用户默认偏好设置
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # 创建用户默认偏好设置（与用户记录在同一事务中提交）
         cursor.execute('''
             INSERT INTO user_preferences (user_id, theme, language, accent_color)
             VALUES (?, 'light', 'zh-CN', '#0078d4')
@@ -1972,9 +1928,9 @@ def login():
         ''', (username_or_email, username_or_email))
         
         user_data = cursor.fetchone()
-        conn.close()
         
         if not user_data:
+            conn.close()
             return jsonify({
                 'success': False,
                 'error': '用户名/邮箱或密码错误'
@@ -1982,6 +1938,7 @@ def login():
         
         # 验证密码
         if not bcrypt.checkpw(password.encode('utf-8'), user_data['password_hash'].encode('utf-8')):
+            conn.close()
             return jsonify({
                 'success': False,
                 'error': '用户名/邮箱或密码错误'
@@ -1991,14 +1948,13 @@ def login():
         user = User(user_data)
         login_user(user, remember=remember_me)
         
-        # 更新最后登录时间
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # 更新最后登录时间（复用同一个连接）
         cursor.execute('''
             UPDATE users SET last_login = ? WHERE id = ?
         ''', (datetime.now().isoformat(), user.id))
         conn.commit()
         conn.close()
+        invalidate_user_cache(user.id)
         
         return jsonify({
             'success': True,
@@ -2071,6 +2027,27 @@ def check_auth():
             'authenticated': False
         })
 
+# 系统运行指标
+@app.route('/api/system/metrics')
+@login_required
+def get_system_metrics():
+    """获取系统运行指标（用于容量规划）"""
+    return jsonify({
+        'db_pool': db_connection_pool.stats(),
+        'user_cache': user_cache.stats(),
+        'ai_config': ai_config_store.stats(),
+        'conversations': conversation_store.stats(),
+        'llm_client': llm_client.stats(),
+        'ai_response_cache': ai_response_cache.stats(),
+        'event_bus': event_bus.stats(),
+        'ai_jobs': ai_job_queue.stats(),
+        'task_context': task_context_builder.stats(),
+        'calendar': calendar_cache.stats(),
+        'recurrence': task_recurrence.cache_stats(),
+        'reminders': reminder_scheduler.stats(),
+        'sessions': user_session_store.stats()
+    })
+
 # 登录和注册页面
 @app.route('/login')
 def login_page():
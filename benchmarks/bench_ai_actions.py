@@ -0,0 +1,56 @@
+# 病态输入和常规回复的解析耗时基准：python benchmarks/bench_ai_actions.py（正确性测试见 tests/test_ai_actions.py）
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_actions import ACTION_SCHEMAS, parse_reply
+
+
+def random_action(rng):
+    kind = rng.choice(list(ACTION_SCHEMAS))
+    data = {
+        'create_task': {'title': f'任务{rng.randint(1, 999)} {{"x"}} \\ "q"', 'priority': 'high'},
+        'create_list': {'name': f'列表{rng.randint(1, 99)}'},
+        'update_task': {'task_id': rng.randint(1, 999), 'completed': True},
+        'delete_task': {'task_id': rng.randint(1, 999)},
+        'search_tasks': {'query': '会议 }{'},
+    }[kind]
+    return {'action': kind, 'data': data}
+
+
+rng = random.Random(20240601)
+
+# 病态输入：50KB 与 100KB 的耗时之比应接近 2（线性）
+valid = json.dumps(random_action(rng))
+cases = {
+    '未闭合的左括号': lambda size: '{' * size,
+    '右括号': lambda size: '}' * size,
+    '深层嵌套': lambda size: '{' * (size // 2) + '}' * (size // 2),
+    '未闭合字符串': lambda size: '{"action": "' + '\\"' * (size // 2),
+    '大量无效对象': lambda size: '{"action"}' * (size // 10),
+    '引号噪声后接指令': lambda size: '{ "' * (size // 3) + valid,
+    '大段正文加指令': lambda size: '正文' * (size // 2) + valid,
+    '大量指令': lambda size: ' '.join([valid] * (size // len(valid))),
+}
+for name, build in cases.items():
+    timings = []
+    for size in (50_000, 100_000):
+        text = build(size)
+        started = time.perf_counter()
+        parsed = parse_reply(text)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{name}: 100KB {timings[1]:.1f}ms（50KB {timings[0]:.1f}ms），{len(parsed.actions)} 条指令")
+
+# 常规回复：约2KB正文 + 3条指令
+reply = '好的，我来帮你安排。\n' * 100 + '\n'.join(f'```json\n{json.dumps(random_action(rng), ensure_ascii=False)}\n```'
+                                     for _ in range(3))
+rounds = 2000
+started = time.perf_counter()
+for _ in range(rounds):
+    parse_reply(reply)
+print(f"常规回复 {len(reply)} 字符：每次 {(time.perf_counter() - started) / rounds * 1e6:.0f}µs")
@@ -0,0 +1,60 @@
+# 基准：每条指令单独一个事务（旧实现的提交方式） vs 整批一个事务：python benchmarks/bench_ai_executor.py
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool
+import database
+from ai_executor import execute_actions
+
+work_dir = tempfile.mkdtemp(prefix='ai_executor_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+pool = ConnectionPool('settings.db')
+conn = pool.checkout()
+conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('bench', 'b@example.com', 'x')")
+conn.executemany('INSERT INTO task_lists (name, sort_order, user_id) VALUES (?, ?, 1)',
+                 [(f'列表{i}', i) for i in range(20)])
+conn.commit()
+
+
+def make_plan(round_index, size):
+    actions = []
+    for i in range(size):
+        kind = i % 5
+        if kind == 0:
+            actions.append({'action': 'create_list', 'data': {'name': f'项目{round_index}-{i % 3}'}})
+        elif kind in (1, 2):
+            actions.append({'action': 'create_task', 'data': {'title': f'任务{round_index}-{i}',
+                                                              'list_name': f'列表{i % 20}'}})
+        elif kind == 3:
+            actions.append({'action': 'update_task', 'data': {'task_id': i, 'completed': True}})
+        else:
+            actions.append({'action': 'delete_task', 'data': {'task_id': 10_000 + i}})
+    return actions
+
+
+for size in (20, 50):
+    rounds = 20
+    started = time.perf_counter()
+    for round_index in range(rounds):
+        for action in make_plan(round_index, size):
+            execute_actions(conn, 1, [action])
+    single_ms = (time.perf_counter() - started) * 1000 / rounds
+    started = time.perf_counter()
+    for round_index in range(rounds):
+        outcome = execute_actions(conn, 1, make_plan(rounds + round_index, size))
+    batch_ms = (time.perf_counter() - started) * 1000 / rounds
+    failed = sum(1 for result in outcome['results'] if not result['success'])
+    print(f"{size}条指令：逐条事务 {single_ms:.1f}ms，整批 {batch_ms:.1f}ms（{failed} 条失败已单独回滚）")
+
+conn.close()
+pool.close_all()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
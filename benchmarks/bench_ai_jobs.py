@@ -0,0 +1,228 @@
+# 压测：本地假大模型服务（每次调用固定延迟）+ 固定线程数的WSGI服务器（模拟 gunicorn 同步 worker），
+# 对比同步等待、后台任务、按任务单独连接接收流式输出、通过 /api/events 接收流式输出四种方式下，
+# AI请求进行中 /api/tasks 的响应时间：python benchmarks/bench_ai_jobs.py
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_jobs import FINISHED_STATUSES
+
+LLM_LATENCY = 1.0
+STREAM_TOKENS = 20
+WSGI_WORKERS = 4
+CHATS = 12
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        reply = '收到：' + body['messages'][-1]['content']
+        if body.get('stream'):
+            # 流式回复：总耗时相同，分 STREAM_TOKENS 段输出
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for index in range(STREAM_TOKENS):
+                time.sleep(LLM_LATENCY / STREAM_TOKENS)
+                event = {'choices': [{'delta': {'content': f'{index},'}}]}
+                self.wfile.write(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.close_connection = True
+            return
+        time.sleep(LLM_LATENCY)
+        payload = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': reply}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """固定线程数处理请求，线程都被占用时新请求排队"""
+
+    def __init__(self, *args, workers=WSGI_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+work_dir = tempfile.mkdtemp(prefix='ai_jobs_bench_')
+os.chdir(work_dir)
+import app as todo_app
+
+llm_server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLLMHandler)
+threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+config = todo_app.default_ai_config()
+config['assistant'].update({
+    'api_base': f'http://127.0.0.1:{llm_server.server_port}/v1',
+    'api_key': 'stub',
+    'stream_response': False,
+    'timeout': 10,
+})
+config['advanced'].update({'cache_responses': False, 'max_concurrent_requests': 4})
+with open('ai_config.json', 'w', encoding='utf-8') as f:
+    json.dump(config, f, ensure_ascii=False)
+
+server = PooledWSGIServer('127.0.0.1', 0, todo_app.app, handler=QuietHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base = f'http://127.0.0.1:{server.server_port}'
+login = requests.Session()
+login.post(base + '/api/auth/register', json={'username': 'bench', 'email': 'bench@example.com', 'password': 'bench123'})
+login.post(base + '/api/auth/login', json={'username': 'bench', 'password': 'bench123'})
+
+
+def new_session():
+    session = requests.Session()
+    session.cookies.update(login.cookies)
+    return session
+
+
+class EventListener:
+    """模拟一个打开的页面：一条 /api/events 连接接收本用户所有AI任务的 ai.token 和 ai.job 事件"""
+
+    def __init__(self):
+        self.tokens = {}
+        self.results = {}
+        self.condition = threading.Condition()
+        self.response = new_session().get(base + '/api/events', stream=True, timeout=60)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        event = None
+        try:
+            # 逐字节读取：连接不是分块传输时，按块读取会等凑满整块才返回
+            for line in self.response.iter_lines(chunk_size=1, decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:') and event in ('ai.token', 'ai.job'):
+                    data = json.loads(line[5:])
+                    with self.condition:
+                        if event == 'ai.token':
+                            self.tokens[data['job_id']] = self.tokens.get(data['job_id'], 0) + 1
+                        elif data['status'] in FINISHED_STATUSES:
+                            self.results[data['job_id']] = data
+                        self.condition.notify_all()
+        except requests.RequestException:
+            pass
+
+    def wait(self, job_id):
+        with self.condition:
+            self.condition.wait_for(lambda: job_id in self.results, 60)
+            return self.results.get(job_id), self.tokens.get(job_id, 0)
+
+    def close(self):
+        self.response.close()
+
+
+def chat(index, mode, listener=None):
+    """返回 (回复来源, 收到的流式输出段数)"""
+    session = new_session()
+    response = session.post(base + '/api/ai/chat', json={'message': f'第{index}个问题', 'async': mode != 'sync'},
+                            timeout=60)
+    if response.status_code != 202:
+        return response.json().get('source'), 0
+    job_id = response.json()['job_id']
+    if mode == 'stream_job':
+        # 每个回复单独一条SSE连接，输出期间占用一个WSGI线程
+        tokens = 0
+        result = {}
+        with session.get(f'{base}/api/ai/jobs/{job_id}/stream', stream=True, timeout=60) as stream:
+            event = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    tokens += event == 'token'
+                    if event == 'done':
+                        result = json.loads(line[5:])
+        return result.get('source'), tokens
+    if mode == 'stream_events':
+        job, tokens = listener.wait(job_id)
+        return ((job or {}).get('result') or {}).get('source'), tokens
+    while True:
+        time.sleep(0.2)
+        job = session.get(f'{base}/api/ai/jobs/{job_id}', timeout=60).json()
+        if job['status'] in FINISHED_STATUSES:
+            return (job.get('result') or {}).get('source'), 0
+
+
+def run(mode):
+    config['assistant']['stream_response'] = mode.startswith('stream')
+    todo_app.save_ai_config(config)
+    listener = EventListener() if mode == 'stream_events' else None
+    latencies = []
+    results = []
+    stop = threading.Event()
+
+    def probe():
+        session = new_session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            session.get(base + '/api/tasks', timeout=60)
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.05)
+
+    probe_thread = threading.Thread(target=probe)
+    probe_thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CHATS) as clients:
+        results.extend(clients.map(lambda i: chat(i, mode, listener), range(CHATS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe_thread.join()
+    if listener is not None:
+        listener.close()
+    latencies.sort()
+    names = {'sync': '同步等待', 'async': '后台任务', 'stream_job': '流式/任务连接', 'stream_events': '流式/变更推送'}
+    tokens = sum(count for _, count in results)
+    print(f"{names[mode]}: {CHATS}个AI请求耗时 {elapsed:.1f}s，来源 {set(source for source, _ in results)}，"
+          f"流式输出 {tokens} 段；/api/tasks {len(latencies)}次 p50 {statistics.median(latencies):.0f}ms "
+          f"p95 {latencies[int((len(latencies) - 1) * 0.95)]:.0f}ms 最大 {latencies[-1]:.0f}ms")
+
+
+print(f"大模型延迟 {LLM_LATENCY}s，WSGI线程 {WSGI_WORKERS}，每个提供商并发 4")
+for mode in ('sync', 'async', 'stream_job', 'stream_events'):
+    run(mode)
+print(todo_app.ai_job_queue.stats())
+
+server.shutdown()
+llm_server.shutdown()
+todo_app.ai_job_queue.shutdown()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,58 @@
+# 基准：本地OpenAI兼容桩服务上连续调用的耗时和连接复用：python benchmarks/bench_llm_client.py
+# （重试、超时和流式输出的测试见 tests/test_llm_client.py）
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_client import chat_completion, stats
+
+
+class StubState:
+    connections = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        StubState.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        reply = '收到：' + body['messages'][-1]['content']
+        payload = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': reply}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+assistant = {
+    'api_base': f'http://127.0.0.1:{server.server_port}/v1',
+    'api_key': 'stub',
+    'model': 'stub-model',
+    'max_tokens': 100,
+    'temperature': 0.7,
+    'timeout': 2,
+    'retries': 3,
+}
+messages = [{'role': 'user', 'content': '你好'}]
+
+rounds = 20
+started = time.perf_counter()
+for _ in range(rounds):
+    chat_completion(messages, assistant)
+elapsed = (time.perf_counter() - started) * 1000
+print(f"{rounds}次调用 {elapsed:.1f}ms（每次 {elapsed / rounds:.2f}ms），服务端连接数 {len(StubState.connections)}")
+print(stats())
+server.shutdown()
@@ -0,0 +1,36 @@
+# 解析吞吐量基准：python benchmarks/bench_local_nlu.py（语料的意图和字段测试见 tests/test_local_nlu.py）
+import os
+import sys
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_nlu import parse
+
+TODAY = date(2024, 6, 12)  # 星期三
+MESSAGES = [
+    '创建任务：完成项目报告',
+    '添加重要任务：准备演示文稿',
+    '明天下午3点开会',
+    '提醒我明天早上8点半跑步',
+    '下周三上午10点和客户开会',
+    '六月二十号体检',
+    '今天15:30-16:00面试',
+    '添加到工作列表：写周报',
+    '我需要在周四之前完成设计稿',
+    '帮我找一下关于会议的任务',
+    '总结一下我的任务',
+    '你好',
+    '你有什么功能',
+    'this is nice',
+]
+
+rounds = 200
+started = time.perf_counter()
+for _ in range(rounds):
+    for message in MESSAGES:
+        parse(message, TODAY)
+elapsed = time.perf_counter() - started
+print(f"吞吐量 {rounds * len(MESSAGES) / elapsed:.0f} 条/秒（每条 {elapsed / rounds / len(MESSAGES) * 1e6:.0f}µs）")
@@ -0,0 +1,61 @@
+# 基准：sqlite3.Row + 按名取值 + jsonify 风格序列化 vs 元组行 + 预编译计划 + dumps：python benchmarks/bench_serializers.py
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from flask import Flask, jsonify
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from serializers import get_plan, json_response, orjson
+
+columns = ('id', 'title', 'description', 'completed', 'priority', 'due_date', 'start_time',
+           'end_time', 'list_id', 'created_at', 'updated_at', 'completed_at', 'is_important')
+conn = sqlite3.connect(':memory:')
+conn.execute(f"CREATE TABLE tasks ({', '.join(columns)})")
+conn.executemany(
+    f"INSERT INTO tasks VALUES ({', '.join('?' * len(columns))})",
+    [(i, f'任务标题 {i}', '一些描述文字' * 3, i % 2, 'medium', '2025-01-01', '09:00', '10:00',
+      i % 5, '2025-01-01 08:00:00', '2025-01-01 08:00:00', None, i % 3 == 0) for i in range(5000)]
+)
+query = f"SELECT {', '.join(columns)} FROM tasks"
+app = Flask(__name__)
+
+
+def old_path():
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(query).fetchall()
+    result = []
+    for task in rows:
+        item = {field: task[field] for field in columns}
+        for field in ('completed', 'is_important'):
+            item[field] = bool(item[field])
+        result.append(item)
+    with app.app_context():
+        return jsonify(result).get_data()
+
+
+def new_path():
+    conn.row_factory = None
+    rows = conn.execute(query).fetchall()
+    return json_response(get_plan(columns).rows(rows)).get_data()
+
+
+def stdlib_path():
+    conn.row_factory = None
+    rows = conn.execute(query).fetchall()
+    return json.dumps(get_plan(columns).rows(rows), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+paths = [('旧实现 (Row + jsonify)', old_path), ('列计划 + 标准库json', stdlib_path)]
+if orjson is not None:
+    paths.append(('列计划 + orjson', new_path))
+for name, path in paths:
+    started = time.perf_counter()
+    for _ in range(20):
+        size = len(path())
+    elapsed = (time.perf_counter() - started) / 20 * 1000
+    print(f"{name:<24} 5000行 {elapsed:7.2f}ms/次  响应 {size / 1024:.0f}KB")
@@ -0,0 +1,77 @@
+# 基准：缓存命中、按令牌查表，以及每请求写 last_activity 与合并写入的对比：python benchmarks/bench_session_store.py
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool
+from ttl_cache import TTLCache
+import database
+from session_store import SESSION_CACHE_TTL, TOUCH_SQL, SessionStore, _timestamp, _utcnow
+
+work_dir = tempfile.mkdtemp(prefix='session_store_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+pool = ConnectionPool('settings.db')
+store = SessionStore(pool.checkout)
+sessions = 10_000
+tokens = [store.create(random.randint(1, 500), {'_user_id': '1', '_fresh': True}) for _ in range(sessions)]
+
+rounds = 20_000
+rng = random.Random(3)
+requests = [rng.choice(tokens[:2000]) for _ in range(rounds)]
+
+started = time.perf_counter()
+for token in requests:
+    store.get(token)
+cached_us = (time.perf_counter() - started) * 1e6 / rounds
+
+store.cache = TTLCache(maxsize=1, ttl=SESSION_CACHE_TTL)
+started = time.perf_counter()
+for token in requests:
+    store.get(token)
+lookup_us = (time.perf_counter() - started) * 1e6 / rounds
+
+store.cache = TTLCache(maxsize=8192, ttl=SESSION_CACHE_TTL)
+for token in requests:
+    store.get(token)
+
+# 每个请求都写 last_activity：一次 UPDATE + 提交
+conn = pool.checkout()
+started = time.perf_counter()
+for token in requests:
+    token_hash, record = store.get(token)
+    moment = _utcnow()
+    conn.execute(TOUCH_SQL, (_timestamp(moment), _timestamp(moment + store.lifetime), token_hash))
+    conn.commit()
+per_request_us = (time.perf_counter() - started) * 1e6 / rounds
+conn.close()
+
+started = time.perf_counter()
+for token in requests:
+    token_hash, record = store.get(token)
+    store.touch(token_hash, record)
+flushed = store.flush()
+batched_us = (time.perf_counter() - started) * 1e6 / rounds
+
+conn = pool.checkout()
+conn.execute("UPDATE user_sessions SET expires_at = '2000-01-01 00:00:00' WHERE id % 2 = 0")
+conn.commit()
+conn.close()
+started = time.perf_counter()
+swept = store.sweep()
+sweep_ms = (time.perf_counter() - started) * 1000
+
+print(f"{sessions} 个会话，{rounds} 次请求：缓存命中 {cached_us:.1f}µs/次，按令牌查表 {lookup_us:.1f}µs/次")
+print(f"读取会话并记录活动：每请求写入 {per_request_us:.1f}µs/次，合并写入 {batched_us:.1f}µs/次（{rounds} 次请求合并为 {flushed} 行）")
+print(f"清理 {swept} 个过期会话 {sweep_ms:.1f}ms")
+print(store.stats())
+pool.close_all()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
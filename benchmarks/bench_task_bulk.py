@@ -0,0 +1,94 @@
+# 吞吐量基准：逐条 f-string UPDATE（旧实现） vs 分组 executemany：python benchmarks/bench_task_bulk.py
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import task_stats
+from task_bulk import UPDATE_FIELDS, apply_batch
+
+
+def setup(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.executescript('''
+        CREATE TABLE task_lists (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, user_id INTEGER);
+        CREATE TABLE tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, description TEXT,
+            completed BOOLEAN DEFAULT 0, priority TEXT DEFAULT 'medium', due_date DATE,
+            start_time TIME, end_time TIME, list_id INTEGER, user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP, is_important BOOLEAN DEFAULT 0
+        );
+        CREATE INDEX idx_tasks_user_list_completed ON tasks (user_id, list_id, completed);
+        INSERT INTO task_lists (name, user_id) VALUES ('默认', 1), ('工作', 1);
+    ''')
+    for sql in task_stats.STATS_TABLES_SQL:
+        conn.execute(sql)
+    for sql in task_stats.get_stats_triggers_sql():
+        conn.execute(sql)
+    conn.executemany(
+        'INSERT INTO tasks (title, list_id, user_id, due_date) VALUES (?, 1, 1, ?)',
+        [(f'任务{i}', f'2025-01-{i % 28 + 1:02d}') for i in range(count)]
+    )
+    conn.commit()
+    return conn
+
+
+def make_updates(count):
+    updates = []
+    for i in range(1, count + 1):
+        if i % 3 == 0:
+            updates.append({'id': i, 'completed': True})
+        elif i % 3 == 1:
+            updates.append({'id': i, 'due_date': '2025-02-01', 'start_time': '09:00', 'end_time': '10:00'})
+        else:
+            updates.append({'id': i, 'list_id': 2, 'is_important': True})
+    return updates
+
+
+def legacy(conn, updates, commit_each=False):
+    cursor = conn.cursor()
+    for update in updates:
+        fields = [f for f in UPDATE_FIELDS if f in update]
+        values = [update[f] for f in fields] + [datetime.now().isoformat(), update['id'], 1]
+        cursor.execute(f"UPDATE tasks SET {', '.join(f + ' = ?' for f in fields)}, updated_at = ? "
+                       f"WHERE id = ? AND user_id = ?", values)
+        if commit_each:
+            conn.commit()
+    conn.commit()
+
+
+for count in (1000, 10000):
+    # “逐项提交”相当于前端对每个任务单独发 PUT /api/tasks/<id>
+    for name, run in (('逐项提交', lambda conn, updates: legacy(conn, updates, commit_each=True)),
+                      ('逐条UPDATE', legacy),
+                      ('executemany', lambda conn, updates: apply_batch(conn, 1, updates=updates))):
+        with tempfile.TemporaryDirectory() as directory:
+            conn = setup(os.path.join(directory, 'bench.db'), count)
+            updates = make_updates(count)
+            started = time.perf_counter()
+            run(conn, updates)
+            elapsed = time.perf_counter() - started
+            conn.close()
+        print(f"{count:>6} 项 {name:<12} {elapsed * 1000:8.1f}ms  {count / elapsed:10.0f} 项/秒")
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = setup(os.path.join(directory, 'bench.db'), count)
+        mixed = {
+            'creates': [{'title': f'新任务{i}'} for i in range(count // 2)],
+            'updates': make_updates(count // 2),
+            'deletes': list(range(count // 2 + 1, count + 1)),
+        }
+        started = time.perf_counter()
+        result = apply_batch(conn, 1, **mixed)
+        elapsed = time.perf_counter() - started
+        conn.close()
+    print(f"{count:>6} 项 混合创建/更新/删除 {elapsed * 1000:8.1f}ms  "
+          f"(创建 {result['created_count']}, 更新 {result['updated_count']}, 删除 {result['deleted_count']})")
@@ -0,0 +1,119 @@
+# 基准：旧的周视图实现 vs SQL分组 vs 缓存命中，以及拖动任务后的失效范围：python benchmarks/bench_task_calendar.py
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool
+import database
+import serializers
+from task_calendar import (TASK_FIELDS, TASK_OUTPUT, WEEK_DAYS, WEEK_KEYS, CalendarCache, build_days, week_start_of)
+
+
+def legacy_week(conn, user_id, week_start_date):
+    cursor = serializers.tuple_cursor(conn)
+    week_end_date = week_start_date + timedelta(days=6)
+    cursor.execute('''
+        SELECT t.id, t.title, t.description, t.completed, t.priority,
+               t.due_date, t.start_time, t.end_time, t.list_id, t.is_important,
+               tl.name, tl.icon, tl.color
+        FROM tasks t
+        LEFT JOIN task_lists tl ON t.list_id = tl.id
+        WHERE t.user_id = ? AND t.due_date BETWEEN ? AND ?
+        ORDER BY t.due_date, t.start_time, t.is_important DESC
+    ''', (user_id, week_start_date.isoformat(), week_end_date.isoformat()))
+    tasks = cursor.fetchall()
+    days = [{'date': (week_start_date + timedelta(days=i)).isoformat(),
+             'day_name': (week_start_date + timedelta(days=i)).strftime('%A'), 'tasks': []} for i in range(7)]
+    plan = serializers.get_plan(TASK_FIELDS, TASK_OUTPUT)
+    due_date_index = plan.index('due_date')
+    for task in tasks:
+        task_date = date.fromisoformat(task[due_date_index]) if task[due_date_index] else None
+        if task_date:
+            day_index = (task_date - week_start_date).days
+            if 0 <= day_index < 7:
+                days[day_index]['tasks'].append(plan.convert(task))
+    return serializers.dumps({'week_start': week_start_date.isoformat(),
+                              'week_end': week_end_date.isoformat(), 'days': days})
+
+
+work_dir = tempfile.mkdtemp(prefix='task_calendar_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+pool = ConnectionPool('settings.db')
+conn = pool.checkout()
+rng = random.Random(11)
+users = 20
+conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                 [(f'u{i}', f'u{i}@example.com', 'x') for i in range(users)])
+conn.executemany('INSERT INTO task_lists (name, user_id) VALUES (?, ?)',
+                 [('任务', user) for user in range(2, users + 2)])
+monday = week_start_of(date.today())
+conn.executemany(
+    'INSERT INTO tasks (title, priority, due_date, start_time, is_important, list_id, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+    [(f'任务{i}', 'medium', (monday + timedelta(days=rng.randint(-180, 180))).isoformat(),
+      f'{rng.randint(0, 23):02d}:00', rng.random() < 0.2, user - 1, user)
+     for i in range(100_000) for user in [rng.randint(2, users + 1)]]
+)
+conn.commit()
+user_id = 2
+calendar_cache = CalendarCache()
+
+rounds = 500
+started = time.perf_counter()
+for _ in range(rounds):
+    legacy_week(conn, user_id, monday)
+legacy_ms = (time.perf_counter() - started) * 1000 / rounds
+
+started = time.perf_counter()
+for _ in range(rounds):
+    build_days(serializers.tuple_cursor(conn), user_id, monday, WEEK_DAYS)
+build_ms = (time.perf_counter() - started) * 1000 / rounds
+
+started = time.perf_counter()
+for _ in range(rounds):
+    calendar_cache.get(conn, user_id, monday, WEEK_DAYS, keys=WEEK_KEYS)
+cached_ms = (time.perf_counter() - started) * 1000 / rounds
+print(f"10万任务/{users}用户，周视图：旧实现 {legacy_ms:.2f}ms，SQL分组 {build_ms:.2f}ms，缓存命中 {cached_ms:.3f}ms")
+
+rounds = 50
+started = time.perf_counter()
+for _ in range(rounds):
+    calendar_cache.cache.clear()
+    month = calendar_cache.get(conn, user_id, monday, 42)[1]
+month_ms = (time.perf_counter() - started) * 1000 / rounds
+started = time.perf_counter()
+for _ in range(rounds):
+    for offset in range(6):
+        legacy_week(conn, user_id, monday + timedelta(days=7 * offset))
+six_weeks_ms = (time.perf_counter() - started) * 1000 / rounds
+print(f"月视图（42天）一次查询 {month_ms:.2f}ms（{len(month) // 1024}KB），逐周请求 6 次 {six_weeks_ms:.2f}ms")
+
+# 拖动：把本周的一个任务挪到下周，只有这两周失效，其他周仍命中缓存
+far_week = monday + timedelta(days=70)
+next_week = monday + timedelta(days=7)
+for week in (monday, next_week, far_week):
+    calendar_cache.get(conn, user_id, week, WEEK_DAYS, keys=WEEK_KEYS)
+task_id = conn.execute('SELECT id FROM tasks WHERE user_id = ? AND due_date = ?',
+                       (user_id, monday.isoformat())).fetchone()[0]
+builds = calendar_cache.stats()['builds']
+conn.execute('UPDATE tasks SET due_date = ?, start_time = ? WHERE id = ?',
+             (next_week.isoformat(), '09:00', task_id))
+conn.execute("UPDATE tasks SET updated_at = '2000-01-01' WHERE id = ?", (task_id,))
+conn.commit()
+for week in (monday, next_week, far_week):
+    calendar_cache.get(conn, user_id, week, WEEK_DAYS, keys=WEEK_KEYS)
+print(f"拖动任务后重建 {calendar_cache.stats()['builds'] - builds} 周（本周和下周），第10周仍命中缓存")
+
+print(calendar_cache.stats())
+conn.close()
+pool.close_all()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,86 @@
+# 基准：旧实现（全表 COUNT + 最近5条） vs 缓存的按用户上下文：python benchmarks/bench_task_context.py
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool
+import database
+from task_context import TaskContextBuilder, estimate_tokens
+
+
+def legacy_context(cursor):
+    cursor.execute('SELECT COUNT(*) FROM tasks')
+    total = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM tasks WHERE completed = 1')
+    completed = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM tasks WHERE is_important = 1 AND completed = 0')
+    important = cursor.fetchone()[0]
+    cursor.execute('SELECT title, completed, priority, due_date FROM tasks ORDER BY created_at DESC LIMIT 5')
+    lines = [f"总任务数: {total}, 已完成: {completed}, 重要待办: {important}\n最近任务:\n"]
+    for title, done, priority, due_date in cursor.fetchall():
+        lines.append(f"{'✓' if done else '○'} {title} [{priority}]{f' (截止: {due_date})' if due_date else ''}\n")
+    return ''.join(lines)
+
+
+work_dir = tempfile.mkdtemp(prefix='task_context_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+pool = ConnectionPool('settings.db')
+conn = pool.checkout()
+rng = random.Random(7)
+users = 50
+conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                 [(f'u{i}', f'u{i}@example.com', 'x') for i in range(users)])
+conn.executemany('INSERT INTO task_lists (name, user_id) VALUES (?, ?)',
+                 [('任务', user) for user in range(2, users + 2)])
+base = date.today()
+conn.executemany(
+    'INSERT INTO tasks (title, completed, priority, due_date, is_important, list_id, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+    [(f'任务{i} ' + '说明' * rng.randint(0, 30), rng.random() < 0.4, rng.choice(('high', 'medium', 'low')),
+      (base + timedelta(days=rng.randint(-10, 60))).isoformat() if rng.random() < 0.6 else None,
+      rng.random() < 0.2, user - 1, user)
+     for i in range(100_000) for user in [rng.randint(2, users + 1)]]
+)
+conn.commit()
+
+builder = TaskContextBuilder()
+cursor = conn.cursor()
+rounds = 200
+started = time.perf_counter()
+for _ in range(rounds):
+    legacy = legacy_context(cursor)
+legacy_ms = (time.perf_counter() - started) * 1000 / rounds
+
+started = time.perf_counter()
+for _ in range(rounds):
+    builder.invalidate(2)
+    context = builder.get(conn, 2)
+build_ms = (time.perf_counter() - started) * 1000 / rounds
+
+started = time.perf_counter()
+for _ in range(rounds):
+    builder.get(conn, 2)
+cached_ms = (time.perf_counter() - started) * 1000 / rounds
+
+print(f"10万任务/{users}用户：旧实现 {legacy_ms:.2f}ms（{estimate_tokens(legacy)} tokens，全部用户的数据）")
+print(f"按用户构建 {build_ms:.2f}ms，缓存命中 {cached_ms:.3f}ms，{estimate_tokens(context)} tokens")
+for budget in (120, 400, 1200):
+    print(f"预算 {budget}: 实际 {estimate_tokens(builder.get(conn, 2, budget))} tokens")
+print(context)
+
+conn.execute('UPDATE tasks SET completed = 1 WHERE user_id = 2 AND id = (SELECT MAX(id) FROM tasks WHERE user_id = 2)')
+conn.commit()
+builder.get(conn, 2)
+print(builder.stats())
+conn.close()
+pool.close_all()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
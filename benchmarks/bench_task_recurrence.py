@@ -0,0 +1,57 @@
+# 基准：逐日判断 vs 直接跳到窗口 vs LRU命中：python benchmarks/bench_task_recurrence.py（正确性测试见 tests/test_task_recurrence.py）
+import calendar
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from task_recurrence import RecurrenceRule, expand_window
+
+
+def naive(rule, window_start, window_end):
+    """从系列开始逐日判断，计数到 count 为止"""
+    result = []
+    index = 0
+    day = rule.start
+    while day <= window_end and (rule.until is None or day <= rule.until):
+        if rule.freq == 'daily':
+            hit = (day - rule.start).days % rule.interval == 0
+        elif rule.freq == 'weekly':
+            weeks = (day - timedelta(days=day.weekday()) - (rule.start - timedelta(days=rule.start.weekday()))).days // 7
+            hit = weeks % rule.interval == 0 and day.weekday() in rule.weekdays
+        else:
+            months = (day.year - rule.start.year) * 12 + day.month - rule.start.month
+            hit = months % rule.interval == 0 and day.day == min(
+                rule.start.day, calendar.monthrange(day.year, day.month)[1])
+        if hit:
+            if rule.count is not None and index >= rule.count:
+                break
+            index += 1
+            if day >= window_start:
+                result.append(day)
+        day += timedelta(days=1)
+    return tuple(result)
+
+
+# 开始于 5 年前的每周任务：逐日判断 vs 直接跳到窗口
+rule = RecurrenceRule('weekly', date.today() - timedelta(days=5 * 365), 1, (0, 2, 4))
+window_start = date.today()
+window_end = window_start + timedelta(days=6)
+rounds = 200
+started = time.perf_counter()
+for _ in range(rounds):
+    naive(rule, window_start, window_end)
+naive_ms = (time.perf_counter() - started) * 1000 / rounds
+started = time.perf_counter()
+for offset in range(rounds):
+    expand_window.__wrapped__(rule.key, window_start + timedelta(days=offset), window_end + timedelta(days=offset))
+jump_ms = (time.perf_counter() - started) * 1000 / rounds
+expand_window.cache_clear()
+started = time.perf_counter()
+for _ in range(rounds):
+    rule.occurrences(window_start, window_end)
+cached_ms = (time.perf_counter() - started) * 1000 / rounds
+print(f"5年前开始的每周一三五任务展开一周：逐日 {naive_ms:.3f}ms，直接跳转 {jump_ms:.4f}ms，LRU命中 {cached_ms:.4f}ms")
@@ -0,0 +1,98 @@
+# 基准：10万条待提醒任务的加载、插入/取消和到点弹出，对比每分钟轮询全表：python benchmarks/bench_task_reminders.py
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool
+import database
+from task_reminders import DEFAULT_REMIND_TIME, LEAD_MINUTES, LOOKAHEAD_DAYS, ReminderScheduler
+
+work_dir = tempfile.mkdtemp(prefix='task_reminders_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+pool = ConnectionPool('settings.db')
+conn = pool.checkout()
+rng = random.Random(11)
+users = 50
+conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                 [(f'u{i}', f'u{i}@example.com', 'x') for i in range(users)])
+start = datetime(2030, 1, 7, 0, 0)
+# 10万条落在提醒窗口内的未完成任务，另有 10万条更晚或已完成的任务
+conn.executemany(
+    'INSERT INTO tasks (title, completed, due_date, start_time, user_id) VALUES (?, ?, ?, ?, ?)',
+    [(f'任务{i}', completed, (start.date() + timedelta(days=days)).isoformat(),
+      f'{rng.randint(0, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}' if rng.random() < 0.7 else None,
+      rng.randint(2, users + 1))
+     for i in range(200_000)
+     for completed, days in [(0, rng.randint(0, LOOKAHEAD_DAYS)) if i < 100_000
+                             else (rng.random() < 0.5, rng.randint(LOOKAHEAD_DAYS + 1, 60))]]
+)
+conn.commit()
+
+clock = [start]
+fired = []
+scheduler = ReminderScheduler(pool.checkout, lambda user_id, payload: fired.append(payload),
+                              clock=lambda: clock[0])
+began = time.perf_counter()
+scheduler._load_ahead(start)
+load_ms = (time.perf_counter() - began) * 1000
+pending = scheduler.stats()['pending']
+
+# 插入和取消各 1万次（堆中约 10万条）
+ops = 10_000
+with scheduler._condition:
+    began = time.perf_counter()
+    for i in range(ops):
+        scheduler._push(1_000_000 + i, start + timedelta(minutes=rng.randint(0, 2880)))
+    push_us = (time.perf_counter() - began) * 1e6 / ops
+    began = time.perf_counter()
+    for i in range(ops):
+        scheduler._cancel(1_000_000 + i)
+    cancel_us = (time.perf_counter() - began) * 1e6 / ops
+
+# 写入路径：改期、完成、删除
+conn.execute("UPDATE tasks SET due_date = ?, start_time = '08:00' WHERE id = 1", ((start.date() + timedelta(days=1)).isoformat(),))
+conn.execute('UPDATE tasks SET completed = 1 WHERE id = 2')
+conn.execute('DELETE FROM tasks WHERE id = 3')
+conn.commit()
+scheduler.refresh([1, 2], [3])
+
+# 旧做法：每分钟扫描一次全表找出到点的提醒
+poll_sql = f'''
+    SELECT id FROM tasks WHERE completed = 0
+    AND datetime(due_date || ' ' || IFNULL(start_time, '{DEFAULT_REMIND_TIME}'),
+                 CASE WHEN start_time IS NULL THEN '+0 minutes' ELSE '-{LEAD_MINUTES} minutes' END)
+        BETWEEN ? AND ?
+'''
+began = time.perf_counter()
+conn.execute(poll_sql, ('2030-01-07 09:00:00', '2030-01-07 09:00:59')).fetchall()
+poll_ms = (time.perf_counter() - began) * 1000
+
+# 按分钟推进一天，弹出并确认到点的提醒
+pop_ms = 0.0
+for minute in range(1, 24 * 60 + 1):
+    clock[0] = start + timedelta(minutes=minute)
+    began = time.perf_counter()
+    with scheduler._condition:
+        due = scheduler._pop_due(clock[0])
+    if due:
+        scheduler._fire(due, clock[0])
+    pop_ms += (time.perf_counter() - began) * 1000
+
+scheduler._load_ahead(clock[0])
+stats = scheduler.stats()
+print(f"加载 {pending} 条提醒（{LOOKAHEAD_DAYS + 1} 天）{load_ms:.0f}ms；插入 {push_us:.2f}µs/次，取消 {cancel_us:.2f}µs/次")
+print(f"旧做法每分钟轮询全表 {poll_ms:.1f}ms（一天 {poll_ms * 1440 / 1000:.1f}s）；堆调度一天 1440 次唤醒共 {pop_ms:.0f}ms，发出 {len(fired)} 条")
+print(stats)
+conn.close()
+pool.close_all()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
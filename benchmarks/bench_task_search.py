@@ -0,0 +1,53 @@
+# 基准：同一用户（300个任务）的搜索耗时随总任务数（1000个用户）的变化：python benchmarks/bench_task_search.py
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+from task_search import search_tasks
+
+words = ['会议', '报告', '买菜', '周报', '项目', '评审', '客户', '电话', '预算', '设计', '测试', '上线', '需求', '文档']
+work_dir = tempfile.mkdtemp(prefix='task_search_bench_')
+os.chdir(work_dir)
+database.init_database()
+database.migrate_database()
+conn = sqlite3.connect('settings.db')
+rng = random.Random(5)
+users = 1000
+conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                 [(f'u{i}', f'u{i}@example.com', 'x') for i in range(users)])
+
+
+def add_tasks(count, user_ids):
+    conn.executemany(
+        'INSERT INTO tasks (title, description, user_id) VALUES (?, ?, ?)',
+        [(''.join(rng.sample(words, 3)), ''.join(rng.sample(words, 6)), rng.choice(user_ids)) for _ in range(count)]
+    )
+    conn.commit()
+
+
+add_tasks(300, [2])
+cursor = conn.cursor()
+queries = ['会议', '报告 预算', '买', '项目评审', '客户电话 需求']
+rounds = 50
+total = 300
+for target in (10_000, 100_000, 200_000):
+    add_tasks(target - total, list(range(3, users + 2)))
+    total = target
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            results = search_tasks(cursor, 2, query)
+        timings.append(f"{query}: {(time.perf_counter() - started) * 1000 / rounds:.2f}ms/{len(results)}条")
+    print(f"总任务数 {total}：" + '，'.join(timings))
+conn.close()
+os.chdir(ROOT)
+shutil.rmtree(work_dir, ignore_errors=True)
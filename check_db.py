@@ -1,6 +1,100 @@
 import sqlite3
+import sys
+import api_queries
+import conversation_store
+import task_calendar
+import task_context
+import task_recurrence
+import task_reminders
+import task_search
+import session_store
+import task_stats
+import task_sync
 
-def check_database():
+def _search_query(table, term, owner):
+    sql, rank_params = task_search.build_search_sql(table, [term])
+    return sql, (task_search.build_match_expression([term], owner=owner), 1, *rank_params, 50)
+
+# API中的热点查询：(名称, SQL, 参数)
+# SQL 与路由使用同一份常量（api_queries 及各功能模块），确保它们都能命中索引
+API_QUERIES = [
+    ('get_task_lists', api_queries.TASK_LISTS_SQL, (1,)),
+    ('get_tasks(list)', api_queries.tasks_query(api_queries.TASK_FIELDS, by_list=True, show_completed=False,
+                                                paginate=True), (1, 1, 51)),
+    ('get_tasks(all, cursor)', api_queries.tasks_query(api_queries.TASK_FIELDS, after_cursor=True, paginate=True),
+     (1, 1, 1, '', '', '2025-01-01', '2025-01-01', 10, 51)),
+    ('get_tasks(window)', api_queries.tasks_query(api_queries.TASK_FIELDS, window=True),
+     (1, '2025-01-01', '2025-01-07')),
+    ('handle_task', api_queries.TASK_BY_ID_SQL, (1, 1)),
+    ('get_stats', task_stats.USER_STATS_SQL, ('2025-01-01', 1, '2025-01-01', '2025-01-08', 1, '2025-01-01', '2025-01-08', 1)),
+    ('search_tasks', *_search_query('tasks_fts', '报告', task_search.owner_token(1))),
+    ('search_tasks(short)', *_search_query('tasks_fts_short', '会', task_search.short_owner_token(1))),
+    ('calendar_range', task_calendar.RANGE_SQL, (1, '2025-01-01', '2025-01-07')),
+    ('calendar_version', task_calendar.VERSION_SQL, (1, '2024-12-30', '2025-01-06')),
+    ('recurrence_series', task_recurrence.ACTIVE_SERIES_SQL, (1,)),
+    ('recurrence_exceptions', task_recurrence.EXCEPTIONS_SQL, (1, '2025-01-01', '2025-01-07')),
+    ('reminders_load_day', task_reminders.LOAD_RANGE_SQL, ('2025-01-01', '2025-01-02')),
+    ('reminders_reload_user', task_reminders.LOAD_USER_SQL, (1, '2025-01-01', '2025-01-04')),
+    ('reminders_due', task_reminders.DUE_SQL, ('[1, 2]',)),
+    ('reminders_reload_user_series', task_reminders.LOAD_USER_SERIES_SQL, (1,)),
+    ('reminders_refresh_series', task_reminders.REFRESH_SERIES_SQL, ('[1, 2]',)),
+    ('reminders_series_exceptions', task_reminders.SERIES_EXCEPTIONS_SQL, ('[1, 2]', '2025-01-01', '2025-01-02')),
+    ('session_lookup', session_store.LOOKUP_SQL, ('0' * 64,)),
+    ('session_touch', session_store.TOUCH_SQL, ('2025-01-01 00:00:00', '2025-02-01 00:00:00', '0' * 64)),
+    ('session_sweep', session_store.SWEEP_SQL, ('2025-01-01 00:00:00', 1000)),
+    ('create_task_list(max_order)', api_queries.MAX_LIST_ORDER_SQL, (1,)),
+    ('load_user', api_queries.LOAD_USER_SQL, (1,)),
+    ('conversation_history', conversation_store.HISTORY_SQL, (1, 10)),
+    ('sync_changes', task_sync.CHANGES_SQL, (1, 0, 501)),
+    ('task_context', task_context.CANDIDATES_SQL, (1, '2099-12-31', 10)),
+]
+
+def query_plan(cursor, sql, params):
+    """返回查询计划每一步的描述"""
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    return [row[3] for row in cursor.fetchall()]
+
+def find_full_scans(details):
+    """查询计划中的全表扫描步骤"""
+    # 子查询产生的临时结果（CO-ROUTINE/MATERIALIZE）和常量行的扫描不算全表扫描
+    virtual = {d.split()[1] for d in details if d.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+    virtual.add('CONSTANT')
+    # 全表扫描表现为 "SCAN tasks"/"SCAN t"，没有 "USING ... INDEX"
+    return [d for d in details if d.startswith('SCAN') and 'INDEX' not in d and d.split()[1] not in virtual]
+
+def check_query_plans(conn):
+    """检查所有API查询的执行计划，返回没有使用索引的查询列表"""
+    cursor = conn.cursor()
+    failures = []
+    
+    for name, sql, params in API_QUERIES:
+        details = query_plan(cursor, sql, params)
+        full_scans = find_full_scans(details)
+        status = '✗ 全表扫描' if full_scans else '✓'
+        print(f"{status} {name}: {' | '.join(details)}")
+        if full_scans:
+            failures.append(name)
+    
+    return failures
+
+def check_task_stats(conn, rebuild=False):
+    """检查统计计数表与tasks表是否一致，rebuild=True 时重建计数"""
+    cursor = conn.cursor()
+    mismatches = task_stats.verify_task_stats(cursor)
+    for kind, key, expected, actual in mismatches:
+        print(f"✗ {kind} {key}: 实际 {expected}, 计数表 {actual}")
+    
+    if mismatches and rebuild:
+        task_stats.rebuild_task_stats(cursor)
+        conn.commit()
+        print("已根据tasks表重建统计计数")
+        return []
+    
+    if not mismatches:
+        print("✓ 统计计数与tasks表一致")
+    return mismatches
+
+def check_database(rebuild_stats=False):
     conn = sqlite3.connect('settings.db')
     cursor = conn.cursor()
     
@@ -29,7 +123,15 @@ def check_database():
     for task in tasks:
         print(f"任务 {task[0]}: {task[1]} -> 列表 {task[2]} ({task[3]})")
     
+    print("\n=== 统计计数检查 ===")
+    mismatches = check_task_stats(conn, rebuild=rebuild_stats)
+    
+    print("\n=== 查询计划检查 ===")
+    failures = check_query_plans(conn)
+    
     conn.close()
+    return not failures and not mismatches
 
 if __name__ == '__main__':
-    check_database()
+    # python check_db.py --rebuild-stats 可在计数不一致时重建
+    sys.exit(0 if check_database(rebuild_stats='--rebuild-stats' in sys.argv) else 1)
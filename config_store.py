@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def freeze(value):
+    """把配置递归转换为只读结构（dict→MappingProxyType，list→tuple）"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """把只读配置递归转换回普通 dict/list，便于修改或序列化"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ConfigStore:
+    """JSON配置文件的内存缓存
+
+    - 读取返回只读快照，所有请求共享同一个对象
+    - 每隔 check_interval 秒最多 stat 一次文件，mtime 或大小变化时重新加载
+    - 写入先写临时文件再原子替换，并由锁保护
+    """
+
+    def __init__(self, path, default_factory=dict, check_interval=1.0):
+        self.path = path
+        self.default_factory = default_factory
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._signature = None
+        self._last_check = 0.0
+        self._loads = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, signature):
+        if signature is None:
+            config = self.default_factory()
+        else:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except (OSError, ValueError) as e:
+                # 文件正在被外部编辑或格式错误时保留上一个有效快照
+                print(f"加载配置失败: {e}")
+                if self._snapshot is not None:
+                    return
+                config = self.default_factory()
+        self._snapshot = freeze(config)
+        self._signature = signature
+        self._loads += 1
+
+    def snapshot(self):
+        """获取当前配置的只读快照"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._last_check < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is None or now - self._last_check >= self.check_interval:
+                signature = self._file_signature()
+                if self._snapshot is None or signature != self._signature:
+                    self._load(signature)
+                self._last_check = now
+            return self._snapshot
+
+    def save(self, config):
+        """原子写入配置并立即更新快照"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(thaw(config), f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if os.path.exists(self.path):
+                    os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._snapshot = freeze(config)
+            self._signature = self._file_signature()
+            self._last_check = time.monotonic()
+
+    def stats(self):
+        return {
+            'loads': self._loads,
+            'check_interval': self.check_interval,
+        }
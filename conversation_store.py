@@ -0,0 +1,150 @@
+import threading
+from collections import deque
+from datetime import datetime
+
+from ttl_cache import TTLCache
+
+CONVERSATION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS ai_conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+CONVERSATION_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_ai_conversations_user ON ai_conversations (user_id, id)'
+
+# 最近的 N 条消息（按 (user_id, id) 索引倒序读取）
+HISTORY_SQL = '''
+    SELECT id, role, content, created_at FROM ai_conversations
+    WHERE user_id = ? ORDER BY id DESC LIMIT ?
+'''
+
+# 数据库中每个用户最多保留 maxlen * PRUNE_FACTOR 条，超过后才清理旧记录
+PRUNE_FACTOR = 4
+# 内存中最多缓存多少个用户的历史，闲置超过 CACHE_TTL 秒的用户也会被淘汰（持久化的历史下次从数据库加载）
+CACHE_USERS = 4096
+CACHE_TTL = 3600
+
+# 第 maxlen * PRUNE_FACTOR + 1 新的消息存在时才需要清理，走 (user_id, id) 索引只看几十行
+_PRUNE_CHECK_SQL = '''
+    SELECT id FROM ai_conversations WHERE user_id = ?
+    ORDER BY id DESC LIMIT 1 OFFSET ?
+'''
+
+
+class _UserHistory:
+    __slots__ = ('messages', 'last_id')
+
+    def __init__(self, maxlen):
+        self.messages = deque(maxlen=maxlen)
+        self.last_id = 0
+
+
+class ConversationStore:
+    """按用户隔离的AI对话历史
+
+    内存中为最近活跃的用户各保留一个 deque(maxlen=context_memory) 环形缓冲（LRU + TTL 淘汰），
+    数据库表只追加写入，某个用户的行数超过保留范围后批量清理旧记录（按数据库中的实际行数判断，
+    服务重启不影响）。其他进程写入的新消息通过比较最大行ID发现，读取时按需重新加载。
+    """
+
+    def __init__(self, connection_factory, cache_users=CACHE_USERS, cache_ttl=CACHE_TTL):
+        self.connection_factory = connection_factory
+        self._users = TTLCache(maxsize=cache_users, ttl=cache_ttl)
+        self._lock = threading.Lock()
+
+    def _load(self, user_id, maxlen):
+        history = _UserHistory(maxlen)
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(HISTORY_SQL, (user_id, maxlen))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        for row in reversed(rows):
+            history.messages.append({'role': row[1], 'content': row[2], 'timestamp': row[3]})
+        history.last_id = rows[0][0] if rows else 0
+        return history
+
+    def _latest_id(self, user_id):
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MAX(id) FROM ai_conversations WHERE user_id = ?', (user_id,))
+            return cursor.fetchone()[0] or 0
+        finally:
+            conn.close()
+
+    def _get_history(self, user_id, maxlen, persist):
+        history = self._users.get(user_id)
+        if history is not None and history.messages.maxlen == maxlen:
+            if not persist or history.last_id == self._latest_id(user_id):
+                return history
+        if persist:
+            history = self._load(user_id, maxlen)
+        elif history is None or history.messages.maxlen != maxlen:
+            old = history.messages if history is not None else ()
+            history = _UserHistory(maxlen)
+            history.messages.extend(old)
+        self._users.set(user_id, history)
+        return history
+
+    def append(self, user_id, role, content, maxlen, persist=True):
+        """追加一条消息"""
+        history = self._get_history(user_id, maxlen, persist)
+        message = {'role': role, 'content': content, 'timestamp': datetime.now().isoformat()}
+
+        if persist:
+            conn = self.connection_factory()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO ai_conversations (user_id, role, content, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, role, content, message['timestamp']))
+                row_id = cursor.lastrowid
+                cursor.execute(_PRUNE_CHECK_SQL, (user_id, maxlen * PRUNE_FACTOR))
+                if cursor.fetchone() is not None:
+                    self._prune(cursor, user_id, maxlen)
+                conn.commit()
+            finally:
+                conn.close()
+            with self._lock:
+                history.messages.append(message)
+                history.last_id = row_id
+        else:
+            with self._lock:
+                history.messages.append(message)
+
+    def _prune(self, cursor, user_id, maxlen):
+        """删除超出保留范围的旧消息（惰性批量执行）"""
+        cursor.execute('''
+            DELETE FROM ai_conversations
+            WHERE user_id = ? AND id < (
+                SELECT id FROM ai_conversations WHERE user_id = ?
+                ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+        ''', (user_id, user_id, maxlen - 1))
+
+    def history(self, user_id, maxlen, persist=True):
+        """返回最近 maxlen 条消息（按时间顺序）"""
+        history = self._get_history(user_id, maxlen, persist)
+        with self._lock:
+            return list(history.messages)
+
+    def clear(self, user_id, persist=True):
+        """清空用户的对话历史"""
+        self._users.invalidate(user_id)
+        if persist:
+            conn = self.connection_factory()
+            try:
+                conn.execute('DELETE FROM ai_conversations WHERE user_id = ?', (user_id,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self):
+        return self._users.stats()
@@ -0,0 +1,70 @@
+# 每个用户一个单调递增的数据版本号，由触发器在任何写入时递增，
+# GET 接口据此生成 ETag，未变化时直接返回 304，不需要查询业务表
+VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS user_data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# 需要跟踪的表（都带有 user_id 列）
+VERSIONED_TABLES = ('tasks', 'task_lists', 'user_preferences')
+
+
+def _bump_sql(row):
+    return f'''
+        INSERT INTO user_data_versions (user_id, version)
+        SELECT {row}.user_id, 1 WHERE {row}.user_id IS NOT NULL
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+    '''
+
+
+def get_table_version_triggers_sql(table):
+    """单个表（带有 user_id 列）的版本号维护触发器"""
+    return [
+        f'DROP TRIGGER IF EXISTS trg_{table}_version_insert',
+        f'DROP TRIGGER IF EXISTS trg_{table}_version_update',
+        f'DROP TRIGGER IF EXISTS trg_{table}_version_delete',
+        f'''
+        CREATE TRIGGER trg_{table}_version_insert AFTER INSERT ON {table} BEGIN
+            {_bump_sql('NEW')}
+        END
+        ''',
+        # 任务被移到其他用户名下时两个用户的版本都要变化
+        f'''
+        CREATE TRIGGER trg_{table}_version_update AFTER UPDATE ON {table} BEGIN
+            {_bump_sql('NEW')}
+            INSERT INTO user_data_versions (user_id, version)
+            SELECT OLD.user_id, 1 WHERE OLD.user_id IS NOT NULL AND OLD.user_id IS NOT NEW.user_id
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER trg_{table}_version_delete AFTER DELETE ON {table} BEGIN
+            {_bump_sql('OLD')}
+        END
+        ''',
+    ]
+
+
+def get_version_triggers_sql():
+    """版本号维护触发器"""
+    statements = []
+    for table in VERSIONED_TABLES:
+        statements.extend(get_table_version_triggers_sql(table))
+    return statements
+
+
+def get_data_version(cursor, user_id):
+    """读取用户当前的数据版本（主键查找）"""
+    cursor.execute('SELECT version FROM user_data_versions WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def make_etag(user_id, version, scope=''):
+    """由用户和数据版本生成弱 ETag；scope 用于区分还依赖其他条件（如当天日期）的响应"""
+    tag = f'{user_id}-{version}'
+    if scope:
+        tag += f'-{scope}'
+    return tag
@@ -1,152 +1,335 @@
 import sqlite3
 import json
 from datetime import datetime, date
+import task_stats
+import task_search
+import conversation_store
+import ai_response_cache
+import data_version
+import task_sync
+import task_calendar
+import task_recurrence
+import task_reminders
+import session_store
 
-def migrate_database():
-    """迁移数据库，添加用户系统支持"""
-    conn = sqlite3.connect('settings.db')
-    cursor = conn.cursor()
+class MigrationDeferred(Exception):
+    """迁移依赖的功能当前不可用：回滚该迁移且不记录版本，下次启动时重试"""
+
+def _migrate_user_system(cursor):
+    """迁移1：添加用户系统支持"""
+    # 检查是否需要创建用户表
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
+    if not cursor.fetchone():
+        # 创建用户表
+        cursor.execute('''
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                full_name TEXT,
+                avatar_url TEXT,
+                is_active BOOLEAN DEFAULT 1,
+                email_verified BOOLEAN DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP
+            )
+        ''')
+        print("创建用户表")
     
-    try:
-        # 检查是否需要创建用户表
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        if not cursor.fetchone():
-            # 创建用户表
+    # 检查tasks表是否有user_id字段
+    cursor.execute("PRAGMA table_info(tasks)")
+    columns = [column[1] for column in cursor.fetchall()]
+    
+    if 'user_id' not in columns:
+        # 添加user_id字段
+        cursor.execute('ALTER TABLE tasks ADD COLUMN user_id INTEGER')
+        print("添加tasks.user_id字段")
+    
+    # 检查task_lists表是否有user_id字段
+    cursor.execute("PRAGMA table_info(task_lists)")
+    columns = [column[1] for column in cursor.fetchall()]
+    
+    if 'user_id' not in columns:
+        # 添加user_id字段
+        cursor.execute('ALTER TABLE task_lists ADD COLUMN user_id INTEGER')
+        print("添加task_lists.user_id字段")
+    
+    # 检查是否有start_time和end_time字段
+    cursor.execute("PRAGMA table_info(tasks)")
+    task_columns = [column[1] for column in cursor.fetchall()]
+    
+    if 'start_time' not in task_columns:
+        cursor.execute('ALTER TABLE tasks ADD COLUMN start_time TIME')
+        cursor.execute('ALTER TABLE tasks ADD COLUMN end_time TIME')
+        print("添加start_time和end_time字段")
+    
+    # 检查user_preferences表是否有user_id字段
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_preferences'")
+    if cursor.fetchone():
+        cursor.execute("PRAGMA table_info(user_preferences)")
+        pref_columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'user_id' not in pref_columns:
+            # 如果表存在但没有user_id字段，需要重建表
+            cursor.execute('ALTER TABLE user_preferences RENAME TO user_preferences_old')
+            print("重命名旧的user_preferences表")
+            
+            # 创建新的user_preferences表
             cursor.execute('''
-                CREATE TABLE users (
+                CREATE TABLE user_preferences (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    full_name TEXT,
-                    avatar_url TEXT,
-                    is_active BOOLEAN DEFAULT 1,
-                    email_verified BOOLEAN DEFAULT 0,
+                    user_id INTEGER UNIQUE NOT NULL,
+                    theme TEXT DEFAULT 'light',
+                    language TEXT DEFAULT 'zh-CN',
+                    accent_color TEXT DEFAULT '#0078d4',
+                    font_size TEXT DEFAULT 'medium',
+                    animations_enabled BOOLEAN DEFAULT 1,
+                    transparency_enabled BOOLEAN DEFAULT 1,
+                    view_mode TEXT DEFAULT 'list',
+                    show_completed BOOLEAN DEFAULT 1,
+                    default_list_id INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP
+                    FOREIGN KEY (user_id) REFERENCES users (id)
                 )
             ''')
-            print("创建用户表")
-        
-        # 检查tasks表是否有user_id字段
-        cursor.execute("PRAGMA table_info(tasks)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'user_id' not in columns:
-            # 添加user_id字段
-            cursor.execute('ALTER TABLE tasks ADD COLUMN user_id INTEGER')
-            print("添加tasks.user_id字段")
-        
-        # 检查task_lists表是否有user_id字段
-        cursor.execute("PRAGMA table_info(task_lists)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'user_id' not in columns:
-            # 添加user_id字段
-            cursor.execute('ALTER TABLE task_lists ADD COLUMN user_id INTEGER')
-            print("添加task_lists.user_id字段")
-        
-        # 检查是否有start_time和end_time字段
-        cursor.execute("PRAGMA table_info(tasks)")
-        task_columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'start_time' not in task_columns:
-            cursor.execute('ALTER TABLE tasks ADD COLUMN start_time TIME')
-            cursor.execute('ALTER TABLE tasks ADD COLUMN end_time TIME')
-            print("添加start_time和end_time字段")
-        
-        # 检查user_preferences表是否有user_id字段
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_preferences'")
-        if cursor.fetchone():
-            cursor.execute("PRAGMA table_info(user_preferences)")
-            pref_columns = [column[1] for column in cursor.fetchall()]
+            print("创建新的user_preferences表")
             
-            if 'user_id' not in pref_columns:
-                # 如果表存在但没有user_id字段，需要重建表
-                cursor.execute('ALTER TABLE user_preferences RENAME TO user_preferences_old')
-                print("重命名旧的user_preferences表")
-                
-                # 创建新的user_preferences表
+            # 如果旧表有数据，尝试迁移（这里简单处理，使用默认用户ID）
+            cursor.execute('SELECT COUNT(*) FROM user_preferences_old')
+            if cursor.fetchone()[0] > 0:
                 cursor.execute('''
-                    CREATE TABLE user_preferences (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER UNIQUE NOT NULL,
-                        theme TEXT DEFAULT 'light',
-                        language TEXT DEFAULT 'zh-CN',
-                        accent_color TEXT DEFAULT '#0078d4',
-                        font_size TEXT DEFAULT 'medium',
-                        animations_enabled BOOLEAN DEFAULT 1,
-                        transparency_enabled BOOLEAN DEFAULT 1,
-                        view_mode TEXT DEFAULT 'list',
-                        show_completed BOOLEAN DEFAULT 1,
-                        default_list_id INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
+                    INSERT INTO user_preferences (user_id, theme, language, accent_color, show_completed)
+                    SELECT 1, theme, language, accent_color, show_completed FROM user_preferences_old LIMIT 1
                 ''')
-                print("创建新的user_preferences表")
-                
-                # 如果旧表有数据，尝试迁移（这里简单处理，使用默认用户ID）
-                cursor.execute('SELECT COUNT(*) FROM user_preferences_old')
-                if cursor.fetchone()[0] > 0:
-                    cursor.execute('''
-                        INSERT INTO user_preferences (user_id, theme, language, accent_color, show_completed)
-                        SELECT 1, theme, language, accent_color, show_completed FROM user_preferences_old LIMIT 1
-                    ''')
-                    print("迁移user_preferences数据")
-                
-                # 删除旧表
-                cursor.execute('DROP TABLE user_preferences_old')
-                print("删除旧的user_preferences表")
-        
-        # 创建默认用户（如果不存在）
-        cursor.execute('SELECT COUNT(*) FROM users')
-        if cursor.fetchone()[0] == 0:
-            import bcrypt
-            default_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash, full_name)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', 'admin@example.com', default_password, '系统管理员'))
-            print("创建默认管理员用户")
-        
-        # 获取默认用户ID
-        cursor.execute('SELECT id FROM users WHERE username = "admin"')
-        default_user = cursor.fetchone()
-        if default_user:
-            user_id = default_user[0]
+                print("迁移user_preferences数据")
             
-            # 更新现有任务数据，关联到默认用户
-            cursor.execute('UPDATE tasks SET user_id = ? WHERE user_id IS NULL', (user_id,))
-            cursor.execute('UPDATE task_lists SET user_id = ? WHERE user_id IS NULL', (user_id,))
-            print(f"将现有数据关联到默认用户 (ID: {user_id})")
+            # 删除旧表
+            cursor.execute('DROP TABLE user_preferences_old')
+            print("删除旧的user_preferences表")
+    
+    # 创建默认用户（如果不存在）
+    cursor.execute('SELECT COUNT(*) FROM users')
+    if cursor.fetchone()[0] == 0:
+        import bcrypt
+        default_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        cursor.execute('''
+            INSERT INTO users (username, email, password_hash, full_name)
+            VALUES (?, ?, ?, ?)
+        ''', ('admin', 'admin@example.com', default_password, '系统管理员'))
+        print("创建默认管理员用户")
+    
+    # 获取默认用户ID
+    cursor.execute('SELECT id FROM users WHERE username = "admin"')
+    default_user = cursor.fetchone()
+    if default_user:
+        user_id = default_user[0]
         
-        # 创建会话表
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_sessions'")
-        if not cursor.fetchone():
-            cursor.execute('''
-                CREATE TABLE user_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    session_token TEXT UNIQUE NOT NULL,
-                    expires_at TIMESTAMP NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    ip_address TEXT,
-                    user_agent TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
+        # 更新现有任务数据，关联到默认用户
+        cursor.execute('UPDATE tasks SET user_id = ? WHERE user_id IS NULL', (user_id,))
+        cursor.execute('UPDATE task_lists SET user_id = ? WHERE user_id IS NULL', (user_id,))
+        print(f"将现有数据关联到默认用户 (ID: {user_id})")
+    
+    # 创建会话表
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_sessions'")
+    if not cursor.fetchone():
+        cursor.execute('''
+            CREATE TABLE user_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                session_token TEXT UNIQUE NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                ip_address TEXT,
+                user_agent TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        print("创建用户会话表")
+
+def _migrate_task_indexes(cursor):
+    """迁移2：为高频查询添加二级索引"""
+    # get_tasks() / get_task_lists() 按用户+列表+完成状态过滤
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_list_completed ON tasks (user_id, list_id, completed)')
+    # get_stats() 按截止日期范围过滤（迁移10由 idx_tasks_user_due_start 取代）
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_due_date ON tasks (user_id, due_date)')
+    # 重要任务统计
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_important_completed ON tasks (user_id, is_important, completed)')
+    # get_task_lists() 中的 LEFT JOIN tasks ON list_id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_list_completed ON tasks (list_id, completed)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_lists_user_sort ON task_lists (user_id, sort_order)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user ON user_sessions (user_id)')
+    cursor.execute('ANALYZE')
+
+def _migrate_task_stats(cursor):
+    """迁移3：添加由触发器维护的任务统计计数表"""
+    for sql in task_stats.STATS_TABLES_SQL:
+        cursor.execute(sql)
+    for sql in task_stats.get_stats_triggers_sql():
+        cursor.execute(sql)
+    task_stats.rebuild_task_stats(cursor)
+
+def _create_search_index(cursor):
+    try:
+        task_search.create_search_index(cursor)
+    except sqlite3.OperationalError as e:
+        # SQLite未编译FTS5时搜索会自动退回LIKE查询，换用支持FTS5的SQLite后重新建立索引
+        raise MigrationDeferred(f"无法创建全文检索索引: {e}") from e
+
+def _migrate_task_search_index(cursor):
+    """迁移4：添加任务全文检索索引（FTS5 trigram）"""
+    _create_search_index(cursor)
+
+def _migrate_task_order_indexes(cursor):
+    """迁移5：按任务列表排序顺序建立索引，支持游标分页直接按索引顺序读取"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_order
+        ON tasks (user_id, is_important DESC, COALESCE(due_date, ''), created_at DESC, id DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_list_order
+        ON tasks (user_id, list_id, is_important DESC, COALESCE(due_date, ''), created_at DESC, id DESC)
+    ''')
+
+def _migrate_ai_conversations(cursor):
+    """迁移6：添加按用户保存的AI对话历史表"""
+    cursor.execute(conversation_store.CONVERSATION_TABLE_SQL)
+    cursor.execute(conversation_store.CONVERSATION_INDEX_SQL)
+
+def _migrate_ai_response_cache(cursor):
+    """迁移7：添加AI回复缓存持久层"""
+    cursor.execute(ai_response_cache.RESPONSE_CACHE_TABLE_SQL)
+    cursor.execute(ai_response_cache.RESPONSE_CACHE_INDEX_SQL)
+
+def _migrate_data_versions(cursor):
+    """迁移8：添加由触发器维护的用户数据版本号（用于ETag）"""
+    cursor.execute(data_version.VERSION_TABLE_SQL)
+    for sql in data_version.get_version_triggers_sql():
+        cursor.execute(sql)
+
+def _migrate_sync_changes(cursor):
+    """迁移9：添加增量同步用的变更日志（含删除墓碑）"""
+    for sql in task_sync.SYNC_TABLES_SQL:
+        cursor.execute(sql)
+    for sql in task_sync.get_sync_triggers_sql():
+        cursor.execute(sql)
+    task_sync.seed_sync_changes(cursor)
+
+def _migrate_calendar(cursor):
+    """迁移10：日历范围查询索引和按周的版本号（日历数据缓存失效用）"""
+    for sql in task_calendar.CALENDAR_INDEX_SQL:
+        cursor.execute(sql)
+    cursor.execute(task_calendar.WEEK_VERSION_TABLE_SQL)
+    for sql in task_calendar.get_calendar_triggers_sql():
+        cursor.execute(sql)
+
+def _migrate_recurrences(cursor):
+    """迁移11：重复任务的规则表和单次例外表（含版本号和日历缓存触发器）"""
+    for sql in task_recurrence.RECURRENCE_TABLES_SQL:
+        cursor.execute(sql)
+    for sql in task_recurrence.get_recurrence_triggers_sql():
+        cursor.execute(sql)
+    for table in ('task_recurrences', 'task_occurrence_exceptions'):
+        for sql in data_version.get_table_version_triggers_sql(table):
+            cursor.execute(sql)
+    for sql in task_calendar.get_recurrence_calendar_triggers_sql():
+        cursor.execute(sql)
+
+def _migrate_reminders(cursor):
+    """迁移12：截止日期提醒调度器按天加载用的部分索引（只含未完成任务）"""
+    cursor.execute(task_reminders.REMINDER_INDEX_SQL)
+
+def _migrate_sessions(cursor):
+    """迁移13：服务端会话（user_sessions 增加会话数据列和过期时间索引，旧的未使用行清空）"""
+    cursor.execute("PRAGMA table_info(user_sessions)")
+    if 'data' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute(session_store.SESSION_COLUMN_SQL)
+    cursor.execute('DELETE FROM user_sessions')
+    cursor.execute(session_store.SESSION_INDEX_SQL)
+
+def _migrate_search_owner(cursor):
+    """迁移14：全文索引按用户划分（owner 列），并为1-2个字符的关键词增加单字/两字组索引"""
+    _create_search_index(cursor)
+
+def _migrate_recurrence_due(cursor):
+    """迁移15：重复任务模板的 due_date 由触发器保持为空"""
+    for sql in task_recurrence.get_recurrence_triggers_sql():
+        cursor.execute(sql)
+    cursor.execute(task_recurrence.CLEAR_TEMPLATE_DUE_SQL)
+
+# 版本化迁移列表：(版本号, 描述, 迁移函数)，新迁移只能追加在末尾
+MIGRATIONS = [
+    (1, '添加用户系统支持', _migrate_user_system),
+    (2, '添加任务查询索引', _migrate_task_indexes),
+    (3, '添加任务统计计数表', _migrate_task_stats),
+    (4, '添加任务全文检索索引', _migrate_task_search_index),
+    (5, '添加任务排序索引', _migrate_task_order_indexes),
+    (6, '添加AI对话历史表', _migrate_ai_conversations),
+    (7, '添加AI回复缓存表', _migrate_ai_response_cache),
+    (8, '添加用户数据版本号', _migrate_data_versions),
+    (9, '添加增量同步变更日志', _migrate_sync_changes),
+    (10, '添加日历索引和周版本号', _migrate_calendar),
+    (11, '添加重复任务', _migrate_recurrences),
+    (12, '添加截止日期提醒索引', _migrate_reminders),
+    (13, '启用服务端会话', _migrate_sessions),
+    (14, '全文索引按用户划分并支持短关键词', _migrate_search_owner),
+    (15, '重复任务模板不保存截止日期', _migrate_recurrence_due),
+]
+
+def get_schema_version(cursor):
+    """获取当前数据库结构版本"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+def get_applied_versions(cursor):
+    """已执行的迁移版本（暂缓的迁移不在其中）"""
+    get_schema_version(cursor)
+    cursor.execute('SELECT version FROM schema_version')
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate_database():
+    """按版本依次执行尚未应用的迁移，每个迁移在独立事务中只执行一次
+
+    暂缓（MigrationDeferred）的迁移整体回滚、不记录版本，后续迁移照常执行，下次启动时再重试。
+    """
+    conn = sqlite3.connect('settings.db', isolation_level=None)
+    cursor = conn.cursor()
+
+    try:
+        applied = get_applied_versions(cursor)
+        for version, description, migration in MIGRATIONS:
+            if version in applied:
+                continue
+
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                migration(cursor)
+                cursor.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (version, description)
                 )
-            ''')
-            print("创建用户会话表")
-        
-        conn.commit()
-        print("数据库迁移完成：添加了用户系统支持")
-            
+                cursor.execute('COMMIT')
+            except MigrationDeferred as e:
+                cursor.execute('ROLLBACK')
+                print(f"数据库迁移 {version} 暂缓：{e}")
+                continue
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            print(f"数据库迁移 {version} 完成：{description}")
+
     except sqlite3.OperationalError as e:
         print(f"数据库迁移失败: {e}")
-        conn.rollback()
     finally:
         conn.close()
 
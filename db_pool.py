@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, has_app_context
+
+DATABASE_PATH = 'settings.db'
+
+# 连接建立后只执行一次的预热PRAGMA
+CONNECTION_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 268435456),   # 256MB 内存映射
+    ('cache_size', -16000),     # 约16MB 页缓存（负数表示KB）
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接，close() 会把连接归还到池中而不是真正关闭"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._lease = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.release(self)
+        else:
+            super().close()
+
+    def _close_physical(self):
+        super().close()
+
+
+class ConnectionPool:
+    """SQLite连接池
+
+    空闲连接以后进先出方式复用，保证最常用的连接页缓存一直是热的。
+    连接数达到上限时，checkout() 会等待其他请求归还连接。
+    """
+
+    def __init__(self, database=DATABASE_PATH, max_size=16, timeout=10.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._size = 0
+        self._stats = {
+            'checkouts': 0,
+            'releases': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+        }
+
+    def _create_connection(self):
+        """创建新连接并应用预热PRAGMA"""
+        conn = sqlite3.connect(
+            self.database,
+            factory=PooledConnection,
+            check_same_thread=False,
+            timeout=self.timeout,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn._pool = self
+        return conn
+
+    def checkout(self):
+        """从池中取出一个连接"""
+        with self._available:
+            self._stats['checkouts'] += 1
+            if not self._idle and self._size >= self.max_size:
+                self._stats['waits'] += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        raise TimeoutError('等待数据库连接超时')
+                    self._available.wait(remaining)
+                self._stats['wait_time_ms'] += (time.perf_counter() - started) * 1000
+            if self._idle:
+                conn = self._idle.pop()
+                conn._lease = object()
+                return conn
+            self._size += 1
+
+        try:
+            conn = self._create_connection()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        with self._lock:
+            self._stats['connections_created'] += 1
+            conn._lease = object()
+        return conn
+
+    def release(self, conn, lease=None):
+        """归还连接，未提交的事务会被回滚
+
+        指定lease时只有当该连接仍处于这次借出中才会归还，避免重复归还。
+        """
+        with self._lock:
+            if conn._lease is None or (lease is not None and conn._lease is not lease):
+                return
+            conn._lease = None
+
+        discard = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            discard = True
+
+        with self._available:
+            self._stats['releases'] += 1
+            if discard:
+                self._size -= 1
+                self._stats['connections_discarded'] += 1
+            else:
+                self._idle.append(conn)
+            self._available.notify()
+
+        if discard:
+            conn._pool = None
+            conn._close_physical()
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._available:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            conn._pool = None
+            conn._close_physical()
+
+    def stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        return stats
+
+
+def init_app(app, pool):
+    """在Flask应用上下文结束时归还本次请求借出的所有连接"""
+
+    @app.teardown_appcontext
+    def release_db_connections(exception=None):
+        leases = g.pop('_db_leases', None)
+        if not leases:
+            return
+        for conn, lease in leases:
+            pool.release(conn, lease)
+
+
+def lease_connection(pool):
+    """借出连接并登记到当前应用上下文（无上下文时直接借出）"""
+    conn = pool.checkout()
+    if has_app_context():
+        g.setdefault('_db_leases', []).append((conn, conn._lease))
+    return conn
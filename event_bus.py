@@ -0,0 +1,176 @@
+import itertools
+import secrets
+import threading
+from collections import OrderedDict, deque
+
+from serializers import dumps
+
+# 每个用户保留的最近事件数（断线重连时用 Last-Event-ID 补发）
+HISTORY_SIZE = 256
+# 最多保留多少个用户的频道；超出时淘汰没有订阅者、最久未活动的频道
+MAX_CHANNELS = 4096
+# 不补发的临时事件（如AI流式输出）在频道中最多保留多少条，只用于唤醒中的订阅者读取
+TRANSIENT_SIZE = 1024
+
+
+class _Channel:
+    """单个用户的事件频道：最近事件 + 条件变量（只唤醒该用户的订阅者）"""
+
+    __slots__ = ('events', 'transient', 'latest_seq', 'condition', 'subscribers', 'evicted_seq')
+
+    def __init__(self, history_size):
+        self.events = deque(maxlen=history_size)
+        # 临时事件不占用补发历史，挤出时也不会触发 reset
+        self.transient = deque(maxlen=TRANSIENT_SIZE)
+        self.latest_seq = 0
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        # 已被挤出历史的最大序号：Last-Event-ID 早于它时无法完整补发
+        self.evicted_seq = 0
+
+
+class Subscription:
+    """一个 SSE 连接的订阅状态"""
+
+    def __init__(self, bus, user_id, channel, cursor, pending):
+        self.bus = bus
+        self.user_id = user_id
+        self.channel = channel
+        self.cursor = cursor
+        self.pending = pending
+
+    def wait(self, timeout):
+        """返回 cursor 之后的事件帧列表，没有新事件时最多等待 timeout 秒"""
+        if self.pending:
+            frames, self.pending = self.pending, []
+            return frames
+        channel = self.channel
+        with channel.condition:
+            if channel.latest_seq <= self.cursor:
+                channel.condition.wait(timeout)
+            if self.cursor < channel.evicted_seq:
+                # 消费太慢，中间的事件已经被挤出历史
+                self.cursor = channel.latest_seq
+                return [self.bus.reset_frame(self.cursor)]
+            entries = [entry for entry in channel.events if entry[0] > self.cursor]
+            if channel.transient and channel.transient[-1][0] > self.cursor:
+                entries.extend(entry for entry in channel.transient if entry[0] > self.cursor)
+                entries.sort()
+            self.cursor = channel.latest_seq
+        return [frame for _, frame in entries]
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """进程内发布/订阅总线，按用户分频道
+
+    事件 ID 为 "<启动标识>-<序号>"：序号在进程内全局递增，启动标识在进程重启后变化，
+    因此重连时可以判断 Last-Event-ID 之后的事件是否还能完整补发，不能时下发 reset 事件，
+    由客户端重新加载。多进程部署时每个进程各有一条总线，只能收到本进程内的写入。
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE, max_channels=MAX_CHANNELS):
+        self.history_size = history_size
+        self.max_channels = max_channels
+        self.boot_id = secrets.token_hex(4)
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._published = 0
+        self._resets = 0
+
+    def reset_frame(self, seq):
+        """reset 事件：客户端丢弃本地状态重新加载；带上当前序号，之后重连不会再次 reset"""
+        with self._lock:
+            self._resets += 1
+        return f"id: {self.boot_id}-{seq}\nevent: reset\ndata: {{}}\n\n"
+
+    def _channel(self, user_id):
+        """取得（必要时创建）用户频道，调用方需持有 self._lock"""
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = _Channel(self.history_size)
+            if len(self._channels) > self.max_channels:
+                for idle_user, idle in list(self._channels.items()):
+                    if idle.subscribers == 0 and idle_user != user_id:
+                        del self._channels[idle_user]
+                        break
+        else:
+            self._channels.move_to_end(user_id)
+        return channel
+
+    def publish(self, user_id, event, data, replay=True):
+        """发布一个事件给该用户的所有订阅者（只序列化一次，所有订阅者共享同一帧）
+
+        replay=False 的临时事件不带事件 ID、不进入补发历史：断线期间错过的不会补发，
+        大量临时事件也不会把其他事件挤出历史（如AI流式输出，结束后另有完整结果的事件）。
+        """
+        with self._lock:
+            # 从未订阅过的用户没有频道：没有人接收，也没有人需要补发
+            channel = self._channels.get(user_id)
+            if channel is None:
+                return
+            self._channels.move_to_end(user_id)
+            self._published += 1
+        payload = dumps(data).decode('utf-8')
+        with channel.condition:
+            # 在频道锁内分配序号，保证频道内事件按序号递增排列
+            seq = channel.latest_seq = next(self._counter)
+            if replay:
+                frame = f"id: {self.boot_id}-{seq}\nevent: {event}\ndata: {payload}\n\n"
+                if len(channel.events) == channel.events.maxlen:
+                    channel.evicted_seq = channel.events[0][0]
+                channel.events.append((seq, frame))
+            else:
+                channel.transient.append((seq, f"event: {event}\ndata: {payload}\n\n"))
+            channel.condition.notify_all()
+
+    def has_channel(self, user_id):
+        """该用户是否订阅过变更（发布方据此跳过准备事件数据的查询）"""
+        with self._lock:
+            return user_id in self._channels
+
+    def _parse_event_id(self, last_event_id):
+        boot_id, _, seq = (last_event_id or '').partition('-')
+        if boot_id != self.boot_id:
+            return None
+        try:
+            return int(seq)
+        except ValueError:
+            return None
+
+    def subscribe(self, user_id, last_event_id=None):
+        """订阅用户频道；提供 Last-Event-ID 时先补发其后的事件，无法补发时先发 reset"""
+        with self._lock:
+            # 带着本进程的事件ID重连却没有频道：频道已被淘汰，期间发布的事件都丢弃了
+            evicted = user_id not in self._channels
+            channel = self._channel(user_id)
+            channel.subscribers += 1
+
+        pending = []
+        with channel.condition:
+            latest = channel.events[-1][0] if channel.events else 0
+            cursor = channel.latest_seq
+            if last_event_id:
+                seq = self._parse_event_id(last_event_id)
+                if seq is None or evicted or seq < channel.evicted_seq:
+                    pending.append(self.reset_frame(latest))
+                else:
+                    pending.extend(frame for event_seq, frame in channel.events if event_seq > seq)
+        return Subscription(self, user_id, channel, cursor, pending)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscription.channel.subscribers -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'boot_id': self.boot_id,
+                'channels': len(self._channels),
+                'subscribers': sum(channel.subscribers for channel in self._channels.values()),
+                'published': self._published,
+                'resets': self._resets,
+            }
@@ -0,0 +1,246 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 这些状态码表示服务端暂时不可用，可以重试
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+CONNECT_TIMEOUT = 10
+POOL_MAXSIZE = 16
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'streams': 0,
+    'retries': 0,
+    'failures': 0,
+}
+_stats_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """调用大模型接口失败（已用完重试次数或遇到不可重试的错误）"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """连接失败、超时和服务端暂时不可用的状态码可以重试"""
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_session(api_base):
+    """每个 api_base 共用一个 keep-alive 会话，避免每轮对话重新建立 TCP+TLS 连接"""
+    key = api_base.rstrip('/')
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            # 重试由本模块控制（需要区分流式请求是否已输出内容），适配器本身不重试
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+        return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def backoff_delay(attempt, retry_after=None):
+    """指数退避 + 全抖动；服务端给出 Retry-After 时以它为下限"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, BACKOFF_MAX))
+    return delay
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _settings(assistant):
+    timeout = float(assistant.get('timeout') or 30)
+    retries = max(int(assistant.get('retries') or 0), 0)
+    return (min(CONNECT_TIMEOUT, timeout), timeout), retries
+
+
+def _build_request(messages, assistant, stream):
+    headers = {
+        'Authorization': f'Bearer {assistant.get("api_key", "")}',
+        'Content-Type': 'application/json'
+    }
+    data = {
+        'model': assistant['model'],
+        'messages': messages,
+        'max_tokens': assistant['max_tokens'],
+        'temperature': assistant['temperature']
+    }
+    if stream:
+        data['stream'] = True
+    url = f"{assistant['api_base'].rstrip('/')}/chat/completions"
+    return url, headers, data
+
+
+def _send(messages, assistant, stream):
+    """发送一次请求（不重试），返回状态码为200的响应，否则抛出 LLMError"""
+    url, headers, data = _build_request(messages, assistant, stream)
+    timeout, _ = _settings(assistant)
+    try:
+        response = get_session(assistant['api_base']).post(
+            url, headers=headers, json=data, timeout=timeout, stream=stream)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise LLMError(f'连接失败: {e}')
+    if response.status_code == 200:
+        return response
+    error = LLMError(f'API调用失败: {response.status_code} - {response.text[:500]}',
+                     response.status_code, _retry_after(response))
+    response.close()
+    raise error
+
+
+def _post(messages, assistant, stream):
+    """发送请求并按配置重试，返回状态码为200的响应"""
+    _, retries = _settings(assistant)
+    for attempt in range(retries + 1):
+        try:
+            return _send(messages, assistant, stream)
+        except LLMError as e:
+            error = e
+        if not error.retryable or attempt >= retries:
+            break
+        _count('retries')
+        time.sleep(backoff_delay(attempt, error.retry_after))
+
+    _count('failures')
+    raise error
+
+
+def chat_completion(messages, assistant):
+    """非流式调用，返回完整回复文本"""
+    _count('requests')
+    response = _post(messages, assistant, stream=False)
+    try:
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        _count('failures')
+        raise LLMError(f'响应格式错误: {e}')
+
+
+def _iter_sse_data(response):
+    """逐行解析 text/event-stream，产出每个 data 字段的内容"""
+    buffer = b''
+    for chunk in response.iter_content(chunk_size=None):
+        buffer += chunk
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            line = line.rstrip(b'\r')
+            if line.startswith(b'data:'):
+                yield line[5:].strip().decode('utf-8')
+
+
+class ChatStream:
+    """一次流式调用：迭代得到回复文本的各段
+
+    迭代正常结束表示回复完整（收到 [DONE] 或 finish_reason），此时 completed 为 True；
+    中途断开或连接关闭时没有结束标记都会抛出 LLMError，已收到的部分仍可从 text 读取。
+    每次重试只发送一次请求（_send），连接失败、可重试的状态码和尚未产出内容时的断开
+    共用同一个重试计数；已经产出内容后不再重试。
+    """
+
+    __slots__ = ('messages', 'assistant', 'chunks', 'completed')
+
+    def __init__(self, messages, assistant):
+        self.messages = messages
+        self.assistant = assistant
+        self.chunks = []
+        self.completed = False
+
+    @property
+    def text(self):
+        return ''.join(self.chunks)
+
+    def __iter__(self):
+        _count('streams')
+        _, retries = _settings(self.assistant)
+        for attempt in range(retries + 1):
+            try:
+                response = _send(self.messages, self.assistant, stream=True)
+            except LLMError as e:
+                error = e
+            else:
+                try:
+                    yield from self._read(response)
+                    if self.completed:
+                        return
+                    error = LLMError('流式响应未正常结束')
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    # 服务端中途关闭分块传输时 requests 抛出 ChunkedEncodingError（不是 ConnectionError 的子类）
+                    if self.completed:
+                        return
+                    error = LLMError(f'流式响应中断: {e}')
+                finally:
+                    response.close()
+                if self.chunks:
+                    break
+            if not error.retryable or attempt >= retries:
+                break
+            _count('retries')
+            time.sleep(backoff_delay(attempt, error.retry_after))
+
+        _count('failures')
+        raise error
+
+    def _read(self, response):
+        for payload in _iter_sse_data(response):
+            if payload == '[DONE]':
+                self.completed = True
+                return
+            try:
+                choice = json.loads(payload)['choices'][0]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                self.chunks.append(content)
+                yield content
+            if choice.get('finish_reason'):
+                self.completed = True
+
+
+def stream_chat_completion(messages, assistant):
+    """流式调用，返回 ChatStream：迭代逐段得到回复文本，结束后 completed 表示回复是否完整"""
+    return ChatStream(messages, assistant)
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    with _sessions_lock:
+        result['sessions'] = len(_sessions)
+    return result
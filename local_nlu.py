@@ -0,0 +1,346 @@
+import calendar
+import re
+from collections import deque
+from datetime import date, timedelta
+
+# 没有配置API密钥时的本地意图识别和任务信息提取
+# 所有正则和关键词自动机在导入时构建一次
+
+_CN_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+              '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_WEEKDAYS = {'一': 0, '二': 1, '三': 2, '四': 3, '五': 4, '六': 5, '日': 6, '天': 6, '末': 5,
+             '1': 0, '2': 1, '3': 2, '4': 3, '5': 4, '6': 5, '7': 6}
+
+_NUM = r'(?:\d{1,2}|[零〇一二两三四五六七八九十]{1,3})'
+_PERIOD = r'(凌晨|早上|早晨|上午|中午|下午|傍晚|晚上|今晚)?'
+_EVENING = ('下午', '傍晚', '晚上', '今晚')
+
+# 日期表达式：(正则, 处理函数名)，按顺序匹配，已被前面的表达式占用的位置不再匹配
+_DATE_PATTERNS = [
+    (re.compile(r'(\d{4})[-/年.](\d{1,2})[-/月.](\d{1,2})[日号]?'), '_absolute_date'),
+    (re.compile(rf'({_NUM})月({_NUM})[日号]?'), '_month_day'),
+    (re.compile(r'(下下|下|这|本)?个?(?:周|星期|礼拜)([一二三四五六日天末1-7])'), '_weekday'),
+    (re.compile(r'(下下|下|这|本)个?(?:周|星期|礼拜)'), '_week'),
+    (re.compile(rf'({_NUM})天(?:以|之)?后'), '_days_later'),
+    (re.compile(r'大后天|后天|明天|明日|明早|明晚|今天|今日|今早|今晚'), '_named_day'),
+    (re.compile(r'(下个?月|本月|这个月)?月底'), '_month_end'),
+    (re.compile(rf'(?<![\d月])({_NUM})[日号](?![\d])'), '_day_of_month'),
+]
+_NAMED_DAYS = {'今天': 0, '今日': 0, '今早': 0, '今晚': 0, '明天': 1, '明日': 1, '明早': 1, '明晚': 1,
+               '后天': 2, '大后天': 3}
+
+_TIME_PATTERN = re.compile(
+    rf'{_PERIOD}\s*({_NUM})\s*(?:[点时]\s*(?:({_NUM})\s*分?|(半)|(一刻)|(三刻))?|[:：](\d{{2}}))'
+)
+_RANGE_CONNECTOR = re.compile(r'\s*(?:到|至|-|~|～|—)\s*')
+
+_LIST_PATTERNS = [
+    re.compile(r'(?:放到|放进|添加到|加到|在|到)[“"「]?([^\s“”"「」，,。：:]{1,20}?)[”"」]?(?:列表|清单)里?'),
+    re.compile(r'(?:放到|放进|添加到|加到)[“"「]([^”"」]{1,20})[”"」]'),
+]
+
+# 去掉标题开头的指令用语
+_TITLE_PREFIX = re.compile(
+    r'^(?:请|麻烦)?(?:你)?(?:帮我|给我|替我)?'
+    r'(?:记得|别忘了|提醒我?'
+    r'|(?:创建|新建|添加|加|建|记|安排)(?:一个|一条|一下|个|条)?(?:(?:重要|紧急)的?)?(?:任务|待办|事项|提醒)?'
+    r'|我要|我需要|我得|需要|帮我)'
+    r'[：:，,\s]*'
+)
+_TITLE_LABEL = re.compile(r'(?:任务|待办|事项)[：:]\s*')
+_TITLE_SUFFIX = re.compile(r'(?:的)?(?:任务|待办|事项)$')
+_TITLE_STRIP = ' \t，,。.！!？?：:、;；~～-—的'
+
+# 意图关键词：第一层中最先出现的关键词决定意图；第一层都没有时看第二层
+_PRIMARY_KEYWORDS = {
+    'create': ('创建', '新建', '添加', '提醒', '记得', '别忘了', '安排', '待办', '加个', '建个', '记一下'),
+    'search': ('查找', '搜索', '找一下', '找找', '查一下', '找到', 'search', 'find'),
+    'summary': ('总结', '统计', '报告', '进度', '完成率', 'summary'),
+    'help': ('帮助', '怎么用', '功能', '能做什么', '会做什么', 'help'),
+}
+_WEAK_CREATE_KEYWORDS = ('帮我', '我要', '我需要', '需要', '我得', '任务')
+_GREETING_KEYWORDS = ('你好', '您好', '嗨', '早上好', '下午好', '晚上好', 'hello', 'hi')
+_PRIORITY_KEYWORDS = {
+    'high': ('紧急', '优先', '马上', '立即', '尽快', '高优先级', '优先级高', 'urgent', 'asap'),
+    'low': ('不急', '稍后', '有空', '低优先级', '优先级低', '不着急'),
+}
+_IMPORTANT_KEYWORDS = ('重要', '关键', '核心', '必须', '一定要', '星标', 'important', 'star')
+
+
+def cn_number(text):
+    """解析阿拉伯数字或不超过两位的中文数字（十二、二十三、两）"""
+    if text.isdigit():
+        return int(text)
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    value = 0
+    for char in text:
+        value = value * 10 + _CN_DIGITS[char]
+    return value
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多关键词匹配：一次扫描找出文本中出现的全部关键词
+
+    英文关键词要求前后不是字母或数字（"hi" 不会匹配 "this"）。
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for keyword, label in keywords:
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append((keyword, label, keyword.isascii()))
+
+        # 按层构建失败指针，第一层节点失败时回到根
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text):
+        """返回 [(起始位置, 关键词, 标签)]，按结束位置排列"""
+        matches = []
+        node = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword, label, ascii_word in output[node]:
+                start = index - len(keyword) + 1
+                if ascii_word and ((start > 0 and text[start - 1].isalnum() and text[start - 1].isascii())
+                                   or (index + 1 < len(text) and text[index + 1].isalnum()
+                                       and text[index + 1].isascii())):
+                    continue
+                matches.append((start, keyword, label))
+        return matches
+
+
+def _keyword_table():
+    table = []
+    for intent, keywords in _PRIMARY_KEYWORDS.items():
+        table.extend((keyword, ('intent', intent)) for keyword in keywords)
+    table.extend((keyword, ('weak', 'create')) for keyword in _WEAK_CREATE_KEYWORDS)
+    table.extend((keyword, ('greeting', 'greeting')) for keyword in _GREETING_KEYWORDS)
+    for priority, keywords in _PRIORITY_KEYWORDS.items():
+        table.extend((keyword, ('priority', priority)) for keyword in keywords)
+    table.extend((keyword, ('important', True)) for keyword in _IMPORTANT_KEYWORDS)
+    return table
+
+
+_MATCHER = KeywordMatcher(_keyword_table())
+
+
+class ParsedMessage:
+    """识别结果：intent 为 create/search/summary/help/greeting/unknown，task 为创建任务需要的字段"""
+
+    __slots__ = ('intent', 'task')
+
+    def __init__(self, intent, task=None):
+        self.intent = intent
+        self.task = task
+
+
+class _DateParser:
+    def __init__(self, today):
+        self.today = today
+
+    def _absolute_date(self, match):
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    def _month_day(self, match):
+        month, day = cn_number(match.group(1)), cn_number(match.group(2))
+        result = date(self.today.year, month, day)
+        # 已经过去的日期指明年
+        return result if result >= self.today else date(self.today.year + 1, month, day)
+
+    def _weekday(self, match):
+        prefix, weekday = match.group(1), _WEEKDAYS[match.group(2)]
+        monday = self.today - timedelta(days=self.today.weekday())
+        if prefix in ('这', '本'):
+            return monday + timedelta(days=weekday)
+        if prefix == '下':
+            return monday + timedelta(days=7 + weekday)
+        if prefix == '下下':
+            return monday + timedelta(days=14 + weekday)
+        # 只说“周三”：本周还没过就是本周，否则是下周
+        result = monday + timedelta(days=weekday)
+        return result if result >= self.today else result + timedelta(days=7)
+
+    def _week(self, match):
+        prefix = match.group(1)
+        if prefix in ('这', '本'):
+            return self.today + timedelta(days=6 - self.today.weekday())
+        return self.today + timedelta(days=7 if prefix == '下' else 14)
+
+    def _days_later(self, match):
+        return self.today + timedelta(days=cn_number(match.group(1)))
+
+    def _named_day(self, match):
+        return self.today + timedelta(days=_NAMED_DAYS[match.group()])
+
+    def _month_end(self, match):
+        year, month = self.today.year, self.today.month
+        if match.group(1) and match.group(1).startswith('下'):
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return date(year, month, calendar.monthrange(year, month)[1])
+
+    def _day_of_month(self, match):
+        day = cn_number(match.group(1))
+        year, month = self.today.year, self.today.month
+        if day < self.today.day:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return date(year, month, day)
+
+
+def parse_date(text, today=None):
+    """解析日期表达式，返回 (date, (起始, 结束)) 或 (None, None)"""
+    parser = _DateParser(today or date.today())
+    for pattern, handler in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                return getattr(parser, handler)(match), match.span()
+            except (ValueError, KeyError):
+                continue
+    return None, None
+
+
+def _time_of(match, inherited_period=None):
+    period = match.group(1) or inherited_period
+    hour = cn_number(match.group(2))
+    if match.group(7):
+        minute = int(match.group(7))
+    elif match.group(4):
+        minute = 30
+    elif match.group(5):
+        minute = 15
+    elif match.group(6):
+        minute = 45
+    elif match.group(3):
+        minute = cn_number(match.group(3))
+    else:
+        minute = 0
+    if period in _EVENING and hour < 12:
+        hour += 12
+    elif period == '中午' and hour < 11:
+        hour += 12
+    elif period in ('凌晨', '早上', '早晨', '上午') and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        raise ValueError('时间超出范围')
+    return hour, minute, period
+
+
+def parse_time(text):
+    """解析时间或时间段（下午3点、15:30、3点半到5点），返回 (开始, 结束, (起始, 结束)) 或 (None, None, None)"""
+    match = _TIME_PATTERN.search(text)
+    while match:
+        try:
+            hour, minute, period = _time_of(match)
+        except ValueError:
+            match = _TIME_PATTERN.search(text, match.end())
+            continue
+        end = match.end()
+        end_hour, end_minute = min(hour + 1, 23), minute if hour < 23 else 59
+        connector = _RANGE_CONNECTOR.match(text, end)
+        if connector:
+            second = _TIME_PATTERN.match(text, connector.end())
+            if second:
+                try:
+                    end_hour, end_minute, _ = _time_of(second, period)
+                    end = second.end()
+                except ValueError:
+                    pass
+        return f'{hour:02d}:{minute:02d}', f'{end_hour:02d}:{end_minute:02d}', (match.start(), end)
+    return None, None, None
+
+
+def detect_intent(lowered, matches=None, has_schedule=False):
+    """意图识别：第一层关键词中最先出现的决定意图；其次是弱创建词、优先级词或日期时间；最后是问候"""
+    matches = _MATCHER.find_all(lowered) if matches is None else matches
+    primary = [(start, label[1]) for start, _, label in matches if label[0] == 'intent']
+    if primary:
+        return min(primary)[1]
+    if has_schedule or any(label[0] in ('weak', 'priority', 'important') for _, _, label in matches):
+        return 'create'
+    if any(label[0] == 'greeting' for _, _, label in matches):
+        return 'greeting'
+    return 'unknown'
+
+
+def _extract_title(message, spans):
+    # 去掉日期、时间、列表等已识别的片段
+    parts = []
+    last = 0
+    for start, end in sorted(spans):
+        if start >= last:
+            parts.append(message[last:start])
+        last = max(last, end)
+    parts.append(message[last:])
+    text = ''.join(parts).strip(_TITLE_STRIP)
+    label = _TITLE_LABEL.search(text)
+    if label:
+        text = text[label.end():]
+    text = _TITLE_PREFIX.sub('', text, count=1).strip(_TITLE_STRIP)
+    text = _TITLE_SUFFIX.sub('', text).strip(_TITLE_STRIP)
+    return text
+
+
+def parse(message, today=None):
+    """识别意图；创建任务时同时提取标题、日期、时间、优先级、重要性和列表名称"""
+    message = message.strip()
+    lowered = message.lower()
+    matches = _MATCHER.find_all(lowered)
+
+    due_date, date_span = parse_date(message, today)
+    start_time, end_time, time_span = parse_time(message)
+    intent = detect_intent(lowered, matches, has_schedule=bool(date_span or time_span))
+    if intent != 'create':
+        return ParsedMessage(intent)
+
+    spans = [span for span in (date_span, time_span) if span]
+    list_name = None
+    for pattern in _LIST_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            list_name = match.group(1).strip()
+            spans.append(match.span())
+            break
+
+    priority = 'medium'
+    is_important = False
+    for _, _, (kind, value) in matches:
+        if kind == 'priority' and priority == 'medium':
+            priority = value
+        elif kind == 'important':
+            is_important = True
+
+    return ParsedMessage('create', {
+        'title': _extract_title(message, spans),
+        'description': '',
+        'priority': priority,
+        'due_date': due_date.isoformat() if due_date else None,
+        'start_time': start_time,
+        'end_time': end_time,
+        'is_important': is_important,
+        'list_name': list_name,
+    })
@@ -0,0 +1,67 @@
+import json
+from functools import lru_cache
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时使用标准库
+    orjson = None
+
+# 需要从 0/1 转换为 true/false 的字段
+BOOL_FIELDS = frozenset(('completed', 'is_important'))
+
+
+class RowPlan:
+    """预编译的列映射：把游标返回的元组行直接转换为输出字典
+
+    按列位置取值，不经过 sqlite3.Row 的按名查找；映射函数在创建时生成一次，
+    之后每行只执行一个字典字面量。
+    """
+
+    def __init__(self, columns, fields=None, bool_fields=BOOL_FIELDS):
+        self.columns = tuple(columns)
+        self.fields = tuple(fields) if fields is not None else self.columns
+        positions = {column: index for index, column in enumerate(self.columns)}
+        items = []
+        for field in self.fields:
+            value = f'row[{positions[field]}]'
+            if field in bool_fields:
+                value = f'bool({value})'
+            items.append(f'{field!r}: {value}')
+        source = f"def convert(row):\n    return {{{', '.join(items)}}}\n"
+        namespace = {}
+        exec(compile(source, f'<RowPlan {",".join(self.fields)}>', 'exec'), namespace)
+        self.convert = namespace['convert']
+
+    def index(self, column):
+        return self.columns.index(column)
+
+    def rows(self, rows):
+        convert = self.convert
+        return [convert(row) for row in rows]
+
+
+@lru_cache(maxsize=256)
+def get_plan(columns, fields=None):
+    """按 (查询列, 输出字段) 缓存映射计划"""
+    return RowPlan(columns, fields)
+
+
+def tuple_cursor(conn):
+    """返回产出普通元组行的游标（连接池中的连接默认使用 sqlite3.Row）"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def dumps(data):
+    """序列化为 UTF-8 JSON 字节串，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """与 jsonify 等价的响应，但使用 dumps 序列化"""
+    return Response(dumps(data), status=status, mimetype='application/json')
@@ -0,0 +1,357 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import request
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from ttl_cache import TTLCache
+
+# 未设置 SECRET_KEY 环境变量时，密钥保存在这个文件里（首次启动时生成，多个进程共用）
+SECRET_KEY_PATH = 'secret_key'
+# 进程内会话缓存的有效期：其他进程登出或删除的会话最多这么久后失效
+SESSION_CACHE_TTL = 30
+# last_activity 的合并写入间隔，以及积压多少个会话时提前写入
+FLUSH_INTERVAL = 30
+FLUSH_MAX_PENDING = 1000
+# 清理过期会话的间隔和每批删除的行数（分批删除，不长时间占用写锁）
+SWEEP_INTERVAL = 600
+SWEEP_BATCH = 1000
+
+# 会话数据（Flask 的 TaggedJSON）；清理过期会话走 expires_at 索引
+SESSION_COLUMN_SQL = 'ALTER TABLE user_sessions ADD COLUMN data TEXT'
+SESSION_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions (expires_at)'
+
+# session_token 存的是令牌的 SHA-256，按令牌查找走 UNIQUE 约束自带的索引
+LOOKUP_SQL = 'SELECT user_id, data, expires_at FROM user_sessions WHERE session_token = ?'
+
+INSERT_SQL = '''
+    INSERT INTO user_sessions (user_id, session_token, data, expires_at, last_activity, ip_address, user_agent)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+UPDATE_SQL = 'UPDATE user_sessions SET data = ?, expires_at = ?, last_activity = ? WHERE session_token = ?'
+
+TOUCH_SQL = 'UPDATE user_sessions SET last_activity = ?, expires_at = ? WHERE session_token = ?'
+
+SWEEP_SQL = '''
+    DELETE FROM user_sessions WHERE id IN (
+        SELECT id FROM user_sessions WHERE expires_at < ? LIMIT ?
+    )
+'''
+
+
+def load_secret_key(path=SECRET_KEY_PATH):
+    """读取持久化的密钥，不存在时生成；多个进程同时启动时只有一个能创建文件，其余读取它"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, encoding='ascii') as f:
+            key = f.read().strip()
+        if key:
+            return key
+        # 另一个进程刚创建文件还没写完
+        time.sleep(0.1)
+        with open(path, encoding='ascii') as f:
+            return f.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(key)
+    return key
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('ascii', 'replace')).hexdigest()
+
+
+def _timestamp(moment):
+    """与 CURRENT_TIMESTAMP 相同的 UTC 格式，按字符串比较即按时间比较"""
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class _SessionRecord:
+    """缓存中的会话：用户ID、会话数据和（随活动顺延的）过期时间"""
+
+    __slots__ = ('user_id', 'data', 'expires_at')
+
+    def __init__(self, user_id, data, expires_at):
+        self.user_id = user_id
+        self.data = data
+        self.expires_at = expires_at
+
+
+class SessionStore:
+    """基于 user_sessions 表的服务端会话
+
+    Cookie 中只有随机令牌，表中存令牌的哈希、用户ID和会话数据，多个工作进程共用同一张表。
+    读取先查进程内缓存，未命中时按令牌的唯一索引查一行；每个请求的 last_activity 只记在内存里，
+    由后台线程每 FLUSH_INTERVAL 秒合并成一次 executemany 写入（同时顺延过期时间），
+    并定期分批删除过期的行。
+    """
+
+    def __init__(self, connect, lifetime=timedelta(days=31), cache_size=8192):
+        self._connect = connect
+        self.lifetime = lifetime
+        self.cache = TTLCache(maxsize=cache_size, ttl=SESSION_CACHE_TTL)
+        self.serializer = TaggedJSONSerializer()
+        # 令牌哈希 → 最后活动时间（同一会话的多次请求合并为一次写入）
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._lookups = 0
+        self._created = 0
+        self._deleted = 0
+        self._touches = 0
+        self._flushes = 0
+        self._flushed_rows = 0
+        self._swept = 0
+
+    def start(self):
+        """启动写入 last_activity 和清理过期会话的后台线程（重复调用无效）"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='session-store', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """停止后台线程并写入尚未提交的活动时间"""
+        with self._condition:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def get(self, token):
+        """按令牌取得未过期的会话，返回 (令牌哈希, 记录)，不存在时记录为 None"""
+        token_hash = hash_token(token)
+        now = _timestamp(_utcnow())
+        record = self.cache.get(token_hash)
+        if record is None:
+            conn = self._connect()
+            try:
+                row = conn.execute(LOOKUP_SQL, (token_hash,)).fetchone()
+            finally:
+                conn.close()
+            with self._condition:
+                self._lookups += 1
+            if row is None:
+                return token_hash, None
+            user_id, data, expires_at = row
+            record = _SessionRecord(user_id, self.serializer.loads(data) if data else {}, expires_at)
+            self.cache.set(token_hash, record)
+        if record.expires_at <= now:
+            self.cache.invalidate(token_hash)
+            return token_hash, None
+        return token_hash, record
+
+    def create(self, user_id, data, ip_address=None, user_agent=None):
+        """新建会话，返回新令牌（只在 Cookie 中出现，表中不保存明文）"""
+        token = secrets.token_urlsafe(32)
+        token_hash = hash_token(token)
+        now = _utcnow()
+        expires_at = _timestamp(now + self.lifetime)
+        conn = self._connect()
+        try:
+            conn.execute(INSERT_SQL, (user_id, token_hash, self.serializer.dumps(data), expires_at,
+                                      _timestamp(now), ip_address, (user_agent or '')[:256]))
+            conn.commit()
+        finally:
+            conn.close()
+        self.cache.set(token_hash, _SessionRecord(user_id, data, expires_at))
+        with self._condition:
+            self._created += 1
+        return token
+
+    def save(self, token_hash, record, data):
+        """会话数据变化时立即写入（登录、登出之外很少发生）"""
+        now = _utcnow()
+        record.data = data
+        record.expires_at = _timestamp(now + self.lifetime)
+        conn = self._connect()
+        try:
+            conn.execute(UPDATE_SQL, (self.serializer.dumps(data), record.expires_at, _timestamp(now), token_hash))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._condition:
+            self._pending.pop(token_hash, None)
+
+    def delete(self, token_hash):
+        self.cache.invalidate(token_hash)
+        with self._condition:
+            self._pending.pop(token_hash, None)
+            self._deleted += 1
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM user_sessions WHERE session_token = ?', (token_hash,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def touch(self, token_hash, record):
+        """记录一次活动：只更新内存，由后台线程批量写入"""
+        now = _utcnow()
+        record.expires_at = _timestamp(now + self.lifetime)
+        with self._condition:
+            self._pending[token_hash] = now
+            self._touches += 1
+            if len(self._pending) >= FLUSH_MAX_PENDING:
+                self._condition.notify_all()
+
+    def flush(self):
+        """把合并后的 last_activity 一次写入，返回写入的会话数"""
+        with self._condition:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(_timestamp(moment), _timestamp(moment + self.lifetime), token_hash)
+                for token_hash, moment in pending.items()]
+        conn = self._connect()
+        try:
+            conn.executemany(TOUCH_SQL, rows)
+            conn.commit()
+        except Exception:
+            # 写入失败时放回去等下次，期间更新的时间优先
+            with self._condition:
+                for token_hash, moment in pending.items():
+                    self._pending.setdefault(token_hash, moment)
+            raise
+        finally:
+            conn.close()
+        with self._condition:
+            self._flushes += 1
+            self._flushed_rows += len(rows)
+        return len(rows)
+
+    def sweep(self):
+        """分批删除已过期的会话，返回删除的行数（走 expires_at 索引）"""
+        now = _timestamp(_utcnow())
+        removed = 0
+        conn = self._connect()
+        try:
+            while True:
+                deleted = conn.execute(SWEEP_SQL, (now, SWEEP_BATCH)).rowcount
+                conn.commit()
+                removed += deleted
+                if deleted < SWEEP_BATCH:
+                    break
+        finally:
+            conn.close()
+        with self._condition:
+            self._swept += removed
+        return removed
+
+    def _run(self):
+        next_sweep = 0.0
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                if len(self._pending) < FLUSH_MAX_PENDING:
+                    self._condition.wait(FLUSH_INTERVAL)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + SWEEP_INTERVAL
+            except Exception as e:
+                # 数据库暂时被锁等：下一轮重试
+                print(f"会话写入失败: {e}")
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        with self._condition:
+            return {
+                'pending_touches': len(self._pending),
+                'db_lookups': self._lookups,
+                'created': self._created,
+                'deleted': self._deleted,
+                'touches': self._touches,
+                'flushes': self._flushes,
+                'flushed_rows': self._flushed_rows,
+                'swept': self._swept,
+                'hit_rate': cache_stats['hit_rate'],
+                'cache_size': cache_stats['size'],
+            }
+
+
+class ServerSession(SecureCookieSession):
+    """Flask 会话对象，额外记录对应的令牌和表中的记录"""
+
+    def __init__(self, initial=None, token_hash=None, record=None):
+        super().__init__(initial)
+        self.token_hash = token_hash
+        self.record = record
+
+
+class ServerSessionInterface(SessionInterface):
+    """把 Flask 的会话保存在 SessionStore 中，Cookie 只携带令牌
+
+    只有登录用户（会话中有 _user_id）的会话才写入表；登录时换发新令牌，登出时删除该行。
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token:
+            return ServerSession()
+        token_hash, record = self.store.get(token)
+        if record is None:
+            return ServerSession(token_hash=token_hash)
+        return ServerSession(record.data, token_hash, record)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        user_id = session.get('_user_id')
+        record = session.record
+        if user_id is None:
+            # 匿名会话不落库；登出或令牌已失效时删除行和 Cookie
+            if record is not None:
+                self.store.delete(session.token_hash)
+            if session.token_hash is not None:
+                response.delete_cookie(name, domain=domain, path=path)
+                response.vary.add('Cookie')
+            return
+
+        if record is None or str(record.user_id) != str(user_id):
+            # 新登录（或切换用户）：换发新令牌，防止会话固定
+            if record is not None:
+                self.store.delete(session.token_hash)
+            token = self.store.create(int(user_id), dict(session),
+                                      request.remote_addr, request.headers.get('User-Agent'))
+            response.set_cookie(
+                name, token,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add('Cookie')
+        elif session.modified:
+            self.store.save(session.token_hash, record, dict(session))
+        else:
+            self.store.touch(session.token_hash, record)
@@ -2,6 +2,12 @@
 let currentListId = null;
 let taskLists = [];
 let tasks = [];
+let tasksNextCursor = null; // 任务分页游标（null 表示已加载全部）
+let isLoadingMoreTasks = false;
+let tasksScrollObserver = null;
+const TASK_PAGE_SIZE = 50;
+// 列表视图不需要的字段不请求，减少传输量
+const TASK_LIST_FIELDS = 'id,title,description,completed,priority,due_date,start_time,end_time,list_id,is_important';
 let userPreferences = {};
 let currentEditingTaskId = null;
 let showCompleted = true;
@@ -21,6 +27,15 @@ let weekTasks = [];
 let draggedTask = null;
 let calendarDropZone = null;
 
+// 变更推送（SSE）：连接正常时写操作后不再重新拉取，由推送的事件直接修改本地数据
+let changeFeed = null;
+let changeFeedConnected = false;
+// 等待中的AI任务：job_id -> resolve，任务结束时由 ai.job 推送或轮询唤醒
+const aiJobWaiters = new Map();
+// 通过变更推送收到的AI流式输出：job_id -> { text, content, active }，
+// 202 响应到达之前收到的 ai.token 先累积在这里
+const aiTokenStreams = new Map();
+
 // 页面加载完成后初始化
 document.addEventListener('DOMContentLoaded', function() {
     checkAuthStatus();
@@ -109,6 +124,7 @@ async function logout() {
         });
         
         if (response.ok) {
+            if (changeFeed) changeFeed.close();
             showNotification('已成功退出登录');
             setTimeout(() => {
                 window.location.href = '/login';
@@ -135,6 +151,7 @@ document.addEventListener('click', function(event) {
 // 初始化应用
 async function initializeApp() {
     try {
+        startChangeFeed();
         await loadTaskLists();
         await loadUserPreferences();
         await loadStats();
@@ -201,11 +218,229 @@ function setupEventListeners() {
     }
 }
 
+// 条件请求缓存：URL -> {etag, body}
+const etagCache = new Map();
+
+// 带 If-None-Match 的 GET 请求，服务端返回 304 时使用上次的响应内容
+// 缓存原始文本，每次重新解析，避免调用方修改返回对象影响缓存
+async function fetchJSONWithETag(url) {
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    
+    if (response.status === 304 && cached) {
+        return JSON.parse(cached.body);
+    }
+    
+    const body = await response.text();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        etagCache.set(url, { etag, body });
+    } else {
+        etagCache.delete(url);
+    }
+    return JSON.parse(body);
+}
+
+// 订阅当前用户的变更事件；断线后浏览器带着 Last-Event-ID 自动重连，服务端补发期间的事件
+function startChangeFeed() {
+    if (!window.EventSource || changeFeed) return;
+    
+    changeFeed = new EventSource('/api/events');
+    changeFeed.onopen = () => { changeFeedConnected = true; };
+    changeFeed.onerror = () => { changeFeedConnected = false; };
+    
+    const handlers = {
+        'task.upsert': applyTaskUpsert,
+        'task.delete': applyTaskDelete,
+        'list.upsert': applyListUpsert,
+        'list.delete': applyListDelete,
+        'stats': applyStatsUpdate,
+        'preferences': applyPreferencesUpdate,
+        'ai.job': resolveAIJob,
+        'ai.token': applyAIToken,
+        'reminder': showReminder,
+        'reset': reloadAfterReset
+    };
+    Object.entries(handlers).forEach(([event, handler]) => {
+        changeFeed.addEventListener(event, e => {
+            try {
+                handler(JSON.parse(e.data));
+            } catch (error) {
+                console.error(`处理变更事件 ${event} 失败:`, error);
+            }
+        });
+    });
+}
+
+// 推送未连接时（浏览器不支持或正在重连）退回到重新拉取
+async function refreshAfterTaskChange() {
+    if (changeFeedConnected) return;
+    await loadTasks(currentListId);
+    await loadStats();
+    updateTaskListStats();
+}
+
+// 任务是否属于当前列表视图（与 /api/tasks 的过滤条件一致）
+function taskMatchesCurrentView(task) {
+    return (!currentListId || task.list_id === currentListId) && (showCompleted || !task.completed);
+}
+
+// 与服务端 TASK_ORDER_BY 一致：重要优先、截止日期升序（无日期在前）、新任务在前
+// 列表视图不请求 created_at，用 id 代替创建顺序
+function compareTasks(a, b) {
+    if (Boolean(a.is_important) !== Boolean(b.is_important)) {
+        return a.is_important ? -1 : 1;
+    }
+    const dueA = a.due_date || '';
+    const dueB = b.due_date || '';
+    if (dueA !== dueB) {
+        return dueA < dueB ? -1 : 1;
+    }
+    return b.id - a.id;
+}
+
+// 只替换、插入或移除单个任务元素，不重新渲染整个列表
+function syncTaskElement(taskId) {
+    const tasksList = document.getElementById('tasksList');
+    const existing = tasksList.querySelector(`.task-item[data-task-id="${taskId}"]`);
+    const position = tasks.findIndex(t => t.id === taskId);
+    
+    if (position < 0) {
+        if (existing) existing.remove();
+        if (tasks.length === 0) renderTasks();
+        return;
+    }
+    if (!tasksList.querySelector('.task-item')) {
+        // 列表原来为空（显示的是占位提示）
+        renderTasks();
+        return;
+    }
+    
+    const item = createTaskItem(tasks[position]);
+    if (existing) existing.remove();
+    const next = tasks[position + 1];
+    const anchor = next
+        ? tasksList.querySelector(`.task-item[data-task-id="${next.id}"]`)
+        : document.getElementById('tasksScrollSentinel');
+    tasksList.insertBefore(item, anchor || null);
+}
+
+function applyTaskUpsert(task) {
+    const index = tasks.findIndex(t => t.id === task.id);
+    if (index >= 0) {
+        tasks.splice(index, 1);
+    }
+    if (taskMatchesCurrentView(task)) {
+        const position = tasks.findIndex(t => compareTasks(task, t) < 0);
+        if (position >= 0) {
+            tasks.splice(position, 0, task);
+        } else if (!tasksNextCursor) {
+            // 分页未加载完时，排在已加载部分之后的任务留给后续分页
+            tasks.push(task);
+        }
+    }
+    syncTaskElement(task.id);
+    patchCalendarTask(task);
+}
+
+function applyTaskDelete(data) {
+    tasks = tasks.filter(t => t.id !== data.id);
+    syncTaskElement(data.id);
+    patchCalendarTask(data, true);
+}
+
+function applyListUpsert(list) {
+    const index = taskLists.findIndex(l => l.id === list.id);
+    if (index >= 0) {
+        taskLists[index] = list;
+    } else {
+        taskLists.push(list);
+        taskLists.sort((a, b) => a.sort_order - b.sort_order);
+    }
+    renderSidebar();
+    updateSidebarActiveState(currentListId);
+    if (list.id === currentListId) {
+        updatePageHeader(list.name, getListDescription(list.name));
+    }
+}
+
+function applyListDelete(data) {
+    taskLists = taskLists.filter(l => l.id !== data.id);
+    // 列表中的任务随列表一起删除
+    tasks = tasks.filter(t => t.list_id !== data.id);
+    weekTasks.forEach(day => {
+        day.tasks = day.tasks.filter(t => t.list_id !== data.id);
+    });
+    renderSidebar();
+    if (currentListId === data.id) {
+        currentListId = null;
+        if (taskLists.length > 0) {
+            navigateToList(taskLists[0].id);
+        }
+    } else {
+        updateSidebarActiveState(currentListId);
+    }
+    refreshCalendarIfVisible();
+}
+
+// 统计事件包含用户统计和所有列表的计数
+function applyStatsUpdate(data) {
+    renderStats(data.stats);
+    data.lists.forEach(counts => {
+        const list = taskLists.find(l => l.id === counts.id);
+        if (list) {
+            list.total_tasks = counts.total_tasks;
+            list.completed_tasks = counts.completed_tasks;
+        }
+    });
+    renderSidebar();
+    updateSidebarActiveState(currentListId);
+}
+
+// 偏好事件只包含修改过的字段
+function applyPreferencesUpdate(changes) {
+    Object.assign(userPreferences, changes);
+    if ('theme' in changes) {
+        applyTheme(changes.theme);
+    }
+    if ('show_completed' in changes && Boolean(changes.show_completed) !== showCompleted) {
+        showCompleted = Boolean(changes.show_completed);
+        updateShowCompletedIcon();
+        loadTasks(currentListId);
+    }
+}
+
+// 截止日期提醒：同一账号打开的每个页面都会收到
+function showReminder(reminder) {
+    const when = reminder.start_time ? `${reminder.start_time} 开始` : '今天到期';
+    showNotification(`⏰ ${reminder.title}（${when}）`, 'info');
+}
+
+// 服务端无法补发断线期间的事件（重启或积压过多）或发生了大批量写入时整体重新加载
+async function reloadAfterReset() {
+    try {
+        await loadTaskLists();
+        renderSidebar();
+        updateSidebarActiveState(currentListId);
+        await loadUserPreferences();
+        if (currentListId) {
+            await loadTasks(currentListId);
+        }
+        await loadStats();
+        if (!document.getElementById('calendarWeekView').classList.contains('hidden')) {
+            await loadCalendarWeek();
+            renderCalendarView();
+        }
+    } catch (error) {
+        console.error('重新加载数据失败:', error);
+    }
+}
+
 // 加载任务列表
 async function loadTaskLists() {
     try {
-        const response = await fetch('/api/task_lists');
-        taskLists = await response.json();
+        taskLists = await fetchJSONWithETag('/api/task_lists');
     } catch (error) {
         console.error('加载任务列表失败:', error);
         throw error;
@@ -215,8 +450,7 @@ async function loadTaskLists() {
 // 加载用户偏好
 async function loadUserPreferences() {
     try {
-        const response = await fetch('/api/user_preferences');
-        userPreferences = await response.json();
+        userPreferences = await fetchJSONWithETag('/api/user_preferences');
         showCompleted = userPreferences.show_completed;
         applyTheme(userPreferences.theme);
         updateShowCompletedIcon();
@@ -228,8 +462,7 @@ async function loadUserPreferences() {
 // 加载统计信息
 async function loadStats() {
     try {
-        const response = await fetch('/api/stats');
-        const stats = await response.json();
+        const stats = await fetchJSONWithETag('/api/stats');
         renderStats(stats);
     } catch (error) {
         console.error('加载统计信息失败:', error);
@@ -297,6 +530,15 @@ function renderSidebar() {
 
 // 更新任务列表统计（不重新加载整个列表）
 function updateTaskListStats() {
+    // 分页未加载完时本地数据不完整，改为从服务端获取列表计数
+    if (tasksNextCursor) {
+        loadTaskLists().then(() => {
+            renderSidebar();
+            updateSidebarActiveState(currentListId);
+        });
+        return;
+    }
+    
     // 更新当前列表的统计
     const currentList = taskLists.find(list => list.id === currentListId);
     if (currentList) {
@@ -374,12 +616,28 @@ function updateSidebarActiveState(listId) {
     }
 }
 
-// 加载任务列表
+// 构建任务分页请求地址
+function buildTasksUrl(listId, cursor = null) {
+    const params = new URLSearchParams({
+        show_completed: showCompleted,
+        limit: TASK_PAGE_SIZE,
+        fields: TASK_LIST_FIELDS
+    });
+    if (listId) {
+        params.set('list_id', listId);
+    }
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return `/api/tasks?${params.toString()}`;
+}
+
+// 加载任务列表（第一页）
 async function loadTasks(listId = null) {
     try {
-        const url = listId ? `/api/tasks?list_id=${listId}&show_completed=${showCompleted}` : `/api/tasks?show_completed=${showCompleted}`;
-        const response = await fetch(url);
-        tasks = await response.json();
+        const page = await fetchJSONWithETag(buildTasksUrl(listId));
+        tasks = page.tasks;
+        tasksNextCursor = page.next_cursor;
         renderTasks();
     } catch (error) {
         console.error('加载任务失败:', error);
@@ -387,6 +645,62 @@ async function loadTasks(listId = null) {
     }
 }
 
+// 滚动到底部时加载下一页
+async function loadMoreTasks() {
+    if (!tasksNextCursor || isLoadingMoreTasks) return;
+    
+    isLoadingMoreTasks = true;
+    const listId = currentListId;
+    try {
+        const page = await fetchJSONWithETag(buildTasksUrl(listId, tasksNextCursor));
+        // 加载期间切换了列表则丢弃结果
+        if (listId !== currentListId) return;
+        
+        tasks = tasks.concat(page.tasks);
+        tasksNextCursor = page.next_cursor;
+        
+        const tasksList = document.getElementById('tasksList');
+        page.tasks.forEach(task => {
+            tasksList.insertBefore(createTaskItem(task), document.getElementById('tasksScrollSentinel'));
+        });
+        updateTasksScrollSentinel();
+    } catch (error) {
+        console.error('加载更多任务失败:', error);
+        showNotification('加载更多任务失败', 'error');
+    } finally {
+        isLoadingMoreTasks = false;
+    }
+}
+
+// 在列表末尾放置哨兵元素，进入可视区域时加载下一页
+function updateTasksScrollSentinel() {
+    const tasksList = document.getElementById('tasksList');
+    let sentinel = document.getElementById('tasksScrollSentinel');
+    
+    if (!tasksNextCursor) {
+        if (sentinel) sentinel.remove();
+        return;
+    }
+    
+    if (!sentinel) {
+        sentinel = document.createElement('div');
+        sentinel.id = 'tasksScrollSentinel';
+        sentinel.className = 'text-center py-4 text-sm text-gray-400';
+        sentinel.innerHTML = '<i class="fas fa-spinner fa-spin mr-2"></i>加载更多...';
+    }
+    tasksList.appendChild(sentinel);
+    
+    if (!tasksScrollObserver) {
+        tasksScrollObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreTasks();
+            }
+        }, { rootMargin: '200px' });
+    }
+    tasksScrollObserver.disconnect();
+    tasksScrollObserver.observe(sentinel);
+}
+
 // 渲染任务列表
 function renderTasks() {
     const tasksList = document.getElementById('tasksList');
@@ -433,6 +747,8 @@ function renderTasks() {
             }
         });
     }, 600);
+    
+    updateTasksScrollSentinel();
 }
 
 // 创建任务项
@@ -521,9 +837,7 @@ async function toggleTaskComplete(taskId) {
         });
 
         if (response.ok) {
-            await loadTasks(currentListId);
-            await loadStats();
-            updateTaskListStats(); // 更新侧边栏统计（不重新加载整个列表）
+            await refreshAfterTaskChange();
             showNotification(task.completed ? '任务已标记为未完成' : '任务已完成');
         } else {
             throw new Error('更新失败');
@@ -549,7 +863,7 @@ async function toggleTaskImportant(taskId) {
         });
 
         if (response.ok) {
-            await loadTasks(currentListId);
+            await refreshAfterTaskChange();
             showNotification(task.is_important ? '已取消重要标记' : '已标记为重要');
         } else {
             throw new Error('更新失败');
@@ -605,9 +919,7 @@ async function addQuickTask(event) {
 
         if (response.ok) {
             input.value = '';
-            await loadTasks(currentListId);
-            await loadStats();
-            updateTaskListStats(); // 更新侧边栏统计
+            await refreshAfterTaskChange();
             showNotification('任务已添加');
         } else {
             throw new Error('创建失败');
@@ -731,9 +1043,7 @@ async function saveTask(event) {
 
         if (response.ok) {
             hideTaskModal();
-            await loadTasks(currentListId);
-            await loadStats();
-            updateTaskListStats(); // 更新侧边栏统计
+            await refreshAfterTaskChange();
             showNotification(currentEditingTaskId ? '任务已更新' : '任务已创建');
         } else {
             throw new Error('保存失败');
@@ -756,9 +1066,7 @@ async function deleteTask(taskId) {
         });
 
         if (response.ok) {
-            await loadTasks(currentListId);
-            await loadStats();
-            updateTaskListStats(); // 更新侧边栏统计
+            await refreshAfterTaskChange();
             showNotification('任务已删除');
         } else {
             throw new Error('删除失败');
@@ -818,10 +1126,23 @@ function renderSearchResults(results, query) {
 
     results.forEach(result => {
         const taskItem = createTaskItem(result);
+        applySearchHighlight(taskItem, result);
         searchResults.appendChild(taskItem);
     });
 }
 
+// 使用服务端返回的高亮片段（已转义HTML，只包含<mark>标签）
+function applySearchHighlight(taskItem, result) {
+    const titleElement = taskItem.querySelector('.task-title');
+    if (titleElement && result.title_highlight) {
+        titleElement.innerHTML = result.title_highlight;
+    }
+    const descriptionElement = taskItem.querySelector('.task-description');
+    if (descriptionElement && result.description_snippet) {
+        descriptionElement.innerHTML = result.description_snippet;
+    }
+}
+
 // 切换显示已完成任务
 async function toggleShowCompleted() {
     showCompleted = !showCompleted;
@@ -1109,10 +1430,10 @@ function handleMoreAction(action) {
             showCalendarWeekView();
             break;
         case 'import':
-            showNotification('导入任务功能开发中...', 'info');
+            chooseImportFile();
             break;
         case 'export':
-            showNotification('导出任务功能开发中...', 'info');
+            exportTasks(confirm('点击“确定”导出为CSV（可用Excel打开），点击“取消”导出为JSON Lines（包含列表信息）') ? 'csv' : 'ndjson');
             break;
         case 'ai_config':
             showAIConfigModal();
@@ -1128,6 +1449,79 @@ function handleMoreAction(action) {
     }
 }
 
+// 导出任务（服务端流式输出，浏览器直接下载）
+function exportTasks(format) {
+    const link = document.createElement('a');
+    link.href = `/api/export?format=${format}`;
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+    showNotification('正在导出任务...', 'info');
+}
+
+function chooseImportFile() {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = '.csv,.ndjson,.jsonl,.json';
+    input.onchange = () => {
+        if (input.files.length > 0) {
+            importTasks(input.files[0]);
+        }
+    };
+    input.click();
+}
+
+// 导入任务：上传期间轮询进度接口显示已处理行数
+async function importTasks(file) {
+    const importId = Date.now().toString(36) + Math.random().toString(36).slice(2, 8);
+    const formData = new FormData();
+    formData.append('file', file);
+    
+    showNotification(`正在导入 ${file.name}...`, 'info');
+    const progressTimer = setInterval(async () => {
+        try {
+            const response = await fetch(`/api/import/${importId}/progress`);
+            if (response.ok) {
+                const progress = await response.json();
+                showNotification(`已处理 ${progress.rows_processed} 行，导入 ${progress.imported} 个任务`, 'info');
+            }
+        } catch (error) {
+            console.error('获取导入进度失败:', error);
+        }
+    }, 1000);
+    
+    try {
+        const response = await fetch(`/api/import?import_id=${importId}`, {
+            method: 'POST',
+            body: formData
+        });
+        const result = await response.json();
+        clearInterval(progressTimer);
+        
+        if (!response.ok) {
+            throw new Error(result.error || '导入失败');
+        }
+        
+        // 推送连接正常时服务端会发送 reset 事件触发重新加载
+        if (!changeFeedConnected) {
+            await loadTaskLists();
+            renderSidebar();
+            await loadTasks(currentListId);
+            await loadStats();
+        }
+        
+        const skipped = result.skipped ? `，跳过 ${result.skipped} 行` : '';
+        showNotification(`导入完成：${result.imported} 个任务${skipped}`, result.skipped ? 'info' : 'success');
+        if (result.errors && result.errors.length > 0) {
+            console.warn('导入时跳过的行:', result.errors);
+        }
+    } catch (error) {
+        clearInterval(progressTimer);
+        console.error('导入任务失败:', error);
+        showNotification(error.message || '导入任务失败', 'error');
+    }
+}
+
 // 点击外部关闭滑动侧边栏
 document.addEventListener('click', function(event) {
     const sidebar = document.getElementById('slidingSidebar');
@@ -1418,18 +1812,38 @@ async function sendAIMessage() {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'text/event-stream, application/json'
             },
             body: JSON.stringify({
-                message: message
+                message: message,
+                stream: true,
+                async: true
             })
         });
         
-        const data = await response.json();
+        // 202：请求已进入后台队列，开启流式回复时接收任务的流式输出，否则等待任务结束
+        // 200：本地回复或缓存命中，直接返回JSON
+        let data = await response.json();
+        const streamed = response.status === 202 && data.stream;
+        if (streamed && changeFeedConnected) {
+            // 流式输出以 ai.token 事件通过变更推送到达，不再单独占用一个连接
+            followAIStream(data.job_id);
+            const job = await waitForAIJob(data.job_id);
+            data = finishAIStream(data.job_id, job.result || {});
+        } else if (streamed) {
+            const stream = await fetch(`/api/ai/jobs/${data.job_id}/stream`);
+            data = await readAIStream(stream) || {};
+        } else if (response.status === 202) {
+            const job = await waitForAIJob(data.job_id);
+            data = job.result || {};
+        }
         
         hideAITyping();
         
         if (data.response) {
-            addAIMessage(data.response, 'assistant');
+            if (!streamed) {
+                addAIMessage(data.response, 'assistant');
+            }
             
             // 处理AI通过接口执行的操作
             if (data.source === 'ai_with_actions' && data.actions) {
@@ -1442,8 +1856,12 @@ async function sendAIMessage() {
             } else if (data.source === 'ai_with_actions') {
                 console.log('AI回复来源: AI执行操作');
                 console.log('执行的操作:', data.actions);
+            } else if (data.source === 'cache') {
+                console.log('AI回复来源: 缓存');
             } else if (data.source === 'local_fallback') {
                 console.log('AI回复来源: 本地降级');
+            } else if (data.source === 'ai_interrupted') {
+                console.log('AI回复来源: 真实AI（回复中断，未记录）');
             } else {
                 // 本地回复
                 console.log('AI回复来源: 本地规则');
@@ -1461,6 +1879,87 @@ async function sendAIMessage() {
     }
 }
 
+// 等待AI任务结束：变更推送连接时由 ai.job 事件唤醒，同时以递增间隔轮询兜底
+async function waitForAIJob(jobId) {
+    let delay = 500;
+    let finished = null;
+    const pushed = new Promise(resolve => aiJobWaiters.set(jobId, resolve));
+    try {
+        while (!finished) {
+            const timer = new Promise(resolve => setTimeout(resolve, delay, null));
+            finished = await Promise.race([pushed, timer]);
+            if (!finished) {
+                const response = await fetch(`/api/ai/jobs/${jobId}`);
+                if (!response.ok) throw new Error('AI任务不存在');
+                const job = await response.json();
+                if (['done', 'failed', 'cancelled'].includes(job.status)) finished = job;
+                delay = Math.min(delay * 2, changeFeedConnected ? 10000 : 3000);
+            }
+        }
+    } finally {
+        aiJobWaiters.delete(jobId);
+    }
+    return finished;
+}
+
+function resolveAIJob(job) {
+    if (!['done', 'failed', 'cancelled'].includes(job.status)) return;
+    const resolve = aiJobWaiters.get(job.job_id);
+    if (resolve) {
+        resolve(job);
+    } else {
+        // 其他页面发起的任务：丢弃累积的流式输出
+        aiTokenStreams.delete(job.job_id);
+    }
+}
+
+function getAIStream(jobId) {
+    let stream = aiTokenStreams.get(jobId);
+    if (!stream) {
+        stream = { text: '', content: null, active: false };
+        aiTokenStreams.set(jobId, stream);
+    }
+    return stream;
+}
+
+function renderAIStream(stream) {
+    if (!stream.content) {
+        hideAITyping();
+        stream.content = addAIMessage('', 'assistant');
+    }
+    renderAIMessageContent(stream.content, stream.text);
+    const messagesContainer = document.getElementById('aiChatMessages');
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function applyAIToken(payload) {
+    const stream = getAIStream(payload.job_id);
+    stream.text += payload.content;
+    if (stream.active) renderAIStream(stream);
+}
+
+// 开始显示任务的流式输出（包括 202 响应之前已经收到的部分）
+function followAIStream(jobId) {
+    const stream = getAIStream(jobId);
+    stream.active = true;
+    if (stream.text) renderAIStream(stream);
+}
+
+// 任务结束：最终回复可能包含操作执行结果，替换流式输出的原文
+function finishAIStream(jobId, result) {
+    const stream = aiTokenStreams.get(jobId);
+    aiTokenStreams.delete(jobId);
+    hideAITyping();
+    if (result.response) {
+        if (stream && stream.content) {
+            renderAIMessageContent(stream.content, result.response);
+        } else {
+            addAIMessage(result.response, 'assistant');
+        }
+    }
+    return result;
+}
+
 // 处理AI执行的操作
 async function handleAIActions(actions) {
     console.log('处理AI操作:', actions);
@@ -1496,7 +1995,11 @@ async function handleAIActions(actions) {
         }
     }
     
-    // 执行刷新操作
+    // 执行刷新操作（推送连接正常时变更已通过事件应用）
+    if (changeFeedConnected) {
+        needsListsRefresh = needsRefresh = needsStatsRefresh = false;
+    }
+    
     if (needsListsRefresh) {
         await loadTaskLists();
         renderSidebar();
@@ -1572,6 +2075,25 @@ function addAIMessage(message, sender) {
     
     const content = document.createElement('div');
     content.className = 'ai-message-content';
+    renderAIMessageContent(content, message);
+    
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(content);
+    messagesContainer.appendChild(messageDiv);
+    
+    // 滚动到底部
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    
+    // 移除动画类
+    setTimeout(() => {
+        messageDiv.classList.remove('ai-message-enter');
+    }, 300);
+    
+    return content;
+}
+
+function renderAIMessageContent(content, message) {
+    content.innerHTML = '';
     
     // 处理多行消息
     const lines = message.split('\n');
@@ -1596,18 +2118,61 @@ function addAIMessage(message, sender) {
         p.textContent = message;
         content.appendChild(p);
     }
+}
+
+// 读取流式AI回复（SSE）：token事件逐段追加，done事件给出最终回复和操作结果
+async function readAIStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let content = null;
+    let result = null;
     
-    messageDiv.appendChild(avatar);
-    messageDiv.appendChild(content);
-    messagesContainer.appendChild(messageDiv);
-    
-    // 滚动到底部
-    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let eventName = 'message';
+            let eventData = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) eventData += line.slice(5).trim();
+            });
+            if (!eventData) continue;
+            const payload = JSON.parse(eventData);
+            
+            if (eventName === 'token') {
+                if (!content) {
+                    hideAITyping();
+                    content = addAIMessage('', 'assistant');
+                }
+                text += payload.content;
+                renderAIMessageContent(content, text);
+                const messagesContainer = document.getElementById('aiChatMessages');
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            } else if (eventName === 'done') {
+                result = payload;
+            }
+        }
+    }
     
-    // 移除动画类
-    setTimeout(() => {
-        messageDiv.classList.remove('ai-message-enter');
-    }, 300);
+    hideAITyping();
+    if (result && result.response) {
+        // 最终回复可能包含操作执行结果，替换流式输出的原文
+        if (content) {
+            renderAIMessageContent(content, result.response);
+        } else {
+            addAIMessage(result.response, 'assistant');
+        }
+    }
+    return result;
 }
 
 function showAITyping() {
@@ -2283,6 +2848,53 @@ async function loadCalendarWeek() {
     }
 }
 
+// 根据任务变更事件修改已加载的周数据，不重新请求整周
+function patchCalendarTask(task, deleted = false) {
+    if (weekTasks.length === 0) return;
+    
+    // 重复任务的每一次由服务端按规则展开：重新加载本周（服务端有缓存）
+    if (weekTasks.some(day => day.tasks.some(t => t.id === task.id && t.occurrence_date))) {
+        loadCalendarWeek().then(refreshCalendarIfVisible);
+        return;
+    }
+    
+    weekTasks.forEach(day => {
+        day.tasks = day.tasks.filter(t => t.id !== task.id);
+    });
+    const day = deleted ? null : weekTasks.find(d => d.date === task.due_date);
+    if (day) {
+        const list = taskLists.find(l => l.id === task.list_id) || {};
+        day.tasks.push({
+            id: task.id,
+            title: task.title,
+            description: task.description,
+            completed: task.completed,
+            priority: task.priority,
+            start_time: task.start_time,
+            end_time: task.end_time,
+            list_id: task.list_id,
+            is_important: task.is_important,
+            list_name: list.name,
+            list_icon: list.icon,
+            list_color: list.color
+        });
+        // 与服务端一致：按开始时间（无时间在前），同一时间重要任务在前
+        day.tasks.sort((a, b) => {
+            const startA = a.start_time || '';
+            const startB = b.start_time || '';
+            if (startA !== startB) return startA < startB ? -1 : 1;
+            return Number(Boolean(b.is_important)) - Number(Boolean(a.is_important));
+        });
+    }
+    refreshCalendarIfVisible();
+}
+
+function refreshCalendarIfVisible() {
+    if (!document.getElementById('calendarWeekView').classList.contains('hidden')) {
+        renderCalendarView();
+    }
+}
+
 // 更新周标题
 function updateWeekTitle() {
     const weekEnd = new Date(currentWeekStart);
@@ -2465,7 +3077,8 @@ function createCalendarTaskBlock(task) {
     const taskBlock = document.createElement('div');
     taskBlock.className = `calendar-task-block priority-${task.priority} ${task.completed ? 'completed' : ''}`;
     taskBlock.dataset.taskId = task.id;
-    taskBlock.draggable = true;
+    // 重复任务的单次日期由规则决定，不能拖动
+    taskBlock.draggable = !task.occurrence_date;
     
     // 计算位置和高度
     const startHour = task.start_time ? parseInt(task.start_time.split(':')[0]) : 9;
@@ -2653,8 +3266,14 @@ async function updateTaskTime(taskId, newDate, newHour) {
         
         if (response.ok) {
             showNotification(`任务时间已更新到 ${startTime}`);
-            await loadCalendarWeek();
-            renderCalendarView();
+            // 直接移动已加载的任务，不重新请求整周（变更推送到达时会再按服务端数据修正一次）
+            const task = weekTasks.flatMap(day => day.tasks).find(t => t.id === taskId);
+            if (task) {
+                patchCalendarTask({ ...task, due_date: newDate, start_time: startTime, end_time: endTime });
+            } else if (!changeFeedConnected) {
+                await loadCalendarWeek();
+                renderCalendarView();
+            }
         } else {
             throw new Error('更新失败');
         }
@@ -0,0 +1,219 @@
+import json
+from datetime import datetime
+
+# 批量更新允许修改的字段（顺序固定，用于生成列签名）
+UPDATE_FIELDS = ('title', 'description', 'priority', 'due_date', 'start_time',
+                 'end_time', 'list_id', 'completed', 'is_important')
+
+CREATE_TASK_SQL = '''
+    INSERT INTO tasks (title, description, priority, due_date, start_time, end_time,
+                       list_id, is_important, completed, completed_at, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+DELETE_TASK_SQL = 'DELETE FROM tasks WHERE id = ? AND user_id = ?'
+
+# 用 json_each 一次查出本批次涉及的、属于当前用户的任务ID，参数个数与批次大小无关
+OWNED_IDS_SQL = '''
+    SELECT id FROM tasks
+    WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+'''
+OWNED_LISTS_SQL = '''
+    SELECT id FROM task_lists
+    WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+'''
+
+# 可以为 null 的文本字段，以及取布尔值（或 0/1）的字段
+TEXT_FIELDS = ('description', 'priority', 'due_date', 'start_time', 'end_time')
+FLAG_FIELDS = ('completed', 'is_important')
+
+
+class BatchError(ValueError):
+    """批量请求格式错误"""
+
+
+def _item_id(item):
+    task_id = item.get('id') if isinstance(item, dict) else item
+    if isinstance(task_id, bool):
+        return None
+    try:
+        return int(task_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_task_fields(fields, creating=False):
+    """检查任务字段的类型，有问题时返回错误信息，否则返回 None
+
+    创建时必须有标题，更新时只检查出现的字段
+    """
+    if creating or 'title' in fields:
+        title = fields.get('title')
+        if title is not None and not isinstance(title, str):
+            return '字段 title 必须是字符串'
+        if not (title or '').strip():
+            return '任务标题不能为空'
+    for field in TEXT_FIELDS:
+        if fields.get(field) is not None and not isinstance(fields[field], str):
+            return f'字段 {field} 必须是字符串'
+    if fields.get('list_id') is not None and not _is_id(fields['list_id']):
+        return '字段 list_id 必须是整数'
+    for field in FLAG_FIELDS:
+        if field in fields and not isinstance(fields[field], (bool, int)):
+            return f'字段 {field} 必须是布尔值'
+    return None
+
+
+def owned_list_ids(cursor, user_id, items):
+    """一次查出这些字段中引用的、属于当前用户的列表ID"""
+    refs = {item['list_id'] for item in items if isinstance(item, dict) and _is_id(item.get('list_id'))}
+    if not refs:
+        return set()
+    cursor.execute(OWNED_LISTS_SQL, (user_id, json.dumps(sorted(refs))))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def check_task_fields(fields, owned_lists, creating=False):
+    """字段类型和列表归属检查，有问题时返回错误信息"""
+    error = validate_task_fields(fields, creating)
+    if error is None and fields.get('list_id') is not None and fields['list_id'] not in owned_lists:
+        error = f'列表{fields["list_id"]}不存在'
+    return error
+
+
+def update_signature(update):
+    """按出现的字段生成列签名，签名相同的更新可以共用同一条预编译语句"""
+    return tuple(field for field in UPDATE_FIELDS if field in update)
+
+
+def update_sql(signature):
+    assignments = [f'{field} = ?' for field in signature]
+    if 'completed' in signature:
+        assignments.append('completed_at = ?')
+    assignments.append('updated_at = ?')
+    return f"UPDATE tasks SET {', '.join(assignments)} WHERE id = ? AND user_id = ?"
+
+
+def update_params(update, signature, task_id, user_id, now):
+    params = [update[field] for field in signature]
+    if 'completed' in signature:
+        params.append(now if update['completed'] else None)
+    params.extend([now, task_id, user_id])
+    return params
+
+
+def _execute_group(cursor, sql, rows):
+    """用一次 executemany 执行一组按主键匹配的语句，返回每条语句影响的行数
+
+    每条语句至多影响1行，总行数等于条数时每条都是1行；否则撤销这一组，
+    逐条执行并取每条语句自己的行数
+    """
+    cursor.execute('SAVEPOINT bulk_group')
+    cursor.executemany(sql, rows)
+    if cursor.rowcount == len(rows):
+        counts = [1] * len(rows)
+    else:
+        cursor.execute('ROLLBACK TO bulk_group')
+        counts = []
+        for row in rows:
+            cursor.execute(sql, row)
+            counts.append(cursor.rowcount)
+    cursor.execute('RELEASE bulk_group')
+    return counts
+
+
+def apply_batch(conn, user_id, creates=(), updates=(), deletes=()):
+    """在一个 BEGIN IMMEDIATE 事务中执行批量创建、更新和删除
+
+    - 字段类型不对或引用了其他用户列表的项单独报错，不影响其他项
+    - 更新按列签名分组，每组一次 executemany
+    - 删除一次 executemany
+    - 返回逐项结果（创建的ID、每项实际影响的行数），失败时整体回滚
+    """
+    if not all(isinstance(items, (list, tuple)) for items in (creates, updates, deletes)):
+        raise BatchError('creates、updates、deletes 必须是数组')
+
+    now = datetime.now().isoformat()
+    cursor = conn.cursor()
+    created, updated, deleted = [], [], []
+
+    if conn.in_transaction:
+        conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        owned_lists = owned_list_ids(cursor, user_id, list(creates) + list(updates))
+
+        # 创建：需要逐项返回新ID，使用同一条语句（语句缓存复用）
+        for index, item in enumerate(creates):
+            error = check_task_fields(item, owned_lists, creating=True) if isinstance(item, dict) else '格式错误'
+            if error:
+                created.append({'index': index, 'id': None, 'error': error})
+                continue
+            completed = bool(item.get('completed', False))
+            cursor.execute(CREATE_TASK_SQL, (
+                item['title'].strip(),
+                item.get('description', ''),
+                item.get('priority', 'medium'),
+                item.get('due_date'),
+                item.get('start_time'),
+                item.get('end_time'),
+                item.get('list_id'),
+                item.get('is_important', False),
+                completed,
+                now if completed else None,
+                user_id
+            ))
+            created.append({'index': index, 'id': cursor.lastrowid})
+
+        # 更新：签名 → [(结果下标, 参数)]，行数由执行的语句回填
+        groups = {}
+        for update in updates:
+            task_id = _item_id(update) if isinstance(update, dict) else None
+            if task_id is None:
+                updated.append({'id': None, 'rowcount': 0, 'error': '缺少任务ID'})
+                continue
+            signature = update_signature(update)
+            error = check_task_fields(update, owned_lists) if signature else '没有要更新的字段'
+            if error:
+                updated.append({'id': task_id, 'rowcount': 0, 'error': error})
+                continue
+            groups.setdefault(signature, []).append(
+                (len(updated), update_params(update, signature, task_id, user_id, now)))
+            updated.append({'id': task_id, 'rowcount': 0})
+
+        for signature, items in groups.items():
+            counts = _execute_group(cursor, update_sql(signature), [params for _, params in items])
+            for (index, _), count in zip(items, counts):
+                updated[index]['rowcount'] = count
+
+        delete_rows = []
+        for item in deletes:
+            task_id = _item_id(item)
+            if task_id is None:
+                deleted.append({'id': None, 'rowcount': 0, 'error': '缺少任务ID'})
+                continue
+            delete_rows.append((len(deleted), (task_id, user_id)))
+            deleted.append({'id': task_id, 'rowcount': 0})
+        if delete_rows:
+            # 同一批次中重复删除同一任务时，后面的语句影响0行
+            counts = _execute_group(cursor, DELETE_TASK_SQL, [params for _, params in delete_rows])
+            for (index, _), count in zip(delete_rows, counts):
+                deleted[index]['rowcount'] = count
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'created': created,
+        'updated': updated,
+        'deleted': deleted,
+        'created_count': sum(1 for item in created if item['id'] is not None),
+        'updated_count': sum(item['rowcount'] for item in updated),
+        'deleted_count': sum(item['rowcount'] for item in deleted),
+        'update_groups': len(groups),
+    }
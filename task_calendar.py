@@ -0,0 +1,306 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+import serializers
+import task_recurrence
+from ttl_cache import TTLCache
+
+# 周视图之外的范围查询（月视图、日程视图）最多跨越的天数
+MAX_RANGE_DAYS = 92
+WEEK_DAYS = 7
+# 周视图输出中起止日期的字段名（范围查询为 start/end）
+WEEK_KEYS = ('week_start', 'week_end')
+
+# 覆盖范围查询过滤和排序列的索引，取代迁移2的 (user_id, due_date)
+CALENDAR_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_due_start ON tasks (user_id, due_date, start_time)',
+    'DROP INDEX IF EXISTS idx_tasks_user_due_date',
+]
+
+# 每个 (用户, 周一) 一个版本号，由触发器在该周内的任务变化时递增。
+# 缓存的日历数据按覆盖的各周版本号之和判断是否过期（版本号只增不减，和变化即有写入）
+WEEK_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS calendar_week_versions (
+        user_id INTEGER NOT NULL,
+        week_start DATE NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, week_start)
+    ) WITHOUT ROWID
+'''
+
+# 重复任务的规则或模板变化会影响所有周：记在每个用户一行的特殊版本号上，所有范围都计入它
+SERIES_WEEK = ''
+
+# 截止日期所在周的周一（'weekday 0' 前进到周日，周日当天不变）
+_WEEK_OF = "date({due}, 'weekday 0', '-6 days')"
+# 会出现在日历数据中的任务列，只修改其他列（如 updated_at、completed_at）时不使缓存失效
+_CALENDAR_COLUMNS = ('title', 'description', 'completed', 'priority', 'due_date', 'start_time',
+                     'end_time', 'list_id', 'is_important', 'user_id')
+
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'due_date', 'start_time',
+               'end_time', 'list_id', 'is_important', 'list_name', 'list_icon', 'list_color')
+# 任务按日期分组输出，不再重复 due_date
+TASK_OUTPUT = tuple(field for field in TASK_FIELDS if field != 'due_date')
+
+# 分组在SQL中完成：day_index 为任务所在的天相对范围起点的偏移，
+# 按 idx_tasks_user_due_start 的顺序读出，Python 只需按下标追加
+RANGE_SQL = '''
+    SELECT CAST(julianday(t.due_date) - julianday(?2) AS INTEGER) AS day_index,
+           t.id, t.title, t.description, t.completed, t.priority,
+           t.due_date, t.start_time, t.end_time, t.list_id, t.is_important,
+           tl.name, tl.icon, tl.color
+    FROM tasks t
+    LEFT JOIN task_lists tl ON t.list_id = tl.id
+    WHERE t.user_id = ?1 AND t.due_date BETWEEN ?2 AND ?3
+    ORDER BY t.due_date, t.start_time, t.is_important DESC
+'''
+
+# 两个子查询各走主键：OR 写在一起会退化成扫描该用户的全部周
+VERSION_SQL = f'''
+    SELECT IFNULL((SELECT SUM(version) FROM calendar_week_versions
+                   WHERE user_id = ?1 AND week_start BETWEEN ?2 AND ?3), 0)
+         + IFNULL((SELECT version FROM calendar_week_versions
+                   WHERE user_id = ?1 AND week_start = '{SERIES_WEEK}'), 0)
+'''
+
+# 窗口内有重复日期的系列模板
+_SERIES_TASKS_SQL = '''
+    SELECT t.id, t.title, t.description, t.completed, t.priority,
+           t.due_date, t.start_time, t.end_time, t.list_id, t.is_important,
+           tl.name, tl.icon, tl.color
+    FROM tasks t
+    LEFT JOIN task_lists tl ON t.list_id = tl.id
+    WHERE t.user_id = ? AND t.id IN (SELECT value FROM json_each(?))
+'''
+
+
+class CalendarRangeError(ValueError):
+    """日期范围参数错误"""
+
+
+def week_bump_sql(row, condition=''):
+    """使 {row}.due_date 所在周的版本号递增（{row} 为 NEW 或 OLD，需有 user_id、due_date 列）"""
+    return f'''
+        INSERT INTO calendar_week_versions (user_id, week_start, version)
+        SELECT {row}.user_id, {_WEEK_OF.format(due=f'{row}.due_date')}, 1
+        WHERE {row}.user_id IS NOT NULL AND date({row}.due_date) IS NOT NULL {condition}
+        ON CONFLICT(user_id, week_start) DO UPDATE SET version = version + 1;
+    '''
+
+
+def get_calendar_triggers_sql():
+    """周版本号维护触发器"""
+    columns = ', '.join(_CALENDAR_COLUMNS)
+    moved = (f"AND (OLD.user_id IS NOT NEW.user_id "
+             f"OR {_WEEK_OF.format(due='OLD.due_date')} IS NOT {_WEEK_OF.format(due='NEW.due_date')})")
+    return [
+        'DROP TRIGGER IF EXISTS trg_tasks_calendar_insert',
+        'DROP TRIGGER IF EXISTS trg_tasks_calendar_update',
+        'DROP TRIGGER IF EXISTS trg_tasks_calendar_delete',
+        'DROP TRIGGER IF EXISTS trg_task_lists_calendar_update',
+        f'''
+        CREATE TRIGGER trg_tasks_calendar_insert AFTER INSERT ON tasks BEGIN
+            {week_bump_sql('NEW')}
+        END
+        ''',
+        # 任务移到其他周（或其他用户）时原来所在的周也要失效
+        f'''
+        CREATE TRIGGER trg_tasks_calendar_update AFTER UPDATE OF {columns} ON tasks BEGIN
+            {week_bump_sql('NEW')}
+            {week_bump_sql('OLD', moved)}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER trg_tasks_calendar_delete AFTER DELETE ON tasks BEGIN
+            {week_bump_sql('OLD')}
+        END
+        ''',
+        # 日历数据带有列表名称、图标和颜色：只使包含该列表任务的周失效
+        f'''
+        CREATE TRIGGER trg_task_lists_calendar_update AFTER UPDATE OF name, icon, color ON task_lists BEGIN
+            INSERT INTO calendar_week_versions (user_id, week_start, version)
+            SELECT DISTINCT NEW.user_id, {_WEEK_OF.format(due='due_date')}, 1 FROM tasks
+            WHERE list_id = NEW.id AND user_id = NEW.user_id AND date(due_date) IS NOT NULL
+            ON CONFLICT(user_id, week_start) DO UPDATE SET version = version + 1;
+        END
+        ''',
+    ]
+
+
+def _series_bump_sql(user_id):
+    return f'''
+        INSERT INTO calendar_week_versions (user_id, week_start, version)
+        SELECT {user_id}, '{SERIES_WEEK}', 1 WHERE {user_id} IS NOT NULL
+        ON CONFLICT(user_id, week_start) DO UPDATE SET version = version + 1;
+    '''
+
+
+def get_recurrence_calendar_triggers_sql():
+    """重复任务相关的周版本号触发器：规则和模板变化影响所有周，单次的例外只影响所在周"""
+    columns = ', '.join(_CALENDAR_COLUMNS)
+    statements = []
+    for event, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+        statements.extend([
+            f'DROP TRIGGER IF EXISTS trg_task_recurrences_calendar_{event}',
+            f'DROP TRIGGER IF EXISTS trg_task_occurrence_exceptions_calendar_{event}',
+            f'''
+            CREATE TRIGGER trg_task_recurrences_calendar_{event} AFTER {event.upper()} ON task_recurrences BEGIN
+                {_series_bump_sql(f'{row}.user_id')}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER trg_task_occurrence_exceptions_calendar_{event}
+            AFTER {event.upper()} ON task_occurrence_exceptions BEGIN
+                {week_bump_sql(row)}
+            END
+            ''',
+        ])
+    statements.extend([
+        'DROP TRIGGER IF EXISTS trg_tasks_calendar_series',
+        'DROP TRIGGER IF EXISTS trg_task_lists_calendar_series',
+        f'''
+        CREATE TRIGGER trg_tasks_calendar_series AFTER UPDATE OF {columns} ON tasks
+        WHEN EXISTS (SELECT 1 FROM task_recurrences WHERE task_id = NEW.id) BEGIN
+            {_series_bump_sql('NEW.user_id')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER trg_task_lists_calendar_series AFTER UPDATE OF name, icon, color ON task_lists
+        WHEN EXISTS (SELECT 1 FROM tasks t JOIN task_recurrences r ON r.task_id = t.id WHERE t.list_id = NEW.id)
+        BEGIN
+            {_series_bump_sql('NEW.user_id')}
+        END
+        ''',
+    ])
+    return statements
+
+
+def week_start_of(day):
+    """所在周的周一"""
+    return day - timedelta(days=day.weekday())
+
+
+def parse_range(start, end=None, days=None):
+    """解析日期范围参数，返回 (起始日期, 天数)；end 为包含在内的最后一天"""
+    try:
+        start_date = date.fromisoformat(start)
+        if end:
+            days = (date.fromisoformat(end) - start_date).days + 1
+    except (TypeError, ValueError):
+        raise CalendarRangeError('日期格式应为 YYYY-MM-DD')
+    days = WEEK_DAYS if days is None else days
+    if not 1 <= days <= MAX_RANGE_DAYS:
+        raise CalendarRangeError(f'日期范围应为 1 到 {MAX_RANGE_DAYS} 天')
+    return start_date, days
+
+
+def get_range_version(cursor, user_id, start_date, days):
+    """范围覆盖的各周版本号之和（主键范围查找）"""
+    end_date = start_date + timedelta(days=days - 1)
+    cursor.execute(VERSION_SQL, (user_id, week_start_of(start_date).isoformat(), week_start_of(end_date).isoformat()))
+    return cursor.fetchone()[0]
+
+
+def _calendar_order(task):
+    # 与 RANGE_SQL 的排序一致：没有开始时间的在前，同一时间重要任务在前
+    return (task['start_time'] is not None, task['start_time'] or '', not task['is_important'])
+
+
+def _add_occurrences(cursor, user_id, start_date, end_date, days):
+    """把范围内重复任务的每一次加入对应的天（带 occurrence_date，completed 为这一次的状态）"""
+    occurrences = task_recurrence.occurrences(cursor, user_id, start_date, end_date)
+    if not occurrences:
+        return
+    cursor.execute(_SERIES_TASKS_SQL, (user_id, json.dumps(sorted({task_id for task_id, _, _ in occurrences}))))
+    convert = serializers.get_plan(TASK_FIELDS, TASK_OUTPUT).convert
+    templates = {row[0]: convert(row) for row in cursor.fetchall()}
+    touched = set()
+    for task_id, day, done in occurrences:
+        template = templates.get(task_id)
+        if template is not None:
+            offset = (day - start_date).days
+            days[offset]['tasks'].append(dict(template, completed=done, occurrence_date=day.isoformat()))
+            touched.add(offset)
+    for offset in touched:
+        days[offset]['tasks'].sort(key=_calendar_order)
+
+
+def build_days(cursor, user_id, start_date, days, include_empty=True):
+    """一次查询取出范围内的任务并按天分组；include_empty=False 时省略没有任务的天（日程视图）"""
+    end_date = start_date + timedelta(days=days - 1)
+    result = []
+    for offset in range(days):
+        current = start_date + timedelta(days=offset)
+        result.append({
+            'date': current.isoformat(),
+            'day_name': current.strftime('%A'),
+            'tasks': []
+        })
+
+    cursor.execute(RANGE_SQL, (user_id, start_date.isoformat(), end_date.isoformat()))
+    convert = serializers.get_plan(('day_index',) + TASK_FIELDS, TASK_OUTPUT).convert
+    for row in cursor.fetchall():
+        # due_date 带时间等非标准格式时偏移可能越界
+        if 0 <= row[0] < days:
+            result[row[0]]['tasks'].append(convert(row))
+
+    _add_occurrences(cursor, user_id, start_date, end_date, result)
+
+    if not include_empty:
+        result = [day for day in result if day['tasks']]
+    return result
+
+
+class CalendarCache:
+    """按 (用户, 范围) 缓存序列化好的日历数据
+
+    每次请求先读取范围所覆盖各周的版本号之和（主键范围查找），
+    与缓存时相同则直接返回缓存的 JSON，只有该范围内的任务变化时才重新查询。
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600.0):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._builds = 0
+        self._stale = 0
+        self._build_ms = 0.0
+
+    def get(self, conn, user_id, start_date, days, include_empty=True, keys=('start', 'end')):
+        """返回 (版本号, JSON 字节串)；keys 为输出中起止日期的字段名（周视图为 week_start/week_end）"""
+        cursor = serializers.tuple_cursor(conn)
+        # 版本号在查询任务之前读取：期间若有写入，缓存的数据新于版本号，下次请求只会多重建一次
+        version = get_range_version(cursor, user_id, start_date, days)
+        cache_key = (user_id, start_date, days, include_empty, keys)
+        entry = self.cache.get(cache_key)
+        if entry is not None:
+            if entry[0] == version:
+                return entry
+            with self._lock:
+                self._stale += 1
+
+        started = time.perf_counter()
+        end_date = start_date + timedelta(days=days - 1)
+        body = serializers.dumps({
+            keys[0]: start_date.isoformat(),
+            keys[1]: end_date.isoformat(),
+            'days': build_days(cursor, user_id, start_date, days, include_empty)
+        })
+        entry = (version, body)
+        self.cache.set(cache_key, entry)
+        with self._lock:
+            self._builds += 1
+            self._build_ms += (time.perf_counter() - started) * 1000
+        return entry
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        with self._lock:
+            return {
+                'builds': self._builds,
+                'stale': self._stale,
+                'avg_build_ms': round(self._build_ms / self._builds, 2) if self._builds else 0.0,
+                'hit_rate': cache_stats['hit_rate'],
+                'size': cache_stats['size'],
+            }
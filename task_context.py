@@ -0,0 +1,160 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import data_version
+import task_stats
+from ttl_cache import TTLCache
+
+# 默认的上下文预算（估算的 token 数），可由 ai_config.json 的 advanced.context_token_budget 覆盖
+DEFAULT_TOKEN_BUDGET = 400
+# 截止日期在今天之后多少天内算“即将到期”
+DUE_SOON_DAYS = 7
+# 每类候选任务最多取多少条（预算再大也不会超过 3 倍）
+CANDIDATES_PER_SECTION = 10
+# 标题过长时截断
+MAX_TITLE_LENGTH = 40
+
+SECTIONS = (
+    ('due', '即将到期'),
+    ('important', '重要待办'),
+    ('recent', '最近修改'),
+)
+
+_TASK_COLUMNS = 't.id, t.title, t.completed, t.priority, t.due_date'
+
+# 三类候选各走自己的索引取少量行：
+# 即将到期 idx_tasks_user_due_start，重要待办 idx_tasks_user_important_completed，
+# 最近修改 sync_changes 的 (user_id, seq) 索引（触发器维护的最后修改顺序）
+CANDIDATES_SQL = f'''
+    SELECT * FROM (
+        SELECT 'due', {_TASK_COLUMNS} FROM tasks t
+        WHERE t.user_id = ?1 AND t.due_date IS NOT NULL AND t.due_date <= ?2 AND t.completed = 0
+        ORDER BY t.due_date LIMIT ?3
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'important', {_TASK_COLUMNS} FROM tasks t
+        WHERE t.user_id = ?1 AND t.is_important = 1 AND t.completed = 0
+        ORDER BY t.id DESC LIMIT ?3
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'recent', {_TASK_COLUMNS} FROM sync_changes c
+        JOIN tasks t ON t.id = c.entity_id AND t.user_id = c.user_id
+        WHERE c.user_id = ?1 AND c.entity = 'task' AND c.op = 'upsert'
+        ORDER BY c.seq DESC LIMIT ?3
+    )
+'''
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩等宽字符约 1 个 token，其余约 4 个字符 1 个 token"""
+    wide = sum(1 for char in text if char > '⹿')
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _format_task(row, today):
+    _, task_id, title, completed, priority, due_date = row
+    if len(title) > MAX_TITLE_LENGTH:
+        title = title[:MAX_TITLE_LENGTH - 1] + '…'
+    status = '✓' if completed else '○'
+    line = f"#{task_id} {status} {title} [{priority or 'medium'}]"
+    if due_date:
+        overdue = '，已逾期' if not completed and due_date < today else ''
+        line += f" (截止: {due_date}{overdue})"
+    return line
+
+
+def render_context(stats, rows, today, token_budget):
+    """在预算内生成上下文：统计行必选，任务按三类轮流入选
+
+    rows 按 SECTIONS 的顺序排列，同一任务属于多类时只归入排在前面的一类。
+    """
+    header = (f"总任务数: {stats['total_tasks']}, 已完成: {stats['completed_tasks']}, "
+              f"重要待办: {stats['important_tasks']}, 今天到期: {stats['today_due_tasks']}, "
+              f"7天内到期: {stats['week_due_tasks']}\n")
+    remaining = token_budget - estimate_tokens(header)
+
+    queues = {key: [] for key, _ in SECTIONS}
+    seen = set()
+    for row in rows:
+        if row[1] not in seen:
+            seen.add(row[1])
+            queues[row[0]].append(row)
+
+    chosen = {key: [] for key, _ in SECTIONS}
+    while remaining > 0 and any(queues.values()):
+        for key, title in SECTIONS:
+            queue = queues[key]
+            if not queue:
+                continue
+            row = queue.pop(0)
+            line = _format_task(row, today) + '\n'
+            # 第一次进入某一类时还要算上小标题
+            cost = estimate_tokens(line) + (0 if chosen[key] else estimate_tokens(title) + 1)
+            if cost > remaining:
+                queues[key] = []
+                continue
+            remaining -= cost
+            chosen[key].append(line)
+
+    parts = [header]
+    for key, title in SECTIONS:
+        if chosen[key]:
+            parts.append(f"{title}:\n")
+            parts.extend(chosen[key])
+    return ''.join(parts)
+
+
+class TaskContextBuilder:
+    """按用户构建AI提示中的任务上下文
+
+    统计来自计数表（task_stats），任务按即将到期、重要、最近修改三类各取少量候选，
+    在 token 预算内轮流入选。结果按 (数据版本, 日期, 预算) 缓存，
+    用户数据没有变化时只需一次主键查找。
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600.0):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._builds = 0
+        self._stale = 0
+        self._build_ms = 0.0
+
+    def get(self, conn, user_id, token_budget=DEFAULT_TOKEN_BUDGET, today=None):
+        today = (today or date.today()).isoformat()
+        cursor = conn.cursor()
+        key = (data_version.get_data_version(cursor, user_id), today, token_budget)
+        entry = self.cache.get(user_id)
+        if entry is not None:
+            if entry[0] == key:
+                return entry[1]
+            with self._lock:
+                self._stale += 1
+
+        started = time.perf_counter()
+        stats = task_stats.get_user_stats(cursor, user_id, date.fromisoformat(today))
+        due_until = (date.fromisoformat(today) + timedelta(days=DUE_SOON_DAYS)).isoformat()
+        cursor.execute(CANDIDATES_SQL, (user_id, due_until, CANDIDATES_PER_SECTION))
+        rows = [tuple(row) for row in cursor.fetchall()]
+        context = render_context(stats, rows, today, token_budget)
+        self.cache.set(user_id, (key, context))
+        with self._lock:
+            self._builds += 1
+            self._build_ms += (time.perf_counter() - started) * 1000
+        return context
+
+    def invalidate(self, user_id):
+        self.cache.invalidate(user_id)
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        with self._lock:
+            return {
+                'builds': self._builds,
+                'stale': self._stale,
+                'avg_build_ms': round(self._build_ms / self._builds, 2) if self._builds else 0.0,
+                'hit_rate': cache_stats['hit_rate'],
+                'size': cache_stats['size'],
+            }
@@ -0,0 +1,452 @@
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+
+# 重复任务：每个系列只存一行任务（模板，due_date 为空）和一条规则，
+# 单次的完成/跳过记录为例外。具体日期只在请求的时间窗口内按规则计算（结果经 LRU 缓存）。
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# 例外状态：done 已完成这一次，skipped 跳过（删除）这一次
+OCCURRENCE_STATUSES = ('done', 'skipped')
+
+MAX_INTERVAL = 365
+MAX_COUNT = 10000
+# 一次展开的时间窗口最多多少天
+MAX_WINDOW_DAYS = 366
+# 查找下一次待办时向后看多少天
+NEXT_OCCURRENCE_DAYS = 366
+
+RECURRENCE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS task_recurrences (
+        task_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        freq TEXT NOT NULL,
+        interval INTEGER NOT NULL DEFAULT 1,
+        weekdays INTEGER NOT NULL DEFAULT 0,
+        start_date DATE NOT NULL,
+        until_date DATE,
+        count INTEGER,
+        FOREIGN KEY (task_id) REFERENCES tasks (id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_task_recurrences_user ON task_recurrences (user_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS task_occurrence_exceptions (
+        task_id INTEGER NOT NULL,
+        due_date DATE NOT NULL,
+        status TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (task_id, due_date)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_task_occurrence_exceptions_user_due
+    ON task_occurrence_exceptions (user_id, due_date)
+    ''',
+]
+
+_RULE_COLUMNS = 'r.task_id, r.freq, r.interval, r.weekdays, r.start_date, r.until_date, r.count'
+
+# 用户未完成的系列（整个系列标记完成后不再展开）
+ACTIVE_SERIES_SQL = f'''
+    SELECT {_RULE_COLUMNS} FROM task_recurrences r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE r.user_id = ? AND t.completed = 0
+'''
+_ALL_SERIES_SQL = f'''
+    SELECT {_RULE_COLUMNS} FROM task_recurrences r WHERE r.user_id = ?
+'''
+_RULE_SQL = f'''
+    SELECT {_RULE_COLUMNS} FROM task_recurrences r WHERE r.task_id = ? AND r.user_id = ?
+'''
+EXCEPTIONS_SQL = '''
+    SELECT task_id, due_date, status FROM task_occurrence_exceptions
+    WHERE user_id = ? AND due_date BETWEEN ? AND ?
+'''
+_UPSERT_RULE_SQL = '''
+    INSERT INTO task_recurrences (task_id, user_id, freq, interval, weekdays, start_date, until_date, count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(task_id) DO UPDATE SET
+        freq = excluded.freq, interval = excluded.interval, weekdays = excluded.weekdays,
+        start_date = excluded.start_date, until_date = excluded.until_date, count = excluded.count
+'''
+_UPSERT_EXCEPTION_SQL = '''
+    INSERT INTO task_occurrence_exceptions (task_id, due_date, status, user_id)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(task_id, due_date) DO UPDATE SET status = excluded.status, updated_at = CURRENT_TIMESTAMP
+'''
+
+
+# 修正已有数据中带截止日期的模板
+CLEAR_TEMPLATE_DUE_SQL = '''
+    UPDATE tasks SET due_date = NULL
+    WHERE due_date IS NOT NULL AND id IN (SELECT task_id FROM task_recurrences)
+'''
+
+
+class RecurrenceError(ValueError):
+    """重复规则或单次日期不合法"""
+
+
+def get_recurrence_triggers_sql():
+    """删除系列模板时一并删除规则和例外；模板转给其他用户时规则随之转移；
+    模板的 due_date 始终为空（批量修改、同步、AI 操作等任何写入路径设置的日期都会被清掉）
+    """
+    return [
+        'DROP TRIGGER IF EXISTS trg_tasks_recurrence_delete',
+        'DROP TRIGGER IF EXISTS trg_tasks_recurrence_owner',
+        'DROP TRIGGER IF EXISTS trg_tasks_recurrence_due',
+        '''
+        CREATE TRIGGER trg_tasks_recurrence_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM task_occurrence_exceptions WHERE task_id = OLD.id;
+            DELETE FROM task_recurrences WHERE task_id = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_tasks_recurrence_owner AFTER UPDATE OF user_id ON tasks
+        WHEN OLD.user_id IS NOT NEW.user_id BEGIN
+            UPDATE task_recurrences SET user_id = NEW.user_id WHERE task_id = NEW.id;
+            UPDATE task_occurrence_exceptions SET user_id = NEW.user_id WHERE task_id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_tasks_recurrence_due AFTER UPDATE OF due_date ON tasks
+        WHEN NEW.due_date IS NOT NULL AND EXISTS (SELECT 1 FROM task_recurrences WHERE task_id = NEW.id) BEGIN
+            UPDATE tasks SET due_date = NULL WHERE id = NEW.id;
+        END
+        ''',
+    ]
+
+
+class RecurrenceRule:
+    """重复规则（RRULE 的子集）：每 interval 天/周/月一次，每周可指定多个星期几，
+    可选截止日期 until 和总次数 count。每月重复时当月没有该日则取月末。
+    """
+
+    __slots__ = ('freq', 'interval', 'weekdays', 'start', 'until', 'count')
+
+    def __init__(self, freq, start, interval=1, weekdays=(), until=None, count=None):
+        self.freq = freq
+        self.start = start
+        self.interval = interval
+        # 每周重复默认为开始日期的星期几
+        self.weekdays = tuple(sorted(set(weekdays))) if weekdays else \
+            ((start.weekday(),) if freq == 'weekly' else ())
+        self.until = until
+        self.count = count
+
+    @property
+    def key(self):
+        return (self.freq, self.interval, self.weekdays, self.start, self.until, self.count)
+
+    @classmethod
+    def from_row(cls, row):
+        _, freq, interval, mask, start, until, count = row
+        return cls(freq, date.fromisoformat(start), interval,
+                   [day for day in range(7) if mask & (1 << day)],
+                   date.fromisoformat(until) if until else None, count)
+
+    def to_row(self):
+        mask = sum(1 << day for day in self.weekdays)
+        return (self.freq, self.interval, mask, self.start.isoformat(),
+                self.until.isoformat() if self.until else None, self.count)
+
+    def to_dict(self):
+        return {
+            'freq': self.freq,
+            'interval': self.interval,
+            'weekdays': list(self.weekdays),
+            'start': self.start.isoformat(),
+            'until': self.until.isoformat() if self.until else None,
+            'count': self.count,
+            'rrule': self.to_rrule(),
+        }
+
+    def to_rrule(self):
+        parts = [f'FREQ={self.freq.upper()}', f'INTERVAL={self.interval}']
+        if self.freq == 'weekly':
+            parts.append('BYDAY=' + ','.join(WEEKDAY_CODES[day] for day in self.weekdays))
+        if self.until:
+            parts.append(f"UNTIL={self.until.strftime('%Y%m%d')}")
+        if self.count:
+            parts.append(f'COUNT={self.count}')
+        return ';'.join(parts)
+
+    def occurrences(self, window_start, window_end):
+        return expand_window(self.key, window_start, window_end)
+
+
+def _parse_date(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, str) and len(value) == 8 and value.isdigit():
+            return date(int(value[:4]), int(value[4:6]), int(value[6:]))
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RecurrenceError(f'{field} 日期格式错误')
+
+
+def _parse_rrule(text):
+    """解析 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20241231;COUNT=10' 形式的规则"""
+    data = {}
+    for part in text.strip().removeprefix('RRULE:').split(';'):
+        if not part:
+            continue
+        name, _, value = part.partition('=')
+        name = name.strip().upper()
+        if name == 'FREQ':
+            data['freq'] = value.strip().lower()
+        elif name == 'INTERVAL':
+            data['interval'] = value
+        elif name == 'BYDAY':
+            data['weekdays'] = [code.strip().upper() for code in value.split(',') if code.strip()]
+        elif name == 'UNTIL':
+            data['until'] = value.strip()[:8]
+        elif name == 'COUNT':
+            data['count'] = value
+        else:
+            raise RecurrenceError(f'不支持的规则字段: {name}')
+    return data
+
+
+def _positive_int(value, field, maximum):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise RecurrenceError(f'{field} 应为正整数')
+    if not 1 <= number <= maximum:
+        raise RecurrenceError(f'{field} 应在 1 到 {maximum} 之间')
+    return number
+
+
+def parse_rule(value, default_start):
+    """把接口传入的规则（对象或 RRULE 字符串）解析为 RecurrenceRule
+
+    对象格式：{"freq": "weekly", "interval": 1, "weekdays": [0, 2] 或 ["MO", "WE"],
+              "start": "2024-06-10", "until": "2024-12-31", "count": 10}
+    """
+    if isinstance(value, str):
+        value = _parse_rrule(value)
+    if not isinstance(value, dict):
+        raise RecurrenceError('重复规则格式错误')
+
+    freq = str(value.get('freq') or '').lower()
+    if freq not in FREQUENCIES:
+        raise RecurrenceError(f'freq 应为 {"/".join(FREQUENCIES)}')
+    interval = _positive_int(value.get('interval', 1), 'interval', MAX_INTERVAL)
+    count = _positive_int(value['count'], 'count', MAX_COUNT) if value.get('count') else None
+    start = _parse_date(value.get('start'), 'start') or default_start
+    until = _parse_date(value.get('until'), 'until')
+    if until and until < start:
+        raise RecurrenceError('until 不能早于开始日期')
+
+    weekdays = []
+    for day in value.get('weekdays') or ():
+        if isinstance(day, str) and day.upper() in WEEKDAY_CODES:
+            weekdays.append(WEEKDAY_CODES.index(day.upper()))
+        elif isinstance(day, int) and not isinstance(day, bool) and 0 <= day <= 6:
+            weekdays.append(day)
+        else:
+            raise RecurrenceError('weekdays 应为 0-6（周一为0）或 MO-SU')
+    if weekdays and freq != 'weekly':
+        raise RecurrenceError('只有每周重复可以指定 weekdays')
+    return RecurrenceRule(freq, start, interval, weekdays, until, count)
+
+
+def _add_months(day, months, anchor_day):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def _expand_daily(start, interval, count, lo, hi):
+    # 直接跳到窗口内的第一次：序号 k 满足 start + k*interval >= lo
+    k = -(-(lo - start).days // interval)
+    day = start + timedelta(days=k * interval)
+    while day <= hi and (count is None or k < count):
+        yield day
+        k += 1
+        day += timedelta(days=interval)
+
+
+def _expand_weekly(start, interval, weekdays, count, lo, hi):
+    base = start - timedelta(days=start.weekday())
+    first_week = sum(1 for weekday in weekdays if weekday >= start.weekday())
+    # 窗口起点所在的周，向上取到 interval 的整数倍
+    week = (lo - base).days // 7
+    week += -week % interval
+    while True:
+        monday = base + timedelta(days=week * 7)
+        if monday > hi:
+            return
+        ordinal = week // interval
+        for position, weekday in enumerate(weekdays):
+            day = monday + timedelta(days=weekday)
+            if day < lo:
+                continue
+            if day > hi:
+                return
+            # 第一周只有开始日期及之后的星期几算数
+            index = position - (len(weekdays) - first_week) if ordinal == 0 \
+                else first_week + (ordinal - 1) * len(weekdays) + position
+            if count is not None and index >= count:
+                return
+            yield day
+        week += interval
+
+
+def _expand_monthly(start, interval, count, lo, hi):
+    k = (lo.year - start.year) * 12 + lo.month - start.month
+    k = max(k + -k % interval, 0)
+    while count is None or k // interval < count:
+        day = _add_months(start, k, start.day)
+        if day > hi:
+            return
+        if day >= lo:
+            yield day
+        k += interval
+
+
+@lru_cache(maxsize=8192)
+def expand_window(rule_key, window_start, window_end):
+    """展开规则在 [window_start, window_end] 内的全部日期（不考虑例外）
+
+    直接计算窗口内第一次的序号，耗时只与窗口内的次数有关，与系列开始了多久无关。
+    规则内容本身就是缓存键的一部分，修改规则不需要清理缓存。
+    """
+    freq, interval, weekdays, start, until, count = rule_key
+    lo = max(window_start, start)
+    hi = min(window_end, until) if until else window_end
+    if lo > hi:
+        return ()
+    if freq == 'daily':
+        return tuple(_expand_daily(start, interval, count, lo, hi))
+    if freq == 'weekly':
+        return tuple(_expand_weekly(start, interval, weekdays, count, lo, hi))
+    return tuple(_expand_monthly(start, interval, count, lo, hi))
+
+
+def cache_stats():
+    info = expand_window.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'hit_rate': round(info.hits / lookups, 4) if lookups else 0.0,
+        'size': info.currsize,
+    }
+
+
+def check_window(window_start, window_end):
+    if window_end < window_start or (window_end - window_start).days >= MAX_WINDOW_DAYS:
+        raise RecurrenceError(f'时间窗口应为 1 到 {MAX_WINDOW_DAYS} 天')
+
+
+def load_series(cursor, user_id, active_only=True):
+    """读取用户的系列规则 {任务ID: RecurrenceRule}；active_only 时只取未完成的系列"""
+    cursor.execute(ACTIVE_SERIES_SQL if active_only else _ALL_SERIES_SQL, (user_id,))
+    return {row[0]: RecurrenceRule.from_row(row) for row in cursor.fetchall()}
+
+
+def get_rule(cursor, user_id, task_id):
+    """单个任务的重复规则，不是重复任务时返回 None"""
+    cursor.execute(_RULE_SQL, (task_id, user_id))
+    row = cursor.fetchone()
+    return RecurrenceRule.from_row(row) if row else None
+
+
+def load_exceptions(cursor, user_id, window_start, window_end):
+    """窗口内的例外 {(任务ID, 日期字符串): 状态}"""
+    cursor.execute(EXCEPTIONS_SQL, (user_id, window_start.isoformat(), window_end.isoformat()))
+    return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+
+def occurrences(cursor, user_id, window_start, window_end, series=None):
+    """窗口内各系列的每一次，返回 [(任务ID, 日期, 是否已完成)]，跳过的不返回"""
+    series = load_series(cursor, user_id) if series is None else series
+    if not series:
+        return []
+    exceptions = load_exceptions(cursor, user_id, window_start, window_end)
+    result = []
+    for task_id, rule in series.items():
+        for day in rule.occurrences(window_start, window_end):
+            status = exceptions.get((task_id, day.isoformat())) if exceptions else None
+            if status != 'skipped':
+                result.append((task_id, day, status == 'done'))
+    return result
+
+
+def due_counts(cursor, user_id, today, week_end):
+    """今天和 [today, week_end] 内未完成的次数（计入 /api/stats 的到期统计）"""
+    today_due = week_due = 0
+    for _, day, done in occurrences(cursor, user_id, today, week_end):
+        if not done:
+            week_due += 1
+            today_due += day == today
+    return today_due, week_due
+
+
+def next_due_dates(cursor, user_id, series, today):
+    """各系列从今天起第一次未完成的日期 {任务ID: 日期字符串或 None}"""
+    window_end = today + timedelta(days=NEXT_OCCURRENCE_DAYS - 1)
+    exceptions = load_exceptions(cursor, user_id, today, window_end) if series else {}
+    result = {}
+    for task_id, rule in series.items():
+        result[task_id] = next((day.isoformat() for day in rule.occurrences(today, window_end)
+                                if (task_id, day.isoformat()) not in exceptions), None)
+    return result
+
+
+def decorate_tasks(cursor, user_id, items, today):
+    """给列表中的系列模板加上 recurrence，due_date 改为下一次未完成的日期"""
+    series = load_series(cursor, user_id, active_only=False)
+    if not series:
+        return items
+    series = {item['id']: series[item['id']] for item in items if item['id'] in series}
+    next_dates = next_due_dates(cursor, user_id, series, today)
+    for item in items:
+        rule = series.get(item['id'])
+        if rule is not None:
+            item['recurrence'] = rule.to_dict()
+            if 'due_date' in item:
+                item['due_date'] = next_dates[item['id']]
+    return items
+
+
+def set_rule(cursor, user_id, task_id, rule):
+    """设置（或替换）任务的重复规则；模板行的 due_date 清空，日期由规则决定"""
+    cursor.execute(_UPSERT_RULE_SQL, (task_id, user_id) + rule.to_row())
+    cursor.execute('UPDATE tasks SET due_date = NULL WHERE id = ? AND user_id = ? AND due_date IS NOT NULL',
+                   (task_id, user_id))
+    # 替换规则后不在新规则中的例外没有意义
+    cursor.execute('DELETE FROM task_occurrence_exceptions WHERE task_id = ?', (task_id,))
+
+
+def clear_rule(cursor, user_id, task_id, today):
+    """取消重复：任务变回普通任务，截止日期为下一次未完成的日期"""
+    rule = get_rule(cursor, user_id, task_id)
+    if rule is None:
+        return False
+    due_date = next_due_dates(cursor, user_id, {task_id: rule}, today)[task_id]
+    cursor.execute('DELETE FROM task_occurrence_exceptions WHERE task_id = ?', (task_id,))
+    cursor.execute('DELETE FROM task_recurrences WHERE task_id = ?', (task_id,))
+    cursor.execute('UPDATE tasks SET due_date = ? WHERE id = ? AND user_id = ?', (due_date, task_id, user_id))
+    return True
+
+
+def set_occurrence(cursor, user_id, task_id, day, status):
+    """标记系列中的某一次：done 完成、skipped 跳过、None 恢复为未完成；只写一行例外"""
+    rule = get_rule(cursor, user_id, task_id)
+    if rule is None:
+        raise RecurrenceError('任务不是重复任务')
+    if not rule.occurrences(day, day):
+        raise RecurrenceError(f'{day.isoformat()} 不是该任务的重复日期')
+    if status is None:
+        cursor.execute('DELETE FROM task_occurrence_exceptions WHERE task_id = ? AND due_date = ?',
+                       (task_id, day.isoformat()))
+    else:
+        cursor.execute(_UPSERT_EXCEPTION_SQL, (task_id, day.isoformat(), status, user_id))
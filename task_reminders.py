@@ -0,0 +1,342 @@
+import heapq
+import itertools
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+import task_recurrence
+
+# 有开始时间的任务提前多少分钟提醒
+LEAD_MINUTES = 10
+# 只有截止日期的任务在当天几点提醒
+DEFAULT_REMIND_TIME = '09:00'
+# 堆里只放截止日期在这个天数以内的提醒，更晚的在日期临近时按天从索引加载
+LOOKAHEAD_DAYS = 2
+# 加载或唤醒时已经过去这么久以内的提醒仍然发出（如服务刚重启）
+GRACE_SECONDS = 300
+# 调度线程最长睡眠时间：系统时间被调整时也能及时纠正
+MAX_SLEEP_SECONDS = 60
+# 取消留下的过期条目超过有效条目数（且不少于这个数量）时重建堆
+COMPACT_MIN_STALE = 1024
+
+# 只索引未完成的任务：按天加载时走范围查找，完成的任务不占索引空间
+REMINDER_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_tasks_reminder
+    ON tasks (due_date, start_time) WHERE completed = 0
+'''
+
+# 按截止日期加载一天（或几天）内的待提醒任务
+LOAD_RANGE_SQL = '''
+    SELECT id, due_date, start_time, completed FROM tasks
+    WHERE completed = 0 AND due_date >= ? AND due_date < ?
+'''
+
+# 用户整体变化（如导入）后重新加载该用户已加载范围内的任务
+LOAD_USER_SQL = '''
+    SELECT id, due_date, start_time, completed FROM tasks
+    WHERE user_id = ? AND due_date >= ? AND due_date < ?
+'''
+
+REFRESH_SQL = '''
+    SELECT id, due_date, start_time, completed FROM tasks
+    WHERE id IN (SELECT value FROM json_each(?))
+'''
+
+# 到点时按主键取当前数据再确认一次，堆里的条目过期（写入没有通知调度器）也不会误发
+DUE_SQL = '''
+    SELECT id, due_date, start_time, completed, user_id, title FROM tasks
+    WHERE id IN (SELECT value FROM json_each(?))
+'''
+
+# 重复任务：模板的 due_date 为空，不在 idx_tasks_reminder 中。按天加载时展开未完成的系列，
+# 每一次以 (任务ID, 日期) 为键放进堆，可以单独改期或取消。系列表每个系列一行，每天只扫描一次
+_SERIES_COLUMNS = '''r.task_id, r.freq, r.interval, r.weekdays, r.start_date, r.until_date, r.count,
+                     t.start_time, t.user_id, t.title'''
+LOAD_SERIES_SQL = f'''
+    SELECT {_SERIES_COLUMNS} FROM task_recurrences r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE t.completed = 0 AND r.start_date < ? AND (r.until_date IS NULL OR r.until_date >= ?)
+'''
+LOAD_USER_SERIES_SQL = f'''
+    SELECT {_SERIES_COLUMNS} FROM task_recurrences r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE r.user_id = ? AND t.completed = 0
+'''
+REFRESH_SERIES_SQL = f'''
+    SELECT {_SERIES_COLUMNS} FROM task_recurrences r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE r.task_id IN (SELECT value FROM json_each(?)) AND t.completed = 0
+'''
+# 已完成或跳过的那一次不再提醒
+SERIES_EXCEPTIONS_SQL = '''
+    SELECT task_id, due_date FROM task_occurrence_exceptions
+    WHERE task_id IN (SELECT value FROM json_each(?)) AND due_date >= ? AND due_date < ?
+'''
+
+
+def remind_at(due_date, start_time):
+    """提醒时间：有开始时间时提前 LEAD_MINUTES 分钟，否则为截止日当天 DEFAULT_REMIND_TIME；日期无效时返回 None"""
+    if not due_date:
+        return None
+    try:
+        if start_time:
+            return datetime.fromisoformat(f"{due_date[:10]}T{start_time}") - timedelta(minutes=LEAD_MINUTES)
+        return datetime.fromisoformat(f"{due_date[:10]}T{DEFAULT_REMIND_TIME}")
+    except ValueError:
+        return None
+
+
+class ReminderScheduler:
+    """截止日期提醒调度器：后台线程 + 按提醒时间排序的最小堆
+
+    堆里只有截止日期在 [loaded_from, loaded_until) 内的未完成任务（重复任务按规则展开到
+    这些日期，每一次单独一条），更晚的日期在临近时按天走 idx_tasks_reminder 加载，不做周期性全表扫描。写入提交后调用 refresh() 按主键
+    重新读取涉及的任务：插入 O(log n)；取消只从 键 → 令牌 的字典中删除（O(1)），
+    堆里留下的旧条目在弹出时发现令牌不符而跳过，过多时整体重建。到点的任务交给 on_due(user_id, payload)。
+    """
+
+    def __init__(self, connect, on_due, lookahead_days=LOOKAHEAD_DAYS, clock=datetime.now):
+        self._connect = connect
+        self._on_due = on_due
+        self.lookahead_days = lookahead_days
+        self._clock = clock
+        # (提醒时间, 令牌, 键)：普通任务的键为任务ID，重复任务的每一次为 (任务ID, 日期)
+        self._heap = []
+        # 键 → 当前有效条目的令牌
+        self._tokens = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._loaded_from = None
+        self._loaded_until = None
+        self._fired = 0
+        self._cancelled = 0
+        self._stale_skipped = 0
+        self._loaded_rows = 0
+        self._compactions = 0
+
+    def start(self):
+        """加载今天的提醒并启动调度线程（重复调用无效）"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='task-reminders', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _query(self, sql, params):
+        conn = self._connect()
+        try:
+            return [tuple(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def _occurrence_rows(self, sql, params, day_from, day_until):
+        """展开系列在 [day_from, day_until) 内未完成的每一次，返回
+        [((任务ID, 日期), 日期, 开始时间, 0, 用户ID, 标题)]，前四项与任务行的格式相同
+        """
+        series = self._query(sql, params)
+        if not series:
+            return []
+        window_start = date.fromisoformat(day_from)
+        window_end = date.fromisoformat(day_until) - timedelta(days=1)
+        exceptions = set(self._query(SERIES_EXCEPTIONS_SQL,
+                                     (json.dumps([row[0] for row in series]), day_from, day_until)))
+        rows = []
+        for row in series:
+            task_id, start_time, user_id, title = row[0], row[7], row[8], row[9]
+            for day in task_recurrence.RecurrenceRule.from_row(row[:7]).occurrences(window_start, window_end):
+                day = day.isoformat()
+                if (task_id, day) not in exceptions:
+                    rows.append(((task_id, day), day, start_time, 0, user_id, title))
+        return rows
+
+    def _cancel_occurrences(self, task_ids):
+        """取消这些任务在已加载日期范围内每一次的提醒，调用方需持有 self._condition"""
+        day = date.fromisoformat(self._loaded_from)
+        until = date.fromisoformat(self._loaded_until)
+        while day < until:
+            for task_id in task_ids:
+                self._cancel((task_id, day.isoformat()))
+            day += timedelta(days=1)
+
+    def _push(self, task_id, when):
+        """加入或替换任务的提醒，调用方需持有 self._condition"""
+        if task_id in self._tokens:
+            self._cancelled += 1
+        token = next(self._counter)
+        self._tokens[task_id] = token
+        heapq.heappush(self._heap, (when, token, task_id))
+        if self._heap[0][1] == token:
+            # 新的最早提醒：唤醒调度线程重新计算睡眠时间
+            self._condition.notify_all()
+
+    def _cancel(self, task_id):
+        """取消任务的提醒（惰性删除），调用方需持有 self._condition"""
+        if self._tokens.pop(task_id, None) is None:
+            return
+        self._cancelled += 1
+        stale = len(self._heap) - len(self._tokens)
+        if stale >= COMPACT_MIN_STALE and stale > len(self._tokens):
+            self._heap = [entry for entry in self._heap if self._tokens.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+            self._compactions += 1
+
+    def _apply(self, rows, now):
+        """按任务的当前数据加入、改期或取消提醒，调用方需持有 self._condition"""
+        earliest = now - timedelta(seconds=GRACE_SECONDS)
+        for task_id, due_date, start_time, completed in rows:
+            when = remind_at(due_date, start_time)
+            if (when is None or completed or when < earliest
+                    or not self._loaded_from <= due_date[:10] < self._loaded_until):
+                self._cancel(task_id)
+            else:
+                self._push(task_id, when)
+
+    def refresh(self, task_ids=(), deleted_task_ids=()):
+        """写入提交后调用：重新读取这些任务的截止日期和完成状态（按主键），删除的任务直接取消
+
+        重复任务的每一次先全部取消，再按当前的规则和例外重新展开已加载的日期。
+        """
+        with self._condition:
+            if self._loaded_until is None:
+                return
+            loaded_from, loaded_until = self._loaded_from, self._loaded_until
+        rows = occurrences = []
+        if task_ids:
+            ids = json.dumps(list(task_ids))
+            rows = self._query(REFRESH_SQL, (ids,))
+            occurrences = self._occurrence_rows(REFRESH_SERIES_SQL, (ids,), loaded_from, loaded_until)
+        with self._condition:
+            found = {row[0] for row in rows}
+            for task_id in itertools.chain(deleted_task_ids, (i for i in task_ids if i not in found)):
+                self._cancel(task_id)
+            self._cancel_occurrences(list(itertools.chain(task_ids, deleted_task_ids)))
+            self._apply(rows + [row[:4] for row in occurrences], self._clock())
+
+    def reload_user(self, user_id):
+        """重新加载用户在已加载日期范围内的任务（导入等涉及大量任务的写入之后），走 (user_id, due_date) 索引"""
+        with self._condition:
+            if self._loaded_until is None:
+                return
+            loaded_from, loaded_until = self._loaded_from, self._loaded_until
+        rows = self._query(LOAD_USER_SQL, (user_id, loaded_from, loaded_until))
+        occurrences = self._occurrence_rows(LOAD_USER_SERIES_SQL, (user_id,), loaded_from, loaded_until)
+        with self._condition:
+            self._apply(rows + [row[:4] for row in occurrences], self._clock())
+
+    def _load_ahead(self, now):
+        """把截止日期在 now 之后 lookahead_days 天以内、尚未加载的日期逐天加载进堆"""
+        today = now.date().isoformat()
+        horizon = (now.date() + timedelta(days=self.lookahead_days)).isoformat()
+        with self._condition:
+            if self._loaded_until is None:
+                self._loaded_until = today
+            # 过去的日期不再需要重新加载
+            self._loaded_from = max(self._loaded_from or today, today)
+        while True:
+            with self._condition:
+                day = self._loaded_until
+            if day > horizon:
+                return
+            next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+            rows = self._query(LOAD_RANGE_SQL, (day, next_day))
+            rows += [row[:4] for row in self._occurrence_rows(LOAD_SERIES_SQL, (next_day, day), day, next_day)]
+            with self._condition:
+                self._loaded_until = next_day
+                self._loaded_rows += len(rows)
+                self._apply(rows, now)
+
+    def _pop_due(self, now):
+        """弹出所有到点的有效条目，返回键列表（任务ID或 (任务ID, 日期)），调用方需持有 self._condition"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, token, task_id = heapq.heappop(self._heap)
+            if self._tokens.get(task_id) != token:
+                self._stale_skipped += 1
+                continue
+            del self._tokens[task_id]
+            due.append(task_id)
+        return due
+
+    def _sleep_seconds(self, now):
+        """到下一个提醒或下一次按天加载的秒数，调用方需持有 self._condition"""
+        next_load = datetime.fromisoformat(self._loaded_until) - timedelta(days=self.lookahead_days)
+        wake = min(self._heap[0][0], next_load) if self._heap else next_load
+        return min(max((wake - now).total_seconds(), 0.0), MAX_SLEEP_SECONDS)
+
+    def _fire(self, keys, now):
+        task_ids = [key for key in keys if not isinstance(key, tuple)]
+        rows = self._query(DUE_SQL, (json.dumps(task_ids),)) if task_ids else []
+        # 重复任务的每一次：按当前的规则和例外重新展开那一天，确认仍然需要提醒
+        for day in sorted({key[1] for key in keys if isinstance(key, tuple)}):
+            series_ids = [key[0] for key in keys if isinstance(key, tuple) and key[1] == day]
+            next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+            rows += self._occurrence_rows(REFRESH_SERIES_SQL, (json.dumps(series_ids),), day, next_day)
+        reschedule = []
+        for task_id, due_date, start_time, completed, user_id, title in rows:
+            when = remind_at(due_date, start_time)
+            if when is None or completed:
+                continue
+            if when > now:
+                # 写入没有经过 refresh()：按当前数据重新排期
+                reschedule.append((task_id, due_date, start_time, completed))
+                continue
+            try:
+                self._on_due(user_id, {
+                    'id': task_id[0] if isinstance(task_id, tuple) else task_id,
+                    'title': title,
+                    'due_date': due_date,
+                    'start_time': start_time,
+                    'remind_at': when.isoformat(timespec='minutes'),
+                })
+            except Exception as e:
+                print(f"发送提醒失败: {e}")
+            with self._condition:
+                self._fired += 1
+        if reschedule:
+            with self._condition:
+                self._apply(reschedule, now)
+
+    def _run(self):
+        while True:
+            try:
+                now = self._clock()
+                self._load_ahead(now)
+                with self._condition:
+                    if self._stopped:
+                        return
+                    due = self._pop_due(now)
+                    if not due:
+                        self._condition.wait(self._sleep_seconds(now))
+                        continue
+                self._fire(due, now)
+            except Exception as e:
+                # 数据库暂时不可用等：稍后重试，线程不能退出
+                print(f"提醒调度出错: {e}")
+                with self._condition:
+                    if self._stopped:
+                        return
+                    self._condition.wait(MAX_SLEEP_SECONDS)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending': len(self._tokens),
+                'heap_size': len(self._heap),
+                'loaded_until': self._loaded_until,
+                'fired': self._fired,
+                'cancelled': self._cancelled,
+                'stale_skipped': self._stale_skipped,
+                'loaded_rows': self._loaded_rows,
+                'compactions': self._compactions,
+            }
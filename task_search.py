@@ -0,0 +1,310 @@
+import html
+import re
+import sqlite3
+
+import serializers
+
+# 两个全文索引都是无内容表（content=''），结果按 rowid 回表取字段，并都带一个按用户划分的 owner 列：
+# 查询时 owner 与关键词一起 AND 进 MATCH，只遍历当前用户的倒排记录，耗时不随其他用户的数据量增长。
+#
+# tasks_fts：trigram 分词，中文无需分词即可做子串匹配，处理3个字符以上的关键词。
+# trigram 下任何短于3个字符的内容都不是独立的词，所以 owner 由用户ID编码成3个私有区字符，
+# 恰好是一个三字组，不会与其他用户的值发生子串匹配。
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        owner, title, description,
+        content='', tokenize='trigram'
+    )
+'''
+
+# tasks_fts_short：1-2个字符的关键词（会议、报告、买菜）。文字预先切成单字和相邻两字，
+# 用空格分开交给 unicode61 分词，每个单字、两字组都是一个词；owner 为 "u<用户ID>"。
+SHORT_FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts_short USING fts5(
+        owner, title, description,
+        content='', tokenize='unicode61'
+    )
+'''
+
+# 触发器里不能用 WITH，切分单字/两字组借助一张位置表：每个位置取 substr(x, n, 1) 和 substr(x, n, 2)
+SHORT_INDEX_CHARS = 2000
+SEARCH_POSITIONS_SQL = [
+    'CREATE TABLE IF NOT EXISTS search_positions (n INTEGER PRIMARY KEY)',
+    f'''
+    INSERT OR IGNORE INTO search_positions (n)
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {SHORT_INDEX_CHARS})
+    SELECT n FROM seq
+    ''',
+]
+
+# 3个私有区字符（U+E000 起，每位 6400 个取值）
+_OWNER_BASE = 6400
+
+
+def _owner_sql(column):
+    return (f"char(57344 + IFNULL({column}, 0) % {_OWNER_BASE}, "
+            f"57344 + IFNULL({column}, 0) / {_OWNER_BASE} % {_OWNER_BASE}, "
+            f"57344 + IFNULL({column}, 0) / {_OWNER_BASE * _OWNER_BASE})")
+
+
+def _grams_sql(column):
+    return (f"(SELECT group_concat(substr({column}, n, 1) || ' ' || substr({column}, n, 2), ' ') "
+            f"FROM search_positions WHERE n <= length({column}))")
+
+
+def owner_token(user_id):
+    """tasks_fts 中的 owner 值（与 _owner_sql 相同的编码）"""
+    user_id = user_id or 0
+    return ''.join(chr(0xE000 + digit) for digit in
+                   (user_id % _OWNER_BASE, user_id // _OWNER_BASE % _OWNER_BASE, user_id // (_OWNER_BASE * _OWNER_BASE)))
+
+
+def short_owner_token(user_id):
+    return f'u{user_id or 0}'
+
+
+def _index_values(row):
+    """(trigram 表的值, 短词表的值)，row 为 NEW 或 OLD"""
+    return (
+        f"{row}.id, {_owner_sql(f'{row}.user_id')}, {row}.title, {row}.description",
+        f"{row}.id, 'u' || IFNULL({row}.user_id, 0), {_grams_sql(f'{row}.title')}, {_grams_sql(f'{row}.description')}",
+    )
+
+
+def get_search_triggers_sql():
+    """维护两个无内容索引的触发器：删除时传入与插入时相同的值"""
+    new_fts, new_short = _index_values('NEW')
+    old_fts, old_short = _index_values('OLD')
+    insert = f'''
+        INSERT INTO tasks_fts (rowid, owner, title, description) VALUES ({new_fts});
+        INSERT INTO tasks_fts_short (rowid, owner, title, description) VALUES ({new_short});
+    '''
+    delete = f'''
+        INSERT INTO tasks_fts (tasks_fts, rowid, owner, title, description) VALUES ('delete', {old_fts});
+        INSERT INTO tasks_fts_short (tasks_fts_short, rowid, owner, title, description) VALUES ('delete', {old_short});
+    '''
+    return [
+        'DROP TRIGGER IF EXISTS trg_tasks_fts_insert',
+        'DROP TRIGGER IF EXISTS trg_tasks_fts_delete',
+        'DROP TRIGGER IF EXISTS trg_tasks_fts_update',
+        f'CREATE TRIGGER trg_tasks_fts_insert AFTER INSERT ON tasks BEGIN {insert} END',
+        f'CREATE TRIGGER trg_tasks_fts_delete AFTER DELETE ON tasks BEGIN {delete} END',
+        f'CREATE TRIGGER trg_tasks_fts_update AFTER UPDATE OF title, description, user_id ON tasks BEGIN {delete} {insert} END',
+    ]
+
+
+TRIGRAM = 3
+SEARCHABLE_FIELDS = ('title', 'description')
+# 高亮标记使用私有区字符，先转义HTML再替换成<mark>，避免注入
+_MARK_OPEN = '\ue000'
+_MARK_CLOSE = '\ue001'
+
+RESULT_FIELDS = ('id', 'title', 'description', 'completed', 'priority',
+                 'due_date', 'list_id', 'list_name', 'list_icon')
+_RESULT_COLUMNS = '''
+    t.id, t.title, t.description, t.completed, t.priority,
+    t.due_date, t.list_id, tl.name as list_name, tl.icon as list_icon
+'''
+_RESULT_PLAN = serializers.get_plan(RESULT_FIELDS)
+_TITLE = _RESULT_PLAN.index('title')
+_DESCRIPTION = _RESULT_PLAN.index('description')
+
+
+def create_search_index(cursor):
+    """（重新）创建两个全文索引及同步触发器，并从tasks表回填"""
+    for sql in get_search_triggers_sql()[:3]:
+        cursor.execute(sql)
+    cursor.execute('DROP TABLE IF EXISTS tasks_fts')
+    cursor.execute('DROP TABLE IF EXISTS tasks_fts_short')
+    for sql in SEARCH_POSITIONS_SQL:
+        cursor.execute(sql)
+    cursor.execute(FTS_TABLE_SQL)
+    cursor.execute(SHORT_FTS_TABLE_SQL)
+    for sql in get_search_triggers_sql()[3:]:
+        cursor.execute(sql)
+    fts_values, short_values = _index_values('tasks')
+    cursor.execute(f'INSERT INTO tasks_fts (rowid, owner, title, description) SELECT {fts_values} FROM tasks')
+    cursor.execute(f'INSERT INTO tasks_fts_short (rowid, owner, title, description) SELECT {short_values} FROM tasks')
+
+
+SNIPPET_CONTEXT = 24
+
+
+def _highlight_pattern(terms):
+    alternatives = sorted(set(terms), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(term) for term in alternatives), re.IGNORECASE)
+
+
+def _highlight(text, pattern, snippet=False):
+    """转义HTML并用<mark>标出命中片段；snippet=True 时只保留首个命中附近的文字
+
+    trigram 的 highlight()/snippet() 在重叠三字组上会重复输出文字，所以高亮在Python中完成，
+    只作用于已经由索引筛选出的少量结果行。
+    """
+    if not text:
+        return text
+    if snippet and len(text) > SNIPPET_CONTEXT * 2:
+        match = pattern.search(text)
+        start = max((match.start() if match else 0) - SNIPPET_CONTEXT, 0)
+        end = start + SNIPPET_CONTEXT * 2 + (match.end() - match.start() if match else 0)
+        text = ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+    marked = pattern.sub(lambda m: _MARK_OPEN + m.group(0) + _MARK_CLOSE, text)
+    marked = marked.replace(_MARK_CLOSE + _MARK_OPEN, '')
+    return html.escape(marked).replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+
+def _with_highlights(rows, terms):
+    pattern = _highlight_pattern(terms)
+    results = []
+    for row in rows:
+        result = _RESULT_PLAN.convert(row)
+        result['title_highlight'] = _highlight(row[_TITLE], pattern)
+        result['description_snippet'] = _highlight(row[_DESCRIPTION], pattern, snippet=True)
+        results.append(result)
+    return results
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _trigrams(term):
+    return [term[i:i + TRIGRAM] for i in range(len(term) - TRIGRAM + 1)]
+
+
+def build_match_expression(terms, fuzzy=False, fields=SEARCHABLE_FIELDS, owner=None):
+    """构造FTS5查询表达式
+
+    精确模式：所有关键词都必须作为子串出现（trigram下前缀匹配即子串匹配）。
+    模糊模式：把关键词拆成三字组（短关键词保持原样）后取并集，按命中数量排序（_rank_sql），
+    可以容忍错别字和词序变化。给出 owner 时只匹配该用户的行。
+    """
+    if fuzzy:
+        grams = []
+        for term in terms:
+            for gram in _trigrams(term) or [term]:
+                if gram not in grams:
+                    grams.append(gram)
+        expression = ' OR '.join(_quote(gram) for gram in grams)
+    else:
+        expression = ' AND '.join(_quote(term) for term in terms)
+
+    columns = [field for field in fields if field in SEARCHABLE_FIELDS] or list(SEARCHABLE_FIELDS)
+    expression = '{' + ' '.join(columns) + '} : (' + expression + ')'
+    if owner is not None:
+        expression = f'owner : {_quote(owner)} AND {expression}'
+    return expression
+
+
+def _like_conditions(terms):
+    """短关键词在索引候选行上的精确子串过滤（与原先的 LIKE 语义一致）"""
+    conditions = ''
+    params = []
+    for term in terms:
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions += " AND (t.title LIKE ? ESCAPE '\\' OR t.description LIKE ? ESCAPE '\\')"
+        params.extend([f'%{escaped}%'] * 2)
+    return conditions, params
+
+
+def _like_search(cursor, user_id, terms, fields, limit):
+    """全文索引不可用或关键词里没有可索引的字符（如只有标点）时的后备方案，只扫描当前用户的任务"""
+    columns = [field for field in fields if field in SEARCHABLE_FIELDS] or list(SEARCHABLE_FIELDS)
+    conditions = []
+    params = [user_id]
+    for term in terms:
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append('(' + ' OR '.join(f"t.{column} LIKE ? ESCAPE '\\'" for column in columns) + ')')
+        params.extend([f'%{escaped}%'] * len(columns))
+    params.append(limit)
+
+    cursor.execute(f'''
+        SELECT {_RESULT_COLUMNS}
+        FROM tasks t
+        LEFT JOIN task_lists tl ON t.list_id = tl.id
+        WHERE t.user_id = ? AND {' AND '.join(conditions)}
+        ORDER BY t.is_important DESC, t.due_date ASC
+        LIMIT ?
+    ''', params)
+    return _with_highlights(cursor.fetchall(), terms)
+
+
+# 两个索引共用的查询：{table} 为 tasks_fts 或 tasks_fts_short，{rank} 为 _rank_sql() 的相关度表达式。
+# 不用 bm25()：它要统计每个关键词在全表中的命中行数，耗时随所有用户的数据量增长。
+# 相关度改为在 SQL 中对当前用户的全部命中行计算并排序后再 LIMIT，旧任务匹配得更好时同样排在前面。
+SEARCH_SQL = '''
+    SELECT {columns}
+    FROM {table}
+    JOIN tasks t ON t.id = {table}.rowid
+    LEFT JOIN task_lists tl ON t.list_id = tl.id
+    WHERE {table} MATCH ? AND t.user_id = ?{conditions}
+    ORDER BY {rank} DESC, {table}.rowid DESC
+    LIMIT ?
+'''
+
+# 相关度权重：标题命中与描述命中（与原先 bm25 的列权重一致）
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def _hits_sql(column, count):
+    """关键词在列中出现的次数之和（每个关键词两个参数）"""
+    value = f"lower(IFNULL({column}, ''))"
+    return ' + '.join(f'(length({value}) - length(replace({value}, ?, \'\'))) / length(?)'
+                      for _ in range(count))
+
+
+def _rank_sql(terms):
+    """按关键词在标题/描述中的出现次数加权，描述越长单次命中的分量越低；返回 (表达式, 参数)"""
+    terms = sorted({term.lower() for term in terms})
+    expression = (f'{TITLE_WEIGHT} * ({_hits_sql("t.title", len(terms))}) '
+                  f"/ (1 + length(IFNULL(t.title, '')) / 40.0) + "
+                  f'{DESCRIPTION_WEIGHT} * ({_hits_sql("t.description", len(terms))}) '
+                  f"/ (1 + length(IFNULL(t.description, '')) / 200.0)")
+    params = [value for term in terms for value in (term, term)]
+    return expression, params * 2
+
+
+def build_search_sql(table, terms, conditions=''):
+    """返回 (SQL, 相关度参数)，参数顺序：MATCH 表达式、用户ID、过滤条件参数、相关度参数、LIMIT"""
+    rank, rank_params = _rank_sql(terms)
+    return SEARCH_SQL.format(columns=_RESULT_COLUMNS, table=table, conditions=conditions, rank=rank), rank_params
+
+
+def search_tasks(cursor, user_id, query, fuzzy=False, fields=SEARCHABLE_FIELDS, limit=50):
+    """搜索用户任务，返回按相关度排序的结果（含高亮HTML）
+
+    有3个字符以上的关键词时走 trigram 索引，其余短关键词作为候选行上的过滤条件；
+    全部是1-2个字符的关键词时走单字/两字组索引，再做一次精确子串过滤。
+    """
+    terms = [term.strip('*') for term in query.split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return []
+
+    long_terms = [term for term in terms if len(term) >= TRIGRAM]
+    short_terms = [term for term in terms if len(term) < TRIGRAM]
+    if long_terms:
+        table = 'tasks_fts'
+        match = build_match_expression(long_terms, fuzzy, fields, owner_token(user_id))
+        conditions, like_params = _like_conditions(short_terms)
+    elif all(any(char.isalnum() for char in term) for term in terms):
+        table = 'tasks_fts_short'
+        match = build_match_expression(terms, fuzzy, fields, short_owner_token(user_id))
+        # unicode61 会丢掉关键词中的标点，结果再按原关键词精确过滤（模糊模式下命中任意一个即可）
+        conditions, like_params = ('', []) if fuzzy else _like_conditions(terms)
+    else:
+        return _like_search(cursor, user_id, terms, fields, limit)
+
+    # 模糊模式下可能只命中部分三字组，排序和高亮时一并计入
+    highlight_terms = list(terms)
+    if fuzzy:
+        for term in long_terms:
+            highlight_terms.extend(_trigrams(term))
+    sql, rank_params = build_search_sql(table, highlight_terms, conditions)
+    try:
+        cursor.execute(sql, [match, user_id, *like_params, *rank_params, limit])
+    except sqlite3.OperationalError as e:
+        print(f"全文检索不可用，改为LIKE搜索: {e}")
+        return _like_search(cursor, user_id, terms, fields, limit)
+    return _with_highlights(cursor.fetchall(), highlight_terms)
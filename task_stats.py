@@ -0,0 +1,250 @@
+import sqlite3
+from datetime import date, timedelta
+
+import task_recurrence
+
+# 计数表由 tasks 表上的触发器维护（见 database.py 迁移3），
+# 这里的 CASE 表达式必须与触发器中的保持一致
+COMPLETED_EXPR = 'CASE WHEN {t}completed = 1 THEN 1 ELSE 0 END'
+IMPORTANT_EXPR = 'CASE WHEN {t}is_important = 1 AND {t}completed = 0 THEN 1 ELSE 0 END'
+PENDING_EXPR = 'CASE WHEN {t}completed = 0 THEN 1 ELSE 0 END'
+
+STATS_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_task_stats (
+        user_id INTEGER PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        important INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS list_task_stats (
+        list_id INTEGER PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_due_stats (
+        user_id INTEGER NOT NULL,
+        due_date DATE NOT NULL,
+        pending INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, due_date)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def _apply_row_sql(row, sign):
+    """生成把一行任务（NEW 或 OLD）计入/移出计数表的语句"""
+    t = row + '.'
+    completed = COMPLETED_EXPR.format(t=t)
+    important = IMPORTANT_EXPR.format(t=t)
+    pending = PENDING_EXPR.format(t=t)
+    return f'''
+        INSERT INTO user_task_stats (user_id, total, completed, important)
+        SELECT {t}user_id, {sign}1, {sign}({completed}), {sign}({important}) WHERE {t}user_id IS NOT NULL
+        ON CONFLICT(user_id) DO UPDATE SET
+            total = total + excluded.total,
+            completed = completed + excluded.completed,
+            important = important + excluded.important;
+        INSERT INTO list_task_stats (list_id, total, completed)
+        SELECT {t}list_id, {sign}1, {sign}({completed}) WHERE {t}list_id IS NOT NULL
+        ON CONFLICT(list_id) DO UPDATE SET
+            total = total + excluded.total,
+            completed = completed + excluded.completed;
+        INSERT INTO user_due_stats (user_id, due_date, pending)
+        SELECT {t}user_id, {t}due_date, {sign}1
+        WHERE {t}user_id IS NOT NULL AND {t}due_date IS NOT NULL AND {pending} = 1
+        ON CONFLICT(user_id, due_date) DO UPDATE SET
+            pending = pending + excluded.pending;
+    '''
+
+
+def get_stats_triggers_sql():
+    """计数表维护触发器"""
+    return [
+        'DROP TRIGGER IF EXISTS trg_tasks_stats_insert',
+        'DROP TRIGGER IF EXISTS trg_tasks_stats_delete',
+        'DROP TRIGGER IF EXISTS trg_tasks_stats_update',
+        'DROP TRIGGER IF EXISTS trg_task_lists_stats_delete',
+        f'''
+        CREATE TRIGGER trg_tasks_stats_insert AFTER INSERT ON tasks BEGIN
+            {_apply_row_sql('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER trg_tasks_stats_delete AFTER DELETE ON tasks BEGIN
+            {_apply_row_sql('OLD', '-')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER trg_tasks_stats_update
+        AFTER UPDATE OF completed, is_important, list_id, user_id, due_date ON tasks BEGIN
+            {_apply_row_sql('OLD', '-')}
+            {_apply_row_sql('NEW', '+')}
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_task_lists_stats_delete AFTER DELETE ON task_lists BEGIN
+            DELETE FROM list_task_stats WHERE list_id = OLD.id;
+        END
+        ''',
+    ]
+
+
+def rebuild_task_stats(cursor):
+    """根据 tasks 表重新计算所有计数（用于迁移回填和一致性修复）"""
+    completed = COMPLETED_EXPR.format(t='')
+    important = IMPORTANT_EXPR.format(t='')
+    pending = PENDING_EXPR.format(t='')
+
+    cursor.execute('DELETE FROM user_task_stats')
+    cursor.execute('DELETE FROM list_task_stats')
+    cursor.execute('DELETE FROM user_due_stats')
+    cursor.execute(f'''
+        INSERT INTO user_task_stats (user_id, total, completed, important)
+        SELECT user_id, COUNT(*), SUM({completed}), SUM({important})
+        FROM tasks WHERE user_id IS NOT NULL GROUP BY user_id
+    ''')
+    cursor.execute(f'''
+        INSERT INTO list_task_stats (list_id, total, completed)
+        SELECT list_id, COUNT(*), SUM({completed})
+        FROM tasks WHERE list_id IS NOT NULL GROUP BY list_id
+    ''')
+    cursor.execute(f'''
+        INSERT INTO user_due_stats (user_id, due_date, pending)
+        SELECT user_id, due_date, COUNT(*)
+        FROM tasks WHERE user_id IS NOT NULL AND due_date IS NOT NULL AND {pending} = 1
+        GROUP BY user_id, due_date
+    ''')
+
+
+def _format_stats(total, completed, important, today_due, week_due):
+    total = total or 0
+    completed = completed or 0
+    return {
+        'total_tasks': total,
+        'completed_tasks': completed,
+        'pending_tasks': total - completed,
+        'important_tasks': important or 0,
+        'today_due_tasks': today_due or 0,
+        'week_due_tasks': week_due or 0,
+        'completion_rate': round((completed / total * 100) if total > 0 else 0, 1)
+    }
+
+
+def _due_window(today=None):
+    today = today or date.today()
+    return today.isoformat(), (today + timedelta(days=7)).isoformat()
+
+
+def _add_recurring_due(cursor, user_id, today, stats):
+    """重复任务的模板没有截止日期，到期数量加上窗口内展开的未完成次数"""
+    today = today or date.today()
+    today_due, week_due = task_recurrence.due_counts(cursor, user_id, today, today + timedelta(days=7))
+    stats['today_due_tasks'] += today_due
+    stats['week_due_tasks'] += week_due
+    return stats
+
+
+def compute_user_stats(cursor, user_id, today=None):
+    """单次扫描计算用户的全部统计（计数表不可用时的后备方案）"""
+    today_str, week_end = _due_window(today)
+    completed = COMPLETED_EXPR.format(t='')
+    important = IMPORTANT_EXPR.format(t='')
+    pending = PENDING_EXPR.format(t='')
+    cursor.execute(f'''
+        SELECT COUNT(*),
+               SUM({completed}),
+               SUM({important}),
+               SUM(CASE WHEN due_date = ? AND {pending} = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN due_date BETWEEN ? AND ? AND {pending} = 1 THEN 1 ELSE 0 END)
+        FROM tasks WHERE user_id = ?
+    ''', (today_str, today_str, week_end, user_id))
+    return _add_recurring_due(cursor, user_id, today, _format_stats(*cursor.fetchone()))
+
+
+USER_STATS_SQL = '''
+    SELECT s.total, s.completed, s.important,
+           (SELECT SUM(CASE WHEN due_date = ? THEN pending ELSE 0 END)
+            FROM user_due_stats WHERE user_id = ? AND due_date BETWEEN ? AND ?),
+           (SELECT SUM(pending)
+            FROM user_due_stats WHERE user_id = ? AND due_date BETWEEN ? AND ?)
+    FROM (SELECT ? AS user_id) u
+    LEFT JOIN user_task_stats s ON s.user_id = u.user_id
+'''
+
+
+def get_user_stats(cursor, user_id, today=None):
+    """读取用户统计：计数表上的主键查找，与任务数量无关"""
+    today_str, week_end = _due_window(today)
+    try:
+        cursor.execute(USER_STATS_SQL, (today_str, user_id, today_str, week_end,
+                                        user_id, today_str, week_end, user_id))
+    except sqlite3.OperationalError as e:
+        print(f"统计计数表不可用，改为实时计算: {e}")
+        return compute_user_stats(cursor, user_id, today)
+    return _add_recurring_due(cursor, user_id, today, _format_stats(*cursor.fetchone()))
+
+
+def verify_task_stats(cursor):
+    """比较计数表与实时计算结果，返回不一致项列表"""
+    completed = COMPLETED_EXPR.format(t='')
+    important = IMPORTANT_EXPR.format(t='')
+    pending = PENDING_EXPR.format(t='')
+    mismatches = []
+
+    cursor.execute(f'''
+        SELECT a.user_id, a.total, a.completed, a.important,
+               IFNULL(s.total, 0), IFNULL(s.completed, 0), IFNULL(s.important, 0)
+        FROM (SELECT user_id, COUNT(*) AS total, SUM({completed}) AS completed,
+                     SUM({important}) AS important
+              FROM tasks WHERE user_id IS NOT NULL GROUP BY user_id) a
+        LEFT JOIN user_task_stats s ON s.user_id = a.user_id
+        WHERE a.total != IFNULL(s.total, 0) OR a.completed != IFNULL(s.completed, 0)
+           OR a.important != IFNULL(s.important, 0)
+    ''')
+    mismatches += [('user', row[0], tuple(row[1:4]), tuple(row[4:7])) for row in cursor.fetchall()]
+
+    cursor.execute(f'''
+        SELECT a.list_id, a.total, a.completed, IFNULL(s.total, 0), IFNULL(s.completed, 0)
+        FROM (SELECT list_id, COUNT(*) AS total, SUM({completed}) AS completed
+              FROM tasks WHERE list_id IS NOT NULL GROUP BY list_id) a
+        LEFT JOIN list_task_stats s ON s.list_id = a.list_id
+        WHERE a.total != IFNULL(s.total, 0) OR a.completed != IFNULL(s.completed, 0)
+    ''')
+    mismatches += [('list', row[0], tuple(row[1:3]), tuple(row[3:5])) for row in cursor.fetchall()]
+
+    cursor.execute(f'''
+        SELECT a.user_id, a.due_date, a.pending, IFNULL(s.pending, 0)
+        FROM (SELECT user_id, due_date, COUNT(*) AS pending
+              FROM tasks WHERE user_id IS NOT NULL AND due_date IS NOT NULL AND {pending} = 1
+              GROUP BY user_id, due_date) a
+        LEFT JOIN user_due_stats s ON s.user_id = a.user_id AND s.due_date = a.due_date
+        WHERE a.pending != IFNULL(s.pending, 0)
+    ''')
+    mismatches += [('due', (row[0], row[1]), (row[2],), (row[3],)) for row in cursor.fetchall()]
+
+    # 计数表中多出的非零行（对应任务已不存在）
+    cursor.execute('''
+        SELECT s.user_id FROM user_task_stats s
+        WHERE s.total != 0 AND NOT EXISTS (SELECT 1 FROM tasks t WHERE t.user_id = s.user_id)
+    ''')
+    mismatches += [('user', row[0], (0, 0, 0), None) for row in cursor.fetchall()]
+    cursor.execute('''
+        SELECT s.list_id FROM list_task_stats s
+        WHERE s.total != 0 AND NOT EXISTS (SELECT 1 FROM tasks t WHERE t.list_id = s.list_id)
+    ''')
+    mismatches += [('list', row[0], (0, 0), None) for row in cursor.fetchall()]
+    cursor.execute(f'''
+        SELECT s.user_id, s.due_date, s.pending FROM user_due_stats s
+        WHERE s.pending != 0 AND NOT EXISTS (
+            SELECT 1 FROM tasks t
+            WHERE t.user_id = s.user_id AND t.due_date = s.due_date AND {PENDING_EXPR.format(t='t.')} = 1
+        )
+    ''')
+    mismatches += [('due', (row[0], row[1]), (0,), (row[2],)) for row in cursor.fetchall()]
+
+    return mismatches
@@ -0,0 +1,439 @@
+import json
+from datetime import datetime
+
+import serializers
+import task_bulk
+
+# 变更日志：每个 (用户, 实体, ID) 只保留最后一次变更，seq 单调递增，既是同步游标也是删除墓碑。
+# 由触发器维护，任何写入路径（接口、AI操作、批量、导入）都会被记录。
+SYNC_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS sync_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, entity, entity_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_sync_changes_user_seq ON sync_changes (user_id, seq)',
+    "CREATE INDEX IF NOT EXISTS idx_sync_changes_tombstones ON sync_changes (changed_at) WHERE op = 'delete'",
+    # 清理墓碑后的最小可用游标：更早的游标无法得知期间的删除，需要全量同步
+    '''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''',
+]
+
+# (表名, 实体名)
+SYNC_ENTITIES = (('tasks', 'task'), ('task_lists', 'list'))
+
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'due_date', 'start_time',
+               'end_time', 'list_id', 'created_at', 'updated_at', 'completed_at', 'is_important')
+LIST_FIELDS = ('id', 'name', 'icon', 'color', 'sort_order', 'total_tasks', 'completed_tasks')
+# 客户端可以修改的列表字段（任务字段同批量接口 task_bulk.UPDATE_FIELDS）
+LIST_UPDATE_FIELDS = ('name', 'icon', 'color', 'sort_order')
+
+SYNC_PAGE_SIZE = 500
+SYNC_PAGE_MAX = 5000
+MAX_MUTATIONS = 1000
+# 删除墓碑保留天数，以及每多少次同步请求清理一次
+TOMBSTONE_DAYS = 30
+PRUNE_EVERY = 500
+
+CHANGES_SQL = '''
+    SELECT seq, entity, entity_id, op FROM sync_changes
+    WHERE user_id = ? AND seq > ?
+    ORDER BY seq
+    LIMIT ?
+'''
+_CURRENT_SEQ_SQL = '''
+    SELECT entity_id, seq, op FROM sync_changes
+    WHERE user_id = ? AND entity = ? AND entity_id IN (SELECT value FROM json_each(?))
+'''
+_TASK_ROWS_SQL = f'''
+    SELECT {', '.join(TASK_FIELDS)} FROM tasks
+    WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+'''
+_LIST_ROWS_SQL = '''
+    SELECT tl.id, tl.name, tl.icon, tl.color, tl.sort_order,
+           IFNULL(s.total, 0), IFNULL(s.completed, 0)
+    FROM task_lists tl
+    LEFT JOIN list_task_stats s ON s.list_id = tl.id
+    WHERE tl.user_id = ? AND tl.id IN (SELECT value FROM json_each(?))
+'''
+
+
+class SyncError(ValueError):
+    """同步请求格式错误"""
+
+
+def _record_sql(row, entity, op):
+    return f'''
+        INSERT OR REPLACE INTO sync_changes (user_id, entity, entity_id, op)
+        SELECT {row}.user_id, '{entity}', {row}.id, '{op}' WHERE {row}.user_id IS NOT NULL;
+    '''
+
+
+def get_sync_triggers_sql():
+    """变更日志触发器"""
+    statements = []
+    for table, entity in SYNC_ENTITIES:
+        statements.extend([
+            f'DROP TRIGGER IF EXISTS trg_{table}_sync_insert',
+            f'DROP TRIGGER IF EXISTS trg_{table}_sync_update',
+            f'DROP TRIGGER IF EXISTS trg_{table}_sync_delete',
+            f'''
+            CREATE TRIGGER trg_{table}_sync_insert AFTER INSERT ON {table} BEGIN
+                {_record_sql('NEW', entity, 'upsert')}
+            END
+            ''',
+            # 转移到其他用户名下时，原用户记录为删除
+            f'''
+            CREATE TRIGGER trg_{table}_sync_update AFTER UPDATE ON {table} BEGIN
+                {_record_sql('NEW', entity, 'upsert')}
+                INSERT OR REPLACE INTO sync_changes (user_id, entity, entity_id, op)
+                SELECT OLD.user_id, '{entity}', OLD.id, 'delete'
+                WHERE OLD.user_id IS NOT NULL AND OLD.user_id IS NOT NEW.user_id;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER trg_{table}_sync_delete AFTER DELETE ON {table} BEGIN
+                {_record_sql('OLD', entity, 'delete')}
+            END
+            ''',
+        ])
+    return statements
+
+
+def seed_sync_changes(cursor):
+    """为已有数据补记变更日志，游标 0 的全量同步因此也走同一条查询"""
+    for table, entity in SYNC_ENTITIES:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO sync_changes (user_id, entity, entity_id, op)
+            SELECT user_id, '{entity}', id, 'upsert' FROM {table}
+            WHERE user_id IS NOT NULL ORDER BY id
+        ''')
+
+
+def get_horizon(cursor):
+    cursor.execute("SELECT value FROM sync_state WHERE key = 'tombstone_horizon'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def prune_tombstones(cursor, days=TOMBSTONE_DAYS):
+    """删除过期的墓碑并提高最小可用游标，返回删除的条数"""
+    cursor.execute('''
+        SELECT MAX(seq) FROM sync_changes
+        WHERE op = 'delete' AND changed_at < datetime('now', ?)
+    ''', (f'-{int(days)} days',))
+    horizon = cursor.fetchone()[0]
+    if horizon is None:
+        return 0
+    cursor.execute('''
+        INSERT INTO sync_state (key, value) VALUES ('tombstone_horizon', ?)
+        ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+    ''', (horizon,))
+    cursor.execute("DELETE FROM sync_changes WHERE op = 'delete' AND seq <= ?", (horizon,))
+    return cursor.rowcount
+
+
+def parse_token(value):
+    """同步游标是非负整数，缺省为 0（全量）"""
+    if value in (None, ''):
+        return 0
+    try:
+        token = int(value)
+    except (TypeError, ValueError):
+        raise SyncError('无效的同步游标')
+    if token < 0:
+        raise SyncError('无效的同步游标')
+    return token
+
+
+def _fetch_rows(cursor, sql, plan, user_id, ids):
+    if not ids:
+        return []
+    cursor.execute(sql, (user_id, json.dumps(ids)))
+    return plan.rows(cursor.fetchall())
+
+
+def get_changes(cursor, user_id, since=0, limit=SYNC_PAGE_SIZE):
+    """返回游标之后变更过的任务和列表（当前行）以及被删除的ID
+
+    cursor 需要产出元组行（serializers.tuple_cursor）。同一对象多次变更只返回一次；
+    游标早于墓碑清理线时返回 full=True，并从头开始全量同步，客户端应丢弃本地数据。
+    """
+    full = since == 0
+    if since and since < get_horizon(cursor):
+        since, full = 0, True
+
+    cursor.execute(CHANGES_SQL, (user_id, since, limit + 1))
+    changes = cursor.fetchall()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    upserts = {'task': [], 'list': []}
+    deletes = {'task': [], 'list': []}
+    for seq, entity, entity_id, op in changes:
+        (upserts if op == 'upsert' else deletes)[entity].append(entity_id)
+
+    return {
+        'sync_token': changes[-1][0] if changes else since,
+        'full': full,
+        'has_more': has_more,
+        'lists': _fetch_rows(cursor, _LIST_ROWS_SQL, serializers.get_plan(LIST_FIELDS), user_id, upserts['list']),
+        'tasks': _fetch_rows(cursor, _TASK_ROWS_SQL, serializers.get_plan(TASK_FIELDS), user_id, upserts['task']),
+        'deleted_lists': deletes['list'],
+        'deleted_tasks': deletes['task'],
+    }
+
+
+def _current_seqs(cursor, user_id, entity, ids):
+    if not ids:
+        return {}
+    cursor.execute(_CURRENT_SEQ_SQL, (user_id, entity, json.dumps(sorted(set(ids)))))
+    return {entity_id: (seq, op) for entity_id, seq, op in cursor.fetchall()}
+
+
+def _validate(mutations):
+    if not isinstance(mutations, list):
+        raise SyncError('mutations 必须是数组')
+    if len(mutations) > MAX_MUTATIONS:
+        raise SyncError(f'每次最多提交 {MAX_MUTATIONS} 个修改')
+    for mutation in mutations:
+        if not isinstance(mutation, dict):
+            raise SyncError('每个修改必须是对象')
+        if mutation.get('entity') not in ('task', 'list'):
+            raise SyncError('entity 必须是 task 或 list')
+        if mutation.get('op') not in ('upsert', 'delete'):
+            raise SyncError('op 必须是 upsert 或 delete')
+        if mutation.get('fields') is not None and not isinstance(mutation['fields'], dict):
+            raise SyncError('fields 必须是对象')
+
+
+def _list_field_error(fields, creating):
+    """列表字段的类型检查，有问题时返回错误信息"""
+    if creating or 'name' in fields:
+        name = fields.get('name')
+        if name is not None and not isinstance(name, str):
+            return '字段 name 必须是字符串'
+        if not (name or '').strip():
+            return '列表名称不能为空'
+    for field in ('icon', 'color'):
+        if fields.get(field) is not None and not isinstance(fields[field], str):
+            return f'字段 {field} 必须是字符串'
+    sort_order = fields.get('sort_order')
+    if sort_order is not None and (not isinstance(sort_order, int) or isinstance(sort_order, bool)):
+        return '字段 sort_order 必须是整数'
+    return None
+
+
+def _create(cursor, user_id, entity, fields, owned_lists, now):
+    """返回 (新ID, 错误信息)"""
+    if entity == 'list':
+        error = _list_field_error(fields, creating=True)
+        if error:
+            return None, error
+        cursor.execute('SELECT MAX(sort_order) FROM task_lists WHERE user_id = ?', (user_id,))
+        sort_order = fields.get('sort_order')
+        if sort_order is None:
+            sort_order = (cursor.fetchone()[0] or 0) + 1
+        cursor.execute('''
+            INSERT INTO task_lists (name, icon, color, sort_order, user_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (fields['name'].strip(), fields.get('icon', '📋'), fields.get('color', '#0078d4'), sort_order, user_id))
+        owned_lists.add(cursor.lastrowid)
+        return cursor.lastrowid, None
+
+    error = task_bulk.check_task_fields(fields, owned_lists, creating=True)
+    if error:
+        return None, error
+    completed = bool(fields.get('completed', False))
+    cursor.execute(task_bulk.CREATE_TASK_SQL, (
+        fields['title'].strip(),
+        fields.get('description', ''),
+        fields.get('priority', 'medium'),
+        fields.get('due_date'),
+        fields.get('start_time'),
+        fields.get('end_time'),
+        fields.get('list_id'),
+        fields.get('is_important', False),
+        completed,
+        now if completed else None,
+        user_id
+    ))
+    return cursor.lastrowid, None
+
+
+def _update(cursor, user_id, entity, entity_id, fields, owned_lists, now):
+    """返回错误信息，成功时返回 None"""
+    if entity == 'list':
+        signature = tuple(field for field in LIST_UPDATE_FIELDS if field in fields)
+        if not signature:
+            return '没有要更新的字段'
+        error = _list_field_error(fields, creating=False)
+        if error:
+            return error
+        cursor.execute(f'''
+            UPDATE task_lists SET {', '.join(f'{field} = ?' for field in signature)}, updated_at = ?
+            WHERE id = ? AND user_id = ?
+        ''', [fields[field] for field in signature] + [now, entity_id, user_id])
+        return None
+
+    signature = task_bulk.update_signature(fields)
+    if not signature:
+        return '没有要更新的字段'
+    error = task_bulk.check_task_fields(fields, owned_lists)
+    if error:
+        return error
+    cursor.execute(task_bulk.update_sql(signature),
+                   task_bulk.update_params(fields, signature, entity_id, user_id, now))
+    return None
+
+
+def _delete(cursor, user_id, entity, entity_id):
+    if entity == 'list':
+        # 与删除列表接口一致：列表中的任务一并删除
+        cursor.execute('DELETE FROM tasks WHERE list_id = ? AND user_id = ?', (entity_id, user_id))
+        cursor.execute('DELETE FROM task_lists WHERE id = ? AND user_id = ?', (entity_id, user_id))
+    else:
+        cursor.execute(task_bulk.DELETE_TASK_SQL, (entity_id, user_id))
+
+
+def apply_mutations(conn, user_id, mutations, base_token=None):
+    """在一个 BEGIN IMMEDIATE 事务中应用客户端离线期间的修改
+
+    每个修改：{"entity": "task"|"list", "op": "upsert"|"delete", "id": ...,
+              "client_id": ..., "base_token": ..., "fields": {...}}
+    - 没有 id 的 upsert 是创建，结果中带回 client_id 对应的新ID；
+      任务的 fields 可以用 list_client_id 引用同一批次中新建的列表
+    - 有 id 的修改做冲突检测：对象在 base_token（缺省为请求的 since）之后被其他修改改动过、
+      或已被删除时不应用，结果为 conflict 并附带服务端当前行（已删除时为 null）；
+      两者都没有时（base_token 为 None）只检测是否已被删除
+    - 删除已删除的对象视为成功（重试安全）
+    """
+    _validate(mutations)
+    now = datetime.now().isoformat()
+    cursor = serializers.tuple_cursor(conn)
+    results = []
+    touched = {'task': set(), 'list': set()}
+    removed = {'task': set(), 'list': set()}
+    conflicts = {'task': set(), 'list': set()}
+    list_aliases = {}
+
+    if conn.in_transaction:
+        conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # 事务内一次查出涉及对象的最后变更序号，检测期间不会有其他写入
+        current = {
+            entity: _current_seqs(cursor, user_id, entity,
+                                  [m['id'] for m in mutations if m['entity'] == entity
+                                   and isinstance(m.get('id'), int) and not isinstance(m['id'], bool)])
+            for entity in ('task', 'list')
+        }
+        # 任务引用的列表必须属于当前用户；本批次新建的列表在创建时加入
+        owned_lists = task_bulk.owned_list_ids(cursor, user_id, [m.get('fields') for m in mutations
+                                                                 if m['entity'] == 'task'])
+
+        for index, mutation in enumerate(mutations):
+            entity, op = mutation['entity'], mutation['op']
+            entity_id = mutation.get('id')
+            fields = dict(mutation.get('fields') or {})
+            result = {'index': index, 'entity': entity, 'op': op}
+            if 'client_id' in mutation:
+                result['client_id'] = mutation['client_id']
+            results.append(result)
+
+            if entity == 'task' and 'list_client_id' in fields:
+                alias = fields.pop('list_client_id')
+                if alias not in list_aliases:
+                    result.update(status='error', error='list_client_id 没有对应的新建列表')
+                    continue
+                fields['list_id'] = list_aliases[alias]
+
+            if entity_id is None:
+                if op == 'delete':
+                    result.update(status='error', error='删除需要提供ID')
+                    continue
+                new_id, error = _create(cursor, user_id, entity, fields, owned_lists, now)
+                if error:
+                    result.update(status='error', error=error)
+                    continue
+                if entity == 'list' and 'client_id' in mutation:
+                    list_aliases[mutation['client_id']] = new_id
+                touched[entity].add(new_id)
+                result.update(status='created', id=new_id)
+                continue
+
+            if not isinstance(entity_id, int) or isinstance(entity_id, bool):
+                result.update(status='error', error='无效的ID')
+                continue
+            result['id'] = entity_id
+            seq, last_op = current[entity].get(entity_id, (None, None))
+            if seq is None:
+                result.update(status='not_found')
+                continue
+            if last_op == 'delete':
+                if op == 'delete':
+                    result.update(status='applied')
+                else:
+                    conflicts[entity].add(entity_id)
+                    result.update(status='conflict', reason='deleted')
+                continue
+
+            # 同一批次中已经修改过的对象不再和自己的修改冲突
+            base = mutation.get('base_token', base_token)
+            if entity_id not in touched[entity] and base is not None:
+                try:
+                    base = parse_token(base)
+                except SyncError:
+                    result.update(status='error', error='无效的 base_token')
+                    continue
+                if seq > base:
+                    conflicts[entity].add(entity_id)
+                    result.update(status='conflict', reason='modified')
+                    continue
+
+            if op == 'delete':
+                _delete(cursor, user_id, entity, entity_id)
+                removed[entity].add(entity_id)
+                current[entity][entity_id] = (seq, 'delete')
+                result.update(status='applied')
+            else:
+                error = _update(cursor, user_id, entity, entity_id, fields, owned_lists, now)
+                if error:
+                    result.update(status='error', error=error)
+                    continue
+                touched[entity].add(entity_id)
+                result.update(status='applied')
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # 冲突项附带服务端当前行，客户端据此合并或覆盖
+    server_rows = {
+        'task': {row['id']: row for row in _fetch_rows(cursor, _TASK_ROWS_SQL, serializers.get_plan(TASK_FIELDS),
+                                                         user_id, sorted(conflicts['task']))},
+        'list': {row['id']: row for row in _fetch_rows(cursor, _LIST_ROWS_SQL, serializers.get_plan(LIST_FIELDS),
+                                                         user_id, sorted(conflicts['list']))},
+    }
+    for result in results:
+        if result.get('status') == 'conflict':
+            result['server'] = server_rows[result['entity']].get(result['id'])
+
+    return {
+        'results': results,
+        'task_ids': sorted(touched['task'] - removed['task']),
+        'list_ids': sorted(touched['list'] - removed['list']),
+        'deleted_task_ids': sorted(removed['task']),
+        'deleted_list_ids': sorted(removed['list']),
+    }
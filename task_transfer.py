@@ -0,0 +1,343 @@
+import csv
+import io
+import json
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+# 导出/导入的任务字段（list_name 由 list_id 解析，导入时按名称找回或新建列表）
+TASK_EXPORT_FIELDS = ('list_name', 'title', 'description', 'completed', 'priority', 'due_date',
+                      'start_time', 'end_time', 'is_important', 'created_at', 'completed_at')
+LIST_EXPORT_FIELDS = ('name', 'icon', 'color', 'sort_order')
+EXPORT_FORMATS = ('ndjson', 'csv')
+PRIORITIES = ('high', 'medium', 'low')
+
+EXPORT_FETCH_SIZE = 500
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', '是', '✓'}
+
+# 按任务ID分批读取，每批是一条独立的语句，读完即结束读事务
+_EXPORT_TASKS_SQL = '''
+    SELECT t.id, tl.name AS list_name, t.title, t.description, t.completed, t.priority, t.due_date,
+           t.start_time, t.end_time, t.is_important, t.created_at, t.completed_at
+    FROM tasks t
+    LEFT JOIN task_lists tl ON t.list_id = tl.id
+    WHERE t.user_id = ? AND t.id > ?
+    ORDER BY t.id
+    LIMIT ?
+'''
+_EXPORT_LISTS_SQL = f'''
+    SELECT {', '.join(LIST_EXPORT_FIELDS)} FROM task_lists
+    WHERE user_id = ? ORDER BY sort_order, id
+'''
+
+_IMPORT_TASK_SQL = '''
+    INSERT INTO tasks (title, description, completed, priority, due_date, start_time, end_time,
+                       list_id, is_important, created_at, completed_at, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+'''
+
+
+class ImportFormatError(ValueError):
+    """导入文件格式无法识别"""
+
+
+def _fetch(connect, sql, params):
+    """借出一个连接执行一条查询，取完结果后立即归还"""
+    conn = connect()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def _export_task_batches(connect, user_id, fetch_size=EXPORT_FETCH_SIZE):
+    """按任务ID分批产出导出行（不含ID列）
+
+    批次之间不持有连接和读事务，下载慢的客户端不会占住连接池或阻止 WAL 检查点；
+    代价是导出不是单一快照：下载期间修改的任务按读到那一批时的内容导出。
+    """
+    last_id = 0
+    while True:
+        rows = _fetch(connect, _EXPORT_TASKS_SQL, (user_id, last_id, fetch_size))
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+
+def _task_record(row):
+    record = dict(zip(TASK_EXPORT_FIELDS, row))
+    record['completed'] = bool(record['completed'])
+    record['is_important'] = bool(record['is_important'])
+    return record
+
+
+def iter_export(connect, user_id, fmt):
+    """逐批生成导出内容，任何时刻只在内存中保留一个批次的行
+
+    connect 返回一个连接（close() 归还到连接池），每读一批借出一次。
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM 让 Excel 按 UTF-8 打开中文
+        buffer.write('\ufeff')
+        writer.writerow(TASK_EXPORT_FIELDS)
+        for rows in _export_task_batches(connect, user_id):
+            for row in rows:
+                record = _task_record(row)
+                writer.writerow(['1' if value is True else '0' if value is False else value
+                                 for value in record.values()])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    # NDJSON：先输出列表（保留图标、颜色和顺序），再输出任务
+    lines = []
+    for row in _fetch(connect, _EXPORT_LISTS_SQL, (user_id,)):
+        record = {'type': 'list'}
+        record.update(zip(LIST_EXPORT_FIELDS, row))
+        lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+    yield ''.join(lines)
+
+    for rows in _export_task_batches(connect, user_id):
+        lines = []
+        for row in rows:
+            record = {'type': 'task'}
+            record.update(_task_record(row))
+            lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        yield ''.join(lines)
+
+
+def detect_format(fmt=None, filename=None):
+    """根据参数或文件扩展名确定导入格式"""
+    if fmt:
+        fmt = fmt.lower()
+        if fmt in ('jsonl', 'json'):
+            fmt = 'ndjson'
+    elif filename:
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        fmt = 'csv' if extension == 'csv' else 'ndjson' if extension in ('ndjson', 'jsonl', 'json') else None
+    if fmt not in EXPORT_FORMATS:
+        raise ImportFormatError('不支持的导入格式，请使用 .csv 或 .ndjson/.jsonl 文件')
+    return fmt
+
+
+def _iter_records(text_stream, fmt):
+    """逐行解析导入文件，产出 (行号, 记录或None, 错误信息)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_number, line in enumerate(text_stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'JSON解析失败: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, '每行必须是一个JSON对象'
+            continue
+        yield line_number, record, None
+
+
+def _field_error(record, fields):
+    """字段只能是字符串、数字、布尔值或 null，嵌套的对象和数组无法写入"""
+    for field in fields:
+        if isinstance(record.get(field), (dict, list)):
+            return f'字段 {field} 必须是字符串、数字或布尔值'
+    return None
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_VALUES
+    return bool(value)
+
+
+def _blank_to_none(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+class ListResolver:
+    """列表名称 → ID，导入开始时一次加载，缺失的列表按需创建"""
+
+    def __init__(self, cursor, user_id):
+        self.cursor = cursor
+        self.user_id = user_id
+        cursor.execute('SELECT id, name, sort_order FROM task_lists WHERE user_id = ? ORDER BY id', (user_id,))
+        self.ids = {}
+        self.max_order = 0
+        for list_id, name, sort_order in cursor.fetchall():
+            self.ids.setdefault(name, list_id)
+            self.max_order = max(self.max_order, sort_order or 0)
+        self.created = 0
+
+    def resolve(self, name, icon='📋', color='#0078d4'):
+        name = _blank_to_none(name)
+        if name is None:
+            return None
+        list_id = self.ids.get(name)
+        if list_id is None:
+            self.max_order += 1
+            self.cursor.execute('''
+                INSERT INTO task_lists (name, icon, color, sort_order, user_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, icon or '📋', color or '#0078d4', self.max_order, self.user_id))
+            list_id = self.ids[name] = self.cursor.lastrowid
+            self.created += 1
+        return list_id
+
+
+class ImportProgress:
+    """导入进度（由进度接口读取）"""
+
+    def __init__(self, import_id, user_id):
+        self.import_id = import_id
+        self.user_id = user_id
+        self.status = 'running'
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.lists_created = 0
+        self.errors = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add_error(self, line_number, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                'import_id': self.import_id,
+                'status': self.status,
+                'rows_processed': self.rows,
+                'imported': self.imported,
+                'skipped': self.skipped,
+                'lists_created': self.lists_created,
+                'errors': list(self.errors),
+                'elapsed_seconds': round(elapsed, 2),
+                'rows_per_second': round(self.rows / elapsed) if elapsed > 0 else 0,
+            }
+
+
+# 进度保留一小时，供前端轮询
+import_progress = TTLCache(maxsize=1024, ttl=3600)
+
+
+def _task_params(record, list_id, user_id):
+    completed = _as_bool(record.get('completed', False))
+    priority = _blank_to_none(record.get('priority'))
+    description = record.get('description')
+    return (
+        record['title'].strip(),
+        description if isinstance(description, str) else '' if description is None else str(description),
+        completed,
+        priority if priority in PRIORITIES else 'medium',
+        _blank_to_none(record.get('due_date')),
+        _blank_to_none(record.get('start_time')),
+        _blank_to_none(record.get('end_time')),
+        list_id,
+        _as_bool(record.get('is_important', False)),
+        _blank_to_none(record.get('created_at')),
+        _blank_to_none(record.get('completed_at')) if completed else None,
+        user_id,
+    )
+
+
+def import_tasks(conn, user_id, text_stream, fmt, progress, chunk_size=IMPORT_CHUNK_SIZE):
+    """流式导入：逐行解析，每 chunk_size 行在一个事务中 executemany 写入
+
+    读取和解析请求体时不持有写锁（上传慢时不会阻塞其他写入），每批解析完成后才在
+    flush() 中开启 BEGIN IMMEDIATE，创建缺失的列表并写入任务。
+    失败的行记录在进度的 errors 中并跳过；已提交的批次不会因后续错误回滚。
+    """
+    cursor = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    resolver = ListResolver(cursor, user_id)
+    # 待写入的列表记录 (名称, 图标, 颜色) 和任务 (列表名称, 参数)，参数中的 list_id 在写入时解析
+    pending_lists = []
+    pending = []
+
+    def flush():
+        if not pending and not pending_lists:
+            return
+        cursor.execute('BEGIN IMMEDIATE')
+        for name, icon, color in pending_lists:
+            resolver.resolve(name, icon, color)
+        if pending:
+            cursor.executemany(_IMPORT_TASK_SQL, [params[:7] + (resolver.resolve(list_name),) + params[8:]
+                                                  for list_name, params in pending])
+        conn.commit()
+        with progress._lock:
+            progress.imported += len(pending)
+            progress.lists_created = resolver.created
+        pending_lists.clear()
+        pending.clear()
+
+    try:
+        for line_number, record, error in _iter_records(text_stream, fmt):
+            with progress._lock:
+                progress.rows += 1
+                if error:
+                    progress.add_error(line_number, error)
+                    continue
+
+                record_type = record.get('type', 'task')
+                if record_type == 'list':
+                    error = _field_error(record, LIST_EXPORT_FIELDS)
+                    if error is None and _blank_to_none(record.get('name')) is None:
+                        error = '列表名称不能为空'
+                    if error:
+                        progress.add_error(line_number, error)
+                    else:
+                        pending_lists.append((record['name'], _blank_to_none(record.get('icon')),
+                                              _blank_to_none(record.get('color'))))
+                    continue
+                if record_type != 'task':
+                    progress.add_error(line_number, f'未知的记录类型: {record_type}')
+                    continue
+                error = _field_error(record, TASK_EXPORT_FIELDS)
+                if error is None and (not isinstance(record.get('title'), str) or not record['title'].strip()):
+                    error = '任务标题不能为空'
+                if error:
+                    progress.add_error(line_number, error)
+                    continue
+
+            pending.append((record.get('list_name'), _task_params(record, None, user_id)))
+            if len(pending) + len(pending_lists) >= chunk_size:
+                flush()
+        flush()
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        with progress._lock:
+            progress.status = 'failed'
+            progress.errors.append({'line': None, 'error': str(e)})
+            progress.finished_at = time.time()
+        raise
+    else:
+        with progress._lock:
+            progress.status = 'completed'
+            progress.finished_at = time.time()
+    return progress.to_dict()
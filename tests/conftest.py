@@ -0,0 +1,154 @@
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import database
+from db_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    """临时目录中初始化并迁移好的数据库（各模块按相对路径打开 settings.db）"""
+    monkeypatch.chdir(tmp_path)
+    database.init_database()
+    database.migrate_database()
+    pool = ConnectionPool('settings.db')
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def conn(pool):
+    conn = pool.checkout()
+    yield conn
+    conn.close()
+
+
+def add_user(conn, username):
+    """插入一个用户并返回其ID"""
+    cursor = conn.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                          (username, f'{username}@example.com', 'x'))
+    conn.commit()
+    return cursor.lastrowid
+
+
+class LLMStub:
+    """本地 OpenAI 兼容桩服务的行为设置
+
+    fail_next: 接下来返回 503 的次数；delay: 响应前等待的秒数；
+    interrupt_after: 流式回复输出这么多段后直接断开（不发送 [DONE]）
+    """
+
+    def __init__(self):
+        self.fail_next = 0
+        self.delay = 0.0
+        self.interrupt_after = None
+        self.connections = set()
+        self.requests = 0
+        self.api_base = None
+
+    def assistant(self, **overrides):
+        settings = {
+            'api_base': self.api_base,
+            'api_key': 'stub',
+            'model': 'stub-model',
+            'max_tokens': 100,
+            'temperature': 0.7,
+            'timeout': 2,
+            'retries': 3,
+        }
+        settings.update(overrides)
+        return settings
+
+
+def _stub_handler(stub):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            stub.connections.add(self.client_address)
+            stub.requests += 1
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if stub.fail_next > 0:
+                stub.fail_next -= 1
+                payload = b'{"error": "overloaded"}'
+                self.send_response(503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            time.sleep(stub.delay)
+            reply = '收到：' + body['messages'][-1]['content']
+            if body.get('stream'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for index, char in enumerate(reply):
+                    if stub.interrupt_after is not None and index >= stub.interrupt_after:
+                        return
+                    event = {'choices': [{'delta': {'content': char}}]}
+                    self.wfile.write(f'data: {json.dumps(event, ensure_ascii=False)}\n\n'.encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b'data: [DONE]\n\n')
+                return
+            payload = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': reply}}]}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return StubHandler
+
+
+@pytest.fixture
+def llm_stub():
+    stub = LLMStub()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _stub_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub.api_base = f'http://127.0.0.1:{server.server_port}/v1'
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def todo_app(tmp_path_factory):
+    """在临时目录中导入 app（导入时按相对路径初始化数据库和配置），之后改用绝对路径"""
+    directory = tmp_path_factory.mktemp('app')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    app.db_connection_pool.database = str(directory / 'settings.db')
+    app.ai_config_store.path = str(directory / 'ai_config.json')
+    return app
+
+
+def login(todo_app, prefix='user'):
+    """注册并登录一个新用户，返回 (测试客户端, 用户ID)"""
+    client = todo_app.app.test_client()
+    name = f'{prefix}{time.perf_counter_ns()}'
+    client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret1'})
+    response = client.post('/api/auth/login', json={'username': name, 'password': 'secret1'})
+    assert response.status_code == 200, response.get_json()
+    return client, int(response.get_json()['user']['id'])
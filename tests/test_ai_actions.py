@@ -0,0 +1,65 @@
+import json
+import random
+
+from ai_actions import ACTION_SCHEMAS, parse_reply, validate_action
+
+PLAIN = '今天的安排如下：请注意时间。abc \n'
+NOISY = PLAIN + '{}"\\[],:'
+
+
+def random_action(rng):
+    kind = rng.choice(list(ACTION_SCHEMAS))
+    data = {
+        'create_task': {'title': f'任务{rng.randint(1, 999)} {{"x"}} \\ "q"', 'priority': 'high'},
+        'create_list': {'name': f'列表{rng.randint(1, 99)}'},
+        'update_task': {'task_id': rng.randint(1, 999), 'completed': True},
+        'delete_task': {'task_id': rng.randint(1, 999)},
+        'search_tasks': {'query': '会议 }{'},
+    }[kind]
+    return {'action': kind, 'data': data}
+
+
+def random_prose(rng, size, alphabet):
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+def test_embedded_actions_are_recovered_in_order():
+    # 纯正文中嵌入指令：必须按顺序全部找回，去掉指令后的正文里不留指令和代码块
+    rng = random.Random(20240601)
+    for _ in range(2000):
+        expected = [random_action(rng) for _ in range(rng.randint(0, 4))]
+        pieces = [random_prose(rng, rng.randint(0, 40), PLAIN)]
+        for action in expected:
+            encoded = json.dumps(action, ensure_ascii=rng.random() < 0.5)
+            if rng.random() < 0.3:
+                encoded = f'```json\n{encoded}\n```'
+            pieces.extend([encoded, random_prose(rng, rng.randint(0, 40), PLAIN)])
+        parsed = parse_reply(''.join(pieces))
+        assert parsed.actions == expected, pieces
+        assert not parsed.rejected
+        assert '"action"' not in parsed.text and '```' not in parsed.text
+
+
+def test_noise_never_raises_and_actions_are_valid():
+    # 随机括号、引号、转义噪声：不抛异常，返回的指令都符合格式
+    rng = random.Random(20240602)
+    for _ in range(2000):
+        pieces = [random_prose(rng, rng.randint(0, 60), NOISY)]
+        for _ in range(rng.randint(0, 3)):
+            pieces.extend([json.dumps(random_action(rng)), random_prose(rng, rng.randint(0, 60), NOISY)])
+        parsed = parse_reply(''.join(pieces))
+        for action in parsed.actions:
+            assert validate_action(action) == action
+
+
+def test_invalid_actions_are_rejected():
+    parsed = parse_reply('{"action": "delete_task", "data": {"task_id": "12"}} '
+                         '{"action": "drop_table", "data": {}} {"action": "create_task", "data": {"title": ""}}')
+    assert parsed.actions == [{'action': 'delete_task', 'data': {'task_id': 12}}]
+    assert [action for action, _ in parsed.rejected] == ['drop_table', 'create_task']
+
+
+def test_action_list_wrapper():
+    parsed = parse_reply('好的 {"actions": [{"action": "create_list", "data": {"name": "工作"}}]}')
+    assert parsed.actions == [{'action': 'create_list', 'data': {'name': '工作'}}]
+    assert parsed.text == '好的'
@@ -0,0 +1,45 @@
+from ai_executor import DEFAULT_LIST_NAME, execute_actions
+
+from .conftest import add_user
+
+
+def test_failed_action_rolls_back_only_itself(conn):
+    user_id = add_user(conn, 'executor')
+    other_id = add_user(conn, 'other')
+    foreign = conn.execute("INSERT INTO tasks (title, user_id) VALUES ('别人的任务', ?)", (other_id,)).lastrowid
+    conn.commit()
+
+    outcome = execute_actions(conn, user_id, [
+        {'action': 'create_list', 'data': {'name': '新项目'}},
+        {'action': 'create_task', 'data': {'title': '写方案', 'list_name': '新项目'}},
+        {'action': 'create_list', 'data': {'name': '新项目'}},
+        {'action': 'delete_task', 'data': {'task_id': foreign}},
+        {'action': 'create_task', 'data': {'title': '买菜'}},
+        {'action': 'search_tasks', 'data': {'query': '方案'}},
+    ])
+    results = outcome['results']
+    assert [result['success'] for result in results] == [True, True, True, False, True, True]
+    assert results[2]['list_id'] == results[0]['list_id'] == results[1]['list_id']
+    assert [task['id'] for task in results[5]['results']] == [results[1]['task_id']]
+    assert outcome['task_ids'] == sorted([results[1]['task_id'], results[4]['task_id']])
+
+    lists = conn.execute('SELECT name FROM task_lists WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+    assert [row[0] for row in lists] == ['新项目', DEFAULT_LIST_NAME]
+    assert conn.execute('SELECT COUNT(*) FROM tasks WHERE id = ?', (foreign,)).fetchone()[0] == 1
+
+
+def test_update_and_delete_own_tasks(conn):
+    user_id = add_user(conn, 'executor')
+    task_id = conn.execute("INSERT INTO tasks (title, user_id) VALUES ('旧标题', ?)", (user_id,)).lastrowid
+    conn.commit()
+
+    outcome = execute_actions(conn, user_id, [
+        {'action': 'update_task', 'data': {'task_id': task_id, 'title': '新标题', 'completed': True}},
+        {'action': 'update_task', 'data': {'task_id': task_id, 'title': ''}},
+    ])
+    assert [result['success'] for result in outcome['results']] == [True, False]
+    assert tuple(conn.execute('SELECT title, completed FROM tasks WHERE id = ?', (task_id,)).fetchone()) == ('新标题', 1)
+
+    outcome = execute_actions(conn, user_id, [{'action': 'delete_task', 'data': {'task_id': task_id}}])
+    assert outcome['deleted_task_ids'] == [task_id] and outcome['task_ids'] == []
+    assert conn.execute('SELECT COUNT(*) FROM tasks WHERE id = ?', (task_id,)).fetchone()[0] == 0
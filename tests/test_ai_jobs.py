@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+
+import pytest
+
+from ai_jobs import FINISHED_STATUSES, JobQueue, QueueFull
+
+
+def test_queue_limits_concurrency_per_provider():
+    finished = []
+    queue = JobQueue(max_workers=4, on_finish=finished.append)
+    release = threading.Event()
+    running = []
+    lock = threading.Lock()
+
+    def work(job):
+        with lock:
+            running.append(job.id)
+            active = len(running)
+        release.wait(5)
+        with lock:
+            running.remove(job.id)
+        return {'active': active}
+
+    jobs = [queue.submit(1, 'a', work, concurrency=1, max_queued=2) for _ in range(3)]
+    with pytest.raises(QueueFull):
+        queue.submit(1, 'a', work, concurrency=1, max_queued=2)
+    # 其他提供商不受影响
+    other = queue.submit(1, 'b', lambda job: 'ok', concurrency=1)
+    assert other.wait(5) and other.result == 'ok'
+
+    release.set()
+    for job in jobs:
+        assert job.wait(5)
+    assert [job.result['active'] for job in jobs] == [1, 1, 1]
+    assert queue.get(jobs[0].id, 1) is jobs[0] and queue.get(jobs[0].id, 2) is None
+    # 完成回调和计数在任务结束之后更新，等后台线程退出再检查
+    queue.shutdown()
+    assert len(finished) == 4
+    stats = queue.stats()
+    assert stats['submitted'] == 4 and stats['completed'] == 4 and stats['providers']['a']['rejected'] == 1
+
+
+def test_cancel_queued_job():
+    queue = JobQueue(max_workers=1)
+    release = threading.Event()
+    first = queue.submit(1, 'a', lambda job: release.wait(5), concurrency=1)
+    second = queue.submit(1, 'a', lambda job: 'never', concurrency=1)
+    assert queue.cancel(second)
+    release.set()
+    assert first.wait(5) and first.status == 'done'
+    assert second.status == 'cancelled' and second.result is None
+    queue.shutdown()
+    assert queue.stats()['completed'] == 1
+
+
+def test_failed_job_reports_error():
+    queue = JobQueue(max_workers=1)
+    job = queue.submit(1, 'a', lambda job: 1 / 0)
+    assert job.wait(5) and job.status == 'failed' and job.error
+    queue.shutdown()
+    assert queue.stats()['failed'] == 1
+
+
+@pytest.fixture
+def chat(todo_app, llm_stub):
+    """已登录的测试客户端，AI配置指向桩服务；返回 (客户端, 用户ID)"""
+    config = todo_app.default_ai_config()
+    config['assistant'].update({'api_base': llm_stub.api_base, 'api_key': 'stub', 'timeout': 2})
+    config['advanced'].update({'cache_responses': False})
+    todo_app.save_ai_config(config)
+    client = todo_app.app.test_client()
+    name = f'chat{time.perf_counter_ns()}'
+    client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret1'})
+    response = client.post('/api/auth/login', json={'username': name, 'password': 'secret1'})
+    return client, int(response.get_json()['user']['id'])
+
+
+def set_stream(todo_app, enabled):
+    config = todo_app.load_ai_config()
+    config = dict(config, assistant=dict(config['assistant'], stream_response=enabled))
+    todo_app.save_ai_config(config)
+
+
+def wait_job(client, job_id):
+    for _ in range(100):
+        job = client.get(f'/api/ai/jobs/{job_id}').get_json()
+        if job['status'] in FINISHED_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'AI任务 {job_id} 未结束')
+
+
+def wait_ai_job_event(subscription, job_id):
+    """收集订阅中的事件直到收到该任务的 ai.job 事件（任务结束后才发布），返回 [(事件名, 数据)]"""
+    result = []
+    deadline = time.monotonic() + 5
+    while not any(event == 'ai.job' and data['job_id'] == job_id for event, data in result):
+        assert time.monotonic() < deadline, result
+        for frame in subscription.wait(0.5):
+            lines = dict(line.split(': ', 1) for line in frame.strip().splitlines() if ': ' in line)
+            result.append((lines.get('event'), json.loads(lines['data'])))
+    return result
+
+
+def test_chat_requires_login(todo_app):
+    client = todo_app.app.test_client()
+    assert client.post('/api/ai/chat', json={'message': '你好'}).status_code != 200
+    assert client.get('/api/ai/history').status_code != 200
+
+
+def test_async_chat(chat):
+    client, _ = chat
+    response = client.post('/api/ai/chat', json={'message': '你好', 'async': True})
+    assert response.status_code == 202
+    job = wait_job(client, response.get_json()['job_id'])
+    assert job['result'] == {'response': '收到：你好', 'source': 'ai'}
+    history = client.get('/api/ai/history').get_json()['history']
+    assert [message['content'] for message in history][-2:] == ['你好', '收到：你好']
+
+
+def test_stream_tokens_over_event_bus(todo_app, chat):
+    client, user_id = chat
+    set_stream(todo_app, True)
+    subscription = todo_app.event_bus.subscribe(user_id)
+    try:
+        job_id = client.post('/api/ai/chat', json={'message': '你好', 'async': True}).get_json()['job_id']
+        job = wait_job(client, job_id)
+        received = wait_ai_job_event(subscription, job_id)
+    finally:
+        subscription.close()
+    assert job['result']['source'] == 'ai'
+    tokens = [data['content'] for event, data in received if event == 'ai.token' and data['job_id'] == job_id]
+    assert ''.join(tokens) == '收到：你好'
+
+
+def test_interrupted_stream_is_not_recorded(todo_app, chat, llm_stub):
+    client, _ = chat
+    set_stream(todo_app, True)
+    llm_stub.interrupt_after = 2
+    job_id = client.post('/api/ai/chat', json={'message': '你好', 'async': True}).get_json()['job_id']
+    result = wait_job(client, job_id)['result']
+    assert result['source'] == 'ai_interrupted' and result['interrupted']
+    assert result['response'] == '收到' + todo_app.AI_INTERRUPTED_NOTE
+    history = client.get('/api/ai/history').get_json()['history']
+    assert [message['role'] for message in history] == ['user']
@@ -0,0 +1,86 @@
+import pytest
+
+import ai_response_cache
+from ai_response_cache import ResponseCache, make_cache_key, normalize_message
+
+from .conftest import login
+
+
+def test_key_ignores_formatting_but_not_meaning():
+    key = make_cache_key(1, 'model', 0.7, '今天有什么任务？', 'ctx')
+    assert make_cache_key(1, 'model', 0.7, '  今天有什么任务?  ', 'ctx') == key
+    assert make_cache_key(1, 'model', 0.7, '今天有什么任务', 'ctx') == key
+    assert normalize_message('ＨＥＬＬＯ   World！') == 'hello world'
+
+    different = [
+        make_cache_key(2, 'model', 0.7, '今天有什么任务？', 'ctx'),
+        make_cache_key(1, 'other', 0.7, '今天有什么任务？', 'ctx'),
+        make_cache_key(1, 'model', 0.2, '今天有什么任务？', 'ctx'),
+        make_cache_key(1, 'model', 0.7, '明天有什么任务？', 'ctx'),
+        make_cache_key(1, 'model', 0.7, '今天有什么任务？', 'ctx changed'),
+    ]
+    assert key not in different and len(set(different)) == len(different)
+
+
+def test_persistent_layer_is_shared_and_expires(pool, monkeypatch):
+    first = ResponseCache(pool.checkout)
+    second = ResponseCache(pool.checkout)
+    first.set('k', '回复', 120.0, ttl=60, persist=True)
+    first.set('memory-only', '回复', 5.0)
+
+    assert first.get('k') == '回复'
+    assert second.get('k') is None
+    assert second.get('k', persist=True) == '回复' and second.get('memory-only', persist=True) is None
+    stats = second.stats()
+    assert stats['db_hits'] == 1 and stats['saved_latency_ms'] == 120.0
+
+    third = ResponseCache(pool.checkout)
+    now = ai_response_cache.time.time()
+    monkeypatch.setattr(ai_response_cache.time, 'time', lambda: now + 61)
+    assert third.get('k', persist=True) is None
+
+
+def test_expired_rows_are_purged(pool, monkeypatch):
+    monkeypatch.setattr(ai_response_cache, 'PURGE_EVERY', 3)
+    cache = ResponseCache(pool.checkout)
+    cache.set('old', 'a', 1.0, ttl=-1, persist=True)
+    cache.set('new', 'b', 1.0, ttl=60, persist=True)
+    cache.set('newer', 'c', 1.0, ttl=60, persist=True)
+    conn = pool.checkout()
+    try:
+        keys = {row[0] for row in conn.execute('SELECT cache_key FROM ai_response_cache')}
+    finally:
+        conn.close()
+    assert keys == {'new', 'newer'}
+
+
+@pytest.fixture
+def cached_chat(todo_app, llm_stub):
+    previous = todo_app.load_ai_config()
+    config = todo_app.default_ai_config()
+    config['assistant'].update({'api_base': llm_stub.api_base, 'api_key': 'stub', 'timeout': 2,
+                                'stream_response': False})
+    config['advanced'].update({'cache_responses': True})
+    todo_app.save_ai_config(config)
+    yield login(todo_app, 'cached')
+    todo_app.save_ai_config(previous)
+
+
+def test_chat_reuses_reply_until_tasks_change(todo_app, llm_stub, cached_chat):
+    client, _ = cached_chat
+    first = client.post('/api/ai/chat', json={'message': '你好'}).get_json()
+    assert first == {'response': '收到：你好', 'source': 'ai'}
+    requests = llm_stub.requests
+
+    again = client.post('/api/ai/chat', json={'message': '  你好！'}).get_json()
+    assert again == {'response': '收到：你好', 'source': 'cache'} and llm_stub.requests == requests
+
+    # 其他用户的相同问题不会命中
+    other, _ = login(todo_app, 'cached')
+    assert other.post('/api/ai/chat', json={'message': '你好'}).get_json()['source'] == 'ai'
+    requests = llm_stub.requests
+
+    # 任务数据变化后上下文不同，重新请求模型
+    client.post('/api/tasks', json={'title': '新任务'})
+    assert client.post('/api/ai/chat', json={'message': '你好'}).get_json()['source'] == 'ai'
+    assert llm_stub.requests == requests + 1
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+import database
+import task_search
+import task_stats
+from check_db import API_QUERIES, check_query_plans, find_full_scans, query_plan
+
+
+@pytest.mark.parametrize('name, sql, params', API_QUERIES, ids=[name for name, _, _ in API_QUERIES])
+def test_api_query_uses_index(conn, name, sql, params):
+    details = query_plan(conn.cursor(), sql, params)
+    assert not find_full_scans(details), details
+    assert any('INDEX' in detail or 'PRIMARY KEY' in detail
+               for detail in details if detail.startswith(('SEARCH', 'SCAN'))), details
+
+
+def test_check_query_plans_reports_no_failures(conn):
+    assert check_query_plans(conn) == []
+
+
+def test_task_stats_consistent_after_migration(conn):
+    assert task_stats.verify_task_stats(conn.cursor()) == []
+
+
+def test_search_migrations_are_retried_when_fts_is_unavailable(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    create_search_index = task_search.create_search_index
+
+    def unavailable(cursor):
+        raise sqlite3.OperationalError('no such module: fts5')
+
+    monkeypatch.setattr(task_search, 'create_search_index', unavailable)
+    database.init_database()
+    database.migrate_database()
+    conn = sqlite3.connect('settings.db')
+    versions = database.get_applied_versions(conn.cursor())
+    assert {4, 14}.isdisjoint(versions)
+    assert versions == {version for version, _, _ in database.MIGRATIONS} - {4, 14}
+
+    monkeypatch.setattr(task_search, 'create_search_index', create_search_index)
+    database.migrate_database()
+    assert database.get_applied_versions(conn.cursor()) == {version for version, _, _ in database.MIGRATIONS}
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'tasks_fts'").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import config_store
+from config_store import ConfigStore, freeze, thaw
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(config_store.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def write(path, config):
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding='utf-8')
+
+
+def test_snapshot_is_shared_and_read_only(tmp_path, clock):
+    path = tmp_path / 'config.json'
+    write(path, {'model': 'a', 'tags': ['x', {'y': 1}]})
+    store = ConfigStore(str(path))
+    snapshot = store.snapshot()
+    assert store.snapshot() is snapshot and store.stats()['loads'] == 1
+    assert snapshot['tags'] == ('x', {'y': 1})
+    with pytest.raises(TypeError):
+        snapshot['model'] = 'b'
+    with pytest.raises(TypeError):
+        snapshot['tags'][1]['y'] = 2
+    assert thaw(snapshot) == {'model': 'a', 'tags': ['x', {'y': 1}]}
+    assert thaw(freeze(thaw(snapshot))) == thaw(snapshot)
+
+
+def test_external_edit_is_picked_up_after_check_interval(tmp_path, clock):
+    path = tmp_path / 'config.json'
+    write(path, {'model': 'a'})
+    store = ConfigStore(str(path), check_interval=1.0)
+    first = store.snapshot()
+
+    write(path, {'model': 'changed'})
+    clock[0] += 0.5
+    assert store.snapshot() is first
+    clock[0] += 0.6
+    assert store.snapshot()['model'] == 'changed' and store.stats()['loads'] == 2
+
+    # 文件未变化时只 stat，不重新加载
+    clock[0] += 5
+    second = store.snapshot()
+    assert store.snapshot() is second and store.stats()['loads'] == 2
+
+
+def test_save_replaces_snapshot_without_reload(tmp_path, clock):
+    path = tmp_path / 'config.json'
+    store = ConfigStore(str(path), default_factory=lambda: {'model': 'default'})
+    assert store.snapshot()['model'] == 'default'
+
+    store.save({'model': 'saved', 'max_tokens': 10})
+    assert store.snapshot()['model'] == 'saved'
+    assert json.loads(path.read_text(encoding='utf-8')) == {'model': 'saved', 'max_tokens': 10}
+    clock[0] += 5
+    assert store.snapshot()['max_tokens'] == 10 and store.stats()['loads'] == 1
+    assert not [name for name in tmp_path.iterdir() if name.name.startswith('.config-')]
+
+
+def test_broken_file_keeps_last_snapshot(tmp_path, clock):
+    path = tmp_path / 'config.json'
+    write(path, {'model': 'good'})
+    store = ConfigStore(str(path))
+    good = store.snapshot()
+
+    path.write_text('{"model": "half', encoding='utf-8')
+    clock[0] += 5
+    assert store.snapshot() is good
+
+    path.unlink()
+    clock[0] += 5
+    assert store.snapshot() == {}
@@ -0,0 +1,61 @@
+from conversation_store import PRUNE_FACTOR, ConversationStore
+
+
+def row_count(pool, user_id):
+    conn = pool.checkout()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM ai_conversations WHERE user_id = ?', (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def contents(store, user_id, maxlen, persist=True):
+    return [message['content'] for message in store.history(user_id, maxlen, persist)]
+
+
+def test_history_and_table_stay_bounded(pool):
+    store = ConversationStore(pool.checkout)
+    for i in range(50):
+        store.append(1, 'user' if i % 2 == 0 else 'assistant', f'消息{i}', maxlen=5)
+        assert row_count(pool, 1) <= 5 * PRUNE_FACTOR
+    assert contents(store, 1, 5) == [f'消息{i}' for i in range(45, 50)]
+    assert row_count(pool, 1) >= 5
+
+    # 其他用户的历史不受影响
+    store.append(2, 'user', '另一个用户', maxlen=5)
+    assert contents(store, 2, 5) == ['另一个用户']
+    assert contents(ConversationStore(pool.checkout), 1, 5) == [f'消息{i}' for i in range(45, 50)]
+
+
+def test_evicted_users_are_reloaded_from_database(pool):
+    store = ConversationStore(pool.checkout, cache_users=2)
+    for user_id in (1, 2, 3):
+        store.append(user_id, 'user', f'用户{user_id}', maxlen=10)
+    stats = store.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert contents(store, 1, 10) == ['用户1']
+
+
+def test_writes_from_another_store_are_visible(pool):
+    first = ConversationStore(pool.checkout)
+    second = ConversationStore(pool.checkout)
+    first.append(1, 'user', '你好', maxlen=10)
+    assert contents(second, 1, 10) == ['你好']
+    second.append(1, 'assistant', '收到', maxlen=10)
+    assert contents(first, 1, 10) == ['你好', '收到']
+
+
+def test_memory_only_history_and_clear(pool):
+    store = ConversationStore(pool.checkout)
+    for i in range(6):
+        store.append(1, 'user', f'临时{i}', maxlen=4, persist=False)
+    assert contents(store, 1, 4, persist=False) == ['临时2', '临时3', '临时4', '临时5']
+    assert row_count(pool, 1) == 0
+    # 缩小上下文长度时只保留最近的消息
+    assert contents(store, 1, 2, persist=False) == ['临时4', '临时5']
+
+    store.append(2, 'user', '持久', maxlen=4)
+    store.clear(2)
+    store.clear(1, persist=False)
+    assert contents(store, 2, 4) == [] and row_count(pool, 2) == 0
+    assert contents(store, 1, 4, persist=False) == []
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import db_pool
+from db_pool import ConnectionPool
+
+
+def test_checkout_reuses_released_connection(pool):
+    conn = pool.checkout()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+    assert pool.checkout() is conn
+    conn.close()
+    stats = pool.stats()
+    assert stats['connections_created'] == 1 and stats['checkouts'] == 2 and stats['releases'] == 2
+    assert stats['in_use'] == 0 and stats['idle'] == 1
+
+
+def test_release_rolls_back_and_ignores_double_close(pool):
+    conn = pool.checkout()
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('pending', 'p@example.com', 'x')")
+    conn.close()
+    conn.close()
+    assert pool.stats()['releases'] == 1
+    again = pool.checkout()
+    assert again.execute("SELECT COUNT(*) FROM users WHERE username = 'pending'").fetchone()[0] == 0
+    again.close()
+
+
+def test_checkout_waits_for_release_and_times_out(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=1, timeout=0.2)
+    conn = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+
+    threading.Timer(0.05, conn.close).start()
+    pool.timeout = 2
+    assert pool.checkout() is conn
+    conn.close()
+    stats = pool.stats()
+    assert stats['waits'] == 2 and stats['size'] == 1
+    pool.close_all()
+
+
+def test_connections_are_returned_when_app_context_ends(pool):
+    app = Flask(__name__)
+    db_pool.init_app(app, pool)
+    with app.app_context():
+        db_pool.lease_connection(pool)
+        db_pool.lease_connection(pool)
+        assert pool.stats()['in_use'] == 2
+    assert pool.stats()['in_use'] == 0
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+import pytest
+
+from .conftest import login
+
+URLS = ['/api/tasks', '/api/task_lists', '/api/stats', '/api/user_preferences']
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_unchanged_data_returns_304(todo_app, url):
+    client, _ = login(todo_app, 'etag')
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and etag.startswith('W/')
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = revalidate(client, url, etag)
+    assert cached.status_code == 304 and cached.data == b'' and cached.headers['ETag'] == etag
+    assert revalidate(client, url, 'W/"other"').status_code == 200
+
+
+@pytest.mark.parametrize('write', ['create', 'update', 'delete', 'list', 'preferences'])
+def test_writes_change_etag(todo_app, write):
+    client, _ = login(todo_app, 'etag')
+    task_id = client.post('/api/tasks', json={'title': '任务'}).get_json()['id']
+    etags = {url: client.get(url).headers['ETag'] for url in URLS}
+
+    if write == 'create':
+        client.post('/api/tasks', json={'title': '另一个任务'})
+    elif write == 'update':
+        client.put(f'/api/tasks/{task_id}', json={'completed': True})
+    elif write == 'delete':
+        client.delete(f'/api/tasks/{task_id}')
+    elif write == 'list':
+        client.post('/api/task_lists', json={'name': '新列表'})
+    else:
+        client.put('/api/user_preferences', json={'theme': 'dark'})
+
+    for url, etag in etags.items():
+        response = revalidate(client, url, etag)
+        assert response.status_code == 200 and response.headers['ETag'] != etag, url
+
+
+def test_other_users_writes_keep_etag(todo_app):
+    client, _ = login(todo_app, 'etag')
+    other, _ = login(todo_app, 'etag')
+    etag = client.get('/api/tasks').headers['ETag']
+    other.post('/api/tasks', json={'title': '别人的任务'})
+    assert revalidate(client, '/api/tasks', etag).status_code == 304
+
+
+def test_day_scoped_etag_changes_at_midnight(todo_app, monkeypatch):
+    client, _ = login(todo_app, 'etag')
+    tasks_etag = client.get('/api/tasks').headers['ETag']
+    lists_etag = client.get('/api/task_lists').headers['ETag']
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(todo_app, 'date', Tomorrow)
+    # 今天/逾期等统计依赖日期，跨天后必须重新获取；任务列表不依赖日期
+    assert revalidate(client, '/api/tasks', tasks_etag).status_code == 200
+    assert revalidate(client, '/api/task_lists', lists_etag).status_code == 304
@@ -0,0 +1,109 @@
+import json
+
+from event_bus import EventBus
+
+from .conftest import login
+
+
+def parse(frames):
+    """把事件帧解析为 [(事件ID, 事件名, 数据)]"""
+    events = []
+    for frame in frames:
+        for block in frame.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+            if 'event' in fields:
+                events.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_resume_replays_events_after_last_event_id():
+    bus = EventBus()
+    bus.subscribe(1).close()
+    for i in range(3):
+        bus.publish(1, 'task.upsert', {'id': i})
+    bus.publish(1, 'ai.token', {'content': '临时'}, replay=False)
+    bus.publish(2, 'task.upsert', {'id': 99})
+
+    subscription = bus.subscribe(1, f'{bus.boot_id}-0')
+    events = parse(subscription.wait(0))
+    assert [data['id'] for _, _, data in events] == [0, 1, 2]
+
+    resumed = bus.subscribe(1, events[0][0])
+    assert [data['id'] for _, _, data in parse(resumed.wait(0))] == [1, 2]
+    bus.publish(1, 'task.delete', {'id': 1})
+    assert parse(resumed.wait(0)) == parse(subscription.wait(0))
+    assert parse(resumed.wait(0.01)) == []
+    for item in (subscription, resumed):
+        item.close()
+    assert bus.stats()['subscribers'] == 0 and bus.stats()['resets'] == 0
+
+
+def test_reset_when_events_cannot_be_replayed():
+    bus = EventBus(history_size=3)
+    bus.subscribe(1).close()
+    bus.publish(1, 'task.upsert', {'id': 0})
+    first_id = parse(bus.subscribe(1, f'{bus.boot_id}-0').wait(0))[0][0]
+
+    # 其他进程或重启前的事件ID、格式错误的事件ID
+    for last_event_id in ('ffffffff-1', 'garbage', f'{bus.boot_id}-x'):
+        assert [event for _, event, _ in parse(bus.subscribe(1, last_event_id).wait(0))] == ['reset']
+
+    for i in range(1, 5):
+        bus.publish(1, 'task.upsert', {'id': i})
+    (reset_id, event, _), = parse(bus.subscribe(1, first_id).wait(0))
+    assert event == 'reset'
+    # reset 带上当前序号，用它重连不会再次 reset
+    assert parse(bus.subscribe(1, reset_id).wait(0)) == []
+
+
+def test_slow_subscriber_gets_reset():
+    bus = EventBus(history_size=2)
+    subscription = bus.subscribe(1)
+    for i in range(4):
+        bus.publish(1, 'task.upsert', {'id': i})
+    assert [event for _, event, _ in parse(subscription.wait(0))] == ['reset']
+    bus.publish(1, 'task.upsert', {'id': 4})
+    assert [data['id'] for _, _, data in parse(subscription.wait(0))] == [4]
+
+
+def test_evicted_channel_resets_on_resume():
+    bus = EventBus(max_channels=2)
+    bus.subscribe(1).close()
+    bus.publish(1, 'task.upsert', {'id': 0})
+    subscription = bus.subscribe(1, f'{bus.boot_id}-0')
+    last_event_id = parse(subscription.wait(0))[0][0]
+    subscription.close()
+    for user_id in (2, 3):
+        bus.subscribe(user_id).close()
+    assert not bus.has_channel(1)
+    bus.publish(1, 'task.upsert', {'id': 1})
+    assert [event for _, event, _ in parse(bus.subscribe(1, last_event_id).wait(0))] == ['reset']
+
+
+def open_stream(client, last_event_id=None):
+    headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+    response = client.get('/api/events', headers=headers, buffered=False)
+    stream = response.response
+    assert next(stream).startswith(b'retry:')
+    return response, stream
+
+
+def test_event_stream_resumes_after_reconnect(todo_app):
+    client, _ = login(todo_app, 'events')
+    response, stream = open_stream(client)
+    first = client.post('/api/tasks', json={'title': '第一个'}).get_json()['id']
+    events = parse([next(stream).decode('utf-8')])
+    response.close()
+    upserts = [(event_id, data) for event_id, event, data in events if event == 'task.upsert']
+    assert [data['id'] for _, data in upserts] == [first]
+
+    # 断线期间的写入在重连后补发
+    second = client.post('/api/tasks', json={'title': '第二个'}).get_json()['id']
+    response, stream = open_stream(client, events[-1][0])
+    missed = parse([next(stream).decode('utf-8')])
+    response.close()
+    assert [data['id'] for _, event, data in missed if event == 'task.upsert'] == [second]
+
+    response, stream = open_stream(client, 'unknown-1')
+    assert [event for _, event, _ in parse([next(stream).decode('utf-8')])] == ['reset']
+    response.close()
@@ -0,0 +1,53 @@
+import pytest
+
+import llm_client
+from llm_client import LLMError, chat_completion, stream_chat_completion
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+
+def test_connections_are_reused(llm_stub):
+    for _ in range(10):
+        assert chat_completion(MESSAGES, llm_stub.assistant()) == '收到：你好'
+    assert len(llm_stub.connections) == 1
+
+
+def test_retries_retryable_status(llm_stub):
+    llm_stub.fail_next = 2
+    retries = llm_client.stats()['retries']
+    assert chat_completion(MESSAGES, llm_stub.assistant()) == '收到：你好'
+    assert llm_client.stats()['retries'] - retries == 2
+
+
+def test_gives_up_after_retries(llm_stub):
+    llm_stub.fail_next = 5
+    with pytest.raises(LLMError) as info:
+        chat_completion(MESSAGES, llm_stub.assistant(retries=1))
+    assert info.value.status_code == 503 and info.value.retryable
+    assert llm_stub.requests == 2
+
+
+def test_timeout(llm_stub):
+    llm_stub.delay = 1.0
+    with pytest.raises(LLMError):
+        chat_completion(MESSAGES, llm_stub.assistant(timeout=0.2, retries=0))
+
+
+def test_stream(llm_stub):
+    llm_stub.fail_next = 1
+    stream = stream_chat_completion(MESSAGES, llm_stub.assistant())
+    assert list(stream) == list('收到：你好')
+    assert stream.completed and stream.text == '收到：你好'
+
+
+def test_interrupted_stream_keeps_partial_text(llm_stub):
+    # 已经产出内容后断开：不重试，抛出 LLMError，已收到的部分仍可读取
+    llm_stub.interrupt_after = 2
+    stream = stream_chat_completion(MESSAGES, llm_stub.assistant())
+    chunks = []
+    with pytest.raises(LLMError):
+        for content in stream:
+            chunks.append(content)
+    assert chunks == ['收', '到'] and stream.text == '收到'
+    assert not stream.completed
+    assert llm_stub.requests == 1
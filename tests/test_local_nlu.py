@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from local_nlu import parse
+
+TODAY = date(2024, 6, 12)  # 星期三
+# (消息, 意图, 期望字段)；只校验列出的字段
+CORPUS = [
+    ('创建任务：完成项目报告', 'create', {'title': '完成项目报告'}),
+    ('新建一个任务：买牛奶', 'create', {'title': '买牛奶'}),
+    ('添加重要任务：准备演示文稿', 'create', {'title': '准备演示文稿', 'is_important': True}),
+    ('明天下午3点开会', 'create', {'title': '开会', 'due_date': '2024-06-13', 'start_time': '15:00', 'end_time': '16:00'}),
+    ('提醒我明天早上8点半跑步', 'create', {'title': '跑步', 'due_date': '2024-06-13', 'start_time': '08:30'}),
+    ('下周三上午10点和客户开会', 'create', {'due_date': '2024-06-19', 'start_time': '10:00', 'title': '和客户开会'}),
+    ('周五交周报', 'create', {'due_date': '2024-06-14', 'title': '交周报'}),
+    ('周一复盘', 'create', {'due_date': '2024-06-17', 'title': '复盘'}),
+    ('这周日去看电影', 'create', {'due_date': '2024-06-16', 'title': '去看电影'}),
+    ('后天晚上七点吃饭', 'create', {'due_date': '2024-06-14', 'start_time': '19:00', 'title': '吃饭'}),
+    ('大后天交房租', 'create', {'due_date': '2024-06-15', 'title': '交房租'}),
+    ('3天后提交申请', 'create', {'due_date': '2024-06-15', 'title': '提交申请'}),
+    ('三天后提交申请', 'create', {'due_date': '2024-06-15', 'title': '提交申请'}),
+    ('7月1日缴纳保险', 'create', {'due_date': '2024-07-01', 'title': '缴纳保险'}),
+    ('六月二十号体检', 'create', {'due_date': '2024-06-20', 'title': '体检'}),
+    ('5号还信用卡', 'create', {'due_date': '2024-07-05', 'title': '还信用卡'}),
+    ('月底前整理发票', 'create', {'due_date': '2024-06-30'}),
+    ('下午3点到5点写代码', 'create', {'start_time': '15:00', 'end_time': '17:00', 'title': '写代码'}),
+    ('今天15:30-16:00面试', 'create', {'due_date': '2024-06-12', 'start_time': '15:30', 'end_time': '16:00', 'title': '面试'}),
+    ('中午12点午餐会', 'create', {'start_time': '12:00', 'title': '午餐会'}),
+    ('中午1点取快递', 'create', {'start_time': '13:00', 'title': '取快递'}),
+    ('今晚9点给妈妈打电话', 'create', {'due_date': '2024-06-12', 'start_time': '21:00', 'title': '给妈妈打电话'}),
+    ('紧急：修复线上故障', 'create', {'priority': 'high'}),
+    ('有空的时候整理书架', 'create', {'priority': 'low'}),
+    ('添加到工作列表：写周报', 'create', {'list_name': '工作', 'title': '写周报'}),
+    ('在购物清单里加个任务买鸡蛋', 'create', {'list_name': '购物', 'title': '买鸡蛋'}),
+    ('记得下周给车做保养', 'create', {'due_date': '2024-06-19', 'title': '给车做保养'}),
+    ('帮我安排明天9点的站会', 'create', {'due_date': '2024-06-13', 'start_time': '09:00', 'title': '站会'}),
+    ('我需要在周四之前完成设计稿', 'create', {'due_date': '2024-06-13'}),
+    ('帮我创建任务：写总结报告', 'create', {'title': '写总结报告'}),
+    ('帮我找一下关于会议的任务', 'search', {}),
+    ('搜索报销', 'search', {}),
+    ('查一下明天有什么任务', 'search', {}),
+    ('总结一下我的任务', 'summary', {}),
+    ('帮我统计完成率', 'summary', {}),
+    ('今天的进度怎么样', 'summary', {}),
+    ('你好', 'greeting', {}),
+    ('早上好呀', 'greeting', {}),
+    ('hi', 'greeting', {}),
+    ('Hello there', 'greeting', {}),
+    ('你有什么功能', 'help', {}),
+    ('怎么用这个应用', 'help', {}),
+    ('this is nice', 'unknown', {}),
+    ('谢谢', 'unknown', {}),
+    ('你好，帮我添加任务：明天交报告', 'create', {'due_date': '2024-06-13', 'title': '交报告'}),
+]
+
+
+@pytest.mark.parametrize('message, intent, expected', CORPUS)
+def test_corpus(message, intent, expected):
+    parsed = parse(message, TODAY)
+    assert parsed.intent == intent
+    actual = {field: parsed.task.get(field) if parsed.task else None for field in expected}
+    assert actual == expected
@@ -0,0 +1,36 @@
+import json
+import sqlite3
+
+from flask import Flask, jsonify
+
+import serializers
+
+COLUMNS = ('id', 'title', 'description', 'completed', 'priority', 'due_date', 'start_time',
+           'end_time', 'list_id', 'created_at', 'updated_at', 'completed_at', 'is_important')
+
+
+def test_plan_matches_row_and_jsonify():
+    # 元组行 + 列计划的输出与 sqlite3.Row + 按名取值 + jsonify 完全一致
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE tasks ({', '.join(COLUMNS)})")
+    conn.executemany(
+        f"INSERT INTO tasks VALUES ({', '.join('?' * len(COLUMNS))})",
+        [(i, f'任务标题 {i}', '一些描述文字', i % 2, 'medium', '2025-01-01', '09:00', '10:00',
+          i % 5, '2025-01-01 08:00:00', '2025-01-01 08:00:00', None, i % 3 == 0) for i in range(200)]
+    )
+    query = f"SELECT {', '.join(COLUMNS)} FROM tasks"
+
+    conn.row_factory = sqlite3.Row
+    expected = []
+    for task in conn.execute(query).fetchall():
+        item = {field: task[field] for field in COLUMNS}
+        for field in ('completed', 'is_important'):
+            item[field] = bool(item[field])
+        expected.append(item)
+    with Flask(__name__).app_context():
+        legacy = json.loads(jsonify(expected).get_data())
+
+    conn.row_factory = None
+    rows = serializers.get_plan(COLUMNS).rows(conn.execute(query).fetchall())
+    assert json.loads(serializers.json_response(rows).get_data()) == legacy
+    assert json.loads(serializers.dumps(rows)) == legacy
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import session_store
+from session_store import SessionStore, hash_token
+
+from .conftest import add_user, login
+
+
+@pytest.fixture
+def user_id(conn):
+    return add_user(conn, 'session')
+
+
+def session_rows(conn):
+    return [tuple(row) for row in conn.execute(
+        'SELECT session_token, user_id, expires_at, last_activity FROM user_sessions ORDER BY id')]
+
+
+def test_token_lookup_uses_cache_then_table(pool, conn, user_id):
+    store = SessionStore(pool.checkout)
+    token = store.create(user_id, {'_user_id': str(user_id)})
+    (token_hash, row_user, _, _), = session_rows(conn)
+    assert token_hash == hash_token(token) != token and row_user == user_id
+
+    assert store.get(token)[1].user_id == user_id and store.stats()['db_lookups'] == 0
+    # 另一个进程：第一次查表，之后命中缓存
+    other = SessionStore(pool.checkout)
+    for _ in range(3):
+        found_hash, record = other.get(token)
+        assert found_hash == token_hash and record.data == {'_user_id': str(user_id)}
+    assert other.stats()['db_lookups'] == 1
+    assert other.get('no-such-token')[1] is None
+
+    store.delete(token_hash)
+    assert store.get(token)[1] is None and session_rows(conn) == []
+
+
+def test_expired_session_is_rejected(pool, user_id, monkeypatch):
+    store = SessionStore(pool.checkout, lifetime=timedelta(hours=1))
+    token = store.create(user_id, {})
+    later = datetime.now(timezone.utc) + timedelta(hours=2)
+    monkeypatch.setattr(session_store, '_utcnow', lambda: later)
+    assert store.get(token)[1] is None
+    assert SessionStore(pool.checkout).get(token)[1] is None
+
+
+def test_touches_are_coalesced_and_extend_expiry(pool, conn, user_id, monkeypatch):
+    store = SessionStore(pool.checkout, lifetime=timedelta(hours=1))
+    tokens = [store.create(user_id, {}) for _ in range(2)]
+    before = session_rows(conn)
+    later = datetime.now(timezone.utc) + timedelta(minutes=30)
+    monkeypatch.setattr(session_store, '_utcnow', lambda: later)
+    for _ in range(5):
+        for token in tokens:
+            store.touch(*store.get(token))
+    assert session_rows(conn) == before
+
+    assert store.flush() == 2 and store.flush() == 0
+    for (_, _, expires_at, last_activity), old in zip(session_rows(conn), before):
+        assert last_activity == later.strftime('%Y-%m-%d %H:%M:%S') and expires_at > old[2]
+    stats = store.stats()
+    assert stats['touches'] == 10 and stats['flushes'] == 1 and stats['flushed_rows'] == 2
+
+
+def test_sweep_deletes_expired_rows_in_batches(pool, conn, user_id, monkeypatch):
+    monkeypatch.setattr(session_store, 'SWEEP_BATCH', 3)
+    expired = SessionStore(pool.checkout, lifetime=timedelta(seconds=-1))
+    for _ in range(7):
+        expired.create(user_id, {})
+    live = SessionStore(pool.checkout).create(user_id, {})
+
+    assert expired.sweep() == 7 and expired.stats()['swept'] == 7
+    assert [row[0] for row in session_rows(conn)] == [hash_token(live)]
+    assert expired.sweep() == 0
+
+
+def test_each_login_gets_own_token_and_logout_deletes_it(todo_app):
+    client, user_id = login(todo_app, 'session')
+    token = client.get_cookie('session').value
+    username = client.get('/api/auth/me').get_json()['user']['username']
+    other = todo_app.app.test_client()
+    other.post('/api/auth/login', json={'username': username, 'password': 'secret1'})
+    other_token = other.get_cookie('session').value
+
+    conn = todo_app.db_connection_pool.checkout()
+    try:
+        def tokens():
+            return {row[0] for row in conn.execute('SELECT session_token FROM user_sessions WHERE user_id = ?',
+                                                   (user_id,))}
+        assert other_token != token and tokens() == {hash_token(token), hash_token(other_token)}
+
+        client.post('/api/auth/logout')
+        assert tokens() == {hash_token(other_token)} and client.get_cookie('session') is None
+        assert other.get('/api/auth/check').get_json()['authenticated']
+        # 登出后的令牌不能再使用
+        stale = todo_app.app.test_client()
+        stale.set_cookie('session', token)
+        assert not stale.get('/api/auth/check').get_json()['authenticated']
+    finally:
+        conn.close()
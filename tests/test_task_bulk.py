@@ -0,0 +1,69 @@
+import pytest
+
+import task_stats
+from task_bulk import BatchError, apply_batch
+
+from .conftest import add_user
+
+
+def test_mixed_batch_keeps_stats_consistent(conn):
+    user_id = add_user(conn, 'bulk')
+    other_id = add_user(conn, 'other')
+    conn.executemany('INSERT INTO tasks (title, due_date, user_id) VALUES (?, ?, ?)',
+                     [(f'任务{i}', f'2025-01-{i % 28 + 1:02d}', user_id) for i in range(30)])
+    foreign = conn.execute('INSERT INTO tasks (title, user_id) VALUES (?, ?)', ('别人的任务', other_id)).lastrowid
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM tasks WHERE user_id = ? ORDER BY id', (user_id,))]
+
+    updates = []
+    for index, task_id in enumerate(ids[:20]):
+        if index % 3 == 0:
+            updates.append({'id': task_id, 'completed': True})
+        elif index % 3 == 1:
+            updates.append({'id': task_id, 'due_date': '2025-02-01', 'start_time': '09:00', 'end_time': '10:00'})
+        else:
+            updates.append({'id': task_id, 'is_important': True})
+    updates.append({'id': foreign, 'title': '改别人的'})
+    result = apply_batch(conn, user_id,
+                         creates=[{'title': '新任务'}, {'title': '  '}],
+                         updates=updates,
+                         deletes=ids[20:] + [ids[20], foreign])
+
+    assert result['created_count'] == 1 and result['created'][1]['error']
+    assert result['updated_count'] == 20 and result['update_groups'] == 4
+    assert result['deleted_count'] == 10
+    assert [item['rowcount'] for item in result['updated']] == [1] * 20 + [0]
+    assert [item['rowcount'] for item in result['deleted']][-2:] == [0, 0]
+    assert conn.execute('SELECT title FROM tasks WHERE id = ?', (foreign,)).fetchone()[0] == '别人的任务'
+    assert conn.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ? AND completed = 1',
+                        (user_id,)).fetchone()[0] == 7
+    assert not task_stats.verify_task_stats(conn.cursor())
+
+
+def test_rejects_non_list_arguments(conn):
+    with pytest.raises(BatchError):
+        apply_batch(conn, 1, updates={'id': 1})
+
+
+def test_invalid_items_are_reported_per_item(conn):
+    user_id = add_user(conn, 'bulk')
+    other_id = add_user(conn, 'other')
+    own_list = conn.execute('INSERT INTO task_lists (name, user_id) VALUES (?, ?)', ('我的', user_id)).lastrowid
+    foreign_list = conn.execute('INSERT INTO task_lists (name, user_id) VALUES (?, ?)', ('别人的', other_id)).lastrowid
+    task_id = conn.execute('INSERT INTO tasks (title, user_id) VALUES (?, ?)', ('任务', user_id)).lastrowid
+    conn.commit()
+
+    result = apply_batch(conn, user_id,
+                         creates=[{'title': '放进别人的列表', 'list_id': foreign_list},
+                                  {'title': 123},
+                                  {'title': '好的', 'list_id': own_list}],
+                         updates=[{'id': task_id, 'title': None},
+                                  {'id': task_id, 'description': {'x': 1}},
+                                  {'id': task_id, 'list_id': foreign_list},
+                                  {'id': task_id, 'list_id': own_list}])
+
+    assert [bool(item.get('error')) for item in result['created']] == [True, True, False]
+    assert [item['rowcount'] for item in result['updated']] == [0, 0, 0, 1]
+    assert all(item['error'] for item in result['updated'][:3])
+    assert tuple(conn.execute('SELECT title, list_id FROM tasks WHERE id = ?', (task_id,)).fetchone()) == ('任务', own_list)
+    assert conn.execute('SELECT COUNT(*) FROM tasks WHERE list_id = ?', (foreign_list,)).fetchone()[0] == 0
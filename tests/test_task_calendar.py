@@ -0,0 +1,92 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import serializers
+from task_calendar import (TASK_FIELDS, TASK_OUTPUT, WEEK_DAYS, WEEK_KEYS, CalendarCache, CalendarRangeError,
+                           parse_range, week_start_of)
+
+from .conftest import add_user
+
+
+def legacy_week(conn, user_id, week_start_date):
+    """旧的周视图实现：取出一周的任务后在 Python 中按天分组"""
+    cursor = serializers.tuple_cursor(conn)
+    week_end_date = week_start_date + timedelta(days=6)
+    cursor.execute('''
+        SELECT t.id, t.title, t.description, t.completed, t.priority,
+               t.due_date, t.start_time, t.end_time, t.list_id, t.is_important,
+               tl.name, tl.icon, tl.color
+        FROM tasks t
+        LEFT JOIN task_lists tl ON t.list_id = tl.id
+        WHERE t.user_id = ? AND t.due_date BETWEEN ? AND ?
+        ORDER BY t.due_date, t.start_time, t.is_important DESC
+    ''', (user_id, week_start_date.isoformat(), week_end_date.isoformat()))
+    days = [{'date': (week_start_date + timedelta(days=i)).isoformat(),
+             'day_name': (week_start_date + timedelta(days=i)).strftime('%A'), 'tasks': []} for i in range(7)]
+    plan = serializers.get_plan(TASK_FIELDS, TASK_OUTPUT)
+    due_date_index = plan.index('due_date')
+    for task in cursor.fetchall():
+        day_index = (date.fromisoformat(task[due_date_index]) - week_start_date).days
+        if 0 <= day_index < 7:
+            days[day_index]['tasks'].append(plan.convert(task))
+    return serializers.dumps({'week_start': week_start_date.isoformat(),
+                              'week_end': week_end_date.isoformat(), 'days': days})
+
+
+@pytest.fixture
+def calendar(conn):
+    rng = random.Random(11)
+    user_id = add_user(conn, 'calendar')
+    list_id = conn.execute('INSERT INTO task_lists (name, user_id) VALUES (?, ?)', ('任务', user_id)).lastrowid
+    monday = week_start_of(date.today())
+    conn.executemany(
+        'INSERT INTO tasks (title, priority, due_date, start_time, is_important, list_id, user_id) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(f'任务{i}', 'medium', (monday + timedelta(days=rng.randint(-30, 90))).isoformat(),
+          f'{rng.randint(0, 23):02d}:{i % 60:02d}', rng.random() < 0.2, list_id, user_id) for i in range(500)]
+    )
+    conn.execute('INSERT INTO tasks (title, due_date, list_id, user_id) VALUES (?, ?, ?, ?)',
+                 ('本周一', monday.isoformat(), list_id, user_id))
+    conn.commit()
+    return user_id, list_id, monday
+
+
+def test_week_matches_legacy(conn, calendar):
+    user_id, _, monday = calendar
+    cache = CalendarCache()
+    assert cache.get(conn, user_id, monday, WEEK_DAYS, keys=WEEK_KEYS)[1] == legacy_week(conn, user_id, monday)
+
+
+def test_moving_a_task_invalidates_only_affected_weeks(conn, calendar):
+    user_id, list_id, monday = calendar
+    cache = CalendarCache()
+    next_week = monday + timedelta(days=7)
+    far_week = monday + timedelta(days=70)
+    for week in (monday, next_week, far_week):
+        cache.get(conn, user_id, week, WEEK_DAYS, keys=WEEK_KEYS)
+    task_id = conn.execute('SELECT id FROM tasks WHERE user_id = ? AND due_date = ?',
+                           (user_id, monday.isoformat())).fetchone()[0]
+    builds = cache.stats()['builds']
+    conn.execute('UPDATE tasks SET due_date = ?, start_time = ? WHERE id = ?', (next_week.isoformat(), '09:00', task_id))
+    # 修改时间戳等不影响日历的列不会使缓存失效
+    conn.execute("UPDATE tasks SET updated_at = '2000-01-01' WHERE id = ?", (task_id,))
+    conn.commit()
+    for week in (monday, next_week, far_week):
+        assert cache.get(conn, user_id, week, WEEK_DAYS, keys=WEEK_KEYS)[1] == legacy_week(conn, user_id, week)
+    assert cache.stats()['builds'] - builds == 2
+
+    # 列表颜色变化影响所有周
+    conn.execute("UPDATE task_lists SET color = '#ff0000' WHERE id = ?", (list_id,))
+    conn.commit()
+    assert cache.get(conn, user_id, far_week, WEEK_DAYS, keys=WEEK_KEYS)[1] == legacy_week(conn, user_id, far_week)
+
+
+def test_parse_range():
+    assert parse_range('2024-06-10', '2024-06-16') == (date(2024, 6, 10), 7)
+    assert parse_range('2024-06-10', days=42) == (date(2024, 6, 10), 42)
+    with pytest.raises(CalendarRangeError):
+        parse_range('2024-06-10', days=200)
+    with pytest.raises(CalendarRangeError):
+        parse_range('6/10')
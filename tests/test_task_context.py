@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import pytest
+
+from task_context import CANDIDATES_PER_SECTION, DEFAULT_TOKEN_BUDGET, TaskContextBuilder, estimate_tokens
+
+from .conftest import add_user
+
+TODAY = date(2025, 3, 10)
+
+
+@pytest.fixture
+def user_id(conn):
+    """各类任务都比一类的候选上限多：即将到期、重要、普通，另有已完成和远期任务"""
+    user_id = add_user(conn, 'context')
+    rows = []
+    for i in range(15):
+        rows.append((f'到期任务{i}', (TODAY + timedelta(days=i % 5 - 1)).isoformat(), 0, 0))
+        rows.append((f'重要任务{i}' + '很长的标题' * 10, None, 1, 0))
+        rows.append((f'普通任务{i}', '2030-01-01', 0, 0))
+        rows.append((f'已完成{i}', TODAY.isoformat(), 1, 1))
+    conn.executemany('INSERT INTO tasks (title, due_date, is_important, completed, user_id) VALUES (?, ?, ?, ?, ?)',
+                     [row + (user_id,) for row in rows])
+    conn.commit()
+    return user_id
+
+
+def task_lines(context):
+    return [line for line in context.splitlines() if line.startswith('#')]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好') == 2
+    assert estimate_tokens('abcd') == 1 and estimate_tokens('abcde') == 2
+    assert estimate_tokens('任务 task') == 2 + 2
+
+
+@pytest.mark.parametrize('budget', [60, 150, DEFAULT_TOKEN_BUDGET, 1000, 5000])
+def test_context_fits_budget(conn, user_id, budget):
+    context = TaskContextBuilder().get(conn, user_id, budget, today=TODAY)
+    assert context.startswith('总任务数: 60, 已完成: 15') and estimate_tokens(context) <= budget
+    ids = [line.split()[0] for line in task_lines(context)]
+    assert len(ids) == len(set(ids)) and len(ids) <= 3 * CANDIDATES_PER_SECTION
+    if budget >= DEFAULT_TOKEN_BUDGET:
+        # 三类轮流入选，预算不大时每类也都有任务
+        assert all(title in context for title in ('即将到期:', '重要待办:', '最近修改:'))
+
+
+def test_larger_budget_adds_tasks(conn, user_id):
+    builder = TaskContextBuilder()
+    counts = [len(task_lines(builder.get(conn, user_id, budget, today=TODAY))) for budget in (100, 400, 5000, 50000)]
+    # 预算足够时所有候选都已入选（同一任务属于多类时只出现一次）
+    assert counts[0] < counts[1] < counts[2] == counts[3] <= 3 * CANDIDATES_PER_SECTION
+
+
+def test_task_lines(conn, user_id):
+    context = TaskContextBuilder().get(conn, user_id, 5000, today=TODAY)
+    lines = task_lines(context)
+    overdue = [line for line in lines if '已逾期' in line]
+    assert overdue and all(f'截止: {(TODAY - timedelta(days=1)).isoformat()}' in line for line in overdue)
+    important = [line for line in lines if '重要任务' in line]
+    assert important and all('…' in line and len(line.split(' [')[0].split(' ', 2)[2]) == 40 for line in important)
+    # 已完成的任务只会作为最近修改出现
+    sections = context.split('最近修改:')
+    assert not any('✓' in line for line in task_lines(sections[0]))
+    assert all(line.split()[1] == '✓' for line in task_lines(sections[1]) if '已完成' in line)
+
+
+def test_cached_until_data_or_date_changes(conn, user_id):
+    builder = TaskContextBuilder()
+    context = builder.get(conn, user_id, today=TODAY)
+    assert builder.get(conn, user_id, today=TODAY) is context
+    assert builder.stats()['builds'] == 1
+
+    task_id = conn.execute("SELECT id FROM tasks WHERE title = '普通任务0'").fetchone()[0]
+    conn.execute("UPDATE tasks SET title = '刚刚修改的任务' WHERE id = ?", (task_id,))
+    conn.commit()
+    changed = builder.get(conn, user_id, today=TODAY)
+    assert '刚刚修改的任务' in changed.split('最近修改:')[1]
+
+    builder.get(conn, user_id, today=TODAY + timedelta(days=1))
+    builder.get(conn, user_id, 100, today=TODAY + timedelta(days=1))
+    stats = builder.stats()
+    assert stats['builds'] == 4 and stats['stale'] == 3
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from .conftest import login
+
+
+@pytest.fixture
+def seeded(todo_app):
+    """一个用户，两个列表中的 60 个任务：重要性、截止日期（含空）和创建时间都有重复值"""
+    client, user_id = login(todo_app, 'page')
+    rng = random.Random(5)
+    conn = todo_app.db_connection_pool.checkout()
+    try:
+        list_ids = [conn.execute('INSERT INTO task_lists (name, user_id) VALUES (?, ?)', (name, user_id)).lastrowid
+                    for name in ('工作', '生活')]
+        conn.executemany(
+            'INSERT INTO tasks (title, description, completed, is_important, due_date, created_at, list_id, user_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(f'任务{i}', '很长的描述' * 10, i % 4 == 0, rng.random() < 0.3,
+              rng.choice([None, '2025-01-01', '2025-01-02', '2025-02-01']),
+              rng.choice(['2024-12-01 08:00:00', '2024-12-02 08:00:00']), list_ids[i % 2], user_id)
+             for i in range(60)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return client, list_ids
+
+
+def pages(client, query, limit):
+    tasks, cursor, requests = [], None, 0
+    while True:
+        url = f'/api/tasks?{query}&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        requests += 1
+        assert len(page['tasks']) <= limit
+        tasks.extend(page['tasks'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return tasks, requests
+
+
+@pytest.mark.parametrize('query', ['show_completed=true', 'show_completed=false', 'list_id={list_id}'])
+def test_pages_match_unpaginated_order(seeded, query):
+    client, list_ids = seeded
+    query = query.format(list_id=list_ids[0])
+    everything = client.get(f'/api/tasks?{query}').get_json()
+    paged, requests = pages(client, query, 7)
+    assert [task['id'] for task in paged] == [task['id'] for task in everything]
+    assert requests == len(everything) // 7 + 1
+
+    # 与排序定义一致：重要优先、截止日期升序（无日期在前）、创建时间倒序、id 倒序
+    expected = sorted(everything, key=lambda task: task['id'], reverse=True)
+    expected.sort(key=lambda task: task['created_at'], reverse=True)
+    expected.sort(key=lambda task: (not task['is_important'], task['due_date'] or ''))
+    assert [task['id'] for task in paged] == [task['id'] for task in expected]
+
+
+def test_cursor_is_stable_across_inserts(seeded):
+    client, list_ids = seeded
+    everything = {task['id'] for task in client.get('/api/tasks').get_json()}
+    first = client.get('/api/tasks?limit=10').get_json()
+    client.post('/api/tasks', json={'title': '新任务', 'list_id': list_ids[0]})
+    rest, _ = pages(client, f'cursor={first["next_cursor"]}', 100)
+    # 翻页期间插入的任务不会让已返回的任务重复出现或被跳过
+    ids = [task['id'] for task in first['tasks'] + rest]
+    assert len(ids) == len(set(ids)) and everything <= set(ids)
+
+
+def test_field_projection(seeded):
+    client, _ = seeded
+    tasks = client.get('/api/tasks?fields=title,due_date&limit=5').get_json()['tasks']
+    assert len(tasks) == 5 and all(set(task) == {'id', 'title', 'due_date'} for task in tasks)
+    # 未请求的排序键不会出现在结果中，游标仍然可用
+    first = client.get('/api/tasks?fields=title&limit=30').get_json()
+    second = client.get(f'/api/tasks?fields=title&limit=30&cursor={first["next_cursor"]}').get_json()
+    assert all(set(task) == {'id', 'title'} for task in first['tasks'] + second['tasks'])
+    assert len({task['id'] for task in first['tasks'] + second['tasks']}) == 60
+
+    assert client.get('/api/tasks?fields=title,password').status_code == 400
+    assert client.get('/api/tasks?limit=5&cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/tasks?limit=abc').status_code == 400
@@ -0,0 +1,64 @@
+import calendar
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from task_recurrence import FREQUENCIES, RecurrenceError, RecurrenceRule, parse_rule
+
+
+def naive(rule, window_start, window_end):
+    """从系列开始逐日判断，计数到 count 为止"""
+    result = []
+    index = 0
+    day = rule.start
+    while day <= window_end and (rule.until is None or day <= rule.until):
+        if rule.freq == 'daily':
+            hit = (day - rule.start).days % rule.interval == 0
+        elif rule.freq == 'weekly':
+            weeks = (day - timedelta(days=day.weekday()) - (rule.start - timedelta(days=rule.start.weekday()))).days // 7
+            hit = weeks % rule.interval == 0 and day.weekday() in rule.weekdays
+        else:
+            months = (day.year - rule.start.year) * 12 + day.month - rule.start.month
+            hit = months % rule.interval == 0 and day.day == min(
+                rule.start.day, calendar.monthrange(day.year, day.month)[1])
+        if hit:
+            if rule.count is not None and index >= rule.count:
+                break
+            index += 1
+            if day >= window_start:
+                result.append(day)
+        day += timedelta(days=1)
+    return tuple(result)
+
+
+def test_expansion_matches_naive():
+    rng = random.Random(2024)
+    for _ in range(3000):
+        freq = rng.choice(FREQUENCIES)
+        start = date(2023, 1, 1) + timedelta(days=rng.randint(0, 700))
+        rule = RecurrenceRule(
+            freq, start, rng.choice((1, 1, 2, 3)),
+            rng.sample(range(7), rng.randint(1, 4)) if freq == 'weekly' and rng.random() < 0.7 else (),
+            start + timedelta(days=rng.randint(0, 500)) if rng.random() < 0.3 else None,
+            rng.randint(1, 40) if rng.random() < 0.3 else None,
+        )
+        window_start = date(2023, 1, 1) + timedelta(days=rng.randint(0, 900))
+        window_end = window_start + timedelta(days=rng.randint(0, 120))
+        assert rule.occurrences(window_start, window_end) == naive(rule, window_start, window_end), \
+            (rule.to_rrule(), rule.start, window_start, window_end)
+
+
+def test_parse_rule():
+    assert parse_rule('FREQ=WEEKLY;BYDAY=MO,WE;COUNT=3', date(2024, 6, 12)).occurrences(
+        date(2024, 6, 1), date(2024, 6, 30)) == (date(2024, 6, 12), date(2024, 6, 17), date(2024, 6, 19))
+    # 每月 31 日在短月份落在月末
+    assert parse_rule({'freq': 'monthly'}, date(2024, 1, 31)).occurrences(
+        date(2024, 2, 1), date(2024, 4, 30)) == (date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30))
+
+
+def test_parse_rule_rejects_bad_input():
+    with pytest.raises(RecurrenceError):
+        parse_rule('FREQ=HOURLY', date(2024, 6, 12))
+    with pytest.raises(RecurrenceError):
+        parse_rule({'freq': 'daily', 'interval': 0}, date(2024, 6, 12))
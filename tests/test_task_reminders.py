@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from task_reminders import DEFAULT_REMIND_TIME, LEAD_MINUTES, LOOKAHEAD_DAYS, ReminderScheduler, remind_at
+
+from .conftest import add_user
+
+START = datetime(2030, 1, 7, 0, 0)
+
+
+def run_day(scheduler, clock):
+    """按分钟推进一天，弹出并确认到点的提醒"""
+    for minute in range(1, 24 * 60 + 1):
+        clock[0] = START + timedelta(minutes=minute)
+        with scheduler._condition:
+            due = scheduler._pop_due(clock[0])
+        if due:
+            scheduler._fire(due, clock[0])
+
+
+@pytest.fixture
+def scheduler(pool):
+    clock = [START]
+    fired = []
+    scheduler = ReminderScheduler(pool.checkout, lambda user_id, payload: fired.append((user_id, payload)),
+                                  clock=lambda: clock[0])
+    return scheduler, clock, fired
+
+
+def test_heap_fires_what_polling_would(conn, scheduler):
+    scheduler, clock, fired = scheduler
+    rng = random.Random(11)
+    users = [add_user(conn, f'u{i}') for i in range(5)]
+    conn.executemany(
+        'INSERT INTO tasks (title, completed, due_date, start_time, user_id) VALUES (?, ?, ?, ?, ?)',
+        [(f'任务{i}', rng.random() < 0.2, (START.date() + timedelta(days=rng.randint(0, LOOKAHEAD_DAYS + 3))).isoformat(),
+          f'{rng.randint(0, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}' if rng.random() < 0.7 else None,
+          rng.choice(users)) for i in range(2000)]
+    )
+    conn.commit()
+    scheduler._load_ahead(START)
+
+    # 写入路径：改期、完成、删除后 refresh
+    first, second, third = [row[0] for row in conn.execute(
+        'SELECT id FROM tasks WHERE completed = 0 AND due_date = ? ORDER BY id LIMIT 3', (START.date().isoformat(),))]
+    conn.execute("UPDATE tasks SET due_date = ?, start_time = '08:00' WHERE id = ?",
+                 ((START.date() + timedelta(days=1)).isoformat(), first))
+    conn.execute('UPDATE tasks SET completed = 1 WHERE id = ?', (second,))
+    conn.execute('DELETE FROM tasks WHERE id = ?', (third,))
+    conn.commit()
+    scheduler.refresh([first, second], [third])
+
+    run_day(scheduler, clock)
+
+    expected = conn.execute(f'''
+        SELECT COUNT(*) FROM tasks WHERE completed = 0
+        AND datetime(due_date || ' ' || IFNULL(start_time, '{DEFAULT_REMIND_TIME}'),
+                     CASE WHEN start_time IS NULL THEN '+0 minutes' ELSE '-{LEAD_MINUTES} minutes' END)
+            BETWEEN ? AND ?
+    ''', (START.isoformat(' '), clock[0].isoformat(' '))).fetchone()[0]
+    payloads = [payload for _, payload in fired]
+    assert len(payloads) == expected
+    assert all(a['remind_at'] <= b['remind_at'] for a, b in zip(payloads, payloads[1:]))
+    assert not any(payload['id'] in (first, second, third) for payload in payloads)
+
+
+def test_recurring_series_fires_each_occurrence(conn, scheduler):
+    scheduler, clock, fired = scheduler
+    user_id = add_user(conn, 'series')
+    task_id = conn.execute("INSERT INTO tasks (title, start_time, user_id) VALUES ('站会', '09:30', ?)",
+                           (user_id,)).lastrowid
+    conn.execute("INSERT INTO task_recurrences (task_id, user_id, freq, interval, start_date) "
+                 "VALUES (?, ?, 'daily', 1, ?)", (task_id, user_id, (START.date() - timedelta(days=30)).isoformat()))
+    conn.commit()
+    scheduler._load_ahead(START)
+    assert scheduler.stats()['pending'] == LOOKAHEAD_DAYS + 1
+
+    run_day(scheduler, clock)
+    assert fired == [(user_id, {'id': task_id, 'title': '站会', 'due_date': START.date().isoformat(),
+                                'start_time': '09:30', 'remind_at': '2030-01-07T09:20'})]
+
+    # 跳过明天这一次后 refresh：只取消那一次
+    tomorrow = (START.date() + timedelta(days=1)).isoformat()
+    conn.execute("INSERT INTO task_occurrence_exceptions (task_id, due_date, status, user_id) VALUES (?, ?, 'skipped', ?)",
+                 (task_id, tomorrow, user_id))
+    conn.commit()
+    scheduler.refresh([task_id])
+    with scheduler._condition:
+        assert (task_id, tomorrow) not in scheduler._tokens
+        assert (task_id, (START.date() + timedelta(days=2)).isoformat()) in scheduler._tokens
+
+
+def test_remind_at():
+    assert remind_at('2030-01-07', '09:00') == datetime(2030, 1, 7, 8, 50)
+    assert remind_at('2030-01-07 12:00:00', None) == datetime(2030, 1, 7, 9, 0)
+    assert remind_at('2030-13-07', None) is None
+    assert remind_at(None, '09:00') is None
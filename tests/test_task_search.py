@@ -0,0 +1,48 @@
+import pytest
+
+from task_search import search_tasks
+
+from .conftest import add_user
+
+
+@pytest.fixture
+def tasks(conn):
+    """旧的几个任务在标题中命中，之后的 1200 个新任务只在长描述中命中一次；另一个用户有同样的标题"""
+    user_id = add_user(conn, 'search')
+    other_id = add_user(conn, 'other')
+    old = [(f'项目评审会议 {i}', '', user_id) for i in range(5)]
+    new = [(f'日常任务 {i}', '一些说明文字' * 20 + ' 项目评审会议纪要', user_id) for i in range(1200)]
+    foreign = [(f'项目评审会议 {i}', '', other_id) for i in range(50)]
+    conn.executemany('INSERT INTO tasks (title, description, user_id) VALUES (?, ?, ?)', old + new + foreign)
+    conn.commit()
+    old_ids = [row[0] for row in conn.execute('SELECT id FROM tasks WHERE user_id = ? ORDER BY id LIMIT 5', (user_id,))]
+    return user_id, old_ids
+
+
+@pytest.mark.parametrize('query', ['会议', '项目评审', '评审 会议'])
+def test_better_old_matches_rank_first(conn, tasks, query):
+    user_id, old_ids = tasks
+    results = search_tasks(conn.cursor(), user_id, query, limit=20)
+    assert len(results) == 20
+    # 标题命中的旧任务排在 1200 个只在描述中命中的新任务前面（新任务在前按ID倒序）
+    assert [result['id'] for result in results[:5]] == old_ids[::-1]
+    assert all(result['title'].startswith('日常任务') for result in results[5:])
+
+
+def test_results_are_scoped_to_user(conn, tasks):
+    user_id, _ = tasks
+    other_id = conn.execute("SELECT id FROM users WHERE username = 'other'").fetchone()[0]
+    own = {row[0] for row in conn.execute('SELECT id FROM tasks WHERE user_id = ?', (user_id,))}
+    for query in ('会议', '项目评审会议'):
+        results = search_tasks(conn.cursor(), user_id, query, limit=2000)
+        assert len(results) == 1205 and {result['id'] for result in results} <= own
+        assert len(search_tasks(conn.cursor(), other_id, query, limit=2000)) == 50
+
+
+def test_highlight_substring_and_fuzzy(conn, tasks):
+    user_id, old_ids = tasks
+    result = search_tasks(conn.cursor(), user_id, '评审会', limit=1)[0]
+    assert result['id'] == old_ids[-1] and result['title_highlight'] == '项目<mark>评审会</mark>议 4'
+    assert search_tasks(conn.cursor(), user_id, '项目评申') == []
+    fuzzy = search_tasks(conn.cursor(), user_id, '项目评申', fuzzy=True, limit=5)
+    assert [result['id'] for result in fuzzy] == old_ids[::-1]
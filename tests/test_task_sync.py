@@ -0,0 +1,109 @@
+import pytest
+
+import serializers
+from task_sync import SyncError, apply_mutations, get_changes, parse_token, prune_tombstones
+
+from .conftest import add_user
+
+
+@pytest.fixture
+def synced(conn):
+    """一个用户，通过同步接口创建的一个列表和其中的两个任务；返回 (用户ID, 列表ID, [任务ID])"""
+    user_id = add_user(conn, 'sync')
+    result = apply_mutations(conn, user_id, [
+        {'entity': 'list', 'op': 'upsert', 'client_id': 'l1', 'fields': {'name': '离线列表'}},
+        {'entity': 'task', 'op': 'upsert', 'client_id': 't1', 'fields': {'title': '任务一', 'list_client_id': 'l1'}},
+        {'entity': 'task', 'op': 'upsert', 'client_id': 't2', 'fields': {'title': '任务二', 'list_client_id': 'l1'}},
+    ])
+    assert [item['status'] for item in result['results']] == ['created'] * 3
+    list_id = result['list_ids'][0]
+    return user_id, list_id, result['task_ids']
+
+
+def test_full_then_incremental_changes(conn, synced):
+    user_id, list_id, task_ids = synced
+    cursor = serializers.tuple_cursor(conn)
+    first = get_changes(cursor, user_id)
+    assert first['full'] and not first['has_more']
+    assert [row['id'] for row in first['lists']] == [list_id]
+    assert sorted(row['id'] for row in first['tasks']) == task_ids
+    assert all(row['list_id'] == list_id for row in first['tasks'])
+
+    result = apply_mutations(conn, user_id, [{'entity': 'task', 'op': 'upsert', 'id': task_ids[0],
+                                              'fields': {'completed': True}}], base_token=first['sync_token'])
+    assert result['results'][0]['status'] == 'applied'
+    second = get_changes(cursor, user_id, first['sync_token'])
+    assert not second['full']
+    assert [row['id'] for row in second['tasks']] == [task_ids[0]] and second['tasks'][0]['completed'] is True
+    assert get_changes(cursor, user_id, second['sync_token'])['tasks'] == []
+
+
+def test_conflicts_and_idempotent_delete(conn, synced):
+    user_id, _, task_ids = synced
+    token = get_changes(serializers.tuple_cursor(conn), user_id)['sync_token']
+    # 其他设备在 token 之后修改了任务一、删除了任务二
+    apply_mutations(conn, user_id, [
+        {'entity': 'task', 'op': 'upsert', 'id': task_ids[0], 'fields': {'title': '服务端标题'}},
+        {'entity': 'task', 'op': 'delete', 'id': task_ids[1]},
+    ])
+
+    result = apply_mutations(conn, user_id, [
+        {'entity': 'task', 'op': 'upsert', 'id': task_ids[0], 'fields': {'title': '客户端标题'}},
+        {'entity': 'task', 'op': 'upsert', 'id': task_ids[1], 'fields': {'title': '改已删除的'}},
+        {'entity': 'task', 'op': 'delete', 'id': task_ids[1]},
+        {'entity': 'task', 'op': 'upsert', 'id': 999999, 'fields': {'title': '不存在'}},
+    ], base_token=token)
+    modified, deleted, delete_again, missing = result['results']
+    assert modified['status'] == 'conflict' and modified['reason'] == 'modified'
+    assert modified['server']['title'] == '服务端标题'
+    assert deleted['status'] == 'conflict' and deleted['reason'] == 'deleted' and deleted['server'] is None
+    assert delete_again['status'] == 'applied'
+    assert missing['status'] == 'not_found'
+    assert conn.execute('SELECT title FROM tasks WHERE id = ?', (task_ids[0],)).fetchone()[0] == '服务端标题'
+
+
+def test_tombstones_and_horizon(conn, synced):
+    user_id, _, task_ids = synced
+    cursor = serializers.tuple_cursor(conn)
+    before = get_changes(cursor, user_id)['sync_token']
+    apply_mutations(conn, user_id, [{'entity': 'task', 'op': 'delete', 'id': task_ids[1]}])
+    changes = get_changes(cursor, user_id, before)
+    assert changes['deleted_tasks'] == [task_ids[1]] and changes['tasks'] == []
+
+    # 新删除的墓碑不会被清理
+    assert prune_tombstones(cursor) == 0
+    conn.execute("UPDATE sync_changes SET changed_at = datetime('now', '-40 days') WHERE op = 'delete'")
+    assert prune_tombstones(cursor) == 1
+    conn.commit()
+    # 游标早于清理线：无法得知期间的删除，退回全量同步
+    changes = get_changes(cursor, user_id, before)
+    assert changes['full'] and changes['deleted_tasks'] == []
+    assert [row['id'] for row in changes['tasks']] == [task_ids[0]]
+
+
+def test_invalid_fields_are_reported_per_mutation(conn, synced):
+    user_id, list_id, task_ids = synced
+    other_id = add_user(conn, 'other')
+    foreign_list = conn.execute('INSERT INTO task_lists (name, user_id) VALUES (?, ?)', ('别人的', other_id)).lastrowid
+    conn.commit()
+
+    result = apply_mutations(conn, user_id, [
+        {'entity': 'task', 'op': 'upsert', 'fields': {'title': 123}},
+        {'entity': 'task', 'op': 'upsert', 'fields': {'title': '放进别人的列表', 'list_id': foreign_list}},
+        {'entity': 'list', 'op': 'upsert', 'fields': {'name': {'x': 1}}},
+        {'entity': 'task', 'op': 'upsert', 'id': task_ids[0], 'fields': {'title': None}},
+        {'entity': 'task', 'op': 'upsert', 'id': task_ids[0], 'fields': {'list_id': foreign_list}},
+        {'entity': 'list', 'op': 'upsert', 'id': list_id, 'fields': {'sort_order': 'first'}},
+        {'entity': 'task', 'op': 'upsert', 'fields': {'title': '正常任务', 'list_id': list_id}},
+    ])
+    assert [item['status'] for item in result['results']] == ['error'] * 6 + ['created']
+    assert all(item['error'] for item in result['results'][:6])
+    assert conn.execute('SELECT COUNT(*) FROM tasks WHERE list_id = ?', (foreign_list,)).fetchone()[0] == 0
+    assert conn.execute('SELECT list_id FROM tasks WHERE id = ?', (task_ids[0],)).fetchone()[0] == list_id
+
+
+def test_parse_token():
+    assert parse_token(None) == 0 and parse_token('15') == 15
+    for value in ('-1', 'abc'):
+        with pytest.raises(SyncError):
+            parse_token(value)
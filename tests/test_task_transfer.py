@@ -0,0 +1,89 @@
+import io
+import json
+
+import task_stats
+from task_transfer import ImportProgress, import_tasks, iter_export
+
+from .conftest import add_user
+
+TASK_COLUMNS = 'tl.name, t.title, t.description, t.completed, t.priority, t.due_date, t.start_time, t.is_important'
+
+
+def user_tasks(conn, user_id):
+    return [tuple(row) for row in conn.execute(f'''
+        SELECT {TASK_COLUMNS} FROM tasks t LEFT JOIN task_lists tl ON t.list_id = tl.id
+        WHERE t.user_id = ? ORDER BY t.id
+    ''', (user_id,))]
+
+
+def run_import(conn, user_id, text, fmt='ndjson', chunk_size=1000):
+    progress = ImportProgress('test', user_id)
+    return import_tasks(conn, user_id, io.StringIO(text), fmt, progress, chunk_size=chunk_size)
+
+
+def seed(conn, user_id, count):
+    work = conn.execute('INSERT INTO task_lists (name, icon, color, sort_order, user_id) VALUES (?, ?, ?, ?, ?)',
+                        ('工作', '💼', '#ff0000', 1, user_id)).lastrowid
+    conn.executemany(
+        'INSERT INTO tasks (title, description, completed, priority, due_date, start_time, is_important, list_id, user_id) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'任务{i}', f'说明,"{i}"\n第二行', i % 2, ('high', 'medium', 'low')[i % 3], f'2025-01-{i % 28 + 1:02d}',
+          '09:00' if i % 4 else None, i % 5 == 0, work if i % 2 else None, user_id) for i in range(count)]
+    )
+    conn.commit()
+
+
+def test_ndjson_round_trip(pool, conn):
+    source = add_user(conn, 'source')
+    target = add_user(conn, 'target')
+    seed(conn, source, 1200)
+
+    text = ''.join(iter_export(pool.checkout, source, 'ndjson'))
+    # 批次之间不占用连接（只有测试自己借出的 conn）
+    assert pool.stats()['in_use'] == 1
+    records = [json.loads(line) for line in text.splitlines()]
+    assert records[0] == {'type': 'list', 'name': '工作', 'icon': '💼', 'color': '#ff0000', 'sort_order': 1}
+    assert sum(record['type'] == 'task' for record in records) == 1200
+
+    result = run_import(conn, target, text, chunk_size=500)
+    assert result['status'] == 'completed' and result['imported'] == 1200 and result['skipped'] == 0
+    assert result['lists_created'] == 1
+    assert user_tasks(conn, target) == user_tasks(conn, source)
+    assert tuple(conn.execute("SELECT icon, color FROM task_lists WHERE user_id = ? AND name = '工作'",
+                              (target,)).fetchone()) == ('💼', '#ff0000')
+    assert not task_stats.verify_task_stats(conn.cursor())
+
+
+def test_csv_round_trip(pool, conn):
+    source = add_user(conn, 'source')
+    target = add_user(conn, 'target')
+    seed(conn, source, 50)
+    text = ''.join(iter_export(pool.checkout, source, 'csv'))
+    assert text.startswith('﻿')
+    result = run_import(conn, target, text[1:], fmt='csv')
+    assert result['imported'] == 50
+    assert user_tasks(conn, target) == user_tasks(conn, source)
+
+
+def test_bad_rows_are_skipped(conn):
+    user_id = add_user(conn, 'import')
+    lines = [
+        {'type': 'task', 'title': '第一批'},
+        {'type': 'task', 'title': '对象说明', 'description': {'a': 1}},
+        {'type': 'task', 'title': ['数组标题']},
+        {'type': 'task', 'title': '数组列表名', 'list_name': ['x']},
+        {'type': 'list', 'name': '图标是对象', 'icon': {'x': 1}},
+        {'type': 'task', 'title': '   '},
+        {'type': 'note', 'title': '未知类型'},
+        {'type': 'task', 'title': '数字说明', 'description': 42, 'priority': 'urgent'},
+    ]
+    text = '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines) + '\n{坏的JSON\n[1, 2]\n'
+    result = run_import(conn, user_id, text, chunk_size=1)
+
+    assert result['status'] == 'completed'
+    assert result['rows_processed'] == 10 and result['imported'] == 2 and result['skipped'] == 8
+    assert [error['line'] for error in result['errors']] == [2, 3, 4, 5, 6, 7, 9, 10]
+    assert [tuple(row) for row in conn.execute(
+        'SELECT title, description, priority FROM tasks WHERE user_id = ? ORDER BY id', (user_id,))] == [
+        ('第一批', '', 'medium'), ('数字说明', '42', 'medium')]
+    assert conn.execute('SELECT COUNT(*) FROM task_lists WHERE user_id = ?', (user_id,)).fetchone()[0] == 0
@@ -0,0 +1,78 @@
+import ttl_cache
+from ttl_cache import TTLCache
+
+from .conftest import login
+
+
+def set_user_field(todo_app, user_id, column, value):
+    conn = todo_app.db_connection_pool.checkout()
+    try:
+        conn.execute(f'UPDATE users SET {column} = ? WHERE id = ?', (value, user_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_requests_reuse_cached_user(todo_app):
+    client, user_id = login(todo_app, 'cache')
+    assert client.get('/api/auth/me').status_code == 200
+    cached = todo_app.user_cache.get(user_id)
+    assert cached is not None and cached.id == str(user_id)
+
+    # 数据库中的修改在缓存有效期内不可见，说明没有再查 users 表
+    set_user_field(todo_app, user_id, 'full_name', '新名字')
+    hits = todo_app.user_cache.stats()['hits']
+    assert client.get('/api/auth/me').get_json()['user']['full_name'] == ''
+    assert todo_app.user_cache.stats()['hits'] > hits
+
+    todo_app.invalidate_user_cache(user_id)
+    assert client.get('/api/auth/me').get_json()['user']['full_name'] == '新名字'
+
+
+def test_login_refreshes_cached_user(todo_app):
+    client, user_id = login(todo_app, 'relogin')
+    user = client.get('/api/auth/me').get_json()['user']
+    set_user_field(todo_app, user_id, 'last_login', '2000-01-01T00:00:00')
+
+    other = todo_app.app.test_client()
+    assert other.post('/api/auth/login', json={'username': user['username'], 'password': 'secret1'}).status_code == 200
+    assert todo_app.user_cache.get(user_id) is None
+    last_login = client.get('/api/auth/me').get_json()['user']['last_login']
+    assert last_login >= user['last_login'] and last_login != '2000-01-01T00:00:00'
+
+
+def test_deactivated_user_is_logged_out_after_invalidation(todo_app):
+    client, user_id = login(todo_app, 'inactive')
+    assert client.get('/api/auth/check').get_json()['authenticated']
+    set_user_field(todo_app, user_id, 'is_active', 0)
+    todo_app.invalidate_user_cache(user_id)
+    assert not client.get('/api/auth/check').get_json()['authenticated']
+    assert client.get('/api/auth/me').status_code != 200
+    assert todo_app.user_cache.get(user_id) is None
+
+
+def test_cached_user_expires_after_ttl(todo_app, monkeypatch):
+    client, user_id = login(todo_app, 'expire')
+    client.get('/api/auth/me')
+    set_user_field(todo_app, user_id, 'full_name', '过期后可见')
+    now = ttl_cache.time.monotonic()
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: now + todo_app.USER_CACHE_TTL + 1)
+    expirations = todo_app.user_cache.stats()['expirations']
+    assert client.get('/api/auth/me').get_json()['user']['full_name'] == '过期后可见'
+    assert todo_app.user_cache.stats()['expirations'] == expirations + 1
+
+
+def test_ttl_cache_evicts_least_recently_used(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: clock[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+
+    clock[0] += 10
+    assert cache.get('a') is None and len(cache) == 1
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['expirations'] == 1 and stats['hits'] == 3 and stats['misses'] == 2